@@ -2,8 +2,20 @@ from .inference import inference
 from .get_visualize_handle import get_visualize_handle
 from .instancing_model import instancing_model
 from .evaluate import inference_task, evaluate_task
+from .dtype_report import dtype_equivalence_report
+from .chunked_inference import chunked_inference_task, get_temporal_receptive_field
+from .benchmark import run_benchmark
+from .tiled_inference import TiledModel
+from .pipelined_inference import PipelinedModel
+from .stream_inference import stream_inference
+from .multi_stream import MultiStreamRunner
+from .inference_server import InferenceServer
+from .inference_client import InferenceClient
 
 __all__ = ['inference', 'get_visualize_handle', 'instancing_model',
-           'inference_task', 'evaluate_task',
+           'inference_task', 'evaluate_task', 'dtype_equivalence_report',
+           'chunked_inference_task', 'get_temporal_receptive_field',
+           'run_benchmark', 'TiledModel', 'PipelinedModel',
+           'stream_inference', 'MultiStreamRunner', 'InferenceServer', 'InferenceClient',
            ]
 
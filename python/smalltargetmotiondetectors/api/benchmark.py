@@ -0,0 +1,342 @@
+import argparse
+import datetime
+import glob
+import importlib
+import json
+import logging
+import os
+import platform
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+from . import instancing_model
+from .. import model
+from ..core.math_operator import GammaDelay, SurroundInhibition
+from ..util.compute_module import compute_direction
+from ..util.datarecord import CircularList
+from ..util.iostream import VidstreamReader, VID_DEFAULT_FOLDER, convert_gray
+from ..util.matrixnms import MatrixNMS
+from ..util.stimulus import SyntheticFrameReader
+
+try:
+    import resource
+except ImportError:   # Windows
+    resource = None
+
+
+BENCHMARK_VERSION = 1
+DEFAULT_SHAPES = ((120, 160), (240, 320))
+NMS_METHODS = ('sort', 'conv2', 'greedy', 'bubble')
+# Relative change of a metric that counts as a regression, and the direction in which it is worse
+REGRESSION_METRICS = {'fps': -1, 'p50': 1, 'p90': 1, 'peakRss': 1}
+
+
+def create_synthetic_frames(shape, numFrames, seed=0, numTargets=3):
+    """
+    Returns deterministic gray frames in [0, 1]: small dark targets moving over
+    a cluttered background, see SyntheticFrameReader.
+    """
+    # about one pixel per frame
+    objIptStream = SyntheticFrameReader({'shape': shape, 'fps': 250, 'numTargets': numTargets, 'seed': seed})
+    return convert_gray(objIptStream.render_frames(np.arange(numFrames)))
+
+
+def read_clip_frames(vidName, numFrames, startFrame=0):
+    """
+    Returns the first numFrames gray frames of a clip.
+    """
+    objIptStream = VidstreamReader(vidName, startFrame, startFrame + numFrames)
+    frames = []
+    while objIptStream.hasFrame:
+        grayImg, _ = objIptStream.get_next_frame()
+        frames.append(grayImg)
+    return np.array(frames)
+
+
+def get_peak_rss():
+    """
+    Returns the peak resident set size of the process in bytes, None when unknown.
+    """
+    if resource is None:
+        return None
+    peakRss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peakRss if sys.platform == 'darwin' else peakRss * 1024
+
+
+def get_latency_stats(latencies):
+    """
+    Returns the frames/s and latency percentiles (ms) of per-frame latencies (s).
+    """
+    latencies = np.asarray(latencies) * 1e3
+    p50, p90, p99 = np.percentile(latencies, [50, 90, 99])
+    return {'numFrames': int(latencies.size),
+            'fps': float(1e3 * latencies.size / latencies.sum()),
+            'mean': float(latencies.mean()),
+            'p50': float(p50),
+            'p90': float(p90),
+            'p99': float(p99),
+            'max': float(latencies.max())}
+
+
+def benchmark_model(modelName, inputSpec, numFrames=20, numWarmUp=None, device='cpu', dtype=None):
+    """
+    Times a model on an input, frame by frame.
+
+    The model first runs numWarmUp frames, by default until its history buffers
+    are full, since partly empty buffers skip work. Then numFrames frames are timed.
+
+    Parameters:
+        - modelName: Name of the model.
+        - inputSpec: ('synthetic', (height, width)) or ('clip', vidName).
+        - numFrames, numWarmUp, device, dtype: see above and inference_task.
+
+    Returns:
+        - dict with fps, mean, p50, p90, p99 and max latency (ms), warm-up frames,
+          input shape and the peak RSS of the process (bytes).
+    """
+    objModel = instancing_model(modelName, device=device, dtype=dtype)
+    objModel.init_config()
+    if numWarmUp is None:
+        numWarmUp = max([len(value) for _, core in objModel.named_cores()
+                         for value in vars(core).values() if isinstance(value, CircularList)] + [1])
+
+    if inputSpec[0] == 'synthetic':
+        frames = create_synthetic_frames(inputSpec[1], numWarmUp + numFrames)
+    else:
+        frames = read_clip_frames(inputSpec[1], numWarmUp + numFrames)
+    if len(frames) <= numWarmUp:
+        raise ValueError(f'The input has {len(frames)} frames, not enough for {numWarmUp} warm-up frames.')
+    if dtype is not None:
+        frames = frames.astype(dtype)
+
+    latencies = []
+    for idxFrame, frame in enumerate(frames):
+        if objModel.backend == 'torch':
+            import torch
+            frame = torch.from_numpy(frame).to(device=objModel.device).float().unsqueeze(0).unsqueeze(0)
+        timeStart = time.perf_counter()
+        objModel.process(frame)
+        if idxFrame >= numWarmUp:
+            latencies.append(time.perf_counter() - timeStart)
+
+    stats = get_latency_stats(latencies)
+    stats['numWarmUp'] = numWarmUp
+    stats['shape'] = list(frames.shape[1:])
+    stats['peakRss'] = get_peak_rss()
+    return stats
+
+
+def time_function(func, numRepeat):
+    """
+    Returns the latency stats of numRepeat calls of func, after one untimed call.
+    """
+    func()
+    latencies = []
+    for _ in range(numRepeat):
+        timeStart = time.perf_counter()
+        func()
+        latencies.append(time.perf_counter() - timeStart)
+    return get_latency_stats(latencies)
+
+
+def benchmark_primitives(shape=(240, 320), numRepeat=20, seed=0):
+    """
+    Microbenchmarks of the primitives the models are built from.
+
+    Returns:
+        - dict {name: latency stats}, see get_latency_stats.
+    """
+    rng = np.random.default_rng(seed)
+    frame = rng.random(shape)
+    results = {}
+
+    # GammaDelay with a full history
+    hGammaDelay = GammaDelay(6, 12)
+    hGammaDelay.init_config()
+    for _ in range(hGammaDelay.lenKernel):
+        hGammaDelay.process(rng.random(shape))
+    results['GammaDelay'] = time_function(lambda: hGammaDelay.process(frame), numRepeat)
+
+    hSubInhi = SurroundInhibition()
+    hSubInhi.init_config()
+    results['SurroundInhibition'] = time_function(lambda: hSubInhi.process(frame), numRepeat)
+
+    # a sparse response map, as after the lobula
+    response = np.where(rng.random(shape) > 0.99, rng.random(shape), 0)
+    for method in NMS_METHODS:
+        hNMS = MatrixNMS(5, method)
+        results[f'MatrixNMS.{method}'] = time_function(lambda: hNMS.nms(response), numRepeat)
+
+    directional = rng.random((8,) + tuple(shape))
+    results['compute_direction'] = time_function(lambda: compute_direction(directional), numRepeat)
+    return results
+
+
+def get_model_names():
+    """
+    Returns the registered models, see model.__all__.
+    """
+    return list(model.__all__)
+
+
+def get_environment():
+    """
+    Returns the versions and host the benchmark ran on.
+    """
+    import scipy
+    import torch
+    return {'python': platform.python_version(),
+            'numpy': np.__version__,
+            'opencv': cv2.__version__,
+            'scipy': scipy.__version__,
+            'torch': torch.__version__,
+            'platform': platform.platform(),
+            'processor': platform.processor(),
+            'cpuCount': os.cpu_count(),
+            'time': datetime.datetime.now().isoformat(timespec='seconds')}
+
+
+def run_benchmark(modelNames=None,
+                  shapes=DEFAULT_SHAPES,
+                  clips=None,
+                  numFrames=20,
+                  numWarmUp=None,
+                  device='cpu',
+                  dtype=None,
+                  withPrimitives=True,
+                  isolate=True,
+                  outputName=None,
+                  baselineName=None,
+                  tolerance=0.1):
+    """
+    Runs the benchmark suite and returns its results.
+
+    Every model runs on deterministic synthetic frames at every shape and on the
+    clips; each case runs in a fresh worker process (isolate), so the peak RSS is
+    the one of the case. A model that cannot run reports its error instead.
+
+    Parameters:
+        - modelNames: Models to run, defaults to every model of model.__all__.
+        - shapes: (height, width) of the synthetic inputs.
+        - clips: Videos to run on, defaults to the .mp4 clips of demodata.
+        - numFrames, numWarmUp, device, dtype: see benchmark_model.
+        - withPrimitives: Whether to run the primitive microbenchmarks.
+        - isolate: Whether to run each case in its own process.
+        - outputName: JSON file to save the results to (optional).
+        - baselineName: JSON file of a previous run to compare to (optional).
+        - tolerance: Relative change of fps, p50, p90 or peakRss flagged as a regression.
+
+    Returns:
+        - dict {'version', 'environment', 'config', 'models': {case: stats},
+          'primitives': {name: stats}, 'regressions': [...]}
+          Cases are named '<model>/synthetic-<height>x<width>' and '<model>/<clip name>'.
+    """
+    logger = logging.getLogger(__name__)
+    if modelNames is None:
+        modelNames = get_model_names()
+    if clips is None:
+        clips = sorted(glob.glob(os.path.join(VID_DEFAULT_FOLDER, '*.mp4')))
+
+    inputSpecs = {f'synthetic-{height}x{width}': ('synthetic', (height, width)) for height, width in shapes}
+    inputSpecs.update({os.path.basename(clip): ('clip', clip) for clip in clips})
+
+    results = {'version': BENCHMARK_VERSION,
+               'environment': get_environment(),
+               'config': {'numFrames': numFrames, 'numWarmUp': numWarmUp, 'device': device,
+                          'dtype': None if dtype is None else np.dtype(dtype).name},
+               'models': {},
+               'primitives': {}}
+
+    for modelName in modelNames:
+        for inputName, inputSpec in inputSpecs.items():
+            caseName = f'{modelName}/{inputName}'
+            try:
+                if isolate:
+                    with ProcessPoolExecutor(max_workers=1) as executor:
+                        stats = executor.submit(benchmark_model, modelName, inputSpec, numFrames,
+                                                numWarmUp, device, dtype).result()
+                else:
+                    stats = benchmark_model(modelName, inputSpec, numFrames, numWarmUp, device, dtype)
+            except Exception as error:
+                stats = {'error': f'{type(error).__name__}: {error}'}
+            results['models'][caseName] = stats
+            if 'error' in stats:
+                logger.info(f'{caseName}: {stats["error"]}')
+            else:
+                logger.info(f'{caseName}: {stats["fps"]:.2f} frames/s, p50 {stats["p50"]:.1f} ms')
+
+    if withPrimitives:
+        for shape in shapes:
+            for name, stats in benchmark_primitives(shape).items():
+                results['primitives'][f'{name}/{shape[0]}x{shape[1]}'] = stats
+
+    results['regressions'] = []
+    if baselineName is not None:
+        with open(baselineName) as hFile:
+            results['regressions'] = compare_to_baseline(results, json.load(hFile), tolerance)
+        for regression in results['regressions']:
+            logger.warning(f'Regression of {regression["case"]} {regression["metric"]}: '
+                           f'{regression["baseline"]:.4g} -> {regression["value"]:.4g} '
+                           f'({100 * regression["change"]:+.1f}%)')
+
+    if outputName is not None:
+        with open(outputName, 'w') as hFile:
+            json.dump(results, hFile, indent=2)
+    return results
+
+
+def compare_to_baseline(results, baseline, tolerance=0.1):
+    """
+    Compares benchmark results to a baseline run.
+
+    Returns:
+        - list of {'case', 'metric', 'baseline', 'value', 'change'} for every case
+          present in both runs whose fps dropped, or whose latency or peak RSS grew,
+          by more than tolerance (relative).
+    """
+    regressions = []
+    for group in ('models', 'primitives'):
+        for caseName, stats in results.get(group, {}).items():
+            baseStats = baseline.get(group, {}).get(caseName)
+            if baseStats is None or 'error' in stats or 'error' in baseStats:
+                continue
+            for metric, sign in REGRESSION_METRICS.items():
+                value, baseValue = stats.get(metric), baseStats.get(metric)
+                if not value or not baseValue:
+                    continue
+                change = value / baseValue - 1
+                if sign * change > tolerance:
+                    regressions.append({'case': f'{group}/{caseName}', 'metric': metric,
+                                        'baseline': baseValue, 'value': value, 'change': change})
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Headless benchmark of the models and their primitives.')
+    parser.add_argument('--models', nargs='*', default=None, help='model names, default: model.__all__')
+    parser.add_argument('--shapes', nargs='*', default=None,
+                        help='synthetic input shapes as HEIGHTxWIDTH, default: 120x160 240x320')
+    parser.add_argument('--clips', nargs='*', default=None, help='videos, default: the demodata clips')
+    parser.add_argument('--frames', type=int, default=20, help='timed frames per case')
+    parser.add_argument('--warm-up', type=int, default=None, help='warm-up frames, default: fill the buffers')
+    parser.add_argument('--device', default='cpu', help="'cpu', 'torch-cpu' or 'cuda[:index]'")
+    parser.add_argument('--float32', action='store_true', help='run the NumPy backend in float32')
+    parser.add_argument('--no-primitives', action='store_true')
+    parser.add_argument('--output', default=None, help='JSON file of the results')
+    parser.add_argument('--baseline', default=None, help='JSON file of a previous run')
+    parser.add_argument('--tolerance', type=float, default=0.1)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    shapes = DEFAULT_SHAPES if args.shapes is None else \
+        [tuple(int(size) for size in shape.split('x')) for shape in args.shapes]
+    # run from the imported module, the worker processes cannot unpickle functions of __main__
+    hBenchmark = importlib.import_module(__spec__.name)
+    results = hBenchmark.run_benchmark(args.models, shapes, args.clips, args.frames, args.warm_up, args.device,
+                            np.float32 if args.float32 else None, not args.no_primitives,
+                            outputName=args.output, baselineName=args.baseline, tolerance=args.tolerance)
+    sys.exit(1 if results['regressions'] else 0)
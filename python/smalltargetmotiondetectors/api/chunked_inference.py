@@ -0,0 +1,204 @@
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from . import instancing_model
+from .evaluate import create_input_stream, postprocess_output
+from ..util.matrixnms import MatrixNMS
+
+
+def get_temporal_receptive_field(modelName, tolerance=1e-6, device='cpu', **kwargs):
+    ''' Returns the temporal receptive field of a model, see BaseModel.get_temporal_receptive_field. '''
+    objModel = instancing_model(modelName, device=device)
+    objModel.set_para(**kwargs)
+    objModel.init_config()
+    return objModel.get_temporal_receptive_field(tolerance)
+
+
+def count_frames(objIptStream):
+    ''' Returns the number of frames left in a freshly opened reader. '''
+    if hasattr(objIptStream, 'fileList'):
+        # ImgstreamReader, fileList is cut to the selected frames
+        return len(objIptStream.fileList) if objIptStream.hasFrame else 0
+    elif hasattr(objIptStream, 'endIdx'):
+        # CachedFrameReader
+        return objIptStream.endIdx - objIptStream.startIdx
+    else:
+        # VidstreamReader
+        return max(objIptStream.endFrame - objIptStream.startFrame, 0) if objIptStream.hasFrame else 0
+
+
+def run_chunk(modelName, inputpath, inputType, readStart, chunkStart, chunkEnd,
+              device='cpu', dtype=None, useFrameCache=True, paraDict=None):
+    '''
+    Runs the model on the frames [readStart, chunkEnd) and keeps the outputs of [chunkStart, chunkEnd).
+
+    The frames before chunkStart are the warm-up of the model, their outputs are dropped.
+    Runs in a worker process, so all arguments are picklable.
+
+    Returns:
+        - results, directions: Outputs of the chunk, as inference_task.
+        - totalRunningTime: Running time of the model, warm-up included.
+        - warmUpResponse: Raw response of the last warm-up frame, None without warm-up.
+        - lastResponse: Raw response of the last frame of the chunk.
+    '''
+    objModel = instancing_model(modelName, device=device, dtype=dtype)
+    objIptStream = create_input_stream(inputpath, inputType, readStart, chunkEnd,
+                                       device=device, dtype=dtype, useFrameCache=useFrameCache)
+    objNMS = MatrixNMS(15)
+
+    objModel.set_para(**(paraDict or {}))
+    objModel.init_config()
+
+    numWarmUp = chunkStart - readStart
+    totalRunningTime = 0
+    results = []
+    directions = []
+    warmUpResponse = None
+    response = None
+    idxFrame = 0
+    if objModel.backend == 'torch':
+        import torch
+    while objIptStream.hasFrame:
+        grayImg, _ = objIptStream.get_next_frame()
+        if objModel.backend == 'torch':
+            grayImg = torch.from_numpy(grayImg).to(device=objModel.device).float().unsqueeze(0).unsqueeze(0)
+
+        result, runTime = objModel.process(grayImg)
+        totalRunningTime += runTime
+
+        response = result['response']
+        if objModel.backend == 'torch':
+            response = response.squeeze(0).squeeze(0).cpu().numpy()
+        if idxFrame < numWarmUp:
+            if idxFrame == numWarmUp - 1:
+                warmUpResponse = np.array(response, copy=True)
+        else:
+            responseListType, directionListType = postprocess_output(result, objNMS, objModel.device)
+            results.append(responseListType)
+            directions.append(directionListType)
+        idxFrame += 1
+
+    lastResponse = None if response is None else np.array(response, copy=True)
+    return results, directions, totalRunningTime, warmUpResponse, lastResponse
+
+
+def chunked_inference_task(modelName,
+                           inputpath,
+                           inputType = 'VidstreamReader',
+                           startFrame = 0,
+                           endFrame = None,
+                           numChunks = None,
+                           numWorkers = None,
+                           device = 'cpu',
+                           dtype = None,
+                           useFrameCache = True,
+                           warmUp = None,
+                           tolerance = 1e-6,
+                           returnReport = False,
+                           **kwargs):
+    '''
+    Runs inference_task on a long input in parallel chunks.
+
+    The frames [startFrame, endFrame) are split into numChunks consecutive chunks,
+    which run in a process pool. Every chunk is pre-rolled by the warm-up length of the
+    model (see BaseModel.get_temporal_receptive_field), then the outputs are stitched
+    in order.
+
+    For a model made of FIR cores only (ESTMD, DSTMD, HaarSTMD, ...), the stitched
+    outputs are identical to those of inference_task. For a model with recursive cores,
+    the state carried over from before the pre-roll is lost at each chunk boundary:
+        - with a known decay rate (FracSTMD), the relative error of the recursive state
+          at the first frame of a chunk is below the reported errorBound (<= tolerance);
+        - otherwise (feedback and facilitated models), no bound is known. The error is
+          measured at each boundary: the previous chunk and the pre-roll of the next one
+          both compute the frame before the boundary, boundaryErrors holds the maximum
+          absolute difference of both responses relative to the maximum response. Since
+          the pre-roll is one frame shorter there, this over-estimates the error of the
+          first frame of the chunk.
+    Increase warmUp when the measured error is too large.
+
+    Parameters:
+        - modelName, inputpath, inputType, startFrame, endFrame, device, dtype,
+          useFrameCache, **kwargs: see inference_task.
+        - numChunks: Number of chunks, defaults to numWorkers.
+        - numWorkers: Number of worker processes, defaults to os.cpu_count().
+        - warmUp: Number of pre-roll frames, defaults to the warm-up of the model.
+        - tolerance: Tolerance of the warm-up of recursive models.
+        - returnReport: Whether to also return the report of the run.
+
+    Returns:
+        - results, directions, totalRunningTime: as inference_task, the running time
+          is summed over the chunks (warm-up included).
+        - report (with returnReport): dict with the receptive field of the model
+          (memory, recursiveCores, warmUp, isExact, errorBound), the chunks as
+          (readStart, chunkStart, chunkEnd) and the measured boundaryErrors.
+    '''
+    logger = logging.getLogger(__name__)
+
+    # receptive field of the model with the given parameters
+    receptiveField = get_temporal_receptive_field(modelName, tolerance, **kwargs)
+    if warmUp is None:
+        warmUp = receptiveField['warmUp']
+    elif warmUp < receptiveField['memory']:
+        logger.warning(f'warmUp={warmUp} is shorter than the memory of {modelName} '
+                       f'({receptiveField["memory"]} frames), the outputs will differ from a serial run.')
+
+    # frames to process
+    objIptStream = create_input_stream(inputpath, inputType, startFrame, endFrame,
+                                       device=device, dtype=dtype, useFrameCache=useFrameCache)
+    numFrames = count_frames(objIptStream)
+    del objIptStream
+
+    if numWorkers is None:
+        numWorkers = os.cpu_count() or 1
+    if numChunks is None:
+        numChunks = numWorkers
+    numChunks = max(1, min(numChunks, numFrames))
+
+    # chunks as (readStart, chunkStart, chunkEnd), the last one keeps the given endFrame
+    bounds = np.linspace(0, numFrames, numChunks + 1).astype(int)
+    chunks = []
+    for idx in range(numChunks):
+        chunkStart = startFrame + int(bounds[idx])
+        chunkEnd = startFrame + int(bounds[idx + 1]) if idx < numChunks - 1 else endFrame
+        readStart = max(startFrame, chunkStart - warmUp)
+        chunks.append((readStart, chunkStart, chunkEnd))
+
+    with ProcessPoolExecutor(max_workers=min(numWorkers, numChunks)) as executor:
+        futures = [executor.submit(run_chunk, modelName, inputpath, inputType,
+                                   readStart, chunkStart, chunkEnd,
+                                   device, dtype, useFrameCache, kwargs)
+                   for readStart, chunkStart, chunkEnd in chunks]
+        chunkOutputs = [future.result() for future in futures]
+
+    # stitch
+    results = []
+    directions = []
+    totalRunningTime = 0
+    boundaryErrors = []
+    for idx, (chunkResults, chunkDirections, runTime, warmUpResponse, _) in enumerate(chunkOutputs):
+        results.extend(chunkResults)
+        directions.extend(chunkDirections)
+        totalRunningTime += runTime
+
+        if idx > 0 and warmUpResponse is not None:
+            lastResponse = chunkOutputs[idx - 1][4]
+            maxResponse = np.max(np.abs(lastResponse))
+            error = np.max(np.abs(lastResponse - warmUpResponse))
+            boundaryErrors.append(float(error / maxResponse) if maxResponse > 0 else float(error))
+
+    if not receptiveField['isExact'] and boundaryErrors:
+        logger.info(f'{modelName}: maximum relative boundary error {max(boundaryErrors):.3g} '
+                    f'with a warm-up of {warmUp} frames.')
+
+    if returnReport:
+        report = dict(receptiveField)
+        report['warmUp'] = warmUp
+        report['isExact'] = receptiveField['isExact'] and warmUp >= receptiveField['memory']
+        report['chunks'] = chunks
+        report['boundaryErrors'] = boundaryErrors
+        return results, directions, totalRunningTime, report
+    return results, directions, totalRunningTime
@@ -0,0 +1,122 @@
+import logging
+
+import numpy as np
+
+from . import instancing_model
+from .. import model
+from ..util.iostream import VidstreamReader, VID_DEFAULT_FOLDER
+from ..util.datarecord import CircularList
+
+
+logger = logging.getLogger(__name__)
+
+
+def dtype_equivalence_report(modelNames=None,
+                             inputpath=None,
+                             startFrame=0,
+                             numFrames=60,
+                             dtype=np.float32,
+                             printReport=True):
+    """
+    Compares every model run at `dtype` (uint8 ingest) against the float64 reference.
+
+    Both instances see the same frames: the reference gets the usual float64
+    frames in [0, 1], the reduced-precision instance gets the raw uint8 frames
+    and normalizes them in its retina.
+
+    Parameters:
+        modelNames (list): Names of the models to compare. Defaults to all available models.
+        inputpath (str): Path of the input video. Defaults to the RIST demo clip.
+        startFrame (int): First frame of the video.
+        numFrames (int): Number of frames fed to each model.
+        dtype: Reduced precision dtype to check, np.float32 by default.
+        printReport (bool): Whether to log the report as a table.
+
+    Returns:
+        report (dict): For each model name, a dict with
+            - 'maxAbsError': Max absolute difference of the response over all frames.
+            - 'maxRelError': maxAbsError divided by the max absolute reference response.
+            - 'peakAgreement': Fraction of frames whose response argmax is at the same pixel.
+            - 'outputDtype': dtype of the reduced-precision response.
+            - 'bufferDtypes': Set of dtypes found in the history buffers after the run.
+            - 'speedup': Reference running time divided by the reduced-precision one.
+            or {'error': message} when the model could not be run.
+    """
+    if modelNames is None:
+        modelNames = [name for name in model.__all__ if not name.startswith('vSTMD')]
+    if inputpath is None:
+        inputpath = f'{VID_DEFAULT_FOLDER}/RIST_GX010290_compressed2_60Hz.mp4'
+
+    # decode once, the same frames are fed to every model
+    objIptStream = VidstreamReader(inputpath, startFrame, startFrame + numFrames, dtype=np.uint8)
+    rawFrames = []
+    while objIptStream.hasFrame:
+        grayImg, _ = objIptStream.get_next_frame()
+        rawFrames.append(grayImg)
+    refFrames = [frame.astype(np.float64) / 255 for frame in rawFrames]
+
+    report = {}
+    for modelName in modelNames:
+        try:
+            report[modelName] = _compare_model(modelName, refFrames, rawFrames, dtype)
+        except Exception as error:
+            report[modelName] = {'error': repr(error)}
+
+    if printReport:
+        msg = f'float64 vs {np.dtype(dtype).name} over {len(rawFrames)} frames:\n'
+        msg += f'  {"model":16} {"maxAbsError":>12} {"maxRelError":>12} {"peakAgree":>10} {"speedup":>8}\n'
+        for modelName, item in report.items():
+            if 'error' in item:
+                msg += f'  {modelName:16} {item["error"]}\n'
+            else:
+                msg += f'  {modelName:16} {item["maxAbsError"]:12.3e} {item["maxRelError"]:12.3e}' \
+                       f' {item["peakAgreement"]:10.3f} {item["speedup"]:8.2f}\n'
+        logger.info(msg)
+
+    return report
+
+
+def _compare_model(modelName, refFrames, rawFrames, dtype):
+    objRef = instancing_model(modelName)
+    objTest = instancing_model(modelName, dtype=dtype)
+    objRef.init_config()
+    objTest.init_config()
+
+    maxAbsError = 0.
+    maxRefResponse = 0.
+    numAgree = 0
+    numCompared = 0
+    timeRef = 0.
+    timeTest = 0.
+    outputDtype = None
+    for refFrame, rawFrame in zip(refFrames, rawFrames):
+        refOpt, runTime = objRef.process(refFrame)
+        refResponse = np.asarray(refOpt['response'], dtype=np.float64)
+        timeRef += runTime
+        testOpt, runTime = objTest.process(rawFrame)
+        outputDtype = np.asarray(testOpt['response']).dtype
+        testResponse = np.asarray(testOpt['response'], dtype=np.float64)
+        timeTest += runTime
+
+        if refResponse.size == 0 or testResponse.size == 0:
+            continue
+        maxAbsError = max(maxAbsError, float(np.nanmax(np.abs(refResponse - testResponse))))
+        maxRefResponse = max(maxRefResponse, float(np.nanmax(np.abs(refResponse))))
+        if np.nanmax(refResponse) > 0:
+            numCompared += 1
+            numAgree += np.nanargmax(refResponse) == np.nanargmax(testResponse)
+
+    bufferDtypes = set()
+    for _, core in objTest.named_cores():
+        for value in vars(core).values():
+            if isinstance(value, CircularList):
+                bufferDtypes.update(str(item.dtype) for item in value if isinstance(item, np.ndarray))
+
+    return {
+        'maxAbsError': maxAbsError,
+        'maxRelError': maxAbsError / maxRefResponse if maxRefResponse > 0 else 0.,
+        'peakAgreement': float(numAgree / numCompared) if numCompared else 1.,
+        'outputDtype': str(outputDtype),
+        'bufferDtypes': bufferDtypes,
+        'speedup': timeRef / timeTest if timeTest > 0 else float('nan'),
+    }
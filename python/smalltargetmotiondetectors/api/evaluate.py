@@ -1,37 +1,112 @@
 # demo_vidstream
-import matplotlib.pyplot as plt
 import numpy as np
+import os
 import time
-import torch
 
 from . import instancing_model
-from ..model import *
-from ..util.iostream import (ImgstreamReader, VidstreamReader)
+from ..util.iostream import (ImgstreamReader, ParallelImgstreamReader, VidstreamReader)
+from ..util.frame_cache import CachedFrameReader, find_frame_cache
+from ..util.stimulus import SyntheticFrameReader
+from ..util.detection_log import DetectionLog, DetectionLogWriter, repair_log
 from ..util.evaluate_module import (get_ROC_curve_data, compute_AUC, 
                                     get_thres_recall_data, compute_AR,
                                     get_P_R_curve_data, compute_AP, )
+from ..core.base_core import parse_device
 from ..util.matrixnms import MatrixNMS
 from ..util.compute_module import matrix_to_sparse_list
 
 
+def create_input_stream(inputpath, 
+                        inputType = 'ImgstreamReader', 
+                        startFrame = 0, 
+                        endFrame = None, 
+                        device = 'cpu',
+                        dtype = None,
+                        useFrameCache = True):
+    ''' Creates the reader of the input, a decoded-frame cache of the input is used when found. '''
+    inputModule = globals().get(inputType)
+    if inputModule is None:
+        raise ValueError(f"Unknown inputType: {inputType}")
+    # a decoded-frame cache of the input (see util/frame_cache.py) replaces the decoder
+    cacheName = find_frame_cache(inputpath, inputType=inputType) \
+        if useFrameCache and inputModule is not SyntheticFrameReader else None
+    if cacheName is not None:
+        inputpath = cacheName
+        inputModule = CachedFrameReader
+
+    if dtype is not None and parse_device(device)[0] == 'numpy':
+        # raw uint8 frames, the retina of the model normalizes them to dtype
+        return inputModule(inputpath, startFrame, endFrame, dtype=np.uint8)
+    else:
+        return inputModule(inputpath, startFrame, endFrame)
+
+
+def has_direction(result):
+    ''' Whether a model output has a direction map, the models without direction leave it empty. '''
+    direction = result.get('direction')
+    return direction is not None and len(direction) > 0
+
+
+def postprocess_output(result, objNMS, device = 'cpu'):
+    ''' Converts a model output to the sparse response and direction lists of a frame. '''
+    if type(result['response']).__module__ == 'torch':
+        if str(device).startswith('cuda'):
+            import torch
+            torch.cuda.synchronize()
+        result = {k: v.squeeze(0).squeeze(0).cpu().numpy() if type(v).__module__ == 'torch' else v
+                  for k, v in result.items()}
+    # response
+    response = result['response']
+    if np.max(response) == 0:
+        return [], []
+    response = objNMS.nms(result['response'])
+    maxOpt = np.max(response)
+    if maxOpt > 0:
+        response /= np.max(response)
+        responseListType = matrix_to_sparse_list(response.astype(np.float64))
+    else:
+        responseListType = []
+
+    # direction
+    direction  = result['direction']
+    if has_direction(result) and len(responseListType):
+        directionListType = [[y, x, float(direction[x, y])] for y, x, _ in responseListType]
+    else:
+        directionListType = []
+
+    return responseListType, directionListType
+
+
 def inference_task(modelName, 
                    inputpath, 
                    inputType = 'ImgstreamReader', 
                    startFrame = 0, 
                    endFrame = None, 
                    device = 'cpu',
+                   dtype = None,
+                   useFrameCache = True,
+                   checkpointName = None,
+                   checkpointInterval = 1000,
                    **kwargs):
-    ''' Instantiate the model '''
-    objModel = instancing_model(modelName, device=device)
-
-    ''' Dynamically create a video stream reader or other input type '''
-    inputModule = globals().get(inputType)
-    if inputModule is None:
-        raise ValueError(f"Unknown inputType: {inputType}")
+    '''
+    Runs a model on an input and returns its sparse outputs.
 
-    objIptStream = inputModule(inputpath, startFrame, endFrame)
+    With checkpointName, the model state is saved to this .npz file every
+    checkpointInterval frames and at the last frame (see BaseModel.save_state),
+    and the outputs are appended to a detection log next to it, named after it
+    with the .stmdlog extension (see util/detection_log.py). When the file
+    already exists, the run resumes from it instead of starting over: the log is
+    cut back to the checkpoint frame and the run goes on from there. It must come
+    from the same model, parameters, input and startFrame. A finished run is
+    resumed as well when endFrame is extended.
 
-    objNMS = MatrixNMS(15)
+    Returns:
+        - results: Sparse responses of the frames.
+        - directions: Sparse directions of the frames.
+        - totalRunningTime: Running time of the model.
+    '''
+    ''' Instantiate the model '''
+    objModel = instancing_model(modelName, device=device, dtype=dtype)
 
     ''' Initialize the model '''
     # set the parameter list
@@ -42,48 +117,81 @@ def inference_task(modelName,
     totalRunningTime = 0
     results = []
     directions = []
+    frameIdx = startFrame
+    outputLog = None
+    ''' Resume from a checkpoint '''
+    if checkpointName is not None:
+        outputLogName = get_checkpoint_log_name(checkpointName)
+        if os.path.exists(checkpointName):
+            header = objModel.load_state(checkpointName)
+            if header.get('inputpath') != os.path.abspath(inputpath) or header.get('startFrame') != startFrame:
+                raise ValueError(f'The checkpoint {checkpointName} belongs to another input '
+                                 f'({header.get("inputpath")}, startFrame={header.get("startFrame")}).')
+            frameIdx = header['frameIdx']
+            totalRunningTime = header['totalRunningTime']
+            # the outputs written after the checkpoint are produced again
+            numFrames = frameIdx - startFrame
+            if not os.path.exists(outputLogName) or repair_log(outputLogName, numFrames)[0] != numFrames:
+                raise ValueError(f'The outputs of the checkpoint {checkpointName} are missing from {outputLogName}.')
+            results, directions = DetectionLog(outputLogName).to_lists()
+            if header['isFinished'] and header['endFrame'] == endFrame:
+                return results, directions, totalRunningTime
+            outputLog = DetectionLogWriter(outputLogName, mode='a', chunkSize=checkpointInterval)
+        else:
+            outputLog = DetectionLogWriter(outputLogName, chunkSize=checkpointInterval, modelName=modelName,
+                                           inputpath=os.path.abspath(inputpath), startFrame=startFrame)
+
+    ''' Dynamically create a video stream reader or other input type '''
+    objIptStream = create_input_stream(inputpath, inputType, frameIdx, endFrame, 
+                                       device=device, dtype=dtype, useFrameCache=useFrameCache)
+
+    objNMS = MatrixNMS(15)
+
     ''' Run '''
+    if objModel.backend == 'torch':
+        import torch
     while objIptStream.hasFrame:
         # Read the next frame from the video stream
         grayImg, _ = objIptStream.get_next_frame()
-        if device != 'cpu':
-            grayImg = torch.from_numpy(grayImg).to(device=device).float().unsqueeze(0).unsqueeze(0)
+        if objModel.backend == 'torch':
+            grayImg = torch.from_numpy(grayImg).to(device=objModel.device).float().unsqueeze(0).unsqueeze(0)
         
         # Perform inference using the model
         result, runTime = objModel.process(grayImg)
         totalRunningTime += runTime
 
         # postprocessing
-        if device != 'cpu':
-            torch.cuda.synchronize()
-            result = {k: v.squeeze(0).squeeze(0).cpu().numpy() for k, v in result.items()}
-        # response
-        response = result['response']
-        if np.max(response) == 0:
-            results.append([])
-            continue
-        response = objNMS.nms(result['response'])
-        maxOpt = np.max(response)
-        if maxOpt > 0:
-            response /= np.max(response)
-            responseListType = matrix_to_sparse_list(response.astype(np.float64))
-        else:
-            responseListType = []
-        results.append(responseListType)          
-
-        # direction
-        direction  = result['direction']
-        if (direction is not None) and len(direction) and len(responseListType):
-            directionListType = [[y, x, float(direction[x, y])] for y, x, _ in responseListType]
-        else:
-            directionListType = []
+        responseListType, directionListType = postprocess_output(result, objNMS, objModel.device)
+        results.append(responseListType)
         directions.append(directionListType)
+        frameIdx += 1
+
+        if outputLog is not None:
+            outputLog.append(frameIdx - 1, responseListType, directionListType)
+            # checkpoint, also at the last frame to reuse the final state
+            if len(results) % checkpointInterval == 0 or not objIptStream.hasFrame:
+                # the outputs first, a checkpoint never runs ahead of its log
+                outputLog.flush()
+                objModel.save_state(checkpointName, frameIdx, 
+                                    inputpath=os.path.abspath(inputpath), 
+                                    startFrame=startFrame, endFrame=endFrame,
+                                    isFinished=not objIptStream.hasFrame,
+                                    totalRunningTime=totalRunningTime)
+
+    if outputLog is not None:
+        outputLog.close()
 
     return results, directions, totalRunningTime
 
 
+def get_checkpoint_log_name(checkpointName):
+    ''' Returns the detection log holding the outputs of a checkpoint of inference_task. '''
+    return os.path.splitext(checkpointName)[0] + '.stmdlog'
+
+
 def evaluate_task(modelOpt, groundTruth, aucPara = 40, gTError = 1, startFrame = 0, endFrame = None, plotFigures=True):
-    
+    if plotFigures:
+        import matplotlib.pyplot as plt
 
     ''' ROC curve Part'''
     # get ROC data
@@ -0,0 +1,211 @@
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+from collections import deque
+
+import numpy as np
+
+from .inference_server import encode_message
+from .stream_inference import DetectionRecord
+from ..util.shared_frames import FrameRing
+
+
+class ClientStream:
+    ''' Ring and slots in flight of a stream of InferenceClient. '''
+
+    def __init__(self, ring):
+        self.ring = ring
+        self.freeSlots = deque(range(ring.numSlots))
+        self.inFlight = deque()     # request ids, oldest first
+        self.numFrames = 0
+
+
+class InferenceClient:
+    '''
+    Client of an InferenceServer.
+
+    Each stream opened by the client has a FrameRing of numSlots frames: `submit`
+    writes a frame into a free slot and sends its slot number, up to numSlots
+    frames of a stream are in flight, and `get_record` waits for the record of a
+    frame. `process` does both. When every slot of a stream is in flight,
+    `submit` first waits for the oldest frame of the stream.
+
+    Example:
+        with InferenceClient('/tmp/stmd.sock') as client:
+            client.open_stream('cam0', 'DSTMD', (480, 640))
+            for frame in frames:
+                record = client.process('cam0', frame)
+    '''
+
+    def __init__(self, socketPath, timeout=None):
+        '''
+        Parameters:
+            - socketPath: Path of the Unix domain socket of the server.
+            - timeout: Timeout (s) of the socket operations, None waits forever.
+        '''
+        self.hSocket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.hSocket.settimeout(timeout)
+        try:
+            self.hSocket.connect(socketPath)
+        except OSError:
+            self.hSocket.close()
+            raise
+        self.hFile = self.hSocket.makefile('rb')
+        self.streams = {}
+        self.replies = {}       # replies received while waiting for another one
+        self.slotOfRequest = {}
+        self.nextId = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def send(self, message):
+        ''' Sends a request and returns its id. '''
+        requestId = self.nextId
+        self.nextId += 1
+        self.hSocket.sendall(encode_message(dict(message, id=requestId)))
+        return requestId
+
+    def receive(self, requestId):
+        ''' Reads the replies until the one of a request has arrived. '''
+        while requestId not in self.replies:
+            line = self.hFile.readline()
+            if not line:
+                raise ConnectionError('The inference server closed the connection.')
+            reply = json.loads(line)
+            self.replies[reply.get('id')] = reply
+            # the slot of a frame is free once its frame is answered
+            if reply.get('id') in self.slotOfRequest:
+                streamId, slot = self.slotOfRequest.pop(reply['id'])
+                if streamId in self.streams:
+                    self.streams[streamId].freeSlots.append(slot)
+
+    def wait_reply(self, requestId):
+        ''' Waits for the reply of a request, raises RuntimeError when the server failed. '''
+        self.receive(requestId)
+        reply = self.replies.pop(requestId)
+        if not reply['ok']:
+            raise RuntimeError(f'Inference server: {reply["error"]}')
+        return reply
+
+    def request(self, message):
+        return self.wait_reply(self.send(message))
+
+    def open_stream(self, streamId, model, shape, dtype=np.uint8, numSlots=4, device='cpu', modelDtype=None,
+                    **params):
+        '''
+        Opens a stream on the server.
+
+        Parameters:
+            - streamId: Id of the stream, a str or an int.
+            - model: Name of the model of the stream.
+            - shape: (height, width) of the frames.
+            - dtype: dtype of the frames, uint8 gray levels or floats in [0, 1].
+            - numSlots: Number of slots of the ring, i.e. frames in flight.
+            - device, modelDtype: device and dtype of the model (see instancing_model).
+            - **params: Model parameters, see BaseModel.set_para.
+        '''
+        if streamId in self.streams:
+            raise ValueError(f'The stream {streamId} already exists.')
+        ring = FrameRing(shape, dtype, numSlots)
+        try:
+            self.request({'op': 'open', 'stream': streamId, 'model': model, 'params': params, 'device': device,
+                          'dtype': None if modelDtype is None else np.dtype(modelDtype).name,
+                          'ring': ring.describe()})
+        except Exception:
+            ring.close()
+            raise
+        self.streams[streamId] = ClientStream(ring)
+
+    def submit(self, streamId, frame):
+        '''
+        Writes a frame into the ring of a stream and sends it, returns the id of the request.
+        '''
+        stream = self.streams[streamId]
+        if not stream.freeSlots:
+            # wait for the oldest frame not answered yet, its reply is kept for get_record
+            self.receive(next(requestId for requestId in stream.inFlight if requestId not in self.replies))
+        slot = stream.freeSlots.popleft()
+        stream.ring.frames[slot] = frame
+        requestId = self.send({'op': 'frame', 'stream': streamId, 'slot': slot, 'frameIdx': stream.numFrames})
+        self.slotOfRequest[requestId] = (streamId, slot)
+        stream.inFlight.append(requestId)
+        stream.numFrames += 1
+        return requestId
+
+    def get_record(self, requestId):
+        ''' Waits for the DetectionRecord of a submitted frame. '''
+        for stream in self.streams.values():
+            if requestId in stream.inFlight:
+                stream.inFlight.remove(requestId)
+        return DetectionRecord.from_dict(self.wait_reply(requestId)['record'])
+
+    def process(self, streamId, frame):
+        ''' Processes a frame of a stream and returns its DetectionRecord. '''
+        return self.get_record(self.submit(streamId, frame))
+
+    def close_stream(self, streamId):
+        ''' Waits for the frames in flight of a stream, then closes it. '''
+        stream = self.streams[streamId]
+        for requestId in list(stream.inFlight):
+            self.get_record(requestId)
+        self.request({'op': 'close', 'stream': streamId})
+        self.streams.pop(streamId).ring.close()
+
+    def get_health(self):
+        ''' See InferenceServer.get_health. '''
+        return self.request({'op': 'health'})
+
+    def get_stats(self):
+        ''' See InferenceServer.get_stats. '''
+        return self.request({'op': 'stats'})
+
+    def shutdown_server(self):
+        ''' Stops the server. '''
+        self.request({'op': 'shutdown'})
+
+    def close(self):
+        ''' Closes the streams of the client and the connection. '''
+        for streamId in list(self.streams):
+            try:
+                self.close_stream(streamId)
+            except (OSError, RuntimeError):
+                self.streams.pop(streamId).ring.close()
+        self.hFile.close()
+        self.hSocket.close()
+
+
+def start_server_process(socketPath, numThreads=None, maxPending=4, timeout=30):
+    '''
+    Starts an InferenceServer in a new Python process and waits until it answers.
+
+    Returns:
+        - process: subprocess.Popen of the server, stop it with
+          InferenceClient.shutdown_server.
+    '''
+    packagePath = os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [packagePath, env.get('PYTHONPATH')]))
+    command = [sys.executable, '-m', 'smalltargetmotiondetectors.api.inference_server', '--socket', socketPath,
+               '--max-pending', str(maxPending)]
+    if numThreads is not None:
+        command += ['--threads', str(numThreads)]
+    process = subprocess.Popen(command, env=env)
+
+    timeEnd = time.time() + timeout
+    while True:
+        try:
+            with InferenceClient(socketPath, timeout=timeout) as client:
+                client.get_health()
+            return process
+        except (FileNotFoundError, ConnectionRefusedError):
+            if process.poll() is not None or time.time() > timeEnd:
+                process.kill()
+                raise RuntimeError(f'The inference server did not start on {socketPath}.')
+            time.sleep(0.05)
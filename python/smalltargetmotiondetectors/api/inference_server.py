@@ -0,0 +1,224 @@
+import asyncio
+import json
+import logging
+import os
+import time
+
+from .evaluate import postprocess_output, has_direction
+from .instancing_model import instancing_model
+from .multi_stream import MultiStreamRunner
+from .stream_inference import DetectionRecord
+from ..util.matrixnms import MatrixNMS
+from ..util.shared_frames import FrameRing, convert_frame
+
+
+def encode_message(message):
+    ''' Encodes a message of the control channel, one JSON object per line. '''
+    return (json.dumps(message, allow_nan=False) + '\n').encode()
+
+
+class InferenceServer:
+    '''
+    Local inference server, one model per stream, fed through shared memory.
+
+    Clients connect to a Unix domain socket and exchange JSON lines (the control
+    channel); the frames themselves stay in the FrameRing of their stream. A
+    request is a dict with an 'op' and an optional 'id' echoed in its reply; a
+    reply has 'ok' and, when ok is false, an 'error' message:
+        - {'op': 'open', 'stream', 'model', 'params', 'device', 'dtype', 'ring': FrameRing.describe()}
+          instances the model of a new stream and attaches to its ring.
+        - {'op': 'frame', 'stream', 'slot', 'frameIdx'} processes the frame in a
+          slot, the reply has the 'record' of the frame (DetectionRecord.to_dict).
+          The frames of a stream are processed in order, those of different
+          streams on the thread pool of a MultiStreamRunner; frame requests are
+          answered when done, possibly out of order across streams.
+        - {'op': 'close', 'stream'} closes a stream, also done when the client
+          that opened it disconnects.
+        - {'op': 'health'}, {'op': 'stats'}: see get_health and get_stats.
+        - {'op': 'shutdown'} stops the server.
+
+    Example:
+        python -m smalltargetmotiondetectors.api.inference_server --socket /tmp/stmd.sock
+    '''
+
+    def __init__(self, socketPath, numThreads=None, maxPending=4):
+        '''
+        Parameters:
+            - socketPath: Path of the Unix domain socket.
+            - numThreads, maxPending: See MultiStreamRunner.
+        '''
+        self.socketPath = socketPath
+        self.runner = MultiStreamRunner(numThreads=numThreads, maxPending=maxPending)
+        self.rings = {}
+        self.openTimes = {}
+        self.numErrors = 0
+        self.startTime = None
+        self.shutdownEvent = None
+
+    def run(self):
+        ''' Serves until a shutdown request. '''
+        asyncio.run(self.serve())
+
+    async def serve(self):
+        self.startTime = time.time()
+        self.shutdownEvent = asyncio.Event()
+        if os.path.exists(self.socketPath):
+            os.remove(self.socketPath)
+        server = await asyncio.start_unix_server(self.handle_connection, path=self.socketPath)
+        logging.info(f'Inference server listening on {self.socketPath}')
+        try:
+            async with server:
+                await self.shutdownEvent.wait()
+        finally:
+            for streamId in list(self.rings):
+                await self.close_stream(streamId)
+            await self.runner.close()
+            if os.path.exists(self.socketPath):
+                os.remove(self.socketPath)
+
+    async def handle_connection(self, reader, writer):
+        openedStreams = set()
+        frameTasks = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                    op = request['op']
+                except (ValueError, KeyError, TypeError) as error:
+                    self.write_reply(writer, {}, {'ok': False, 'error': f'Bad request: {error}'})
+                    continue
+
+                if op == 'frame':
+                    # answered when done, the next requests are read meanwhile
+                    task = asyncio.create_task(self.handle_frame(request, writer))
+                    frameTasks.add(task)
+                    task.add_done_callback(frameTasks.discard)
+                    continue
+                try:
+                    reply = await self.handle_request(request)
+                    if op == 'open':
+                        openedStreams.add(request['stream'])
+                    elif op == 'close':
+                        openedStreams.discard(request['stream'])
+                except Exception as error:
+                    self.numErrors += 1
+                    reply = {'ok': False, 'error': f'{type(error).__name__}: {error}'}
+                self.write_reply(writer, request, reply)
+                await writer.drain()
+                if op == 'shutdown':
+                    self.shutdownEvent.set()
+                    break
+        finally:
+            if frameTasks:
+                await asyncio.gather(*frameTasks, return_exceptions=True)
+            for streamId in openedStreams:
+                if streamId in self.rings:
+                    await self.close_stream(streamId)
+            writer.close()
+
+    @staticmethod
+    def write_reply(writer, request, reply):
+        if 'id' in request:
+            reply['id'] = request['id']
+        writer.write(encode_message(reply))
+
+    async def handle_request(self, request):
+        op = request['op']
+        if op == 'open':
+            self.open_stream(request['stream'], request['model'], request['ring'],
+                             params=request.get('params', {}), device=request.get('device', 'cpu'),
+                             dtype=request.get('dtype'))
+            return {'ok': True}
+        elif op == 'close':
+            await self.close_stream(request['stream'])
+            return {'ok': True}
+        elif op == 'health':
+            return dict(self.get_health(), ok=True)
+        elif op == 'stats':
+            return dict(self.get_stats(), ok=True)
+        elif op == 'shutdown':
+            return {'ok': True}
+        raise ValueError(f'Unknown op: {op}')
+
+    async def handle_frame(self, request, writer):
+        try:
+            streamId = request['stream']
+            ring = self.rings[streamId]
+            frame = convert_frame(ring.frames[request['slot']], self.runner.streams[streamId].objModel)
+            record, runTime = await self.runner.submit(streamId, frame)
+            record.frameIdx = request.get('frameIdx', -1)
+            reply = {'ok': True, 'record': record.to_dict()}
+        except Exception as error:
+            self.numErrors += 1
+            reply = {'ok': False, 'error': f'{type(error).__name__}: {error}'}
+        self.write_reply(writer, request, reply)
+
+    def open_stream(self, streamId, modelName, ringInfo, params=None, device='cpu', dtype=None):
+        ''' Instances the model of a stream and attaches to its ring. '''
+        if streamId in self.rings:
+            raise ValueError(f'The stream {streamId} already exists.')
+        objModel = instancing_model(modelName, device=device, dtype=dtype)
+        objModel.set_para(**(params or {}))
+        objModel.init_config()
+        objNMS = MatrixNMS(15)
+
+        def postprocess(modelOpt):
+            return DetectionRecord.from_lists(-1, *postprocess_output(modelOpt, objNMS, objModel.device),
+                                              hasDirection=has_direction(modelOpt))
+
+        ring = FrameRing(ringInfo['shape'], ringInfo['dtype'], ringInfo['numSlots'], name=ringInfo['shm'])
+        self.runner.add_stream(streamId, objModel, postprocess=postprocess)
+        self.rings[streamId] = ring
+        self.openTimes[streamId] = time.time()
+
+    async def close_stream(self, streamId):
+        ''' Closes a stream, a stream already closed (or being closed) is left as is. '''
+        ring = self.rings.pop(streamId, None)
+        if ring is None:
+            return
+        self.openTimes.pop(streamId)
+        await self.runner.remove_stream(streamId)
+        ring.close()
+
+    def get_health(self):
+        ''' Returns {'status': 'running', 'pid', 'uptime' (s), 'numStreams', 'numErrors'}. '''
+        return {'status': 'running',
+                'pid': os.getpid(),
+                'uptime': time.time() - self.startTime,
+                'numStreams': len(self.rings),
+                'numErrors': self.numErrors}
+
+    def get_stats(self):
+        '''
+        Returns the throughput of the server.
+
+        Returns:
+            - dict with 'numFrames' and 'framesPerSecond' over all streams since
+              the start, and 'streams': {streamId: the stats of
+              MultiStreamRunner.get_stream_stats plus 'framesPerSecond' since the
+              stream was opened}.
+        '''
+        now = time.time()
+        streams = self.runner.get_stream_stats()
+        for streamId, stat in streams.items():
+            stat['framesPerSecond'] = stat['numFrames'] / max(now - self.openTimes[streamId], 1e-9)
+        numFrames = sum(stat['numFrames'] for stat in streams.values())
+        return {'numFrames': numFrames,
+                'framesPerSecond': numFrames / max(now - self.startTime, 1e-9),
+                'streams': streams}
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Local inference server fed through shared memory.')
+    parser.add_argument('--socket', required=True, help='path of the Unix domain socket')
+    parser.add_argument('--threads', type=int, default=None, help='size of the thread pool, default: CPU count')
+    parser.add_argument('--max-pending', type=int, default=4, help='frames buffered per stream')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    InferenceServer(args.socket, numThreads=args.threads, maxPending=args.max_pending).run()
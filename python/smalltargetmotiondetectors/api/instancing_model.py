@@ -1,26 +1,27 @@
 import os
 import sys
-from ..model import * # Import all models
+from ..model import get_model_class
 
 
-def instancing_model(modelName, device = 'cpu', modelPara=None):
+def instancing_model(modelName, device = 'cpu', modelPara=None, dtype=None):
     """
     Instantiate a model object based on the given model name.
 
     Parameters:
         modelName (str): Name of the model to instantiate. If None, a GUI for model selection will be opened.
         modelPara: Parameters for model instantiation (optional).
+        dtype: Floating dtype of the NumPy backend, e.g. np.float32 (optional, see BaseModel.set_dtype).
 
     Returns:
         BaseModel: The instantiated model object.
     """
     
     # Instantiate the model
-    modelN =  globals().get(modelName)
-    if modelN:
-        objModel = modelN(device=device)
-    else:
-        print(f"Class {modelName} not found.")
+    # the model module is imported on first use
+    modelN = get_model_class(modelName)
+    objModel = modelN(device=device)
+    if dtype is not None:
+        objModel.set_dtype(dtype)
 
     # Process additional parameters if provided
     if modelPara is not None:
@@ -0,0 +1,235 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .instancing_model import instancing_model
+from ..util.memory import share_kernels
+
+
+class StreamState:
+    ''' Model, pending frames and statistics of a stream of MultiStreamRunner. '''
+
+    def __init__(self, streamId, objModel, maxPending, postprocess=None):
+        self.streamId = streamId
+        self.objModel = objModel
+        self.maxPending = maxPending
+        self.postprocess = postprocess
+        self.queue = None       # pending (frame, future, submitTime), created in the event loop
+        self.worker = None      # task feeding the frames of the stream to the thread pool
+        self.running = None     # concurrent.futures.Future of the frame in the thread pool
+        self.sharedBytes = 0    # kernel bytes shared with an earlier stream
+        self.numFrames = 0
+        self.totalRunTime = 0.
+        self.totalLatency = 0.  # from submit to result
+
+
+class MultiStreamRunner:
+    '''
+    Runs one model per stream, for many streams, in one process.
+
+    Each stream has its own model instance, hence its own temporal state, and its
+    frames are processed in the order of submission, one at a time. The frames of
+    different streams run on a bounded thread pool; OpenCV and NumPy release the
+    GIL, so the streams share the cores of the host without one process each.
+
+    Scheduling:
+        A stream holds at most one thread at a time and waits for a thread in
+        first-come order behind the other streams, so every stream with pending
+        frames gets its turn: a stream submitting faster than the others does
+        not delay them.
+
+    Backpressure:
+        A stream buffers at most maxPending frames. `submit` waits for room in
+        the buffer of its stream, which slows down a producer ahead of the model
+        without affecting the other streams.
+
+    Kernel sharing:
+        The model of a new stream uses the kernel arrays of an earlier stream of
+        the same model class where they are equal, i.e. when the parameters are
+        the same (see util.memory.share_kernels).
+
+    Example:
+        runner = MultiStreamRunner(numThreads=8)
+        for cameraId in cameraIds:
+            runner.add_stream(cameraId, 'DSTMD')
+
+        async def feed(cameraId):
+            async for frame in camera_frames(cameraId):
+                modelOpt, runTime = await runner.submit(cameraId, frame)
+
+        async with runner:
+            await asyncio.gather(*(feed(cameraId) for cameraId in cameraIds))
+    '''
+
+    def __init__(self, numThreads=None, maxPending=2, shareKernels=True):
+        '''
+        Constructor.
+
+        Parameters:
+            - numThreads: Size of the thread pool, defaults to os.cpu_count().
+            - maxPending: Number of frames a stream buffers before submit waits.
+            - shareKernels: Whether the streams share their kernel arrays.
+        '''
+        if numThreads is not None and numThreads < 1:
+            raise ValueError('numThreads must be None or a positive integer.')
+        if maxPending < 1:
+            raise ValueError('maxPending must be a positive integer.')
+        self.numThreads = (os.cpu_count() or 1) if numThreads is None else numThreads
+        self.maxPending = maxPending
+        self.shareKernels = shareKernels
+
+        self.streams = {}
+        self.executor = None
+        self.threadSlots = None     # asyncio.Semaphore of the threads, created in the event loop
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    def add_stream(self, streamId, model, device='cpu', dtype=None, postprocess=None, **kwargs):
+        '''
+        Adds a stream and its model.
+
+        Parameters:
+            - streamId: Hashable id of the stream.
+            - model: Name of the model, instanced on device with dtype and the
+              parameters kwargs, or a model object on which init_config was
+              called and that has not processed any frame yet.
+            - postprocess: Function of the model output, run in the thread of
+              the frame; submit then returns its result instead of modelOpt.
+        '''
+        if streamId in self.streams:
+            raise ValueError(f'The stream {streamId} already exists.')
+        if isinstance(model, str):
+            objModel = instancing_model(model, device=device, dtype=dtype)
+            objModel.set_para(**kwargs)
+            objModel.init_config()
+        else:
+            objModel = model
+
+        stream = StreamState(streamId, objModel, self.maxPending, postprocess)
+        if self.shareKernels:
+            for otherStream in self.streams.values():
+                if type(otherStream.objModel) is type(objModel):
+                    stream.sharedBytes = share_kernels(objModel, otherStream.objModel)
+                    break
+        self.streams[streamId] = stream
+
+    async def remove_stream(self, streamId):
+        '''
+        Removes a stream, its pending frames are cancelled.
+
+        Returns once the frame of the stream being processed, if any, is done:
+        the model of the stream is then no longer used by the thread pool.
+        '''
+        stream = self.streams.pop(streamId)
+        await self.stop_worker(stream)
+
+    async def submit(self, streamId, frame):
+        '''
+        Processes a frame of a stream.
+
+        Parameters:
+            - streamId: Id of the stream.
+            - frame: Input of the model of the stream.
+
+        Returns:
+            - modelOpt: Model output structure of the frame.
+            - runTime: Time taken by the model.
+        '''
+        stream = self.streams[streamId]
+        loop = asyncio.get_running_loop()
+        if self.threadSlots is None:
+            self.threadSlots = asyncio.Semaphore(self.numThreads)
+            self.executor = ThreadPoolExecutor(max_workers=self.numThreads)
+        if stream.worker is None:
+            stream.queue = asyncio.Queue(maxsize=stream.maxPending)
+            stream.worker = loop.create_task(self.run_stream(stream))
+
+        future = loop.create_future()
+        await stream.queue.put((frame, future, time.time()))
+        if stream.worker is None:
+            # the stream was stopped while waiting for room in its buffer
+            future.cancel()
+        return await future
+
+    async def run_stream(self, stream):
+        ''' Feeds the frames of a stream to the thread pool, in order. '''
+        while True:
+            frame, future, submitTime = await stream.queue.get()
+            if future.cancelled():
+                continue
+            try:
+                async with self.threadSlots:
+                    stream.running = self.executor.submit(self.process_frame, stream.objModel, frame,
+                                                          stream.postprocess)
+                    modelOpt, runTime = await asyncio.wrap_future(stream.running)
+            except asyncio.CancelledError:
+                future.cancel()
+                raise
+            except Exception as error:
+                if not future.cancelled():
+                    future.set_exception(error)
+                continue
+            stream.numFrames += 1
+            stream.totalRunTime += runTime
+            stream.totalLatency += time.time() - submitTime
+            if not future.cancelled():
+                future.set_result((modelOpt, runTime))
+
+    @staticmethod
+    def process_frame(objModel, frame, postprocess=None):
+        modelOpt, runTime = objModel.process(frame)
+        if postprocess is not None:
+            return postprocess(modelOpt), runTime
+        # the next frame of the stream replaces the outputs of the model
+        return dict(modelOpt), runTime
+
+    async def stop_worker(self, stream):
+        if stream.worker is None:
+            return
+        stream.worker.cancel()
+        try:
+            await stream.worker
+        except asyncio.CancelledError:
+            pass
+        stream.worker = None
+        if stream.running is not None:
+            # a thread running the model cannot be interrupted, wait for its frame
+            await asyncio.wait([asyncio.wrap_future(stream.running)])
+            stream.running = None
+        while not stream.queue.empty():
+            _, future, _ = stream.queue.get_nowait()
+            future.cancel()
+
+    async def close(self):
+        ''' Stops the streams, their pending frames are cancelled, and shuts the thread pool down. '''
+        for stream in self.streams.values():
+            await self.stop_worker(stream)
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+            self.threadSlots = None
+
+    def get_stream_stats(self):
+        '''
+        Returns the statistics of every stream.
+
+        Returns:
+            - dict {streamId: {'numFrames', 'meanRunTime' (s), 'meanLatency' (s,
+              from submit to result, waiting included), 'pending', 'sharedBytes'}}.
+        '''
+        stats = {}
+        for streamId, stream in self.streams.items():
+            numFrames = max(stream.numFrames, 1)
+            stats[streamId] = {
+                'numFrames': stream.numFrames,
+                'meanRunTime': stream.totalRunTime / numFrames,
+                'meanLatency': stream.totalLatency / numFrames,
+                'pending': 0 if stream.queue is None else stream.queue.qsize(),
+                'sharedBytes': stream.sharedBytes,
+            }
+        return stats
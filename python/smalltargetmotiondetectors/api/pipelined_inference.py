@@ -0,0 +1,191 @@
+import queue
+import threading
+import time
+
+import numpy as np
+
+
+class PipelinedModel:
+    '''
+    Runs the layers of a model on a pipeline of threads.
+
+    The layers of a model keep a state from one frame to the next, but within a
+    frame each one only needs the output of the layer before it. The stages of
+    the model (see BaseModel.get_pipeline_stages) are split into `depth`
+    consecutive groups, each run by its own worker thread. The workers hand the
+    frames over through single-slot buffers, so while the lobula processes frame
+    t, the medulla processes frame t + 1, the lamina frame t + 2 and so on.
+    OpenCV, NumPy and torch release the GIL in their kernels, so the frame rate
+    grows with the number of workers up to the cost of the slowest group; the
+    time of a frame does not shrink.
+
+    Every layer still sees the frames in order, so the outputs are those of
+    `objModel.process`, bitwise, delayed by `latency` = depth - 1 frames: the
+    output of frame t is returned by the call processing frame t + latency,
+    the first `latency` calls return None, and `flush` returns the outputs of
+    the frames still in the pipeline.
+
+    Models whose layers feed back to an earlier layer (FSTMD, STMDPlus, ApgSTMD)
+    have no stages and cannot be pipelined.
+
+    Example:
+        objModel = instancing_model('DSTMD')
+        objModel.init_config()
+        with PipelinedModel(objModel) as objPipeline:
+            for frame in frames:
+                modelOpt, runTime = objPipeline.process(frame)
+                if modelOpt is not None:
+                    ...  # output of the frame objPipeline.latency frames back
+            for modelOpt in objPipeline.flush():
+                ...
+    '''
+
+    def __init__(self, objModel, depth=None):
+        '''
+        Constructor.
+
+        Parameters:
+            - objModel: Initialized model (init_config). Its layers are run by the
+              workers, it must not process frames itself while the pipeline runs.
+            - depth: Number of workers, between 1 and the number of stages of the
+              model. Defaults to one worker per stage.
+        '''
+        stages = objModel.get_pipeline_stages()
+        # a subclass that changes model_structure has to redefine its stages
+        if stages is None or \
+                defining_class(objModel, 'get_pipeline_stages') is not defining_class(objModel, 'model_structure'):
+            raise ValueError(f'<{objModel.__class__.__name__}> does not define its pipeline stages, '
+                             f'it cannot be pipelined.')
+        if depth is None:
+            depth = len(stages)
+        if not 1 <= depth <= len(stages):
+            raise ValueError(f'depth must be between 1 and the number of stages ({len(stages)}).')
+
+        self.hModel = objModel
+        self.device = objModel.device
+        self.depth = depth
+        self.latency = depth - 1
+        self.stageGroups = [[stages[idx] for idx in group] for group in np.array_split(range(len(stages)), depth)]
+
+        self.slots = []     # slots[i] feeds the worker i, slots[depth] holds the outputs
+        self.workers = []
+        self.numSubmitted = 0
+        self.numReturned = 0
+        self.busyTimes = [0.] * depth   # time spent in the stages of each worker
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def start(self):
+        ''' Starts the workers, called by the first frame. '''
+        self.slots = [queue.Queue(maxsize=1) for _ in range(self.depth + 1)]
+        self.workers = [threading.Thread(target=self.run_worker, args=(idx,), daemon=True)
+                        for idx in range(self.depth)]
+        for worker in self.workers:
+            worker.start()
+
+    def close(self):
+        ''' Stops the workers, the outputs still in the pipeline are dropped (see flush). '''
+        if not self.workers:
+            return
+        self.slots[0].put(None)
+        while self.slots[-1].get() is not None:
+            pass
+        for worker in self.workers:
+            worker.join()
+        self.workers = []
+        self.numReturned = self.numSubmitted
+
+    def run_worker(self, idx):
+        ''' Runs the stages of a group on the frames coming from the previous worker. '''
+        stages = self.stageGroups[idx]
+        inSlot, outSlot = self.slots[idx], self.slots[idx + 1]
+        while True:
+            item = inSlot.get()
+            if item is None:
+                outSlot.put(None)
+                return
+            stageData, error = item
+            if error is None:
+                time_start = time.time()
+                try:
+                    for stage in stages:
+                        stageData = stage(stageData)
+                except Exception as stageError:
+                    stageData, error = None, stageError
+                self.busyTimes[idx] += time.time() - time_start
+            outSlot.put((stageData, error))
+
+    def get_output(self):
+        ''' Waits for the output of the oldest frame in the pipeline. '''
+        modelOpt, error = self.slots[-1].get()
+        self.numReturned += 1
+        if error is not None:
+            # the error of a stage is raised by the call returning its frame
+            raise error
+        if self.device.startswith('cuda'):
+            import torch
+            torch.cuda.synchronize()
+        return modelOpt
+
+    def process(self, modelIpt):
+        '''
+        Feeds a frame to the pipeline and returns the output of the frame `latency` frames back.
+
+        Parameters:
+            - modelIpt: Input of the model.
+
+        Returns:
+            - modelOpt: Model output structure, None while the pipeline fills up.
+            - time_end: Time taken for processing.
+        '''
+        time_start = time.time()
+        if not self.workers:
+            self.start()
+        self.slots[0].put((modelIpt, None))
+        self.numSubmitted += 1
+
+        modelOpt = None
+        if self.numSubmitted - self.numReturned > self.latency:
+            modelOpt = self.get_output()
+        time_end = time.time() - time_start
+        return modelOpt, time_end
+
+    def flush(self):
+        ''' Returns the outputs of the frames still in the pipeline, in order. '''
+        modelOpts = []
+        while self.numReturned < self.numSubmitted:
+            modelOpts.append(self.get_output())
+        return modelOpts
+
+    def get_pipeline_stats(self):
+        '''
+        Returns the load of the workers.
+
+        Returns:
+            - stats: dict with
+                - depth, latency: Number of workers and output delay in frames.
+                - numFrames: Number of frames fed to the pipeline.
+                - stageTime: Mean time (s) per frame spent by each worker in its
+                  stages. The slowest one bounds the frame rate.
+                - bottleneck: Index of the slowest worker.
+        '''
+        stageTime = [busyTime / max(self.numSubmitted, 1) for busyTime in self.busyTimes]
+        return {
+            'depth': self.depth,
+            'latency': self.latency,
+            'numFrames': self.numSubmitted,
+            'stageTime': stageTime,
+            'bottleneck': int(np.argmax(stageTime)),
+        }
+
+
+def defining_class(obj, name):
+    ''' Returns the class of the MRO of obj that defines the attribute name. '''
+    for cls in type(obj).__mro__:
+        if name in vars(cls):
+            return cls
+    return None
@@ -0,0 +1,351 @@
+import json
+from contextlib import ExitStack
+from dataclasses import dataclass
+
+import numpy as np
+
+from .instancing_model import instancing_model
+from .evaluate import create_input_stream, postprocess_output, has_direction
+from ..util.matrixnms import MatrixNMS
+from ..util.evaluate_module import evaluation_model_by_video, compute_AP
+
+
+@dataclass
+class DetectionRecord:
+    '''
+    Detections of a frame, as NumPy arrays instead of the lists of inference_task.
+
+    Attributes:
+        - frameIdx: Index of the frame in the input.
+        - positions: (N, 2) int32 array of the [x, y] (column, row) of the detections.
+        - confidences: (N,) float64 array of their normalized responses.
+        - directions: (N,) float64 array of their directions (NaN when unknown),
+          None for a model without direction.
+        - runTime: Time taken by the model for the frame.
+    '''
+    frameIdx: int
+    positions: np.ndarray
+    confidences: np.ndarray
+    directions: np.ndarray = None
+    runTime: float = 0.
+
+    @classmethod
+    def from_lists(cls, frameIdx, responseListType, directionListType, runTime=0., hasDirection=True):
+        '''
+        Builds a record from the sparse response and direction lists of postprocess_output.
+
+        hasDirection comes from the model (see has_direction): a frame without
+        detections has an empty direction list either way. Without direction,
+        directions is None.
+        '''
+        positions = np.array([item[:2] for item in responseListType], dtype=np.int32).reshape(-1, 2)
+        confidences = np.array([item[-1] for item in responseListType], dtype=np.float64)
+        directions = np.array([item[-1] for item in directionListType], dtype=np.float64) \
+            if hasDirection else None
+        return cls(frameIdx, positions, confidences, directions, runTime)
+
+    def __len__(self):
+        return len(self.confidences)
+
+    def response_list(self):
+        ''' Returns the detections as the [x, y, confidence] list of inference_task. '''
+        return [[x, y, confidence] for (x, y), confidence in zip(self.positions.tolist(), self.confidences.tolist())]
+
+    def direction_list(self):
+        ''' Returns the directions as the [x, y, direction] list of inference_task. '''
+        if self.directions is None:
+            return []
+        return [[x, y, direction] for (x, y), direction in zip(self.positions.tolist(), self.directions.tolist())]
+
+    def to_dict(self):
+        '''
+        Returns the record as a JSON serializable dict, unknown directions (NaN)
+        are None, and so is the direction list of a model without direction.
+        '''
+        directionListType = None if self.directions is None else \
+            [[x, y, None if np.isnan(direction) else direction] for x, y, direction in self.direction_list()]
+        return {'frameIdx': int(self.frameIdx),
+                'response': self.response_list(),
+                'direction': directionListType,
+                'runTime': float(self.runTime)}
+
+    @classmethod
+    def from_dict(cls, recordDict):
+        ''' Inverse of to_dict. '''
+        return cls.from_lists(recordDict['frameIdx'], recordDict['response'], recordDict['direction'] or [],
+                              recordDict.get('runTime', 0.), hasDirection=recordDict['direction'] is not None)
+
+
+def stream_inference(model,
+                     source,
+                     postprocess=None,
+                     sinks=(),
+                     inputType='ImgstreamReader',
+                     startFrame=0,
+                     endFrame=None,
+                     device='cpu',
+                     dtype=None,
+                     useFrameCache=True,
+                     **kwargs):
+    '''
+    Runs a model on an input and yields the detections of every frame as soon as they are ready.
+
+    Unlike inference_task, nothing is accumulated: the frames are read, processed
+    and post-processed one at a time, and each DetectionRecord is handed to the
+    sinks then yielded. A long recording runs in constant memory, the sinks
+    (RecordFileWriter, OnlineEvaluator, VisualizeSink or any object with
+    write(record, colorImg) and close()) keep what they need.
+
+    The sinks are closed when the input ends, when the model or a sink raises,
+    or when the returned DetectionStream is closed. A caller that stops before
+    the end of the input must close it (or use it as a context manager), also
+    when it never asked for a record, otherwise the sinks may lose their last
+    records (e.g. the unflushed chunk of a DetectionLogWriter).
+
+    Parameters:
+        - model: Name of the model, instanced on device with dtype and the
+          parameters kwargs, or a model object on which init_config was called.
+        - source: Input path of inputType (see create_input_stream), or a reader
+          object with hasFrame and get_next_frame().
+        - postprocess: Function of the model output returning the sparse response
+          and direction lists of the frame. Defaults to postprocess_output with a
+          MatrixNMS(15), as inference_task.
+        - sinks: Objects receiving every record.
+        - startFrame: First frame of the input, numbers the records.
+        - inputType, endFrame, device, dtype, useFrameCache: See inference_task,
+          used when model or source are not objects.
+        - **kwargs: Model parameters, see BaseModel.set_para.
+
+    Returns:
+        - records: DetectionStream, iterator over the DetectionRecord of every frame.
+
+    Example:
+        evaluator = OnlineEvaluator(groundTruth)
+        writer = RecordFileWriter('detections.jsonl')
+        with stream_inference('DSTMD', vidName, inputType='VidstreamReader',
+                              sinks=[writer, evaluator]) as records:
+            for record in records:
+                ...
+        print(evaluator.get_metrics()['AP'])
+    '''
+    if isinstance(model, str):
+        objModel = instancing_model(model, device=device, dtype=dtype)
+        objModel.set_para(**kwargs)
+        objModel.init_config()
+    else:
+        objModel = model
+
+    if hasattr(source, 'get_next_frame'):
+        objIptStream = source
+    else:
+        objIptStream = create_input_stream(source, inputType, startFrame, endFrame,
+                                           device=objModel.device, dtype=dtype, useFrameCache=useFrameCache)
+
+    if postprocess is None:
+        objNMS = MatrixNMS(15)
+        postprocess = lambda result: postprocess_output(result, objNMS, objModel.device)
+
+    return DetectionStream(generate_records(objModel, objIptStream, postprocess, sinks, startFrame), sinks)
+
+
+def generate_records(objModel, objIptStream, postprocess, sinks, startFrame):
+    ''' Yields the DetectionRecord of every frame of stream_inference, after handing it to the sinks. '''
+    if objModel.backend == 'torch':
+        import torch
+    frameIdx = startFrame
+    while objIptStream.hasFrame:
+        grayImg, colorImg = objIptStream.get_next_frame()
+        if objModel.backend == 'torch':
+            grayImg = torch.from_numpy(grayImg).to(device=objModel.device).float().unsqueeze(0).unsqueeze(0)
+
+        result, runTime = objModel.process(grayImg)
+        responseListType, directionListType = postprocess(result)
+        record = DetectionRecord.from_lists(frameIdx, responseListType, directionListType, runTime,
+                                            hasDirection=has_direction(result))
+        frameIdx += 1
+
+        for sink in sinks:
+            sink.write(record, colorImg)
+        yield record
+
+
+def close_sinks(sinks):
+    ''' Closes every sink in order, the next ones are closed even when closing one raises. '''
+    with ExitStack() as stack:
+        for sink in reversed(sinks):
+            stack.callback(sink.close)
+
+
+class DetectionStream:
+    '''
+    Iterator over the records of stream_inference, which owns its sinks.
+
+    The sinks are closed once: when the records end, when producing a record
+    raises, or at close(). A stream left unfinished is closed when it is
+    garbage collected, as a generator would be.
+    '''
+
+    def __init__(self, records, sinks):
+        self.records = records
+        self.sinks = list(sinks)
+        self.isClosed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.isClosed:
+            raise StopIteration
+        try:
+            return next(self.records)
+        except BaseException:
+            # StopIteration at the end of the input included
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __del__(self):
+        if not getattr(self, 'isClosed', True):
+            self.close()
+
+    def close(self):
+        ''' Stops the stream and closes its sinks. '''
+        if self.isClosed:
+            return
+        self.isClosed = True
+        try:
+            self.records.close()
+        finally:
+            close_sinks(self.sinks)
+
+
+class RecordFileWriter:
+    '''
+    Sink writing the records to a JSON Lines file, one record per line.
+
+    The file is written as the records come, read it back with read_record_file.
+    '''
+
+    def __init__(self, fileName, mode='w'):
+        '''
+        Parameters:
+            - fileName: Name of the file.
+            - mode: 'w' starts a new file, 'a' appends to an existing one.
+        '''
+        self.fileName = fileName
+        self.hFile = open(fileName, mode)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def write(self, record, colorImg=None):
+        self.hFile.write(json.dumps(record.to_dict(), allow_nan=False) + '\n')
+
+    def close(self):
+        if not self.hFile.closed:
+            self.hFile.close()
+
+
+def read_record_file(fileName):
+    ''' Yields the DetectionRecords of a file written by RecordFileWriter. '''
+    with open(fileName) as f:
+        for line in f:
+            if line.strip():
+                yield DetectionRecord.from_dict(json.loads(line))
+
+
+class OnlineEvaluator:
+    '''
+    Sink accumulating the TP, FN and FP of the records at fixed confidence thresholds.
+
+    Every record is matched against its ground truth as in evaluation_model_by_video,
+    once per threshold, and only the totals are kept. The curves are sampled at
+    the given thresholds, instead of the thresholds refined by get_ROC_curve_data
+    and get_P_R_curve_data from the whole output.
+    '''
+
+    def __init__(self, groundTruth, thresholds=None, gTError=1, ROIThreshold=0.5):
+        '''
+        Parameters:
+            - groundTruth: Ground truth of the records, in the format of
+              evaluate_task: a list whose i-th item belongs to the i-th record, or
+              a function of the frame index.
+            - thresholds: Confidence thresholds, defaults to 0, 0.05, ..., 1.
+            - gTError: Distance error scope for ground truth.
+            - ROIThreshold: ROI threshold.
+        '''
+        self.groundTruth = groundTruth
+        thresholds = np.linspace(0, 1, 21) if thresholds is None else thresholds
+        self.thresholds = np.sort(np.asarray(thresholds, dtype=np.float64))[::-1]
+        self.gTError = gTError
+        self.ROIThreshold = ROIThreshold
+
+        self.numFrames = 0
+        self.totalTP = np.zeros(len(self.thresholds), dtype=np.int64)
+        self.totalFN = np.zeros(len(self.thresholds), dtype=np.int64)
+        self.totalFP = np.zeros(len(self.thresholds), dtype=np.int64)
+
+    def write(self, record, colorImg=None):
+        if callable(self.groundTruth):
+            frameGroundTruth = self.groundTruth(record.frameIdx)
+        elif self.numFrames < len(self.groundTruth):
+            frameGroundTruth = self.groundTruth[self.numFrames]
+        else:
+            return
+        responseListType = record.response_list()
+        for idx, thresholdValue in enumerate(self.thresholds):
+            threInput = [data for data in responseListType if data[-1] > thresholdValue]
+            listTP, listFN, listFP = evaluation_model_by_video([threInput], [frameGroundTruth],
+                                                               confidenceThreshold=thresholdValue,
+                                                               gTError=self.gTError,
+                                                               ROIThreshold=self.ROIThreshold)
+            self.totalTP[idx] += listTP[0]
+            self.totalFN[idx] += listFN[0]
+            self.totalFP[idx] += listFP[0]
+        self.numFrames += 1
+
+    def close(self):
+        pass
+
+    def get_metrics(self):
+        '''
+        Returns the metrics of the records so far.
+
+        Returns:
+            - metrics: dict of arrays over the thresholds (in decreasing order):
+              threshold, recall, precision, FPPI (false positives per image), and
+              AP, the area under the P-R curve (see compute_AP), and numFrames.
+        '''
+        numDetected = self.totalTP + self.totalFN
+        numPredicted = self.totalTP + self.totalFP
+        recall = np.where(numDetected > 0, self.totalTP / np.maximum(numDetected, 1), 0.)
+        precision = np.where(numPredicted > 0, self.totalTP / np.maximum(numPredicted, 1), 1.)
+        return {'threshold': self.thresholds,
+                'recall': recall,
+                'precision': precision,
+                'FPPI': self.totalFP / max(self.numFrames, 1),
+                'AP': compute_AP(recall.tolist(), precision.tolist()),
+                'numFrames': self.numFrames}
+
+
+class VisualizeSink:
+    ''' Sink showing the records with a Visualization handle, see get_visualize_handle. '''
+
+    def __init__(self, hVisual):
+        self.hVisual = hVisual
+
+    def write(self, record, colorImg=None):
+        self.hVisual.show_result(colorImg,
+                                 {'response': record.response_list(), 'direction': record.direction_list()},
+                                 record.runTime)
+
+    def close(self):
+        pass
@@ -0,0 +1,341 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from copy import deepcopy
+
+import cv2
+import numpy as np
+
+
+def split_frame(shape, tileSize, halo):
+    '''
+    Splits a frame into tiles padded by a halo.
+
+    Parameters:
+        - shape: (height, width) of the frame.
+        - tileSize: Side of the tiles, an int or (height, width). The tiles of
+          the last row and column are cut by the frame border.
+        - halo: Number of rows and columns added around each tile, the crops
+          are clipped at the frame border.
+
+    Returns:
+        - tiles: List of (tileSlice, cropSlice, innerSlice), one per tile in
+          row-major order. tileSlice and cropSlice select the tile and its
+          padded crop in the frame, innerSlice selects the tile in the crop.
+        - gridShape: (number of rows, number of columns) of tiles.
+    '''
+    height, width = shape
+    tileHeight, tileWidth = (tileSize, tileSize) if np.isscalar(tileSize) else tileSize
+    rowStarts = range(0, height, tileHeight)
+    columnStarts = range(0, width, tileWidth)
+
+    tiles = []
+    for y0 in rowStarts:
+        y1 = min(y0 + tileHeight, height)
+        cropY0, cropY1 = max(y0 - halo, 0), min(y1 + halo, height)
+        for x0 in columnStarts:
+            x1 = min(x0 + tileWidth, width)
+            cropX0, cropX1 = max(x0 - halo, 0), min(x1 + halo, width)
+            tiles.append(((slice(y0, y1), slice(x0, x1)),
+                          (slice(cropY0, cropY1), slice(cropX0, cropX1)),
+                          (slice(y0 - cropY0, y1 - cropY0), slice(x0 - cropX0, x1 - cropX0))))
+    return tiles, (len(rowStarts), len(columnStarts))
+
+
+def compute_max_change(ipt, reference):
+    ''' Returns the largest absolute difference between two arrays or tensors of the same type. '''
+    if isinstance(ipt, np.ndarray):
+        # no temporary array, and no wrap-around on uint8 frames
+        return cv2.norm(ipt, reference, cv2.NORM_INF)
+    return float((ipt.float() - reference.float()).abs().amax())
+
+
+def copy_array(ipt):
+    ''' Returns a copy of an array or a tensor. '''
+    return np.array(ipt, copy=True) if isinstance(ipt, np.ndarray) else ipt.clone()
+
+
+class TileState:
+    ''' A tile of the frame, with its own model and gate. '''
+
+    def __init__(self, index, tileSlice, cropSlice, innerSlice, objModel):
+        self.index = index              # (row, column) in the grid of tiles
+        self.tileSlice = tileSlice
+        self.cropSlice = cropSlice
+        self.innerSlice = innerSlice
+        self.objModel = objModel        # model with the temporal state of the crop
+        self.anchor = None              # input of the crop when it last changed
+        self.quietFrames = 0            # processed frames since the last change
+        self.numProcessed = 0
+
+
+class TiledModel:
+    '''
+    Runs a model tile by tile, optionally skipping the tiles of a static background.
+
+    The frame is split into tiles of tileSize, each one padded by a halo equal to
+    the spatial receptive field of the model (BaseModel.get_spatial_radius), so the
+    response inside a tile is the response of the untiled model. Models with a
+    layer that depends on the whole frame have no spatial receptive field and
+    cannot be tiled: normalization over the frame (HaarSTMD, ApgSTMD), tracking
+    (STMDPlus) or the convergence test of the feedback loop of FSTMD, which would
+    stop on each tile on its own. Every tile runs
+    its own copy of the model, which keeps the temporal state of the tile.
+    The outputs of the frame size (response, direction) are stitched; the other
+    outputs are those of the first tile. The response is the one of the untiled
+    model up to the rounding of OpenCV, whose filter2D switches to a DFT for
+    large kernels on large frames (bitwise on the torch backend).
+
+    Threads (numThreads):
+        The tiles are independent within a frame, they run on a thread pool and
+        each one writes the inside of its crop to the outputs of the frame. OpenCV
+        and NumPy release the GIL, so a single stream uses several cores; tiles of
+        a few hundred pixels keep the Python overhead of each tile small. The
+        output does not depend on the number of threads.
+
+    Motion gating (gateThreshold):
+        A tile is skipped when its crop, halo included, has stayed within
+        gateThreshold of the same anchor input for restFrames processed frames.
+        restFrames defaults to the temporal receptive field of the model plus the
+        current frame, so the history of a skipped tile only holds still inputs:
+            - for a model made of FIR cores, its state is at rest, and under a
+              constant input its output is constant;
+            - for a model with recursive cores of known decay rate, the state left
+              by the last change has decayed below `tolerance`;
+            - for the other recursive models (feedback and facilitated models),
+              no bound is known: their held output could drift from the untiled
+              model without limit, they cannot be gated.
+        A shorter restFrames is accepted, the state error is then unknown.
+        A skipped tile holds the output of its last processed frame, and its model
+        does not see the skipped frames. The held output and the output of the
+        untiled model are then both responses to inputs within gateThreshold of
+        the anchor, see `get_tile_stats` for the bound. The first input beyond
+        gateThreshold wakes the tile up. gateThreshold is in the units of the input
+        (gray levels of uint8 frames, or [0, 1]).
+
+    Example:
+        objModel = instancing_model('ESTMDBackbone')
+        objModel.init_config()
+        with TiledModel(objModel, tileSize=256, gateThreshold=2 / 255, numThreads=8) as objTiledModel:
+            for frame in frames:
+                modelOpt, runTime = objTiledModel.process(frame)
+            print(objTiledModel.get_tile_stats()['meanActiveRatio'])
+    '''
+
+    def __init__(self, objModel, tileSize=64, gateThreshold=None, restFrames=None, tolerance=1e-6,
+                 numThreads=1):
+        '''
+        Constructor.
+
+        Parameters:
+            - objModel: Initialized model (init_config), that has not processed any
+              frame yet. It is copied, the tiles start from this copy.
+            - tileSize: Side of the tiles, an int or (height, width).
+            - gateThreshold: Largest input change of a static tile, None processes
+              every tile of every frame. Requires a model whose temporal receptive
+              field has an error bound.
+            - restFrames: Number of processed still frames before a tile is skipped,
+              defaults to the warm-up of the model plus one (see
+              BaseModel.get_temporal_receptive_field).
+            - tolerance: Tolerance of the warm-up of recursive models.
+            - numThreads: Number of threads running the tiles, None uses
+              os.cpu_count(). 1 runs them in the calling thread.
+        '''
+        halo = objModel.get_spatial_radius()
+        if halo is None:
+            raise ValueError(f'<{objModel.__class__.__name__}> has a layer that depends on the whole frame, '
+                             f'it cannot be tiled.')
+        if np.min(tileSize) <= 0:
+            raise ValueError('tileSize must be positive.')
+        if gateThreshold is not None and gateThreshold < 0:
+            raise ValueError('gateThreshold must be None or non-negative.')
+        receptiveField = objModel.get_temporal_receptive_field(tolerance)
+        if gateThreshold is not None and receptiveField['errorBound'] is None:
+            raise ValueError(f'The state of <{objModel.__class__.__name__}> has no known decay, a tile at rest could '
+                             f'drift from the untiled model without bound, it cannot be gated.')
+        if numThreads is not None and numThreads < 1:
+            raise ValueError('numThreads must be None or a positive integer.')
+
+        self.hTemplate = deepcopy(objModel)
+        self.backend, self.device = objModel.backend, objModel.device
+        self.tileSize = tileSize
+        self.halo = halo
+        self.gateThreshold = gateThreshold
+        self.receptiveField = receptiveField
+        self.restFrames = receptiveField['warmUp'] + 1 if restFrames is None else restFrames
+
+        self.numThreads = (os.cpu_count() or 1) if numThreads is None else numThreads
+        self.executor = None
+        self.bufferLock = threading.Lock()
+
+        self.frameShape = None
+        self.gridShape = None
+        self.tiles = []
+        self.optBuffers = {}
+        self.modelOpt = {'response': [], 'direction': []}
+        self.activeCounts = []  # processed tiles per frame
+        self.pixelCounts = []   # processed pixels per frame, halos included
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        ''' Shuts the thread pool down, it is started again by the next frame. '''
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    def reset(self):
+        ''' Drops the tiles, their temporal state and the statistics. '''
+        self.frameShape = None
+        self.gridShape = None
+        self.tiles = []
+        self.optBuffers = {}
+        self.activeCounts = []
+        self.pixelCounts = []
+
+    def init_tiles(self, shape):
+        ''' Splits a frame of the given (height, width) into tiles, each with a fresh model. '''
+        tileSlices, self.gridShape = split_frame(shape, self.tileSize, self.halo)
+        numColumns = self.gridShape[1]
+        self.tiles = [TileState(divmod(idx, numColumns), tileSlice, cropSlice, innerSlice, deepcopy(self.hTemplate))
+                      for idx, (tileSlice, cropSlice, innerSlice) in enumerate(tileSlices)]
+        self.frameShape = tuple(shape)
+        self.optBuffers = {}
+
+    def process(self, modelIpt):
+        '''
+        Processes a frame and returns the stitched model output.
+
+        Parameters:
+            - modelIpt: Input of the model, an (H, W) array or a (B, C, H, W) tensor.
+
+        Returns:
+            - modelOpt: Model output structure.
+            - time_end: Time taken for processing.
+        '''
+        time_start = time.time()
+        shape = tuple(modelIpt.shape[-2:])
+        if shape != self.frameShape:
+            self.reset()
+            self.init_tiles(shape)
+
+        if self.numThreads > 1 and len(self.tiles) > 1:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=self.numThreads)
+            isProcessed = list(self.executor.map(lambda tile: self.process_tile(tile, modelIpt), self.tiles))
+        else:
+            isProcessed = [self.process_tile(tile, modelIpt) for tile in self.tiles]
+
+        numActive = 0
+        numPixels = 0
+        for tile, isTileProcessed in zip(self.tiles, isProcessed):
+            if isTileProcessed:
+                numActive += 1
+                cropHeight = tile.cropSlice[0].stop - tile.cropSlice[0].start
+                cropWidth = tile.cropSlice[1].stop - tile.cropSlice[1].start
+                numPixels += cropHeight * cropWidth
+        self.activeCounts.append(numActive)
+        self.pixelCounts.append(numPixels)
+
+        # the held regions stay in the buffers, the caller gets its own copy
+        self.modelOpt = dict(self.modelOpt)
+        for key, optBuffer in self.optBuffers.items():
+            self.modelOpt[key] = copy_array(optBuffer)
+        if self.device.startswith('cuda'):
+            import torch
+            torch.cuda.synchronize()
+        time_end = time.time() - time_start
+        return self.modelOpt, time_end
+
+    def process_tile(self, tile, modelIpt):
+        '''
+        Runs the model of a tile on its crop, unless the tile is at rest.
+
+        Returns:
+            - isProcessed: Whether the tile was processed, otherwise its output is held.
+        '''
+        crop = modelIpt[(Ellipsis,) + tile.cropSlice]
+        if self.gateThreshold is not None:
+            if tile.anchor is None or compute_max_change(crop, tile.anchor) > self.gateThreshold:
+                tile.anchor = copy_array(crop)
+                tile.quietFrames = 0
+            elif tile.quietFrames >= self.restFrames:
+                return False
+            tile.quietFrames += 1
+
+        tileOpt, _ = tile.objModel.process(crop)
+        tile.numProcessed += 1
+        self.stitch(tile, tileOpt, crop.shape[-2:])
+        return True
+
+    def stitch(self, tile, tileOpt, cropShape):
+        ''' Copies the outputs of a tile into the outputs of the frame, the tiles do not overlap. '''
+        for key, value in tileOpt.items():
+            if not hasattr(value, 'shape') or tuple(value.shape[-2:]) != tuple(cropShape):
+                # not a map of the crop, the first tile gives it
+                if tile is self.tiles[0]:
+                    self.modelOpt[key] = value
+                continue
+            if key not in self.optBuffers:
+                # the first tiles of the first frame may arrive together
+                with self.bufferLock:
+                    if key not in self.optBuffers:
+                        bufferShape = tuple(value.shape[:-2]) + self.frameShape
+                        if isinstance(value, np.ndarray):
+                            self.optBuffers[key] = np.zeros(bufferShape, dtype=value.dtype)
+                        else:
+                            self.optBuffers[key] = value.new_zeros(bufferShape)
+            self.optBuffers[key][(Ellipsis,) + tile.tileSlice] = value[(Ellipsis,) + tile.innerSlice]
+
+    def get_tile_stats(self):
+        '''
+        Returns the activity of the tiles, to tune gateThreshold against accuracy.
+
+        Returns:
+            A dict with
+            - tileSize, halo, gridShape, numTiles, gateThreshold, restFrames.
+            - numFrames: Number of processed frames.
+            - activeRatio: Fraction of the tiles processed in each frame.
+            - meanActiveRatio: Mean of activeRatio.
+            - pixelRatio: Processed pixels, halos included, over the pixels of the
+              frames. Without gating, it is the cost of the halos (> 1).
+            - tileActivity: (rows, columns) array, fraction of the frames each tile
+              was processed in.
+            - errorBound: dict with
+                - input: Largest difference between the inputs a held output was
+                  computed from and the skipped inputs (2 * gateThreshold, both are
+                  within gateThreshold of the anchor). 0 without gating.
+                - state: Bound of the relative state error left by the inputs
+                  before the rest period (errorBound of the temporal receptive
+                  field, 0 for FIR models), None if unknown, i.e. when restFrames
+                  is shorter than the temporal receptive field.
+        '''
+        numFrames = len(self.activeCounts)
+        numTiles = len(self.tiles)
+        numPixels = int(np.prod(self.frameShape)) if self.frameShape else 0
+        activeRatio = [count / numTiles for count in self.activeCounts] if numTiles else []
+        tileActivity = np.zeros(self.gridShape if self.gridShape else (0, 0))
+        for tile in self.tiles:
+            tileActivity[tile.index] = tile.numProcessed / numFrames if numFrames else 0.
+
+        isGated = self.gateThreshold is not None
+        stateBound = self.receptiveField['errorBound'] \
+            if self.restFrames > self.receptiveField['warmUp'] else None
+        return {'tileSize': self.tileSize,
+                'halo': self.halo,
+                'gridShape': self.gridShape,
+                'numTiles': numTiles,
+                'gateThreshold': self.gateThreshold,
+                'restFrames': self.restFrames,
+                'numFrames': numFrames,
+                'activeRatio': activeRatio,
+                'meanActiveRatio': float(np.mean(activeRatio)) if activeRatio else 0.,
+                'pixelRatio': float(np.sum(self.pixelCounts) / (numPixels * numFrames)) if numFrames else 0.,
+                'tileActivity': tileActivity,
+                'errorBound': {'input': 2 * self.gateThreshold if isGated else 0.,
+                               'state': stateBound if isGated else 0.}}
@@ -3,7 +3,7 @@ from cv2 import filter2D, BORDER_CONSTANT
 
 from .base_core import BaseCore
 from ..util.create_kernel import create_attention_kernel, create_prediction_kernel
-from ..util.compute_module import compute_temporal_conv
+from ..util.compute_module import compute_temporal_conv, compute_fft_conv2d
 
 class AttentionModule(BaseCore):
     """
@@ -12,18 +12,19 @@ class AttentionModule(BaseCore):
     This class implements the attention mechanism module in the ApgSTMD.
     """
     
-    def __init__(self):
+    def __init__(self, device='cpu'):
         """
         Constructor method.
         
         Initializes the AttentionModule object.
         """
-        super().__init__()
+        super().__init__(device=device)
         self.kernal_size = 17
         self.zeta_list = [2, 2.5, 3, 3.5]
         self.theta_list = [0, np.pi/4, np.pi/2, np.pi*3/4]
         self.alpha = 1
         self.attention_kernel = None
+        self.num_zeta = None
     
     def init_config(self):
         """
@@ -36,6 +37,13 @@ class AttentionModule(BaseCore):
             self.zeta_list,
             self.theta_list
         )
+        if self.backend == 'torch':
+            import torch
+            # one output channel per (zeta, theta) kernel: [r*s, 1, size, size]
+            self.num_zeta = len(self.attention_kernel)
+            self.attention_kernel = torch.from_numpy(
+                np.stack([np.stack(kernels) for kernels in self.attention_kernel])
+            ).float().to(self.device).flatten(0, 1).unsqueeze(1)
     
     def process(self, retina_opt, prediction_map):
         """
@@ -44,6 +52,20 @@ class AttentionModule(BaseCore):
         Processes the retina_opt and prediction_map to generate the
         attention-optimal output.
         """
+        if self.backend == 'torch':
+            import torch
+            import torch.nn.functional as F
+            if prediction_map is None:
+                attention_opt = retina_opt
+            else:
+                # all kernels in one conv2d: [B, r*s, H, W] -> [B, r, s, H, W]
+                attention_response = F.conv2d(retina_opt * prediction_map, self.attention_kernel, padding='same')
+                attention_response = attention_response.unflatten(1, (self.num_zeta, -1))
+                attention_response = torch.amax(torch.amin(attention_response, dim=2), dim=1, keepdim=True)
+                attention_opt = retina_opt + self.alpha * attention_response
+            self.Opt = attention_opt
+            return attention_opt
+
         r = len(self.attention_kernel)
         s = len(self.attention_kernel[0])
 
@@ -93,14 +115,19 @@ class PredictionModule(BaseCore):
     
     This class implements the prediction module in the ApgSTMD.
     """
+
+    # the prediction gain is smoothed with its past value and the prediction
+    # map is fed back into the attention module
+    isRecursive = True
+    stateAttrs = ('cell_prediction_gain', 'cell_prediction_map', 'ring_pointer', 'num_recorded')
     
-    def __init__(self):
+    def __init__(self, device='cpu'):
         """
         Constructor method.
         
         Initializes the PredictionModule object.
         """
-        super().__init__()
+        super().__init__(device=device)
         self.velocity = None
         self.intDeltaT = 25
         self.sizeFilter = 25
@@ -114,6 +141,9 @@ class PredictionModule(BaseCore):
         self.cell_prediction_gain = None
         self.cell_prediction_map = None
         self.time_attenuation_kernel = None
+        self.ring_pointer = 0  # oldest entry of the tensor rings
+        self.num_recorded = 0  # number of frames in the tensor rings
+        self.prediction_kernel_fft = None
     
     def init_config(self):
         """
@@ -139,6 +169,20 @@ class PredictionModule(BaseCore):
         self.cell_prediction_map = [None]*(self.intDeltaT + 1)
         
         self.time_attenuation_kernel = np.exp(self.kappa * np.arange(-self.intDeltaT, 1))
+
+        if self.backend == 'torch':
+            import torch
+            # the kernel of each direction filters its own channel, see compute_fft_conv2d
+            self.prediction_kernel = torch.from_numpy(
+                np.stack(self.prediction_kernel)).float().to(self.device).unsqueeze(1)
+            self.prediction_kernel_fft = None
+            self.time_attenuation_kernel = torch.from_numpy(
+                self.time_attenuation_kernel).float().to(self.device)
+            # the rings are allocated by the first frame, see process_tensor
+            self.cell_prediction_gain = None
+            self.cell_prediction_map = None
+            self.ring_pointer = 0
+            self.num_recorded = 0
     
     def process(self, lobula_opt):
         """
@@ -147,6 +191,9 @@ class PredictionModule(BaseCore):
         Processes the input lobula_opt to predict motion and update
         prediction map.
         """
+        if self.backend == 'torch':
+            return self.process_tensor(lobula_opt)
+
         num_dict = len(lobula_opt)
         img_h, img_w = lobula_opt[0].shape
         
@@ -171,7 +218,7 @@ class PredictionModule(BaseCore):
         self.cell_prediction_gain[-1] = prediction_gain
         
         # Prediction Map
-        tobe_prediction_map = np.zeros((img_h, img_w))
+        tobe_prediction_map = np.zeros((img_h, img_w), dtype=lobula_opt[0].dtype)
         for idxD in range(num_dict):
             tobe_prediction_map += prediction_gain[idxD]
         
@@ -193,3 +240,56 @@ class PredictionModule(BaseCore):
         prediction_map = self.cell_prediction_map[0]
         self.Opt = facilitated_opt
         return facilitated_opt, prediction_map
+
+    def process_tensor(self, lobula_opt):
+        """
+        Processes a [B, numFilter, H, W] tensor.
+
+        The gains and maps of the last intDeltaT + 1 frames are kept in tensor
+        rings, ring_pointer is the oldest entry. Entries not recorded yet are
+        zero, which adds nothing, as the None entries of the NumPy backend.
+        """
+        import torch
+        len_ring = self.intDeltaT + 1
+        if self.cell_prediction_gain is None:
+            self.cell_prediction_gain = lobula_opt.new_zeros((len_ring,) + tuple(lobula_opt.shape))
+            self.cell_prediction_map = torch.zeros((len_ring, lobula_opt.shape[0], 1) + tuple(lobula_opt.shape[2:]),
+                                                   dtype=torch.bool, device=lobula_opt.device)
+        oldest = self.ring_pointer
+
+        # Prediction Gain, from the gain recorded intDeltaT frames ago
+        last_gain = self.cell_prediction_gain[(oldest + 1) % len_ring]
+        prediction_gain, self.prediction_kernel_fft = compute_fft_conv2d(
+            self.mu * lobula_opt + (1 - self.mu) * last_gain, self.prediction_kernel, self.prediction_kernel_fft)
+        self.cell_prediction_gain[oldest] = prediction_gain
+
+        # Prediction Map
+        tobe_prediction_map = torch.sum(prediction_gain, dim=1, keepdim=True)
+
+        # Facilitated STMD Output, the newest gain is weighted by the first
+        # value of time_attenuation_kernel as in compute_temporal_conv
+        self.ring_pointer = (oldest + 1) % len_ring
+        ring_weight = torch.roll(self.time_attenuation_kernel.flip(0), self.ring_pointer)
+        facilitated_opt = lobula_opt + self.beta * torch.tensordot(ring_weight, self.cell_prediction_gain, dims=1)
+
+        # Memorizer update, thresholded per sample of the batch
+        max_tobe_pre_map = torch.amax(tobe_prediction_map, dim=(-3, -2, -1), keepdim=True)
+        self.cell_prediction_map[oldest] = tobe_prediction_map > max_tobe_pre_map * 2e-1
+        self.num_recorded = min(self.num_recorded + 1, len_ring)
+
+        # Output, the map recorded intDeltaT frames ago
+        prediction_map = self.cell_prediction_map[self.ring_pointer] if self.num_recorded == len_ring else None
+        self.Opt = facilitated_opt
+        return facilitated_opt, prediction_map
+
+    def get_temporal_memory(self):
+        """
+        The prediction gains and maps are kept for intDeltaT frames.
+        """
+        return self.intDeltaT
+
+    def get_spatial_radius(self):
+        """
+        The prediction map is thresholded against its maximum over the frame.
+        """
+        return None
@@ -57,7 +57,7 @@ class PredictionModule(BaseCore):
             )
 
         # Prediction Map
-        predictionMap = np.zeros((imgH, imgW))
+        predictionMap = np.zeros((imgH, imgW), dtype=lobulaOpt[0].dtype)
         for idxD in range(numDict):
             predictionMap += predictionGain[idxD]
 
@@ -77,3 +77,7 @@ class PredictionModule(BaseCore):
         self.Opt = facilitatedOpt
         
         return facilitatedOpt, predictionMap
+
+    def get_spatial_radius(self):
+        # The prediction map is thresholded against its maximum over the frame
+        return None
@@ -1,16 +1,48 @@
 from abc import ABC, abstractmethod
 
+from ..util.datarecord import CircularList
+
+
+def parse_device(device):
+    """
+    Splits a device into the backend and the device of the arrays.
+
+    Parameters:
+        - device: 'cpu' (NumPy backend), 'torch-cpu' (torch backend on the CPU,
+          multi-threaded, see torch.set_num_threads) or a CUDA device such as
+          'cuda' or 'cuda:1' (torch backend on the GPU).
+
+    Returns:
+        - backend: 'numpy' or 'torch'.
+        - device: Device of the tensors ('cpu' for the NumPy backend).
+    """
+    device = str(device)
+    if device == 'cpu':
+        return 'numpy', 'cpu'
+    elif device == 'torch-cpu':
+        return 'torch', 'cpu'
+    elif device.startswith('cuda'):
+        return 'torch', device
+    raise ValueError(f"Unknown device: {device}, expected 'cpu', 'torch-cpu' or 'cuda[:index]'.")
+
+
 class BaseCore(ABC):
     """
     Abstract base class for core processing components.
     """
 
+    # A recursive core feeds its past outputs back into its state (IIR), its memory is unbounded
+    isRecursive = False
+    # Attributes, besides the CircularLists, carried over from one frame to the next
+    stateAttrs = ()
+
     def __init__(self, device ='cpu'):
         """
         Constructor.
         """
         self.Opt = None
-        self.device = device
+        self.backend, self.device = parse_device(device)
+        self.dtype = None   # Floating dtype of the NumPy backend, None follows the input
 
     @abstractmethod
     def init_config(self, *args, **kwargs):
@@ -25,3 +57,96 @@ class BaseCore(ABC):
         Abstract method for processing.
         """
         pass
+
+    def named_cores(self, prefix='', memo=None):
+        """
+        Yields (name, core) for this core and all of its sub-cores, depth-first.
+
+        Sub-cores are found among the instance attributes, a core shared by two
+        attributes is only yielded once.
+        """
+        if memo is None:
+            memo = set()
+        if id(self) in memo:
+            return
+        memo.add(id(self))
+
+        yield prefix, self
+        for name, value in vars(self).items():
+            if isinstance(value, BaseCore):
+                yield from value.named_cores(f'{prefix}.{name}' if prefix else name, memo)
+
+    def sub_cores(self):
+        """
+        Returns the direct sub-cores of this core.
+        """
+        return [value for value in vars(self).values() if isinstance(value, BaseCore)]
+
+    def get_temporal_memory(self):
+        """
+        Returns the number of past frames the current output depends on.
+
+        A core whose output only depends on the inputs of the current frame and
+        of the `n` previous ones has a memory of `n` (0 for a spatial filter).
+        For a recursive core, this is the memory of its FIR part only, see
+        `get_decay_rate`. By default the sub-cores are taken as a chain, so
+        their memories add up, plus the longest history buffer of the core
+        itself; cores with parallel branches override it.
+        Kernel lengths are only known after `init_config`.
+        """
+        memory = max([len(value) - 1 for value in vars(self).values() if isinstance(value, CircularList)] + [0])
+        return memory + sum(core.get_temporal_memory() for core in self.sub_cores())
+
+    def get_spatial_radius(self):
+        """
+        Returns the radius, in pixels, of the spatial receptive field of the output.
+
+        The output of a core at a pixel only depends on the inputs within
+        `radius` rows and columns of it: 0 for a point-wise or temporal
+        operation, half the kernel size for a spatial filter. None when the
+        output depends on the whole frame (normalization by the maximum,
+        tracking). By default the sub-cores are taken as a chain, so their
+        radii add up; cores with spatial kernels override it.
+        """
+        radii = [core.get_spatial_radius() for core in self.sub_cores()]
+        if None in radii:
+            return None
+        return sum(radii)
+
+    def get_decay_rate(self):
+        """
+        Returns the per-frame contraction factor of the state of a recursive core.
+
+        After `n` frames, a difference in the state of the core has shrunk by at
+        least `decayRate ** n`. None when no such bound is known (non-linear
+        feedback loops).
+        """
+        return None
+
+    def get_state(self):
+        """
+        Returns the temporal state of this core, without its sub-cores.
+
+        The state is made of the history buffers (CircularList attributes) and
+        of the attributes listed in `stateAttrs`.
+        """
+        state = {name: value for name, value in vars(self).items() if isinstance(value, CircularList)}
+        for name in self.stateAttrs:
+            state[name] = getattr(self, name)
+        return state
+
+    def set_state(self, state):
+        """
+        Restores a state returned by `get_state`.
+
+        History buffers are restored in place, so references to them held by
+        other cores stay valid.
+        """
+        for name, value in state.items():
+            buffer = getattr(self, name, None)
+            if isinstance(value, CircularList) and isinstance(buffer, CircularList):
+                buffer[:] = value
+                buffer.initLen = value.initLen
+                buffer.pointer = value.pointer
+            else:
+                setattr(self, name, value)
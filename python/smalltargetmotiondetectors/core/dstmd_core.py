@@ -1,8 +1,6 @@
 import math
 
 import numpy as np
-import torch
-import torch.nn.functional as F
 
 from .base_core import BaseCore
 from ..util.datarecord import CircularList
@@ -70,6 +68,13 @@ class Medulla(BaseCore):
         self.Opt = [tm3Signal, mi1Para4Signal, tm1Para5Signal, tm1Para6Signal]
         return self.Opt
 
+    def get_temporal_memory(self):
+        """Memory of the longest branch, both Tm1 delays read the history of cellTm1Ipt."""
+        tm1Memory = max(self.hTm1Para5.get_temporal_memory(), self.hTm1Para6.get_temporal_memory())
+        if len(self.cellTm1Ipt):
+            tm1Memory = min(tm1Memory, len(self.cellTm1Ipt) - 1)
+        return max(self.hMi1Para4.get_temporal_memory(), tm1Memory)
+
 
 class Mi1(BaseCore):
     """Mi1 class for motion detection."""
@@ -143,7 +148,8 @@ class Tm2(BaseCore):
     def process(self, iptMatrix):
         """Processing method."""
         # Processes the input matrix by performing a maximum operation with zero for negative values
-        if self.device != 'cpu':
+        if self.backend == 'torch':
+            import torch
             tm2Opt = torch.clamp(-iptMatrix, min=0)
         else:
             tm2Opt = np.maximum(-iptMatrix, 0)
@@ -167,7 +173,8 @@ class Tm3(BaseCore):
     def process(self, iptMatrix):
         """Processing method."""
         # Processes the input matrix by performing a maximum operation with zero for negative values
-        if self.device != 'cpu':
+        if self.backend == 'torch':
+            import torch
             tm3Opt = torch.clamp(iptMatrix, min=0)
         else:
             tm3Opt = np.maximum(iptMatrix, 0)
@@ -197,7 +204,8 @@ class Lobula(BaseCore):
         
         tm3Signal, mi1Para4Signal, tm1Para5Signal, tm1Para6Signal = lobulaIpt
 
-        if self.device != 'cpu':    
+        if self.backend == 'torch':    
+            import torch
             # tm3, mi1_p4, tm1_p5, tm1_p6 形状均为 [1, 1, H, W]
             tm3, mi1_p4, tm1_p5, tm1_p6 = lobulaIpt
             _, _, imgH, imgW = tm3.shape
@@ -269,7 +277,7 @@ class Lobula(BaseCore):
             tm1P5_roi = tm1Para5Signal[x_start:x_end, y_start:y_end]
 
             # 3. 初始化 3D 输出数组 (比 list 效率更高)
-            correOutput = np.zeros((numDict, imgH, imgW))
+            correOutput = np.zeros((numDict, imgH, imgW), dtype=tm3Signal.dtype)
 
             # 4. 优化后的循环
             for i in range(numDict):
@@ -296,6 +304,10 @@ class Lobula(BaseCore):
         self.Opt = lobulaOpt
         return lobulaOpt
 
+    def get_spatial_radius(self):
+        """The delayed signals are correlated alpha1 pixels away, then laterally inhibited."""
+        return int(np.ceil(self.alpha1)) + self.hLateralInhi.get_spatial_radius()
+
 
 class DirectionInhi(BaseCore):
     """Directional inhibition in DSTMD."""
@@ -316,10 +328,33 @@ class DirectionInhi(BaseCore):
             self.diretionalInhiKernel = create_direction_inhi_kernel(
                 self.direction, self.sigma1, self.sigma2
             )
-        if self.device != 'cpu':
-            self.diretionalInhiKernel = torch.from_numpy(self.diretionalInhiKernel).float().cuda()
+        if self.backend == 'torch':
+            import torch
+            if type(self.diretionalInhiKernel).__module__ != 'torch':
+                # [direction, direction, 1, 1] weight of a 1x1 conv over the direction channels
+                self.diretionalInhiKernel = torch.from_numpy(
+                    self.get_direction_matrix(np.squeeze(self.diretionalInhiKernel))
+                ).float().to(self.device)[:, :, None, None]
         else:
             self.diretionalInhiKernel = self.diretionalInhiKernel.squeeze()
+            if self.dtype is not None:
+                self.diretionalInhiKernel = self.diretionalInhiKernel.astype(self.dtype)
+
+    def get_direction_matrix(self, kernel):
+        """
+        Returns the (direction, direction) matrix of the directional inhibition.
+
+        The loop of the NumPy backend wraps both the direction and the kernel
+        indices, opt[idx] = sum_s ipt[(idx - s) % direction] * kernel[(center - s) % len(kernel)],
+        which is a fixed linear map of the directions.
+        """
+        lenKernel = len(kernel)
+        center = lenKernel // 2
+        matrix = np.zeros((self.direction, self.direction))
+        for idx in range(self.direction):
+            for shiftPoint in range(lenKernel):
+                matrix[idx, (idx - shiftPoint) % self.direction] += kernel[(center - shiftPoint) % lenKernel]
+        return matrix
 
     def process(self, iptCell):
         """Processing method."""
@@ -330,37 +365,10 @@ class DirectionInhi(BaseCore):
         certer = len2 // 2
         
 
-        if self.device != 'cpu':
-            # 1. 准备数据维度
-            # 输入是 [1, C, H, W]，卷积需要在 C 维度上滑，所以要把 H, W 暂时视为 Batch
-            b, c, h, w = iptCell.shape
-            
-            # 转换形状: [1, C, H, W] -> [1, C, H*W] -> [H*W, 1, C]
-            # 这样对于 conv1d 来说，BatchSize = H*W, 通道数 = 1, 序列长度 = C
-            x = iptCell.view(c, -1).permute(1, 0).unsqueeze(1) 
-            
-            
-            # 3. 执行循环卷积 (Circular Convolution)
-            # padding 设为 kernel_size // 2，且模式设为 'circular'
-            pad_size = self.diretionalInhiKernel.shape[-1]
-            center_idx = pad_size // 2
-            
-            pad_left = center_idx
-            pad_right = pad_size - center_idx - 1
-            
-            # F.pad 在 1D 信号上的填充格式是 (left, right)
-            x_padded = F.pad(x, (pad_left, pad_right), mode='circular')
-
-            # F.conv1d 会在 C 维度（方向轴）上滑动
-            # 结果形状依然是 [H*W, 1, C]
-            result = F.conv1d(x_padded, self.diretionalInhiKernel)
-            
-            # 4. 激活与恢复形状
-            # np.maximum(result, 0) 对应 F.relu
-            opt = F.relu(result)
-            
-            # 恢复回 [1, C, H, W]
-            opt = opt.squeeze(1).permute(1, 0).view(b, c, h, w)
+        if self.backend == 'torch':
+            import torch.nn.functional as F
+            # [B, C, H, W], the directions are mixed by the matrix of get_direction_matrix
+            opt = F.relu(F.conv2d(iptCell, self.diretionalInhiKernel))
 
         else:
             opt = []
@@ -376,7 +384,7 @@ class DirectionInhi(BaseCore):
                     This takes advantage of the fact that the convolution kernel is symmetric, 
                         there is no flip convolution kernel
                     '''
-                    result += iptCell[matrixPoint] * self.diretionalInhiKernel[kernelPoint]
+                    result += iptCell[matrixPoint] * float(self.diretionalInhiKernel[kernelPoint])
 
                 opt.append(np.maximum(result, 0))
 
@@ -1,5 +1,4 @@
 import numpy as np
-import torch
 
 from .base_core import BaseCore
 from .math_operator import GammaBandPassFilter, SurroundInhibition
@@ -66,6 +65,11 @@ class Medulla(BaseCore):
         self.Opt = varageout
         return varageout
 
+    def get_temporal_memory(self):
+        """Tm2 -> Tm1 and Tm3 are parallel branches (Mi1 is not used)."""
+        return max(self.hTm2.get_temporal_memory() + self.hTm1.get_temporal_memory(),
+                   self.hTm3.get_temporal_memory())
+
 
 class Lobula(BaseCore):
     """Lobula layer of the motion detection system."""
@@ -91,16 +95,8 @@ class Lobula(BaseCore):
         # Performs a correlation operation on the ON and OFF channels
         # and then applies surround inhibition
         
-        # Extract ON and OFF channel signals from the input
-        onSignal = varagein[0]
-        offSignal = varagein[1]
-        
         # Perform the correlation operation
-        correlationOutput = (
-            self.a * onSignal +
-            self.b * offSignal +
-            self.c * onSignal * offSignal
-        )
+        correlationOutput = self.compute_correlation(varagein)
 
         # Apply surround inhibition
         lobulaOpt = self.hSubInhi.process(correlationOutput)
@@ -109,6 +105,19 @@ class Lobula(BaseCore):
         self.Opt = lobulaOpt
         return lobulaOpt, correlationOutput
 
+    def compute_correlation(self, varagein):
+        """Correlates the ON and OFF channels, before the surround inhibition."""
+        # Extract ON and OFF channel signals from the input
+        onSignal = varagein[0]
+        offSignal = varagein[1]
+
+        correlationOutput = (
+            self.a * onSignal +
+            self.b * offSignal +
+            self.c * onSignal * offSignal
+        )
+        return correlationOutput
+
 
 class Tm2(BaseCore):
     """Tm2"""
@@ -126,7 +135,8 @@ class Tm2(BaseCore):
     def process(self, tm2Ipt):
         """Processing method."""
         # Applies surround inhibition to the input to generate the output
-        if self.device != 'cpu':
+        if self.backend == 'torch':
+            import torch
             tm2Opt = torch.clamp(-tm2Ipt, min=0)
         else:
             tm2Opt = np.maximum(-tm2Ipt, 0)  # Apply surround inhibition
@@ -150,7 +160,8 @@ class Tm3(BaseCore):
     def process(self, tm3OptIpt):
         """Processing method."""
         # Applies a surround inhibition to the input to generate the output
-        if self.device != 'cpu':
+        if self.backend == 'torch':
+            import torch
             tm3Opt = torch.clamp(tm3OptIpt, min=0)
         else:
             tm3Opt = np.maximum(tm3OptIpt, 0)  # Apply surround inhibition
@@ -2,8 +2,6 @@ from math import exp
 
 import numpy as np
 from cv2 import filter2D, BORDER_CONSTANT
-import torch
-import torch.nn.functional as F
 
 from .base_core import BaseCore
 from ..util.compute_module import compute_temporal_conv, compute_circularlist_conv
@@ -142,6 +140,20 @@ class Medulla(BaseCore):
         self.Opt = (tm3Signal, tm1Signal)  # Update Opt property with output
         return tm3Signal, tm1Signal
 
+    def get_temporal_memory(self):
+        """
+        Tm2 -> Tm1 and Tm3 are parallel branches (Mi1 is not used).
+        """
+        return max(self.hTm2.get_temporal_memory() + self.hTm1.get_temporal_memory(),
+                   self.hTm3.get_temporal_memory())
+
+    def get_spatial_radius(self):
+        """
+        Tm2 -> Tm1 and Tm3 are parallel branches (Mi1 is not used).
+        """
+        return max(self.hTm2.get_spatial_radius() + self.hTm1.get_spatial_radius(),
+                   self.hTm3.get_spatial_radius())
+
 
 class Lobula(BaseCore):
     """
@@ -290,7 +302,8 @@ class Tm2(BaseCore):
         - tm2Opt: Output of the Tm2 layer
         """
         # Extract the OFF signal from iptMatrix
-        if self.device != 'cpu':
+        if self.backend == 'torch':
+            import torch
             offSignal = torch.clamp(-iptMatrix, min=0)
         else:
             offSignal = np.maximum(-iptMatrix, 0)  
@@ -330,7 +343,8 @@ class Tm3(BaseCore):
         Returns:
         - tm3Opt: Output of the Tm3 layer
         """
-        if self.device != 'cpu':
+        if self.backend == 'torch':
+            import torch
             onSignal = torch.clamp(iptMatrix, min=0)
         else:
             onSignal = np.maximum(iptMatrix, 0)  # Extract the On-signal from iptMatrix
@@ -400,7 +414,10 @@ class LaminaLateralInhibition(BaseCore):
         G_sigma2 = create_gaussian_kernel(self.sizeW1[:2], self.sigma2)
         G_sigma3 = create_gaussian_kernel(self.sizeW1[:2], self.sigma3)
         diffOfGaussian = G_sigma2 - G_sigma3
-        if self.device != 'cpu':
+        if self.dtype is not None:
+            diffOfGaussian = diffOfGaussian.astype(self.dtype)
+        if self.backend == 'torch':
+            import torch
             diffOfGaussian = torch.from_numpy(diffOfGaussian).to(device=self.device)
             # W_{S}^{P} in formulate (8) of DSTMD
             self.spatialPositiveKernel = torch.clamp(diffOfGaussian, min=0)
@@ -428,7 +445,8 @@ class LaminaLateralInhibition(BaseCore):
         Applies lateral inhibition to the input matrix
         """
         # Lateral inhibition
-        if self.device != 'cpu':
+        if self.backend == 'torch':
+            import torch.nn.functional as F
             _on_conv = F.conv2d(iptMatrix, self.spatialPositiveKernel, padding='same')
             _off_conv = F.conv2d(iptMatrix, self.spatialNegativeKernel, padding='same')
         else:
@@ -446,6 +464,9 @@ class LaminaLateralInhibition(BaseCore):
 
         return optMatrix
 
+    def get_spatial_radius(self):
+        return max(self.sizeW1[:2]) // 2
+
     
 
 
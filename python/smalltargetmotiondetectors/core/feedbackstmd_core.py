@@ -1,7 +1,5 @@
 import numpy as np
 from cv2 import filter2D, BORDER_CONSTANT
-import torch
-import torch.nn.functional as F
 
 from .base_core import BaseCore
 from .math_operator import SurroundInhibition, GammaDelay
@@ -10,6 +8,9 @@ from ..util.create_kernel import create_gaussian_kernel
 
 class Lobula(BaseCore):
     """ Lobula layer of the motion detection system."""
+
+    # the delayed feedback (Formula (9)) is computed from the past outputs
+    isRecursive = True
     
     def __init__(self, device='cpu'):
         """Constructor method."""
@@ -19,7 +20,7 @@ class Lobula(BaseCore):
         self.alpha = 1  # Parameter alpha
         self.paraGaussKernel = {'eta': 1.5, 'size': 3}  # Parameters for Gaussian kernel
         self.gaussKernel = None  # Gaussian kernel
-        self.hGammaDelay = GammaDelay(10, 25)  # GammaDelay component
+        self.hGammaDelay = GammaDelay(10, 25, device=device)  # GammaDelay component
 
     def init_config(self):
         """ Initialization method."""
@@ -28,7 +29,8 @@ class Lobula(BaseCore):
         self.hGammaDelay.init_config()
         self.gaussKernel = create_gaussian_kernel(self.paraGaussKernel['size'], 
                                                   self.paraGaussKernel['eta'])
-        if self.device != 'cpu':
+        if self.backend == 'torch':
+            import torch
             self.gaussKernel = torch.from_numpy(self.gaussKernel).float().to(self.device).unsqueeze(0).unsqueeze(0)
 
     def process(self, onSignal, offSignal):
@@ -36,10 +38,10 @@ class Lobula(BaseCore):
         # Performs temporal convolution, correlation, and surround inhibition
 
         # Formula (9)
-        _temp = np.zeros_like(onSignal) if self.device == 'cpu' else torch.zeros_like(onSignal)
+        _temp = np.zeros_like(onSignal) if self.backend == 'numpy' else onSignal.new_zeros(onSignal.shape)
         feedbackSignal = self.alpha * self.hGammaDelay.process(_temp)
 
-        if self.device == 'cpu':
+        if self.backend == 'numpy':
             # Formula (8)
             self.v_on = np.maximum(onSignal - feedbackSignal, 0)
             self.v_off = np.maximum(offSignal - feedbackSignal, 0)
@@ -48,6 +50,8 @@ class Lobula(BaseCore):
             # Formula (10)
             correlationE = filter2D(onSignal * offSignal, -1, self.gaussKernel, borderType=BORDER_CONSTANT)
         else:
+            import torch
+            import torch.nn.functional as F
             # Formula (8)
             self.v_on = torch.clamp(onSignal - feedbackSignal, min=0) 
             self.v_off = torch.clamp(offSignal - feedbackSignal, min=0)
@@ -68,3 +72,7 @@ class Lobula(BaseCore):
         self.Opt = lobulaOpt
 
         return lobulaOpt
+
+    def get_spatial_radius(self):
+        """The feedback is delayed point-wise, it only adds the Gaussian kernel of Formula (10)."""
+        return self.paraGaussKernel['size'] // 2 + self.hSubInhi.get_spatial_radius()
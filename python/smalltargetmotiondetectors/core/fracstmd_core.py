@@ -1,6 +1,5 @@
 import numpy as np
 import math
-import torch
 
 from .base_core import BaseCore
 from ..util.create_kernel import create_fracdiff_kernel
@@ -9,6 +8,10 @@ from ..util.compute_module import compute_circularlist_conv
 
 class Lamina(BaseCore):
     """Lamina class for the lamina layer."""
+
+    # the output is computed by iteration from the previous output
+    isRecursive = True
+    stateAttrs = ('preLaminaIpt', 'preLaminaOpt')
     
     def __init__(self, device ='cpu'):
         """Constructor method."""
@@ -41,9 +44,10 @@ class Lamina(BaseCore):
         """Processing method."""
         # Processes the LaminaIpt to generate the lamina output
         if self.preLaminaIpt is None:
-            if self.device == 'cpu':
+            if self.backend == 'numpy':
                 diffLaminaIpt = np.zeros_like(LaminaIpt)
             else:
+                import torch
                 diffLaminaIpt = torch.zeros_like(LaminaIpt)
         else:
             # First order difference
@@ -72,3 +76,11 @@ class Lamina(BaseCore):
         self.preLaminaOpt = laminaopt
         
         return laminaopt
+
+    def get_temporal_memory(self):
+        """The first order difference needs the previous input."""
+        return 1
+
+    def get_decay_rate(self):
+        """The previous output is weighted by paraPre."""
+        return self.paraPre
@@ -4,6 +4,9 @@ from .math_operator import GammaDelay
 class FeedbackPathway(BaseCore):
     """FeedbackPathway class for the feedback pathway."""
 
+    # the feedback signal is fed back into the lamina
+    isRecursive = True
+
     def __init__(self):
         """Constructor method."""
         # Initializes the FeedbackPathway object
@@ -5,6 +5,8 @@ from . import fracstmd_core
 class Lamina(fracstmd_core.Lamina):
     """Lamina class for the lamina layer."""
 
+    stateAttrs = fracstmd_core.Lamina.stateAttrs + ('loopLaminaOpt',)
+
     def __init__(self):
         """Constructor method."""
         # Initializes the Lamina object
@@ -9,8 +9,8 @@ from .math_operator import SurroundInhibition
 
 
 class Medulla(BaseCore):
-    def __init__(self):
-        super().__init__()
+    def __init__(self, device='cpu'):
+        super().__init__(device=device)
         self.lenTemporalKernel = 15
         self.sizeSpacialKernel = [8, 16]
         self.cp = 15  # a parameter to adjust the spacialOn and spacialOff
@@ -18,6 +18,8 @@ class Medulla(BaseCore):
 
         self.spacialOnKernel = None
         self.spacialOffKernel = None
+        self.boxRowKernel = None
+        self.boxColumnKernel = None
         self.temporalOnKernel = None
         self.temporalOffKernel = None
 
@@ -34,6 +36,12 @@ class Medulla(BaseCore):
 
         self.spacialOnKernel = np.vstack((np.ones((m1, n1)), np.zeros((m1, n2))))
         self.spacialOffKernel = np.vstack((np.zeros((m1, n1)), -np.ones((m1, n2))))
+        if self.backend == 'torch':
+            import torch
+            # both spacial kernels are m1 x n1 boxes, above and below the anchor,
+            # so they share one separable box sum (see compute_spacial_filter)
+            self.boxRowKernel = torch.ones(1, 1, 1, n1, device=self.device)
+            self.boxColumnKernel = torch.ones(1, 1, m1, 1, device=self.device)
 
         # Temporal kernels
         k1 = int(np.ceil(self.lenTemporalKernel / 2))
@@ -49,20 +57,46 @@ class Medulla(BaseCore):
         self.cellMedullaIpt.initLen = self.lenTemporalKernel
         self.cellMedullaIpt.reset()
 
+    def compute_spacial_filter(self, medullaIpt):
+        ''' Returns the rectified outputs of the spacial ON and OFF kernels. '''
+        if self.backend == 'numpy':
+            # SP_ON
+            spacialOnOpt = np.maximum(filter2D(medullaIpt, -1, self.spacialOnKernel, borderType=BORDER_CONSTANT), 0)
+            # SP_OFF
+            spacialOffOpt = np.maximum(filter2D(medullaIpt, -1, self.spacialOffKernel, borderType=BORDER_CONSTANT), 0)
+        else:
+            import torch
+            import torch.nn.functional as F
+            # zero border as filter2D, whose anchor is the kernel center (rounded down)
+            kernelHeight, kernelWidth = self.spacialOnKernel.shape
+            anchorRow, anchorColumn = kernelHeight // 2, kernelWidth // 2
+            paddedIpt = F.pad(medullaIpt, (anchorColumn, kernelWidth - 1 - anchorColumn, 
+                                           anchorRow, kernelHeight - 1 - anchorRow))
+            boxSum = F.conv2d(F.conv2d(paddedIpt, self.boxRowKernel), self.boxColumnKernel)
+            # SP_ON sums the box above the anchor, SP_OFF subtracts the one below
+            height = medullaIpt.shape[-2]
+            boxHeight = self.boxColumnKernel.shape[-2]
+            spacialOnOpt = torch.clamp(boxSum[..., :height, :], min=0)
+            spacialOffOpt = torch.clamp(-boxSum[..., boxHeight:boxHeight + height, :], min=0)
+        return spacialOnOpt, spacialOffOpt
+
     def process(self, medullaIpt):
         ''' Compute spacial part '''
-        # SP_ON
-        spacialOnOpt = np.maximum(filter2D(medullaIpt, -1, self.spacialOnKernel, borderType=BORDER_CONSTANT), 0)
-        # SP_OFF
-        spacialOffOpt = np.maximum(filter2D(medullaIpt, -1, self.spacialOffKernel, borderType=BORDER_CONSTANT), 0)
+        spacialOnOpt, spacialOffOpt = self.compute_spacial_filter(medullaIpt)
 
         # SP
         nowSpacialOpt = self.compute_spacial_correlation(spacialOnOpt, 
                                                          spacialOffOpt, 
                                                          self.cp, 
                                                          self.theta)
-        if nowSpacialOpt.max() > 0:
-            nowSpacialOpt /= nowSpacialOpt.max()
+        if self.backend == 'numpy':
+            if nowSpacialOpt.max() > 0:
+                nowSpacialOpt /= nowSpacialOpt.max()
+        else:
+            import torch
+            # normalized per sample of the batch, without a host synchronization
+            maxOpt = torch.amax(nowSpacialOpt, dim=(-2, -1), keepdim=True)
+            nowSpacialOpt = nowSpacialOpt / torch.where(maxOpt > 0, maxOpt, torch.ones_like(maxOpt))
         # record Spatial output by cell (Parameter_Residual.DLSTMD_SpatialSum)
         self.cellSpatialOpt.record_next(nowSpacialOpt)
 
@@ -70,12 +104,15 @@ class Medulla(BaseCore):
         # record Medulla input (Lamina output) by cell (Parameter_Residual.DLSTMD_SpatialSum)
         self.cellMedullaIpt.record_next(medullaIpt)
 
-        temporalOnOpt = np.maximum(
-            compute_circularlist_conv(self.cellMedullaIpt, self.temporalOnKernel), 
-            0)
-        temporalOffOpt = np.maximum(
-            compute_circularlist_conv(self.cellMedullaIpt, self.temporalOffKernel), 
-            0)
+        temporalOnOpt = compute_circularlist_conv(self.cellMedullaIpt, self.temporalOnKernel)
+        temporalOffOpt = compute_circularlist_conv(self.cellMedullaIpt, self.temporalOffKernel)
+        if self.backend == 'numpy':
+            temporalOnOpt = np.maximum(temporalOnOpt, 0)
+            temporalOffOpt = np.maximum(temporalOffOpt, 0)
+        else:
+            import torch
+            temporalOnOpt = torch.clamp(temporalOnOpt, min=0)
+            temporalOffOpt = torch.clamp(temporalOffOpt, min=0)
 
         # TP
         # There's no need for half-wave rectification here
@@ -86,9 +123,18 @@ class Medulla(BaseCore):
 
         return self.cellSpatialOpt, temporalOpt
 
+    def get_spatial_radius(self):
+        """The spacial output is normalized by its maximum over the frame."""
+        return None
+
     @classmethod
     def compute_spacial_correlation(cls, spacialOnOpt, spacialOffOpt, alpha, theta):
-        spacialOpt = np.zeros_like(spacialOnOpt)
+        ''' Correlates the ON output with the OFF output shifted by alpha along theta, 
+        on arrays or (B, 1, H, W) tensors. '''
+        if isinstance(spacialOnOpt, np.ndarray):
+            spacialOpt = np.zeros_like(spacialOnOpt)
+        else:
+            spacialOpt = spacialOnOpt.new_zeros(spacialOnOpt.shape)
 
         dColumn = round(alpha * np.cos(theta))
         if theta <= np.pi:
@@ -98,17 +144,17 @@ class Medulla(BaseCore):
 
         bw = round(alpha) # bw = round(alpha*sin(pi/2))
 
-        spacialOpt[bw:-bw, bw:-bw] = spacialOnOpt[bw:-bw, bw:-bw] * \
-                                    spacialOffOpt[bw+dLine:-bw+dLine, bw+dColumn:-bw+dColumn]
+        spacialOpt[..., bw:-bw, bw:-bw] = spacialOnOpt[..., bw:-bw, bw:-bw] * \
+                                    spacialOffOpt[..., bw+dLine:-bw+dLine, bw+dColumn:-bw+dColumn]
 
         return spacialOpt
 
 
 class Lobula(BaseCore):
-    def __init__(self):
-        super().__init__()
+    def __init__(self, device='cpu'):
+        super().__init__(device=device)
         self.tau = 1  # a parameter to align the spacialOpt and temporalOpt
-        self.hSubInhi = SurroundInhibition()
+        self.hSubInhi = SurroundInhibition(device=device)
         self.hSubInhi.B = 1
 
     def init_config(self):
@@ -121,14 +167,24 @@ class Lobula(BaseCore):
 
         if spatialOpt is not None:
             correlationOutput = spatialOpt * temporalOpt
-        else:
+        elif self.backend == 'numpy':
             correlationOutput = np.zeros_like(temporalOpt)
+        else:
+            correlationOutput = temporalOpt.new_zeros(temporalOpt.shape)
 
         # Apply surround inhibition
-        lobulaOpt = np.maximum(self.hSubInhi.process(correlationOutput), 0)
+        if self.backend == 'numpy':
+            lobulaOpt = np.maximum(self.hSubInhi.process(correlationOutput), 0)
+        else:
+            import torch
+            lobulaOpt = torch.clamp(self.hSubInhi.process(correlationOutput), min=0)
 
         # Store the output in Opt property
         self.Opt = lobulaOpt
         return lobulaOpt
 
+    def get_temporal_memory(self):
+        # the spatial output is read tau frames back from the history of the medulla
+        return self.tau
+
 
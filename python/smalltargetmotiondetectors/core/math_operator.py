@@ -1,8 +1,5 @@
-from cv2 import filter2D, BORDER_CONSTANT
+from cv2 import filter2D, BORDER_CONSTANT, CV_32F, CV_64F
 import numpy as np
-from scipy.ndimage import gaussian_filter
-import torch
-import torch.nn.functional as F
 
 from .base_core import BaseCore
 from ..util.compute_module import compute_temporal_conv, compute_circularlist_conv
@@ -25,17 +22,27 @@ class GaussianBlur(BaseCore):
         self.size = 3   # Size of the filter kernel
         self.sigma = 1  # Standard deviation of the Gaussian distribution
         self.gaussKernel = None  # Gaussian filter kernel
+        self.gaussKernelUint8 = None  # Gaussian filter kernel with the 1/255 normalization folded in
 
     def init_config(self):
         self.gaussKernel = create_gaussian_kernel(self.size, self.sigma)
+        if self.dtype is not None:
+            self.gaussKernel = self.gaussKernel.astype(self.dtype)
+        # uint8 input is normalized to [0, 1] by the blur itself
+        self.gaussKernelUint8 = self.gaussKernel.astype(np.float64) / 255
 
-        if self.device == 'cuda':
+        if self.backend == 'torch':
+            import torch
             self.gaussKernel = torch.from_numpy(self.gaussKernel).float().to(self.device).unsqueeze(0).unsqueeze(0)
+            self.gaussKernelUint8 = \
+                torch.from_numpy(self.gaussKernelUint8).float().to(self.device).unsqueeze(0).unsqueeze(0)
 
     def process(self, ipt):
         """
         Processing method.
         Applies the Gaussian filter to the input matrix.
+        The input is cast to `dtype` when it is set. A uint8 input (raw gray
+        levels) is normalized to [0, 1] within the filtering.
 
         Parameters:
         - iptMatrix: Input matrix.
@@ -43,13 +50,27 @@ class GaussianBlur(BaseCore):
         Returns:
         - opt: Output after applying the Gaussian filter.
         """
-        if self.device == 'cpu':
-            opt = filter2D(ipt, -1, self.gaussKernel, borderType=BORDER_CONSTANT)
+        if self.backend == 'numpy':
+            if ipt.dtype == np.uint8:
+                ddepth = CV_32F if self.dtype == np.float32 else CV_64F
+                opt = filter2D(ipt, ddepth, self.gaussKernelUint8, borderType=BORDER_CONSTANT)
+            else:
+                if self.dtype is not None and ipt.dtype != self.dtype:
+                    ipt = ipt.astype(self.dtype)
+                opt = filter2D(ipt, -1, self.gaussKernel, borderType=BORDER_CONSTANT)
 
         else:
-            opt = F.conv2d(ipt, self.gaussKernel, padding='same')
+            import torch
+            import torch.nn.functional as F
+            if ipt.dtype == torch.uint8:
+                opt = F.conv2d(ipt.float(), self.gaussKernelUint8, padding='same')
+            else:
+                opt = F.conv2d(ipt, self.gaussKernel, padding='same')
 
         return opt
+
+    def get_spatial_radius(self):
+        return max(np.atleast_1d(self.size)) // 2
     
 
 class GammaDelay(BaseCore):
@@ -65,6 +86,7 @@ class GammaDelay(BaseCore):
         lenKernel (int): Length of the filter kernel. If not provided, it is calculated based on the time constant.
         isRecord (bool): Flag indicating whether to record input history. Default is True.
         isInLoop (bool): Flag indicating whether to cover the point in CircularCell. Default is False.
+        isLoopCached (bool): Flag indicating whether to keep the weighted sum of the older inputs for the next calls in the loop. Default is False.
     
     Methods:
         __init__(order=1, tau=1, len_kernel=None): Constructor method. Initializes a GammaDelay object with the specified parameters.
@@ -85,6 +107,7 @@ class GammaDelay(BaseCore):
             tau (float): Time constant of the filter.
             len_kernel (int): Length of the filter kernel. If not provided, it is calculated based on the time constant.
         """
+        super().__init__(device=device)
         self.order = order
         self.tau = tau
         self.lenKernel = lenKernel
@@ -92,8 +115,9 @@ class GammaDelay(BaseCore):
         self.isInLoop = False
         self.gammaKernel = None
         self.listInput = None
-
-        self.device = device
+        self.isLoopCached = False  # keep the weighted sum of the older entries for the loop
+        self.loopHistory = None
+        self.loopHistoryKey = None
 
     def init_config(self, isRecord=True):
         self.isRecord = isRecord
@@ -108,6 +132,8 @@ class GammaDelay(BaseCore):
             self.gammaKernel = create_gamma_kernel(self.order,
                                                    self.tau,
                                                    self.lenKernel)
+        if self.dtype is not None:
+            self.gammaKernel = self.gammaKernel.astype(self.dtype)
 
         if self.isRecord:
             self.listInput = CircularList(self.lenKernel)
@@ -119,7 +145,7 @@ class GammaDelay(BaseCore):
             return self.process_list(inputData)
         elif isinstance(inputData, np.ndarray):
             return self.process_matrix(inputData)
-        elif isinstance(inputData, torch.Tensor):
+        elif type(inputData).__module__ == 'torch':
             return self.process_tensor(inputData)
 
     def process_matrix(self, inputMatrix):
@@ -143,8 +169,28 @@ class GammaDelay(BaseCore):
                                      self.gammaKernel)
 
     def process_circularlist(self, objCircularList):
-        return compute_circularlist_conv(objCircularList, 
-                                         self.gammaKernel)
+        if not (self.isInLoop or self.isLoopCached):
+            return compute_circularlist_conv(objCircularList, 
+                                             self.gammaKernel)
+
+        # Within a loop only the current entry is covered, the weighted sum of
+        # the older entries is computed once per frame
+        currentIpt = objCircularList[objCircularList.pointer]
+        currentWeight = float(np.squeeze(self.gammaKernel)[0])
+        loopHistoryKey = (id(objCircularList), objCircularList.pointer)
+        if not self.isInLoop or self.loopHistory is None or self.loopHistoryKey != loopHistoryKey:
+            optMatrix = compute_circularlist_conv(objCircularList, 
+                                                  self.gammaKernel)
+            self.loopHistory = optMatrix - currentIpt * currentWeight
+            self.loopHistoryKey = loopHistoryKey
+            return optMatrix
+
+        return self.loopHistory + currentIpt * currentWeight
+
+    def get_temporal_memory(self):
+        # the kernel length, also when the history is recorded by the owner (isRecord=False)
+        lenKernel = self.lenKernel if self.lenKernel is not None else int(np.ceil(3 * self.tau))
+        return lenKernel - 1
 
 
 class GammaBandPassFilter(BaseCore):
@@ -167,6 +213,7 @@ class GammaBandPassFilter(BaseCore):
         self.hGammaDelay1 = GammaDelay(2, 3, device=device)
         self.hGammaDelay2 = GammaDelay(3, 6, device=device)
         self.objListIpt = CircularList()
+        self.isInLoop = False  # cover the current input instead of recording a new one
 
     def init_config(self):
         """
@@ -199,8 +246,11 @@ class GammaBandPassFilter(BaseCore):
         Returns:
         - optMatrix: Processed output matrix
         """
-        # Record input matrix in circular cell
-        self.objListIpt.record_next(iptMatrix)
+        # Record input matrix in circular cell, a loop on the same frame covers it
+        if self.isInLoop:
+            self.objListIpt.cover(iptMatrix)
+        else:
+            self.objListIpt.record_next(iptMatrix)
 
         # Compute outputs of gamma delays
         gamma1Output = self.hGammaDelay1.process_circularlist(self.objListIpt)
@@ -211,6 +261,15 @@ class GammaBandPassFilter(BaseCore):
         optMatrix = gamma1Output - gamma2Output
         return optMatrix
 
+    def get_temporal_memory(self):
+        """
+        Both gamma delays read the same input history, the longest one counts.
+        """
+        memory = max(self.hGammaDelay1.get_temporal_memory(), self.hGammaDelay2.get_temporal_memory())
+        if len(self.objListIpt):
+            memory = min(memory, len(self.objListIpt) - 1)
+        return memory
+
 
 class SurroundInhibition(BaseCore):
     """
@@ -239,7 +298,7 @@ class SurroundInhibition(BaseCore):
         self.rho = rho
         self.A = A
         self.B = B
-        if device != 'cpu':
+        if self.backend == 'torch':
             self.channel_size = channel_size
 
     def init_config(self):
@@ -256,7 +315,10 @@ class SurroundInhibition(BaseCore):
             self.A,
             self.B
         )
-        if self.device != 'cpu':
+        if self.dtype is not None:
+            self.corrInhiKernelW2 = self.corrInhiKernelW2.astype(self.dtype)
+        if self.backend == 'torch':
+            import torch
             self.convInhiKernelW2 = \
                 torch.from_numpy(self.corrInhiKernelW2).float().to(device=self.device).unsqueeze(0).unsqueeze(0).repeat(self.channel_size, 1, 1, 1)
 
@@ -271,15 +333,20 @@ class SurroundInhibition(BaseCore):
         Returns:
         - inhiOpt: Output of the surround inhibition filter
         """
-        if self.device == 'cpu':
+        if self.backend == 'numpy':
             inhiOpt = filter2D(ipt, -1, self.corrInhiKernelW2, borderType=BORDER_CONSTANT)
             inhiOpt = np.maximum(inhiOpt, 0)
             return inhiOpt
         else:
+            import torch
+            import torch.nn.functional as F
             inhiOpt = F.conv2d(ipt, self.convInhiKernelW2, padding='same', groups=self.channel_size)
             inhiOpt = torch.clamp(inhiOpt, min=0)
             return inhiOpt
 
+    def get_spatial_radius(self):
+        return self.KernelSize // 2
+
 
 if __name__ == "__main__":
     pass
\ No newline at end of file
@@ -7,20 +7,26 @@ from .math_operator import SurroundInhibition, GammaDelay
 from . import estmd_backbone 
 from ..util.datarecord import CircularList
 from ..util.create_kernel import *
-from ..util.compute_module import slice_matrix_holding_size
+from ..util.compute_module import slice_matrix_holding_size, sum_shifted_tensors, correlate_shifted_tensors
 
 
 class Medulla(estmd_backbone.Medulla):
     # Medulla layer of the motion detection system
 
-    def __init__(self):
+    # tensor ring of the Tm3 outputs, which replaces cellTm1Ipt on the torch backend
+    stateAttrs = ('cellTm3Ring', 'ringPointer')
+
+    def __init__(self, device='cpu'):
         # Constructor method
         # Initializes the Medulla object
-        super().__init__()
+        super().__init__(device=device)
 
         self.hPara5Mi1 = None
         self.hPara5Tm1 = None
         self.cellTm1Ipt = None
+        self.delayKernels = None  # kernels of hTm1, hPara5Tm1 and hPara5Mi1 (torch)
+        self.cellTm3Ring = None
+        self.ringPointer = -1  # newest entry of cellTm3Ring
 
     def init_config(self):
         # Initialization method
@@ -42,9 +48,26 @@ class Medulla(estmd_backbone.Medulla):
 
         self.cellTm1Ipt.reset()
 
+        if self.backend == 'torch':
+            import torch
+            # The three gamma delays filter the same Tm3 history, one row per
+            # delay, cut or padded with zeros to the length of cellTm1Ipt
+            lenRing = self.cellTm1Ipt.initLen
+            delayKernels = np.zeros((3, lenRing))
+            for idx, hDelay in enumerate([self.hTm1, self.hPara5Tm1, self.hPara5Mi1]):
+                kernel = np.squeeze(hDelay.gammaKernel)[:lenRing]
+                delayKernels[idx, :len(kernel)] = kernel
+            self.delayKernels = torch.from_numpy(delayKernels).float().to(self.device)
+            # the ring is allocated by the first frame, see process_tensor
+            self.cellTm3Ring = None
+            self.ringPointer = -1
+
     def process(self, MedullaIpt):
         # Processing method
         # Applies processing to the input and returns the output
+        if self.backend == 'torch':
+            return self.process_tensor(MedullaIpt)
+
         # Process Tm2 and Tm3 components
         tm2Signal = self.hTm2.process(MedullaIpt)
         tm3Signal = self.hTm3.process(MedullaIpt)
@@ -62,23 +85,48 @@ class Medulla(estmd_backbone.Medulla):
         self.Opt = varageout
         return varageout
 
+    def process_tensor(self, MedullaIpt):
+        """
+        Processes a [B, 1, H, W] tensor.
+
+        The Tm3 outputs are recorded in a tensor ring [lenRing, B, 1, H, W] and
+        the gamma delays of Tm1, Para5 Tm1 and Para5 Mi1 are computed at once,
+        as a product of their kernels with the ring. Entries not recorded yet
+        are zero, which adds nothing, as the None entries of the NumPy backend.
+        """
+        import torch
+        tm2Signal = self.hTm2.process(MedullaIpt)
+        tm3Signal = self.hTm3.process(MedullaIpt)
+
+        lenRing = self.delayKernels.shape[1]
+        if self.cellTm3Ring is None:
+            self.cellTm3Ring = tm3Signal.new_zeros((lenRing,) + tuple(tm3Signal.shape))
+        self.ringPointer = (self.ringPointer + 1) % lenRing
+        self.cellTm3Ring[self.ringPointer] = tm3Signal
+
+        # the entry recorded t frames ago is weighted by kernel[t]
+        ringWeight = torch.roll(self.delayKernels.flip(1), self.ringPointer + 1, dims=1)
+        tm1Para3Signal, tm1Para5Signal, mi1Para5Signal = torch.tensordot(ringWeight, self.cellTm3Ring, dims=1)
+
+        varageout = [tm3Signal, tm1Para3Signal, mi1Para5Signal, tm2Signal, tm1Para5Signal, self.hPara5Mi1.tau]
+        self.Opt = varageout
+        return varageout
+
 
 class Lobula(BaseCore):
     # Lobula layer of the motion detection system
 
-    def __init__(self):
+    def __init__(self, device='cpu'):
         # Constructor method
         # Initializes the Lobula object
-        super().__init__()
+        super().__init__(device=device)
 
-        self.hSTMD = None
-        self.hLPTC = None
+        self.hSTMD = Stmdcell(device=device)
+        self.hLPTC = Lptcell(device=device)
 
     def init_config(self):
         # Initialization method
         # This method initializes the Lobula layer component
-        self.hSTMD = Stmdcell()
-        self.hLPTC = Lptcell()
         self.hSTMD.init_config()
         self.hLPTC.init_config(self.hSTMD.hGammaDelay.lenKernel)
 
@@ -103,12 +151,15 @@ class Lobula(BaseCore):
 class Stmdcell(BaseCore):
     # Lobula layer of the motion detection system
 
-    def __init__(self):
+    # the recorded correlation outputs depend on the delayed feedback signal
+    isRecursive = True
+
+    def __init__(self, device='cpu'):
         # Constructor method
         # Initializes the Lobula object
-        super().__init__()
+        super().__init__(device=device)
 
-        self.hSubInhi = None  # SurroundInhibition component
+        self.hSubInhi = SurroundInhibition(device=device)  # SurroundInhibition component
         self.alpha = 0.1  # Parameter alpha
         self.gaussKernel = None  # Gaussian kernel
         self.hGammaDelay = None
@@ -118,7 +169,6 @@ class Stmdcell(BaseCore):
     def init_config(self):
         # Initialization method
         # This method initializes the Lobula layer component
-        self.hSubInhi = SurroundInhibition()
         self.hGammaDelay = GammaDelay(6, 12)
         self.cellDPlusE = CircularList()
 
@@ -133,10 +183,16 @@ class Stmdcell(BaseCore):
             np.zeros((self.paraGaussKernel['size'], self.paraGaussKernel['size'])),
             self.paraGaussKernel['eta']
         )
+        if self.backend == 'torch':
+            import torch
+            self.gaussKernel = torch.from_numpy(self.gaussKernel).float().to(self.device).unsqueeze(0).unsqueeze(0)
 
     def process(self, tm3Signal, tm1Signal, faiList, psiList):
         # Processing method
         # Performs temporal convolution, correlation, and surround inhibition
+        if self.backend == 'torch':
+            return self.process_tensor(tm3Signal, tm1Signal, faiList, psiList)
+
         convnIpt = [None] * self.cellDPlusE.initLen
 
         for idxT in range(len(convnIpt)-1, -1, -1):
@@ -165,14 +221,57 @@ class Stmdcell(BaseCore):
 
         return lateralInhiSTMDOpt
 
+    def process_tensor(self, tm3Signal, tm1Signal, faiList, psiList):
+        """
+        Processes [B, 1, H, W] tensors.
+
+        As in the NumPy loop, every lag of the feedback shifts the newest
+        recorded (D + E), the lag idxT by (psiList[idxT], faiList[idxT]), and is
+        weighted by the gamma kernel. Lags with the same shift are merged, the
+        others are added with their weights from views of (D + E).
+        """
+        import torch
+        import torch.nn.functional as F
+        newestDPlusE = self.cellDPlusE[self.cellDPlusE.pointer]
+
+        if newestDPlusE is not None:
+            lenList = self.cellDPlusE.initLen
+            kernel = np.squeeze(self.hGammaDelay.gammaKernel)[:lenList]
+            # convnIpt[idxT] is weighted by kernel[lenList - 1 - idxT], see compute_temporal_conv
+            lagWeight = np.zeros(lenList)
+            lagWeight[lenList - len(kernel):] = kernel[::-1]
+
+            shifts = np.round(np.column_stack((psiList, faiList)))
+            shifts, idxShift = np.unique(shifts, axis=0, return_inverse=True)
+            shiftWeight = np.bincount(idxShift.ravel(), lagWeight, minlength=len(shifts))
+
+            feedbackSignal = sum_shifted_tensors(newestDPlusE, shifts[:, 0], shifts[:, 1], self.alpha * shiftWeight)
+
+            correlationD = torch.clamp(tm3Signal - feedbackSignal, min=0) * torch.clamp(tm1Signal - feedbackSignal, min=0)
+        else:
+            correlationD = torch.clamp(tm3Signal, min=0) * torch.clamp(tm1Signal, min=0)
+
+        correlationE = F.conv2d(tm3Signal * tm1Signal, self.gaussKernel, padding='same')
+
+        lateralInhiSTMDOpt = self.hSubInhi.process(correlationD)
+
+        self.cellDPlusE.record_next(correlationD + correlationE)
+
+        self.Opt = lateralInhiSTMDOpt
+
+        return lateralInhiSTMDOpt
+
 
 class Lptcell(BaseCore):
     # Lptcell Lobula Plate Tangential Cell
 
-    def __init__(self):
+    # history of the estimated velocities
+    stateAttrs = ('velocity',)
+
+    def __init__(self, device='cpu'):
         # Constructor method
         # Initializes the Lobula object
-        super().__init__()
+        super().__init__(device=device)
 
         self.bataList = list(range(2, 19, 2))
         self.thetaList = np.arange(0, 2 * np.pi, np.pi / 4)
@@ -197,6 +296,9 @@ class Lptcell(BaseCore):
             self.tuningCurvef[id, idRange] = gaussianDistribution
 
     def process(self, tm1Signal, tm2Signal, tm3Signal, mi1Signal, tau5):
+        if self.backend == 'torch':
+            return self.process_tensor(tm1Signal, tm2Signal, tm3Signal, mi1Signal, tau5)
+
         lenBataList = len(self.bataList)
         lenThetaList = len(self.thetaList)
         sumLplcOptR = np.zeros((lenBataList, lenThetaList))
@@ -214,6 +316,39 @@ class Lptcell(BaseCore):
 
                 sumLplcOptR[idBata, idTheta] = sumLplcOpt
 
+        return self.update_velocity(sumLplcOptR)
+
+    def process_tensor(self, tm1Signal, tm2Signal, tm3Signal, mi1Signal, tau5):
+        """
+        Processes [1, 1, H, W] tensors.
+
+        The products with the shifted signals of all (bata, theta) pairs are
+        reduced on the device, from views of the signals, only the
+        [lenBataList, lenThetaList] sums are copied to the host, for the velocity.
+        """
+        if tm3Signal.shape[0] != 1:
+            raise ValueError('The background velocity of Lptcell belongs to one stream, the batch size must be 1.')
+
+        bata, theta = np.meshgrid(self.bataList, self.thetaList, indexing='ij')
+        shiftX = np.round(bata * np.cos(theta + np.pi / 2)).astype(int).ravel()
+        shiftY = np.round(bata * np.sin(theta + np.pi / 2)).astype(int).ravel()
+        # [1, 1, lenBataList * lenThetaList]
+        sumLplcOptR = correlate_shifted_tensors(tm3Signal, mi1Signal, shiftY, shiftX) \
+            + correlate_shifted_tensors(tm2Signal, tm1Signal, shiftY, shiftX)
+        sumLplcOptR = sumLplcOptR.reshape(bata.shape).double().cpu().numpy()
+
+        return self.update_velocity(sumLplcOptR)
+
+    def update_velocity(self, sumLplcOptR):
+        """
+        Records the background velocity and returns the shifts of the feedback.
+
+        Parameters:
+        - sumLplcOptR: (lenBataList, lenThetaList) responses of the LPTC.
+
+        Returns:
+        - fai, psi: Shifts along the two axes, one per recorded velocity.
+        """
         # preferTheta
         firingRate = np.max(sumLplcOptR, axis=1)
         preferTheta = np.argmax(sumLplcOptR, axis=1)
@@ -235,4 +370,6 @@ class Lptcell(BaseCore):
 
         return fai, psi
 
-
+    def get_spatial_radius(self):
+        # The velocity is estimated from the whole frame
+        return None
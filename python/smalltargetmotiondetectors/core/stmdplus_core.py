@@ -10,10 +10,10 @@ from ..util.compute_module import compute_response
 class ContrastPathway(BaseCore):
     """ContrastPathway class for ApgSTMD."""
 
-    def __init__(self):
+    def __init__(self, device='cpu'):
         """Constructor method."""
         # Initializes the ContrastPathway object
-        super().__init__()
+        super().__init__(device=device)
         self.theta = np.array([0, np.pi/4, np.pi/2, 3*np.pi/4])
         self.alpha2 = 1.5
         self.eta = 3
@@ -24,10 +24,21 @@ class ContrastPathway(BaseCore):
         """Initialization method."""
         # Initializes the T1Kernel
         self.T1Kernel = create_T1_kernels(len(self.theta), self.alpha2, self.eta, self.sizeT1)
+        if self.backend == 'torch':
+            import torch
+            # one output channel per kernel: [len(theta), 1, sizeT1, sizeT1]
+            self.T1Kernel = torch.from_numpy(np.stack(self.T1Kernel)).float().to(self.device).unsqueeze(1)
 
     def process(self, retinaOpt):
         """Processing method."""
         # Processes the input retinaOpt to generate contrastOpt
+        if self.backend == 'torch':
+            import torch.nn.functional as F
+            # [B, 1, H, W] -> [B, len(theta), H, W]
+            contrastOpt = F.conv2d(retinaOpt, self.T1Kernel, padding='same')
+            self.Opt = contrastOpt
+            return contrastOpt
+
         lenKernel = len(self.theta)
         dictContrastOpt = {}
         for idx in range(lenKernel):
@@ -39,10 +50,14 @@ class ContrastPathway(BaseCore):
 class MushroomBody(BaseCore):
     # MushroomBody class for STMDPlus
 
-    def __init__(self):
+    # tracks are kept as long as they are detected again
+    isRecursive = True
+    stateAttrs = ('trackID', 'trackInfo')
+
+    def __init__(self, device='cpu'):
         # Constructor method
         # Initializes the MushroomBody object
-        super().__init__()
+        super().__init__(device=device)
 
         self.paraNMS = {
             'maxRegionSize': 5,
@@ -66,6 +81,8 @@ class MushroomBody(BaseCore):
     def process(self, lobulaOpt, contrastOpt):
         # Processing method
         # Processes the input lobulaOpt and contrastOpt to generate mushroomBodyOpt
+        if self.backend == 'torch':
+            return self.process_tensor(lobulaOpt, contrastOpt)
 
         maxLobulaOpt = compute_response(lobulaOpt)
         nmsLobulaOpt = self.hNMS.nms(maxLobulaOpt)
@@ -84,10 +101,67 @@ class MushroomBody(BaseCore):
 
         idX, idY = np.where(nmsLobulaOpt > 0)
         newID = np.column_stack((idX, idY))
+        newContrast = np.array([[contrastOpt[idCont][x, y] for idCont in range(len(contrastOpt))]
+                                for x, y in newID])
+
+        for idX, idY in self.update_tracks(newID, newContrast):
+            for idxDirection in range(numDirection):
+                mushroomBodyOpt[idxDirection][idX, idY] = 0
+
+        self.Opt = mushroomBodyOpt
+        return mushroomBodyOpt
 
+    def process_tensor(self, lobulaOpt, contrastOpt):
+        """
+        Processes [1, numDirection, H, W] and [1, numContrast, H, W] tensors.
+
+        The peaks are found on the device by a max-pool NMS, which keeps the
+        same peaks as the sort NMS unless equal values touch. Only the peak
+        positions and their contrasts are copied to the host, for the tracks.
+        """
+        import torch
+        import torch.nn.functional as F
+        if lobulaOpt.shape[0] != 1:
+            raise ValueError('The tracks of MushroomBody belong to one stream, the batch size must be 1.')
+        maxRS = self.paraNMS['maxRegionSize']
+
+        maxLobulaOpt = torch.amax(lobulaOpt, dim=1, keepdim=True)
+        localMax = F.max_pool2d(maxLobulaOpt, 2 * maxRS + 1, stride=1, padding=maxRS)
+        isPeak = (maxLobulaOpt == localMax) & (maxLobulaOpt > 0)
+
+        mushroomBodyOpt = lobulaOpt * torch.logical_not(isPeak)
+
+        peakIdxs = torch.nonzero(isPeak[0, 0])
+        if len(peakIdxs) == 0:
+            self.trackID = None
+            self.trackInfo = []
+            self.Opt = mushroomBodyOpt
+            return mushroomBodyOpt
+
+        newID = peakIdxs.cpu().numpy()
+        newContrast = contrastOpt[0, :, peakIdxs[:, 0], peakIdxs[:, 1]].T.cpu().numpy()
+
+        suppressIDs = self.update_tracks(newID, newContrast)
+        if len(suppressIDs):
+            suppressIDs = torch.as_tensor(np.array(suppressIDs), device=mushroomBodyOpt.device)
+            mushroomBodyOpt[:, :, suppressIDs[:, 0], suppressIDs[:, 1]] = 0
+
+        self.Opt = mushroomBodyOpt
+        return mushroomBodyOpt
+
+    def update_tracks(self, newID, newContrast):
+        """
+        Matches the new peaks to the tracks.
+
+        Parameters:
+        - newID: (numPeak, 2) positions of the peaks.
+        - newContrast: (numPeak, numContrast) contrasts at the peaks.
+
+        Returns:
+        - suppressIDs: Positions of the tracks whose contrast barely changes.
+        """
         shouldTrackID = np.ones(len(self.trackID), dtype=bool) if self.trackID is not None else np.array([], dtype=bool)
-        shouldAddNewID = np.ones(len(idX), dtype=bool)
-        numContrast = len(contrastOpt)
+        shouldAddNewID = np.ones(len(newID), dtype=bool)
 
         if self.trackID is not None:
             DD = cdist(self.trackID, newID)
@@ -98,8 +172,7 @@ class MushroomBody(BaseCore):
                     idxJ = np.argmin(DD[idxI])
                     if shouldAddNewID[idxJ]:
                         self.trackID[idxI] = newID[idxJ]
-                        nowContrast = np.array(
-                            [[contrastOpt[idCont][newID[idxJ, 0], newID[idxJ, 1]]] for idCont in range(numContrast)])
+                        nowContrast = newContrast[idxJ][:, None]
                         self.trackInfo[idxI] = np.hstack((self.trackInfo[idxI], nowContrast))
                         shouldTrackID[idxI] = False
                         shouldAddNewID[idxJ] = False
@@ -112,23 +185,22 @@ class MushroomBody(BaseCore):
         isxNew = np.where(shouldAddNewID)[0]
         for kk in isxNew:
             if self.trackID is None:
-                self.trackID = newID[kk]
+                self.trackID = newID[kk:kk+1]
             else:
                 self.trackID = np.vstack((self.trackID, newID[kk]))
-            nowContrast = np.array(
-                [[contrastOpt[idCont][newID[kk, 0], newID[kk, 1]]] for idCont in range(numContrast)])
+            nowContrast = newContrast[kk][:, None]
             self.trackInfo.append(nowContrast)
 
+        suppressIDs = []
         for idx in range(oldTractNum):
             if np.max(np.std(self.trackInfo[idx], axis=1)) < self.SDThres:
-                for idxDirection in range(numDirection):
-                    idX = self.trackID[idx, 0]
-                    idY = self.trackID[idx, 1]
-                    mushroomBodyOpt[idxDirection][idX, idY] = 0
+                suppressIDs.append((self.trackID[idx, 0], self.trackID[idx, 1]))
 
             if self.trackInfo[idx].shape[1] > self.lenDBSCAN:
                 self.trackInfo[idx] = self.trackInfo[idx][:, 1:]
 
-        self.Opt = mushroomBodyOpt
-        return mushroomBodyOpt
+        return suppressIDs
 
+    def get_spatial_radius(self):
+        """The tracks are built over the whole frame."""
+        return None
@@ -10,7 +10,8 @@ pyPackagePath = os.path.dirname(os.path.dirname(os.path.dirname(filePath)))
 gitCodePath = os.path.dirname(pyPackagePath)
 sys.path.append(pyPackagePath)
 
-from smalltargetmotiondetectors.api import inference_task, evaluate_task # type: ignore
+from smalltargetmotiondetectors.api import stream_inference, evaluate_task # type: ignore
+from smalltargetmotiondetectors.util.detection_log import DetectionLog, DetectionLogWriter # type: ignore
 
 
 def inference_and_evaluate_task(modelName, 
@@ -25,15 +26,20 @@ def inference_and_evaluate_task(modelName,
                                 **kwargs):
     
     '''inference'''
-    modelOpt, modelDire = inference_task(modelName, inputpath, inputType, startFrame, endFrame, **kwargs)
-    # save
-    save_as_json(savePath1, modelOpt, modelDire)
+    # the detections are appended to a detection log (folder savePath1) as they come
+    writer = DetectionLogWriter(savePath1, modelName=modelName, inputpath=inputpath, startFrame=startFrame)
+    for _ in stream_inference(modelName, inputpath, sinks=[writer], inputType=inputType,
+                              startFrame=startFrame, endFrame=endFrame, **kwargs):
+        pass
+    detectionLog = DetectionLog(savePath1)
 
     '''evaluate'''
-    rocFig, AUC, mR, RPIList, FPPIList, thresholdList = evaluate_task(modelOpt, groundTruth, gTError, startFrame, endFrame)
+    AUC, mR, AP, figHandle = evaluate_task(detectionLog, groundTruth, gTError=gTError,
+                                           startFrame=startFrame, endFrame=endFrame)
+    rocFig = figHandle['ROC']
     # save
     rocFig.savefig('roc_curve.png')  # Save as PNG file
-    save_as_json(savePath2, AUC, mR, RPIList, FPPIList, thresholdList)
+    save_as_json(savePath2, AUC, mR, AP)
 
     return rocFig, AUC, mR
 
@@ -75,7 +81,7 @@ if __name__ == '__main__':
     gTError = 1
     startFrame = 1
     endFrame = 500
-    savePath1 = os.path.join('C:\\Users\\mings\\Desktop', 'temp_result', 'opt1.json')
+    savePath1 = os.path.join('C:\\Users\\mings\\Desktop', 'temp_result', 'opt1.stmdlog')
     savePath2 = os.path.join('C:\\Users\\mings\\Desktop', 'temp_result', 'opt2.json')
 
     rocFig, AUC, mR = inference_and_evaluate_task(modelName, 
@@ -4,10 +4,12 @@ import queue
 import signal
 import logging
 from typing import Optional, Tuple
-from multiprocessing import Process, Queue, Event
+from collections import deque
+from multiprocessing import Process, Queue, Event, Value
 import time
 
 
+import numpy as np
 import tkinter as tk
 import torch
 
@@ -18,13 +20,18 @@ sys.path.append(py_pkg_path)
 try:
     from smalltargetmotiondetectors.util.iostream import ( # type: ignore
                     ModelAndInputSelectorGUI,
-                    ImgstreamReader,
+                    ParallelImgstreamReader,
                     VidstreamReader
                 )
+    from smalltargetmotiondetectors.util.shared_frames import ( # type: ignore
+                    SharedFramePool,
+                    convert_frame
+                )
     from smalltargetmotiondetectors.api import ( # type: ignore
         instancing_model,
         get_visualize_handle,
     ) 
+    from smalltargetmotiondetectors.api.benchmark import get_latency_stats # type: ignore
 except ImportError as e:
     raise ImportError("Failed to import required modules. "
                       "Ensure that 'smalltargetmotiondetectors' package is correctly installed.") from e
@@ -34,16 +41,91 @@ logging.basicConfig(level=logging.INFO,
                     format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+class PipelineTelemetry:
+    """
+    Drop counts and capture-to-result latencies of the StmdGui pipeline.
+
+    The drop counters are shared by the processes, the latencies are recorded
+    by the process receiving the results (the visualizer), over the last
+    `max_samples` frames.
+    """
+    def __init__(self, max_samples: int = 10000):
+        self.dropped_frames = Value('q', 0)     # frames replaced by newer ones before inference
+        self.dropped_results = Value('q', 0)    # results replaced by newer ones before display
+        self.latencies = deque(maxlen=max_samples)
+        self.num_results = 0
+
+    def count_drop(self, counter):
+        with counter.get_lock():
+            counter.value += 1
+
+    def record(self, capture_time: float):
+        """ record the result of a frame captured at capture_time (time.time()) """
+        self.latencies.append(time.time() - capture_time)
+        self.num_results += 1
+
+    def summary(self) -> dict:
+        """ number of results, drop counts and latency percentiles (ms) """
+        summary = {'numResults': self.num_results,
+                   'droppedFrames': self.dropped_frames.value,
+                   'droppedResults': self.dropped_results.value}
+        if self.latencies:
+            stats = get_latency_stats(list(self.latencies))
+            summary.update({key: stats[key] for key in ['mean', 'p50', 'p90', 'p99', 'max']})
+        return summary
+
+    def log_summary(self):
+        summary = self.summary()
+        msg = (f"Pipeline: {summary['numResults']} results, dropped {summary['droppedFrames']} frames "
+               f"and {summary['droppedResults']} results")
+        if 'p50' in summary:
+            msg += (f", capture-to-result latency (ms): p50 {summary['p50']:.1f}, p90 {summary['p90']:.1f}, "
+                    f"p99 {summary['p99']:.1f}, max {summary['max']:.1f}")
+        logger.info(msg)
+
+
 class StmdGui:
-    def __init__(self, device='cpu', show_threshold: float = 0.8):
+    """
+    Reader, inference and visualizer processes of the STMD GUI.
+
+    The frames and the model outputs travel through a SharedFramePool: the
+    reader decodes a frame into a free slot, the queues only carry slot
+    numbers, and the visualizer hands the slot back once the next frame is on
+    screen. No frame is pickled between the processes.
+
+    Modes:
+        Throughput mode (default) processes every frame: a stage ahead of the
+        next one waits for room in its queue, for offline runs.
+        Latency mode (latency_mode=True) keeps the display close to real time
+        for live inputs: the queues hold one frame, and a stage ahead of the
+        next one replaces the waiting frame by the newer one (drop-oldest).
+        In both modes every frame carries its capture time, and the
+        visualizer reports the capture-to-result latency percentiles and the
+        drop counts (see PipelineTelemetry) every report_interval seconds and
+        at the end.
+
+    Slots:
+        The visualizer holds the slot of the frame on screen until the next
+        one arrives, so the reader needs a second slot to decode it into:
+        num_slots must be at least 2.
+    """
+    def __init__(self, device='cpu', show_threshold: float = 0.8, num_slots: int = 8,
+                 latency_mode: bool = False, report_interval: float = 5.):
         """ Initialize STMD GUI """
+        if num_slots < 2:
+            # the reader would wait forever for the slot of the frame on screen
+            raise ValueError('num_slots must be at least 2, the visualizer holds the slot of the frame on screen.')
         self.device = device
         self.show_threshold = show_threshold
+        self.num_slots = num_slots
+        self.latency_mode = latency_mode
+        self.report_interval = report_interval
         self._setup_paths()
         
     def _setup_paths(self):
         self.ModelAndInputSelectorGUI = ModelAndInputSelectorGUI
-        self.ImgstreamReader = ImgstreamReader
+        # image streams are decoded by a thread pool, frames keep their order
+        self.ImgstreamReader = ParallelImgstreamReader
         self.VidstreamReader = VidstreamReader
         self.instancing_model = instancing_model
         self.get_visualize_handle = get_visualize_handle
@@ -66,18 +148,42 @@ class StmdGui:
 
     def _create_queues(self) -> Tuple[Queue, Queue]:
         """ create queues """
-        return Queue(maxsize=3), Queue(maxsize=3)
+        # in latency mode only the newest frame waits
+        maxsize = 1 if self.latency_mode else 3
+        return Queue(maxsize=maxsize), Queue(maxsize=maxsize)
 
-    def _start_processes(self, ipt_queue: Queue, res_queue: Queue, 
+    def _create_reader(self, opt1: str, opt2: Optional[str]):
+        """ create the frame reader, gray frames are kept as uint8 (the model retina normalizes them) """
+        if opt2:
+            return self.ImgstreamReader(startImgName=opt1, endImgName=opt2, dtype=np.uint8)
+        return self.VidstreamReader(vidName=opt1, dtype=np.uint8)
+
+    def _create_frame_pool(self, opt1: str, opt2: Optional[str]) -> SharedFramePool:
+        """ create the shared slots of the frames and model outputs, sized from the first frame """
+        reader = self._create_reader(opt1, opt2)
+        try:
+            gray_img, color_img = reader.get_next_frame()
+        finally:
+            if hasattr(reader, 'close'):
+                reader.close()
+        return SharedFramePool({'gray': (gray_img.shape, gray_img.dtype),
+                                'color': (color_img.shape, color_img.dtype),
+                                'response': (gray_img.shape, np.float64),
+                                'direction': (gray_img.shape, np.float64)},
+                               numSlots=self.num_slots)
+
+    def _start_processes(self, ipt_queue: Queue, res_queue: Queue, frame_pool: SharedFramePool,
                         model_name: str, opt1: str, opt2: Optional[str], 
-                        is_stepping: bool, exit_event) -> list:
+                        is_stepping: bool, exit_event, telemetry: Optional[PipelineTelemetry] = None) -> list:
         """ start processes """
         # FIX: 移除内部创建 exit_event，改为使用传入的 event，确保主进程信号能传递给子进程
+        if telemetry is None:
+            telemetry = PipelineTelemetry()
         
         processes = [
-            Process(target=self._read_frames, args=(ipt_queue, opt1, opt2, exit_event), name="FrameReader"),
-            Process(target=self._run_inference, args=(ipt_queue, res_queue, model_name, exit_event), name="Inference"),
-            Process(target=self._visualize_results, args=(res_queue, model_name, is_stepping, exit_event, self.show_threshold), name="Visualizer")
+            Process(target=self._read_frames, args=(ipt_queue, frame_pool, opt1, opt2, exit_event, telemetry), name="FrameReader"),
+            Process(target=self._run_inference, args=(ipt_queue, res_queue, frame_pool, model_name, exit_event, telemetry), name="Inference"),
+            Process(target=self._visualize_results, args=(res_queue, frame_pool, model_name, is_stepping, exit_event, self.show_threshold, telemetry), name="Visualizer")
         ]
         
         for p in processes:
@@ -86,14 +192,21 @@ class StmdGui:
             
         return processes
 
-    def _read_frames(self, ipt_queue: Queue, opt1: str, opt2: Optional[str], exit_event):
+    def _read_frames(self, ipt_queue: Queue, frame_pool: SharedFramePool, opt1: str, opt2: Optional[str], exit_event,
+                     telemetry: PipelineTelemetry):
         """ frame reader process """
         try:
-            reader = self.ImgstreamReader(startImgName=opt1, endImgName=opt2) if opt2 else self.VidstreamReader(vidName=opt1)
+            reader = self._create_reader(opt1, opt2)
             
             while not exit_event.is_set() and reader.hasFrame:
-                frame_data = reader.get_next_frame()
-                self._safe_put(ipt_queue, frame_data, exit_event)
+                gray_img, color_img = reader.get_next_frame()
+                capture_time = time.time()
+                if (slot := self._acquire_slot(frame_pool, ipt_queue, telemetry, exit_event)) is None:
+                    break
+                views = frame_pool.get_slot(slot)
+                views['gray'][...] = gray_img
+                views['color'][...] = color_img
+                self._put_frame(ipt_queue, (slot, capture_time), frame_pool, telemetry, telemetry.dropped_frames, exit_event)
                 
             self._safe_put(ipt_queue, None, exit_event)  # terminate signal
             logger.info("Frame reader exited cleanly")
@@ -102,7 +215,8 @@ class StmdGui:
             logger.error(f"Frame reader failed: {str(e)}")
             exit_event.set()
 
-    def _run_inference(self, ipt_queue: Queue, res_queue: Queue, model_name: str, exit_event):
+    def _run_inference(self, ipt_queue: Queue, res_queue: Queue, frame_pool: SharedFramePool, model_name: str, exit_event,
+                       telemetry: PipelineTelemetry):
         """ inference process """
         try:
             model = self.instancing_model(model_name, device = self.device)
@@ -111,22 +225,23 @@ class StmdGui:
             while not exit_event.is_set():
                 if (data := self._safe_get(ipt_queue, exit_event)) is None:
                     break
+                slot, capture_time = data
+                views = frame_pool.get_slot(slot)
                 
-                # Input handling
-                if self.device != 'cpu':
-                    # Ensure numpy array is converted properly before unsqueeze
-                    _ipt = torch.from_numpy(data[0]).float().to(self.device).unsqueeze(0).unsqueeze(0)
-                else:
-                    _ipt = data[0]
+                # Input handling, the NumPy backend reads the slot in place
+                _ipt = convert_frame(views['gray'], model)
 
                 result, runTime = model.process(_ipt)
 
                 # Output handling
-                if self.device != 'cpu':
+                if model.backend == 'torch':
                     # Detach is safer before numpy conversion
                     result = {k: v.detach().cpu().numpy().squeeze(0).squeeze(0) if isinstance(v, torch.Tensor) else v for k, v in result.items()}
                 
-                self._safe_put(res_queue, (data[1], result, runTime), exit_event)
+                # output maps go to the slot, the other outputs through the queue
+                result, shared_keys = self._write_result(views, result)
+                self._put_frame(res_queue, (slot, capture_time, result, shared_keys, runTime),
+                                frame_pool, telemetry, telemetry.dropped_results, exit_event)
                 
             self._safe_put(res_queue, None, exit_event)  # terminate signal
             logger.info("Inference process exited cleanly")
@@ -135,9 +250,15 @@ class StmdGui:
             logger.error(f"Inference failed: {str(e)}")
             exit_event.set()
 
-    def _visualize_results(self, res_queue: Queue, model_name: str, is_stepping: bool, exit_event, show_threshold: float = 0.8):
+    def _visualize_results(self, res_queue: Queue, frame_pool: SharedFramePool, model_name: str, is_stepping: bool, exit_event, show_threshold: float = 0.8,
+                           telemetry: Optional[PipelineTelemetry] = None):
         """ visualization process """
+        if telemetry is None:
+            telemetry = PipelineTelemetry()
+        report_time = time.time() + self.report_interval
         visualizer = None
+        # the figure shows the arrays of this slot until the next frame replaces them
+        shown_slot = None
         try:
             visualizer = self.get_visualize_handle(model_name, show_threshold)
             if is_stepping:
@@ -150,8 +271,19 @@ class StmdGui:
                     
                 if (data := self._safe_get(res_queue, exit_event)) is None:
                     break
+                slot, capture_time, result, shared_keys, runTime = data
+                telemetry.record(capture_time)
+                views = frame_pool.get_slot(slot)
+                result.update({key: views[key] for key in shared_keys})
                     
-                visualizer.show_result(*data)
+                visualizer.show_result(views['color'], result, runTime)
+                if shown_slot is not None:
+                    frame_pool.release(shown_slot)
+                shown_slot = slot
+
+                if time.time() > report_time:
+                    telemetry.log_summary()
+                    report_time = time.time() + self.report_interval
             
             # 正常退出循环也应该设置 Event，通知其他进程
             exit_event.set() 
@@ -161,10 +293,68 @@ class StmdGui:
             logger.error(f"Visualization failed: {str(e)}")
             exit_event.set()
         finally:
+            telemetry.log_summary()
             # FIX: 安全的资源清理
             if visualizer and hasattr(visualizer, 'hasFigHandle') and visualizer.hasFigHandle:
                 del visualizer
 
+    @staticmethod
+    def _write_result(views: dict, result: dict) -> Tuple[dict, list]:
+        """ copy the output maps of a frame into its slot, returns the other outputs and the keys of the copied ones """
+        other_result, shared_keys = {}, []
+        for key, value in result.items():
+            if key in views and isinstance(value, np.ndarray) and value.shape == views[key].shape:
+                views[key][...] = value
+                shared_keys.append(key)
+            else:
+                other_result[key] = value
+        return other_result, shared_keys
+
+    def _acquire_slot(self, frame_pool: SharedFramePool, ipt_queue: Queue, telemetry: PipelineTelemetry,
+                      exit_event, timeout: float = 0.1):
+        """ safe slot acquire, in latency mode the slot of a frame waiting for inference is taken over """
+        if not self.latency_mode:
+            return self._safe_acquire(frame_pool, exit_event, timeout)
+        while not exit_event.is_set():
+            try:
+                return frame_pool.acquire(timeout=0.01)
+            except queue.Empty:
+                pass
+            try:
+                slot, _ = ipt_queue.get_nowait()
+            except queue.Empty:
+                continue
+            telemetry.count_drop(telemetry.dropped_frames)
+            return slot
+        return None
+
+    def _put_frame(self, q: Queue, item: tuple, frame_pool: SharedFramePool, telemetry: PipelineTelemetry,
+                   drop_counter, exit_event, timeout: float = 0.1):
+        """ put the slot of a frame, in latency mode a full queue drops its oldest frame (drop-oldest) """
+        if not self.latency_mode:
+            return self._safe_put(q, item, exit_event, timeout)
+        while not exit_event.is_set():
+            try:
+                q.put(item, timeout=0.01)
+                return
+            except queue.Full:
+                pass
+            try:
+                dropped = q.get_nowait()
+            except queue.Empty:
+                continue
+            frame_pool.release(dropped[0])
+            telemetry.count_drop(drop_counter)
+
+    def _safe_acquire(self, frame_pool: SharedFramePool, exit_event, timeout: float = 0.1):
+        """ safe slot acquire, waits for a free slot """
+        while not exit_event.is_set():
+            try:
+                return frame_pool.acquire(timeout=timeout)
+            except queue.Empty:
+                continue
+        return None
+
     def _safe_put(self, q: Queue, item, exit_event, timeout: float = 0.1):
         """ safe queue put """
         while not exit_event.is_set():
@@ -201,6 +391,7 @@ class StmdGui:
         processes = []
         ipt_queue = None
         res_queue = None
+        frame_pool = None
 
         # FIX: Signal Handler 必须在 exit_event 定义之后
         def signal_handler(*args):
@@ -219,11 +410,12 @@ class StmdGui:
 
             model_name, opt1, opt2, is_stepping = user_input
             
-            # create queues
+            # create queues and the shared frame slots
             ipt_queue, res_queue = self._create_queues()
+            frame_pool = self._create_frame_pool(opt1, opt2)
             
             # start processes (Passing the MAIN exit_event)
-            processes = self._start_processes(ipt_queue, res_queue, 
+            processes = self._start_processes(ipt_queue, res_queue, frame_pool,
                                             model_name, opt1, opt2, 
                                             is_stepping, exit_event)
             
@@ -269,11 +461,16 @@ class StmdGui:
                 res_queue.close()
                 # join_thread 并非必须，但在某些系统上能防止 broken pipe
                 # ipt_queue.join_thread() 
+
+            # the slots are removed once no process uses them
+            if frame_pool is not None:
+                self._cleanup_queues(frame_pool.freeSlots)
+                frame_pool.close()
             
             signal.signal(signal.SIGINT, original_sigint)
             logger.info("Shutdown completed")
 
-def main(show_threshold: float = 0.8):
+def main(show_threshold: float = 0.8, latency_mode: bool = False):
     # 增加 multiprocessing start method 保护 (特别是 Windows/MacOS)
     try:
         from multiprocessing import set_start_method
@@ -283,7 +480,8 @@ def main(show_threshold: float = 0.8):
 
     # DEVICE = 'cuda' if torch.cuda.is_available() else 'cpu'
     DEVICE = 'cpu'
-    obj = StmdGui(DEVICE, show_threshold)
+    # latency_mode=True for live inputs, see StmdGui
+    obj = StmdGui(DEVICE, show_threshold, latency_mode=latency_mode)
     obj.run()
 
 if __name__ == "__main__":
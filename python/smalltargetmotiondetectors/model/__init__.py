@@ -1,19 +1,69 @@
-from .backbone import ESTMD, ESTMDBackbone, FracSTMD, DSTMD, DSTMDBackbone
-from .feedback_model import FeedbackSTMD, FSTMD, FracSTMD_F
-from .facilitated_model import STMDPlus, ApgSTMD
-from .haarstmd import HaarSTMD
-from .vstmd import vSTMD, vSTMD_F
-from .vstmd import (vSTMD_L, vSTMD_F_L, vSTMD_M, vSTMD_F_M,
-                    vSTMD_without_GF, vSTMD_without_cIDP, vSTMD_without_CDGC,
-                    vSTMD_F_without_GF, vSTMD_F_without_cIDP, vSTMD_F_without_CDGC)
-
-
-__all__ = ['ESTMD', 'ESTMDBackbone', 'FracSTMD', 'DSTMD', 'DSTMDBackbone', # backbone with four basis layers
-           'FeedbackSTMD', 'FSTMD', 'FracSTMD_F',  # model with feedback pathway
-           'STMDPlus', 'ApgSTMD', # facilitated model
-           'HaarSTMD', 
-           'vSTMD', 'vSTMD_F',  # under reviewed
-           'vSTMD_L', 'vSTMD_F_L', 'vSTMD_M', 'vSTMD_F_M',
-           'vSTMD_without_GF', 'vSTMD_without_cIDP', 'vSTMD_without_CDGC',
-            'vSTMD_F_without_GF', 'vSTMD_F_without_cIDP', 'vSTMD_F_without_CDGC',
-         ]
+import importlib
+import importlib.util
+
+
+# Model name -> module defining it, the modules are imported on first use
+MODEL_REGISTRY = {
+    # backbone with four basis layers
+    'ESTMD': 'backbone', 'ESTMDBackbone': 'backbone', 'FracSTMD': 'backbone',
+    'DSTMD': 'backbone', 'DSTMDBackbone': 'backbone',
+    # model with feedback pathway
+    'FeedbackSTMD': 'feedback_model', 'FSTMD': 'feedback_model', 'FracSTMD_F': 'feedback_model',
+    'STFeedbackSTMD': 'feedback_model',
+    # facilitated model
+    'STMDPlus': 'facilitated_model', 'ApgSTMD': 'facilitated_model',
+    'HaarSTMD': 'haarstmd',
+    # under reviewed, shipped as a compiled extension (vstmd.cp312-win_amd64.pyd) only
+    'vSTMD': 'vstmd', 'vSTMD_F': 'vstmd',
+    'vSTMD_L': 'vstmd', 'vSTMD_F_L': 'vstmd', 'vSTMD_M': 'vstmd', 'vSTMD_F_M': 'vstmd',
+    'vSTMD_without_GF': 'vstmd', 'vSTMD_without_cIDP': 'vstmd', 'vSTMD_without_CDGC': 'vstmd',
+    'vSTMD_F_without_GF': 'vstmd', 'vSTMD_F_without_cIDP': 'vstmd', 'vSTMD_F_without_CDGC': 'vstmd',
+}
+
+
+def is_module_available(moduleName):
+    """ Whether a model module can be found for this platform, without importing it. """
+    try:
+        return importlib.util.find_spec(f'{__name__}.{moduleName}') is not None
+    except (ImportError, ValueError):
+        return False
+
+
+def is_model_available(modelName):
+    """ Whether a registered model can be used on this platform. """
+    return modelName in MODEL_REGISTRY and is_module_available(MODEL_REGISTRY[modelName])
+
+
+def get_model_class(modelName):
+    """
+    Returns the class of a registered model, importing its module on first use.
+
+    Raises:
+        - ValueError: The model is not registered.
+        - ImportError: The module of the model is not available on this platform.
+    """
+    if modelName not in MODEL_REGISTRY:
+        raise ValueError(f'Unknown model: {modelName}, the models are {list(MODEL_REGISTRY)}.')
+    moduleName = MODEL_REGISTRY[modelName]
+    if not is_module_available(moduleName):
+        raise ImportError(f'{modelName} is not available on this platform: the module {moduleName} '
+                          f'is only shipped as a compiled extension for other platforms.')
+    modelClass = getattr(importlib.import_module(f'.{moduleName}', __name__), modelName)
+    globals()[modelName] = modelClass
+    return modelClass
+
+
+def __getattr__(name):
+    if name in MODEL_REGISTRY:
+        return get_model_class(name)
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
+def __dir__():
+    return sorted(set(globals()) | set(MODEL_REGISTRY))
+
+
+VSTMD_AVAILABLE = is_module_available('vstmd')
+
+# the models available on this platform
+__all__ = [name for name in MODEL_REGISTRY if is_model_available(name)]
@@ -1,12 +1,17 @@
 from abc import ABC, abstractmethod
+import hashlib
 import warnings
 import logging
 import time
 
-import torch
+import numpy as np
 
 from ..core import estmd_core, estmd_backbone, fracstmd_core, dstmd_core
+from ..core.base_core import BaseCore, parse_device
 from ..util.compute_module import compute_response, compute_direction
+from ..util.datarecord import save_state_record, load_state_record
+from ..util.profiler import LayerProfiler
+from ..util.memory import get_memory_report, plan_memory
 
 
 class BaseModel(ABC):
@@ -19,10 +24,20 @@ class BaseModel(ABC):
             'sigma2': 'self.lobulaOpt.hGaussianBlur.sigma',
         }
 
+    # Model attributes carried over from one frame to the next (besides the core states)
+    stateAttrs = ()
+    # Per-frame model attributes recorded by the LayerProfiler, e.g. iteration counts
+    profilerCounters = ()
+
     def __init__(self, device = 'cpu'):
         """ Constructor method.
+
+        Parameters:
+            device: 'cpu' (NumPy backend), 'torch-cpu' or 'cuda[:index]' (torch
+                backend), see parse_device.
         """
-        self.device = device
+        self.backend, self.device = parse_device(device)
+        self.dtype = None # Floating dtype of the NumPy backend, None follows the input
         
         self.hRetina = None # Handle for the retina layer
         self.hLamina = None # Handle for the lamina layer
@@ -39,6 +54,8 @@ class BaseModel(ABC):
         # Model output structure
         self.modelOpt = {'response': [], 'direction': []}
 
+        self.profiler = None # LayerProfiler timing the layers, see enable_profiler
+
     def init_config(self, *args, **kwargs):
         """
         Abstract method for initializing model components.
@@ -72,12 +89,286 @@ class BaseModel(ABC):
         time_start = time.time()
         # Call the model structure method
         self.model_structure(modelIpt)
-        if self.device != 'cpu':
+        if self.device.startswith('cuda'):
+            import torch
             torch.cuda.synchronize()
         time_end = time.time() - time_start
         # Return the model output
         return self.modelOpt, time_end
     
+    def named_cores(self):
+        """ Yields (name, core) for every core of the model, depth-first.
+
+        Names are attribute paths relative to the model, e.g.
+        'hLamina.hGammaBandPassFilter.hGammaDelay1'.
+        """
+        memo = set()
+        for name, value in vars(self).items():
+            if isinstance(value, BaseCore):
+                yield from value.named_cores(name, memo)
+
+    def enable_profiler(self, **kwargs):
+        """ Starts timing every layer of the model, see util.profiler.LayerProfiler.
+
+        Call it after `init_config`. Until then, and after `disable_profiler`,
+        the model runs without any timing overhead.
+
+        Parameters:
+            **kwargs: Arguments of LayerProfiler (subOperators, maxTraceEvents, synchronize).
+
+        Returns:
+            profiler: The LayerProfiler collecting the timings.
+        """
+        self.disable_profiler()
+        self.profiler = LayerProfiler(self, **kwargs)
+        return self.profiler
+
+    def disable_profiler(self):
+        """ Stops timing the layers, the returned profiler keeps the timings. """
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.detach()
+        self.profiler = None
+        return profiler
+
+    def get_memory_report(self):
+        """ Returns the bytes held by every layer and buffer of the model.
+
+        See util.memory.get_memory_report.
+        """
+        return get_memory_report(self)
+
+    def plan_memory(self, shape, numStreams=1, **kwargs):
+        """ Predicts the memory of the model for an input of the given (height, width).
+
+        Call it after `init_config`, before running the model. See
+        util.memory.plan_memory for the method and the returned dict.
+        """
+        return plan_memory(self, shape, numStreams=numStreams, **kwargs)
+
+    def get_temporal_memory(self):
+        """ Returns the number of past frames the current response depends on.
+
+        The layers are taken as a chain, so the memories of the top-level cores
+        add up (an upper bound when some branches run in parallel). Recursive
+        cores only contribute the memory of their FIR part, see
+        `get_temporal_receptive_field`. Valid after `init_config`.
+        """
+        memo = set()
+        memory = 0
+        for value in vars(self).values():
+            if isinstance(value, BaseCore) and id(value) not in memo:
+                memo.add(id(value))
+                memory += value.get_temporal_memory()
+        return memory
+
+    def get_spatial_radius(self):
+        """ Returns the radius, in pixels, of the spatial receptive field of the response.
+
+        The response at a pixel only depends on the inputs within `radius` rows
+        and columns of it, so a tile of the frame padded by this halo gives the
+        response of the untiled model inside the tile. As for the temporal
+        memory, the radii of the top-level cores add up. None when a layer
+        depends on the whole frame (see BaseCore.get_spatial_radius).
+        """
+        memo = set()
+        radius = 0
+        for value in vars(self).values():
+            if isinstance(value, BaseCore) and id(value) not in memo:
+                memo.add(id(value))
+                coreRadius = value.get_spatial_radius()
+                if coreRadius is None:
+                    return None
+                radius += coreRadius
+        return radius
+
+    def get_pipeline_stages(self):
+        """ Returns the layers of model_structure as a list of stages, see api.PipelinedModel.
+
+        The first stage takes the input of the model, every other stage the
+        output of the stage before it, and the last one returns the model
+        output structure of the frame. A stage only updates its own layers, so
+        the stages of consecutive frames can run at the same time. None (the
+        default) when the model does not define its stages, e.g. when a layer
+        feeds back to an earlier layer (FSTMD, ApgSTMD).
+        """
+        return None
+
+    def _get_chain_stages(self, lobula_stage):
+        """ Returns the retina, lamina and medulla stages followed by lobula_stage.
+
+        lobula_stage takes the medulla output and returns the model output.
+        """
+        def retina_stage(iptMatrix):
+            self.retinaOpt = self.hRetina.process(iptMatrix)
+            return self.retinaOpt
+
+        def lamina_stage(retinaOpt):
+            self.laminaOpt = self.hLamina.process(retinaOpt)
+            return self.laminaOpt
+
+        def medulla_stage(laminaOpt):
+            self.hMedulla.process(laminaOpt)
+            self.medullaOpt = self.hMedulla.Opt
+            return self.medullaOpt
+
+        return [retina_stage, lamina_stage, medulla_stage, lobula_stage]
+
+    def get_temporal_receptive_field(self, tolerance=1e-6):
+        """ Returns how many frames a run has to be pre-rolled to match a serial run.
+
+        For a model made of FIR cores only, running it on the `warmUp` frames
+        before a frame reproduces the response of a serial run exactly. For a
+        model with recursive cores, the state carried over from the frames before
+        the pre-roll decays by `decayRate` per frame; the pre-roll is extended
+        until it has shrunk below `tolerance` (relative to the state amplitude of
+        the recursive layer). When the decay rate of a recursive core is unknown,
+        the pre-roll is twice the FIR memory and no bound can be given, the
+        error has to be measured (see `api.chunked_inference_task`).
+        Valid after `init_config`.
+
+        Parameters:
+            tolerance: Accepted relative error of the state of a recursive core.
+
+        Returns:
+            A dict with
+            - memory: FIR memory of the model, see `get_temporal_memory`.
+            - recursiveCores: {name: decayRate} of the recursive cores.
+            - warmUp: Number of frames to pre-roll.
+            - isExact: Whether the pre-roll reproduces the serial run exactly.
+            - errorBound: Bound of the relative state error, None if unknown.
+        """
+        memory = self.get_temporal_memory()
+        recursiveCores = {name: core.get_decay_rate()
+                          for name, core in self.named_cores() if core.isRecursive}
+
+        if not recursiveCores:
+            return {'memory': memory, 'recursiveCores': recursiveCores,
+                    'warmUp': memory, 'isExact': True, 'errorBound': 0.}
+
+        decayRates = list(recursiveCores.values())
+        if all(rate is not None and 0 <= rate < 1 for rate in decayRates):
+            maxRate = max(decayRates)
+            numDecay = int(np.ceil(np.log(tolerance) / np.log(maxRate))) if maxRate > 0 else 1
+            warmUp = memory + numDecay
+            errorBound = float(maxRate ** numDecay)
+        else:
+            warmUp = 2 * memory
+            errorBound = None
+
+        return {'memory': memory, 'recursiveCores': recursiveCores,
+                'warmUp': warmUp, 'isExact': False, 'errorBound': errorBound}
+
+    def get_state(self):
+        """ Returns the temporal state of the model.
+
+        Returns:
+            A dict {coreName: core state} (see BaseCore.get_state), the model
+            attributes listed in `stateAttrs` are under 'self'.
+        """
+        state = {name: core.get_state() for name, core in self.named_cores()}
+        state['self'] = {name: getattr(self, name) for name in self.stateAttrs}
+        return state
+
+    def set_state(self, state):
+        """ Restores a state returned by `get_state`, after `init_config`. """
+        cores = dict(self.named_cores())
+        for name, coreState in state.items():
+            if name == 'self':
+                for attrName, value in coreState.items():
+                    setattr(self, attrName, value)
+            elif name in cores:
+                cores[name].set_state(coreState)
+            else:
+                raise ValueError(f"<{self.__class__.__name__}> has no core '{name}'.")
+
+    def get_para_hash(self):
+        """ Returns a hash of the model class, its parameters (see `print_para`) and dtype. """
+        paraList = getattr(self, f'_{self.__class__.__name__}__paraMappingList', {})
+        paraValues = []
+        for name, value in sorted(paraList.items()):
+            for item in (value if isinstance(value, tuple) else (value,)):
+                try:
+                    paraValues.append(f'{name}:{item}={eval(item)!r}')
+                except AttributeError:
+                    paraValues.append(f'{name}:{item}=None')
+        msg = '|'.join([self.__class__.__name__, str(self.dtype)] + paraValues)
+        return hashlib.sha1(msg.encode()).hexdigest()[:16]
+
+    def save_state(self, fileName, frameIdx=None, **kwargs):
+        """ Saves the temporal state of the model to a .npz file.
+
+        Every history buffer and recurrent state is saved, along with the index
+        of the frame the state belongs to and a hash of the parameters, so the
+        run can be resumed with `load_state`.
+
+        Parameters:
+            fileName: Path of the state file.
+            frameIdx: Index of the next frame to process (optional).
+            **kwargs: JSON-compatible values stored in the header.
+        """
+        header = {'model': self.__class__.__name__,
+                  'paraHash': self.get_para_hash(),
+                  'frameIdx': frameIdx}
+        header.update(kwargs)
+        save_state_record(fileName, self.get_state(), header)
+
+    def load_state(self, fileName, strict=True):
+        """ Loads a state saved by `save_state`.
+
+        The model must be initialized (`init_config`) with the same parameters
+        as the saved one.
+
+        Parameters:
+            fileName: Path of the state file.
+            strict: Whether to raise when the model or its parameters differ.
+                Otherwise, a warning is issued.
+
+        Returns:
+            header: dict with model, paraHash, frameIdx and the saved kwargs.
+        """
+        state, header = load_state_record(fileName)
+        if header.get('model') != self.__class__.__name__ or header.get('paraHash') != self.get_para_hash():
+            msg = (f'The state in {fileName} belongs to <{header.get("model")}> with other parameters, '
+                   f'not to this <{self.__class__.__name__}>.')
+            if strict:
+                raise ValueError(msg)
+            warnings.warn(msg, UserWarning)
+        self.set_state(state)
+        return header
+
+    def set_dtype(self, dtype):
+        """ Sets the floating dtype used by the NumPy backend.
+
+        The dtype is propagated to every core and takes effect at the next
+        `init_config`, where the kernels are created. Inputs are cast to it by
+        the retina; a uint8 input (raw gray levels) is normalized to [0, 1] by
+        the retina blur, so readers can hand over raw uint8 frames. All history
+        buffers then hold `dtype` arrays.
+
+        Parameters:
+            dtype: np.float32, np.float64 or None (follow the input, default).
+        """
+        if dtype is not None:
+            dtype = np.dtype(dtype)
+            if dtype not in (np.float32, np.float64):
+                raise ValueError(f'Unsupported dtype: {dtype}, use float32 or float64.')
+        self.dtype = dtype
+        for _, core in self.named_cores():
+            core.dtype = dtype
+
+    def set_device(self, device):
+        """ Sets the backend and the device of the model and of every core.
+
+        Takes effect at the next `init_config`, where the kernels are created.
+
+        Parameters:
+            device: 'cpu', 'torch-cpu' or 'cuda[:index]', see parse_device.
+        """
+        self.backend, self.device = parse_device(device)
+        for _, core in self.named_cores():
+            core.backend, core.device = self.backend, self.device
+
     def print_para(self):
         logger = logging.getLogger(__name__)
 
@@ -224,6 +515,15 @@ class ESTMD(BaseModel):
         # direction not set in the  ESTMD model
         self.modelOpt['response'] = self.lobulaOpt
 
+    def get_pipeline_stages(self):
+        """ The stages of model_structure, see BaseModel.get_pipeline_stages. """
+        def lobula_stage(medullaOpt):
+            self.lobulaOpt = self.hLobula.process(medullaOpt)
+            self.modelOpt['response'] = self.lobulaOpt
+            return dict(self.modelOpt)
+
+        return self._get_chain_stages(lobula_stage)
+
 
 class ESTMDBackbone(BaseModel):
     """ ESTMDBackbone: A backbone based on ESTMD 
@@ -290,6 +590,15 @@ class ESTMDBackbone(BaseModel):
         # Set model response
         self.modelOpt['response'] = self.lobulaOpt
 
+    def get_pipeline_stages(self):
+        """ The stages of model_structure, see BaseModel.get_pipeline_stages. """
+        def lobula_stage(medullaOpt):
+            self.lobulaOpt, _ = self.hLobula.process(medullaOpt)
+            self.modelOpt['response'] = self.lobulaOpt
+            return dict(self.modelOpt)
+
+        return self._get_chain_stages(lobula_stage)
+
 
 class FracSTMD(ESTMDBackbone):
     """ FracSTMD: Fractional-order Small Target Motion Detector
@@ -463,6 +772,16 @@ class DSTMD(BaseModel):
         self.modelOpt['response'] = compute_response(self.lobulaOpt, device=self.device)
         self.modelOpt['direction'] = compute_direction(self.lobulaOpt, device=self.device)
 
+    def get_pipeline_stages(self):
+        """ The stages of model_structure, see BaseModel.get_pipeline_stages. """
+        def lobula_stage(medullaOpt):
+            self.lobulaOpt = self.hLobula.process(medullaOpt)
+            self.modelOpt['response'] = compute_response(self.lobulaOpt, device=self.device)
+            self.modelOpt['direction'] = compute_direction(self.lobulaOpt, device=self.device)
+            return dict(self.modelOpt)
+
+        return self._get_chain_stages(lobula_stage)
+
 
 class DSTMDBackbone(BaseModel):
     """ DSTMDBackbone: A directional backbone based on DSTMD 
@@ -539,6 +858,16 @@ class DSTMDBackbone(BaseModel):
         self.modelOpt['response'] = compute_response(self.lobulaOpt)
         self.modelOpt['direction'] = compute_direction(self.lobulaOpt)
 
+    def get_pipeline_stages(self):
+        """ The stages of model_structure, see BaseModel.get_pipeline_stages. """
+        def lobula_stage(medullaOpt):
+            self.lobulaOpt = self.hLobula.process(medullaOpt)
+            self.modelOpt['response'] = compute_response(self.lobulaOpt)
+            self.modelOpt['direction'] = compute_direction(self.lobulaOpt)
+            return dict(self.modelOpt)
+
+        return self._get_chain_stages(lobula_stage)
+
 
 
 
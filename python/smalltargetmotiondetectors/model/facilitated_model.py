@@ -1,5 +1,3 @@
-import warnings
-
 from .backbone import DSTMDBackbone
 from ..core import stmdplus_core, apgstmd_core
 from ..util.compute_module import compute_response, compute_direction
@@ -12,6 +10,7 @@ class STMDPlus(DSTMDBackbone):
 
     Description:
         The STMDPlus model builds upon the DSTMD architecture, enhancing target detection accuracy in cluttered moving backgrounds by introducing a contrast pathway. This pathway provides a complementary processing mechanism to improve robustness against dynamic noise and varying background contrasts. The model parameters align with those specified in the reference.
+        The tracks of the mushroom body belong to one stream, so on the torch backend the batch size must be 1; a larger batch raises a ValueError.
 
     Parameters:
         Retina:
@@ -71,8 +70,8 @@ class STMDPlus(DSTMDBackbone):
         super().__init__(device=device)
 
         # Initialize contrast pathway and mushroom body components
-        self.hContrastPathway = stmdplus_core.ContrastPathway()
-        self.hMushroomBody = stmdplus_core.MushroomBody()
+        self.hContrastPathway = stmdplus_core.ContrastPathway(device=device)
+        self.hMushroomBody = stmdplus_core.MushroomBody(device=device)
         
     def init_config(self):
         """
@@ -84,12 +83,9 @@ class STMDPlus(DSTMDBackbone):
         self.hContrastPathway.init_config()
         self.hMushroomBody.init_config()
 
-        if self.device != 'cpu':
-            self.device = 'cpu'
-            warnings.warn('Currently, only CPU is supported. The device parameter will be ignored.', UserWarning)
-
     def model_structure(self, iptMatrix):
         """ Defines the structure of the STMDPlus model. """      
+        self.check_batch_size(iptMatrix)
 
         # A. Ommatidia (Retina)
         self.retinaOpt = self.hRetina.process(iptMatrix)
@@ -111,6 +107,11 @@ class STMDPlus(DSTMDBackbone):
         self.modelOpt['response'] = compute_response(self.mushroomBodyOpt)
         self.modelOpt['direction'] = compute_direction(self.mushroomBodyOpt)
 
+    def check_batch_size(self, iptMatrix):
+        """ The tracks of the mushroom body belong to one stream: one frame per call on the torch backend. """
+        if self.backend == 'torch' and iptMatrix.shape[0] != 1:
+            raise ValueError(f'{type(self).__name__} tracks one stream, the batch size must be 1, got {iptMatrix.shape[0]}.')
+
 
 class ApgSTMD(STMDPlus):
     """ ApgSTMD: Attention-Prediction-guided Small Target Motion Detector
@@ -120,6 +121,7 @@ class ApgSTMD(STMDPlus):
 
     Description:
         The ApgSTMD model extends the STMDPlus model by introducing attention and prediction pathways to improve target detection.
+        As in STMDPlus, the tracks of the mushroom body belong to one stream, so on the torch backend the batch size must be 1.
 
     Parameters:            
         Retina:
@@ -181,6 +183,9 @@ class ApgSTMD(STMDPlus):
         'kappa'     : 'self.hPredictionPathway.kappa', # Eq. (23)
         } 
 
+    # the prediction map of a frame guides the attention of the next one
+    stateAttrs = ('predictionMap',)
+
     def __init__(self, device = 'cpu'):
         """
         Constructor method
@@ -188,8 +193,8 @@ class ApgSTMD(STMDPlus):
         super().__init__(device=device)
 
         # Initialize attention pathway and prediction pathway components
-        self.hAttentionPathway = apgstmd_core.AttentionModule()
-        self.hPredictionPathway = apgstmd_core.PredictionModule()
+        self.hAttentionPathway = apgstmd_core.AttentionModule(device=device)
+        self.hPredictionPathway = apgstmd_core.PredictionModule(device=device)
 
         # Set properties of Lobula's LateralInhibition module
         self.hLobula.hLateralInhi.B = 3.5
@@ -209,12 +214,9 @@ class ApgSTMD(STMDPlus):
         self.hAttentionPathway.init_config()
         self.hPredictionPathway.init_config()
 
-        if self.device != 'cpu':
-            self.device = 'cpu'
-            warnings.warn('Currently, only CPU is supported. The device parameter will be ignored.', UserWarning)
-
     def model_structure(self, iptMatrix):
         """ Defines the structure of the ApgSTMD model. """
+        self.check_batch_size(iptMatrix)
 
         # Preprocessing Module
         self.retinaOpt = self.hRetina.process(iptMatrix)
@@ -5,6 +5,7 @@ import numpy as np
 
 from .backbone import ESTMDBackbone, FracSTMD
 from ..core import feedbackstmd_core, fstmd_core, stfeedbackstmd_core
+from ..util.fixed_point import FixedPointAccelerator
 
 class FeedbackSTMD(ESTMDBackbone):
     """ FeedbackSTMD: Small Target Motion Detector with feedback pathway in lobula
@@ -68,7 +69,7 @@ class FeedbackSTMD(ESTMDBackbone):
         super().__init__(device=device)
 
         # Customize Lobula component
-        self.hLobula = feedbackstmd_core.Lobula()
+        self.hLobula = feedbackstmd_core.Lobula(device=device)
         
         # Customize Lamina's GammaBankPassFilter properties
         self.hLamina.hGammaBandPassFilter.hGammaDelay1.order = 4
@@ -95,6 +96,15 @@ class FeedbackSTMD(ESTMDBackbone):
         # Set model response
         self.modelOpt['response'] = self.lobulaOpt
 
+    def get_pipeline_stages(self):
+        """ The stages of model_structure, see BaseModel.get_pipeline_stages. """
+        def lobula_stage(medullaOpt):
+            self.lobulaOpt = self.hLobula.process(medullaOpt[0], medullaOpt[1])
+            self.modelOpt['response'] = self.lobulaOpt
+            return dict(self.modelOpt)
+
+        return self._get_chain_stages(lobula_stage)
+
 
 class FSTMD(ESTMDBackbone):
     """ FSTMD: Small Target Motion Detector with feedback loop between lobula and lamina
@@ -122,6 +132,18 @@ class FSTMD(ESTMDBackbone):
         Feedback Pathway:
             - n4, tau4: Order and time constant for the gamma delay in the feedback pathway, adjusting temporal coherence to align with the dynamics of target motion. (Eq. 4)
             - a: Feedback constant, regulating the strength of the feedback signal from the lobula to the lamina, balancing sensitivity and stability in target detection by dynamically adjusting the lamina’s response to target motion. (Eq. 4)
+
+    Feedback loop:
+        For each frame, the feedback signal is the fixed point of lamina -> medulla ->
+        lobula correlation -> feedback pathway, iterated until the largest change is
+        below `iterationThreshold` or `maxIterationNum - 1` iterations. These steps are
+        pixel-wise, the surround inhibition of the lobula only runs on the result.
+            - isWarmStart: Start from the feedback signal of the previous frame instead of zeros.
+            - accelerationMethod: None, 'aitken' or 'anderson', see FixedPointAccelerator.
+            - tileSize: Side of the tiles tested for convergence on their own, the
+              feedback of a converged tile is frozen. None tests the whole frame.
+        The number of iterations of the last frame is `iterationCount`, recorded by
+        the LayerProfiler.
     """
 
     # Bind model parameters and their corresponding parameter pointers.
@@ -146,6 +168,10 @@ class FSTMD(ESTMDBackbone):
         'tau4'      : 'self.hFeedbackPathway.hGammaDelay.tau', 
         'a'         : 'self.hFeedbackPathway.feedbackConstant', # Eq. (4)
         }
+
+    # the warm start begins with the feedback signal of the previous frame
+    stateAttrs = ('feedbackSignal',)
+    profilerCounters = ('iterationCount',)
     
     def __init__(self, device = 'cpu'):
         """ FSTMD Constructor method
@@ -160,6 +186,14 @@ class FSTMD(ESTMDBackbone):
 
         self.maxIterationNum = 10
         self.iterationThreshold = 1e-3
+        self.isWarmStart = False
+        self.accelerationMethod = None
+        self.andersonDepth = 3
+        self.tileSize = None
+
+        self.hAccelerator = None
+        self.feedbackSignal = None
+        self.iterationCount = 0
 
         # Customize Medulla's Tm1 component properties
         self.hMedulla.hTm1.hGammaDelay.order = 5
@@ -169,51 +203,113 @@ class FSTMD(ESTMDBackbone):
 
         Initializes the FSTMD components.
         """
+        if self.backend != 'numpy':
+            warnings.warn('Currently, only CPU is supported. The device parameter will be ignored.', UserWarning)
+            self.set_device('cpu')
         # Call superclass init method
         super().init_config()
 
         # Initialize feedback pathway
         self.hFeedbackPathway.init_config()
 
+        # the delays in the loop only recompute the term of the current input
+        for hGammaDelay in self.get_loop_delays():
+            hGammaDelay.isLoopCached = True
+
+        self.hAccelerator = FixedPointAccelerator(self.accelerationMethod, self.andersonDepth)
+        self.feedbackSignal = None
+        self.iterationCount = 0
+
     def model_structure(self, iptMatrix):
         """ MODEL_STRUCTURE Method
 
         Defines the structure of the FSTMD model.
         """
-        m, n = iptMatrix.shape
-        lastFeedbackSignal = np.ones((m, n))
-        self.feedbackSignal = np.zeros((m, n))
-
         # Retina layer
         self.retinaOpt = self.hRetina.process(iptMatrix)
 
-        # Feedback loop
-        iterationCount = 1
-        self.set_loop_state(False)
-        while iterationCount < self.maxIterationNum and np.max(
-                np.abs(self.feedbackSignal - lastFeedbackSignal)) > self.iterationThreshold:
-            lastFeedbackSignal = self.feedbackSignal.copy()
+        if self.isWarmStart and self.feedbackSignal is not None and self.feedbackSignal.shape == self.retinaOpt.shape:
+            feedbackIpt = self.feedbackSignal
+        else:
+            feedbackIpt = np.zeros_like(self.retinaOpt)
+        self.hAccelerator.reset()
+        isActiveTile = None # tiles not converged yet (tileSize)
 
-            # Execute feedback loop
-            self.laminaOpt = self.hLamina.process(self.retinaOpt + self.feedbackSignal)
+        # Feedback loop, the first iteration records the frame, the next ones cover it
+        self.iterationCount = 0
+        self.set_loop_state(False)
+        while True:
+            self.laminaOpt = self.hLamina.process(self.retinaOpt + feedbackIpt)
             self.hMedulla.process(self.laminaOpt)
             self.medullaOpt = self.hMedulla.Opt
-            self.lobulaOpt, correlationOpt = self.hLobula.process(self.medullaOpt)
+            correlationOpt = self.hLobula.compute_correlation(self.medullaOpt)
             self.feedbackSignal = self.hFeedbackPathway.process(correlationOpt)
 
-            iterationCount += 1
+            self.iterationCount += 1
             self.set_loop_state(True)
 
+            diffFeedback = np.abs(self.feedbackSignal - feedbackIpt)
+            if self.tileSize is None:
+                isConverged = np.max(diffFeedback) <= self.iterationThreshold
+            else:
+                isActiveTile = self.get_active_tiles(diffFeedback, isActiveTile)
+                isConverged = not np.any(isActiveTile)
+            if isConverged or self.iterationCount >= self.maxIterationNum - 1:
+                break
+
+            nextFeedbackIpt = self.hAccelerator.update(feedbackIpt, self.feedbackSignal)
+            if isActiveTile is None or np.all(isActiveTile):
+                feedbackIpt = nextFeedbackIpt
+            else:
+                # the feedback of the converged tiles is frozen
+                size = self.tileSize
+                isActive = np.repeat(np.repeat(isActiveTile, size, axis=0), size, axis=1)[:feedbackIpt.shape[0], :feedbackIpt.shape[1]]
+                feedbackIpt = np.where(isActive, nextFeedbackIpt, feedbackIpt)
+
+        # Lobula layer, on the medulla output of the last iteration
+        self.lobulaOpt, _ = self.hLobula.process(self.medullaOpt)
+
         # Set model response
         self.modelOpt['response'] = self.lobulaOpt
 
+    def get_active_tiles(self, diffFeedback, isActiveTile=None):
+        """ Returns the tiles whose feedback still changes.
+
+        Parameters:
+            diffFeedback: Absolute change of the feedback signal in the last iteration.
+            isActiveTile: Tiles active so far, a converged tile stays converged (optional).
+
+        Returns:
+            isActiveTile: Boolean matrix with one element per tileSize x tileSize tile.
+        """
+        m, n = diffFeedback.shape
+        size = self.tileSize
+        numRow, numCol = -(-m // size), -(-n // size)
+        paddedDiff = np.zeros((numRow * size, numCol * size), dtype=diffFeedback.dtype)
+        paddedDiff[:m, :n] = diffFeedback
+        isChanging = paddedDiff.reshape(numRow, size, numCol, size).max(axis=(1, 3)) > self.iterationThreshold
+        return isChanging if isActiveTile is None else isActiveTile & isChanging
+
+    def get_spatial_radius(self):
+        """ The feedback loop stops when the whole frame (or each of its tiles, see
+        tileSize) has converged, so the response at a pixel depends on the whole
+        frame, see BaseModel.get_spatial_radius.
+        """
+        return None
+
+    def get_loop_delays(self):
+        """ Returns the gamma delays of the feedback loop. """
+        return [self.hLamina.hGammaBandPassFilter.hGammaDelay1,
+                self.hLamina.hGammaBandPassFilter.hGammaDelay2,
+                self.hMedulla.hTm1.hGammaDelay,
+                self.hFeedbackPathway.hGammaDelay]
+
     def set_loop_state(self, state):
         """ Sets the loop state of certain components. """
         # Disable circshift for certain components
-        self.hLamina.hGammaBandPassFilter.hGammaDelay1.isInLoop = state
-        self.hLamina.hGammaBandPassFilter.hGammaDelay2.isInLoop = state
-        self.hMedulla.hTm1.hGammaDelay.isInLoop = state
-        self.hFeedbackPathway.hGammaDelay.isInLoop = state
+        self.hLamina.hGammaBandPassFilter.isInLoop = state
+        for hGammaDelay in self.get_loop_delays():
+            hGammaDelay.isInLoop = state
 
 
 class STFeedbackSTMD(ESTMDBackbone):
@@ -237,14 +333,8 @@ class STFeedbackSTMD(ESTMDBackbone):
         super().__init__(device=device)       
 
         # Customize Medulla and Lobula component
-        self.hMedulla = stfeedbackstmd_core.Medulla()
-        self.hLobula = stfeedbackstmd_core.Lobula()
-
-    def init_config(self):
-        """
-        Initializes the STFeedbackSTMD components.
-        """
-        super().init_config()
+        self.hMedulla = stfeedbackstmd_core.Medulla(device=device)
+        self.hLobula = stfeedbackstmd_core.Lobula(device=device)
 
 
 class FracSTMD_F(FracSTMD):
@@ -266,7 +356,7 @@ class FracSTMD_F(FracSTMD):
         super().__init__(device=device)       
 
         # Customize Lamina component to include fractional differentiation
-        self.hLobula = feedbackstmd_core.Lobula()
+        self.hLobula = feedbackstmd_core.Lobula(device=device)
 
     def model_structure(self, iptMatrix):
         """ MODEL_STRUCTURE Method
@@ -283,6 +373,15 @@ class FracSTMD_F(FracSTMD):
         # Set model response
         self.modelOpt['response'] = self.lobulaOpt
 
+    def get_pipeline_stages(self):
+        """ The stages of model_structure, see BaseModel.get_pipeline_stages. """
+        def lobula_stage(medullaOpt):
+            self.lobulaOpt = self.hLobula.process(medullaOpt[0], medullaOpt[1])
+            self.modelOpt['response'] = self.lobulaOpt
+            return dict(self.modelOpt)
+
+        return self._get_chain_stages(lobula_stage)
+
 
 
 
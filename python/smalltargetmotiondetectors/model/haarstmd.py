@@ -1,4 +1,4 @@
-import warnings
+from copy import copy
 
 from ..core import haarstmd_core
 from .backbone import ESTMDBackbone
@@ -26,8 +26,8 @@ class HaarSTMD(ESTMDBackbone):
         ''' Constructor method '''
         super().__init__(device=device)
 
-        self.hMedulla = haarstmd_core.Medulla()
-        self.hLobula = haarstmd_core.Lobula()
+        self.hMedulla = haarstmd_core.Medulla(device=device)
+        self.hLobula = haarstmd_core.Lobula(device=device)
 
         # init parameter
         self.hRetina.hGaussianBlur.sigma = 1
@@ -48,10 +48,6 @@ class HaarSTMD(ESTMDBackbone):
         self.hMedulla.init_config()
         self.hLobula.init_config()
 
-        if self.device != 'cpu':
-            self.device = 'cpu'
-            warnings.warn('Currently, only CPU is supported. The device parameter will be ignored.', UserWarning)
-
     def model_structure(self, iptMatrix):
         ''' MODEL_STRUCTURE: Defines the structure of the HaarSTMD model. 
 
@@ -64,4 +60,20 @@ class HaarSTMD(ESTMDBackbone):
         cellSpatialOpt, temporalOpt = self.hMedulla.process(self.laminaOpt)
         self.lobulaOpt = self.hLobula.process(cellSpatialOpt, temporalOpt)
 
-        self.modelOpt['response'] = self.lobulaOpt
\ No newline at end of file
+        self.modelOpt['response'] = self.lobulaOpt
+
+    def get_pipeline_stages(self):
+        ''' The stages of model_structure, see BaseModel.get_pipeline_stages. '''
+        def medulla_stage(laminaOpt):
+            cellSpatialOpt, temporalOpt = self.hMedulla.process(laminaOpt)
+            # the lobula reads the history of the medulla, which moves on with the next frame
+            return copy(cellSpatialOpt), temporalOpt
+
+        def lobula_stage(medullaOpt):
+            self.lobulaOpt = self.hLobula.process(*medullaOpt)
+            self.modelOpt['response'] = self.lobulaOpt
+            return dict(self.modelOpt)
+
+        stages = self._get_chain_stages(lobula_stage)
+        stages[2] = medulla_stage
+        return stages
@@ -0,0 +1,50 @@
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+filePath = os.path.realpath(__file__)
+pyPackagePath = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(filePath))))
+sys.path.append(pyPackagePath)
+
+from smalltargetmotiondetectors.api.benchmark import (compare_to_baseline, create_synthetic_frames,
+                                                      run_benchmark)
+
+
+class TestBenchmark(unittest.TestCase):
+    def test_synthetic_frames(self):
+        frames = create_synthetic_frames((48, 64), 4, seed=1)
+        self.assertEqual(frames.shape, (4, 48, 64))
+        np.testing.assert_array_equal(frames, create_synthetic_frames((48, 64), 4, seed=1))
+        self.assertFalse(np.array_equal(frames[0], frames[1]))
+
+    def test_run_benchmark(self):
+        with tempfile.TemporaryDirectory() as tmpDir:
+            jsonName = os.path.join(tmpDir, 'benchmark.json')
+            results = run_benchmark(['ESTMD', 'NotAModel'], shapes=[(48, 64)], clips=[], numFrames=3,
+                                    isolate=False, outputName=jsonName)
+            with open(jsonName) as hFile:
+                self.assertEqual(json.load(hFile)['models'].keys(), results['models'].keys())
+
+        stats = results['models']['ESTMD/synthetic-48x64']
+        self.assertEqual(stats['numFrames'], 3)
+        self.assertGreater(stats['fps'], 0)
+        self.assertLessEqual(stats['p50'], stats['max'])
+        self.assertIn('error', results['models']['NotAModel/synthetic-48x64'])
+        for name in ['GammaDelay', 'SurroundInhibition', 'MatrixNMS.sort', 'compute_direction']:
+            self.assertIn(f'{name}/48x64', results['primitives'])
+
+        # a faster baseline flags the run, the run itself does not
+        self.assertEqual(compare_to_baseline(results, results), [])
+        baseline = json.loads(json.dumps(results))
+        baseline['models']['ESTMD/synthetic-48x64']['fps'] *= 2
+        regressions = compare_to_baseline(results, baseline)
+        self.assertEqual([(item['case'], item['metric']) for item in regressions],
+                         [('models/ESTMD/synthetic-48x64', 'fps')])
+
+
+if __name__ == '__main__':
+    unittest.main()
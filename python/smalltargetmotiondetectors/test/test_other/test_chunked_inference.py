@@ -0,0 +1,80 @@
+import os
+import sys
+import tempfile
+import unittest
+
+import cv2
+import numpy as np
+
+filePath = os.path.realpath(__file__)
+pyPackagePath = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(filePath))))
+sys.path.append(pyPackagePath)
+
+from smalltargetmotiondetectors.api import (inference_task, chunked_inference_task,
+                                            instancing_model)
+
+
+class TestChunkedInference(unittest.TestCase):
+    def setUp(self):
+        # a small dark target moving over a textured background
+        self.tmpDir = tempfile.TemporaryDirectory()
+        rng = np.random.default_rng(0)
+        background = cv2.GaussianBlur(rng.integers(80, 200, (64, 96), dtype=np.uint8), (5, 5), 0)
+        for idx in range(1, 301):
+            img = background.copy()
+            x = 10 + idx // 4
+            img[30:33, x:x+3] = 0
+            cv2.imwrite(os.path.join(self.tmpDir.name, f'Frame{idx:04d}.png'), img)
+        self.imgsteamFormat = os.path.join(self.tmpDir.name, 'Frame*.png')
+
+    def tearDown(self):
+        self.tmpDir.cleanup()
+
+    def test_receptive_field(self):
+        for modelName in ['ESTMD', 'DSTMD', 'HaarSTMD']:
+            objModel = instancing_model(modelName)
+            objModel.init_config()
+            receptiveField = objModel.get_temporal_receptive_field()
+            self.assertTrue(receptiveField['isExact'])
+            self.assertEqual(receptiveField['warmUp'], receptiveField['memory'])
+            self.assertGreater(receptiveField['memory'], 0)
+
+        objModel = instancing_model('FracSTMD')
+        objModel.init_config()
+        receptiveField = objModel.get_temporal_receptive_field(tolerance=1e-6)
+        self.assertFalse(receptiveField['isExact'])
+        self.assertIn('hLamina', receptiveField['recursiveCores'])
+        self.assertLessEqual(receptiveField['errorBound'], 1e-6)
+        self.assertGreater(receptiveField['warmUp'], receptiveField['memory'])
+
+        objModel = instancing_model('FSTMD')
+        objModel.init_config()
+        self.assertIsNone(objModel.get_temporal_receptive_field()['errorBound'])
+
+    def test_fir_model_matches_serial(self):
+        results, directions, _ = inference_task('ESTMD', self.imgsteamFormat, 'ImgstreamReader', 1)
+        chunkResults, chunkDirections, _, report = chunked_inference_task(
+            'ESTMD', self.imgsteamFormat, 'ImgstreamReader', 1,
+            numChunks=3, numWorkers=2, returnReport=True)
+
+        self.assertTrue(report['isExact'])
+        self.assertEqual(len(report['chunks']), 3)
+        # the last chunk is pre-rolled from within the second one
+        self.assertGreater(report['chunks'][2][0], report['chunks'][1][1])
+        self.assertGreater(sum(len(result) > 0 for result in results), 0)
+        self.assertEqual(len(chunkResults), len(results))
+        self.assertEqual(len(chunkDirections), len(directions))
+        for result, chunkResult in zip(results, chunkResults):
+            np.testing.assert_array_equal(np.array(result), np.array(chunkResult))
+        self.assertEqual(report['boundaryErrors'], [0.] * 2)
+
+    def test_short_warm_up(self):
+        _, _, _, report = chunked_inference_task(
+            'HaarSTMD', self.imgsteamFormat, 'ImgstreamReader', 1,
+            numChunks=2, numWorkers=2, warmUp=2, returnReport=True)
+        self.assertFalse(report['isExact'])
+        self.assertEqual(report['chunks'][1][1] - report['chunks'][1][0], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
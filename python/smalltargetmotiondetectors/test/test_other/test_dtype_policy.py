@@ -0,0 +1,43 @@
+import os
+import sys
+import unittest
+
+import numpy as np
+
+filePath = os.path.realpath(__file__)
+pyPackagePath = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(filePath))))
+sys.path.append(pyPackagePath)
+
+from smalltargetmotiondetectors.api import instancing_model
+
+
+class TestDtypePolicy(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.rawFrames = [rng.integers(0, 256, (60, 80), dtype=np.uint8) for _ in range(12)]
+
+    def run_pair(self, modelName):
+        objRef = instancing_model(modelName)
+        objTest = instancing_model(modelName, dtype=np.float32)
+        objRef.init_config()
+        objTest.init_config()
+        for rawFrame in self.rawFrames:
+            refOpt, _ = objRef.process(rawFrame.astype(np.float64) / 255)
+            testOpt, _ = objTest.process(rawFrame)
+        return refOpt['response'], testOpt['response']
+
+    def test_float32_matches_float64(self):
+        for modelName in ['ESTMD', 'DSTMD', 'FSTMD']:
+            refResponse, testResponse = self.run_pair(modelName)
+            self.assertEqual(testResponse.dtype, np.float32, modelName)
+            scale = max(np.nanmax(np.abs(refResponse)), 1e-12)
+            maxRelError = np.nanmax(np.abs(refResponse - testResponse)) / scale
+            self.assertLess(maxRelError, 1e-4, modelName)
+
+    def test_invalid_dtype(self):
+        with self.assertRaises(ValueError):
+            instancing_model('ESTMD', dtype=np.int16)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import os
+import sys
+import unittest
+
+import numpy as np
+
+filePath = os.path.realpath(__file__)
+pyPackagePath = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(filePath))))
+sys.path.append(pyPackagePath)
+
+from smalltargetmotiondetectors.api import instancing_model
+from smalltargetmotiondetectors.util.stimulus import read_synthetic_frames
+
+
+class TestFSTMDConvergence(unittest.TestCase):
+    def setUp(self):
+        # bright targets, so that the feedback loop iterates
+        self.frames = [frame * 255 for frame in
+                       read_synthetic_frames({'shape': (60, 80), 'fps': 250, 'numTargets': 2, 'seed': 0}, 30)]
+
+    def run_model(self, **options):
+        objModel = instancing_model('FSTMD')
+        objModel.iterationThreshold = 1e-6
+        objModel.maxIterationNum = 50
+        for name, value in options.items():
+            setattr(objModel, name, value)
+        objModel.init_config()
+        # the default gamma kernels ignore the current input, these ones make
+        # the feedback of a frame depend on itself
+        for hGammaDelay in [objModel.hFeedbackPathway.hGammaDelay, objModel.hLamina.hGammaBandPassFilter.hGammaDelay1]:
+            kernel = 0.6 ** np.arange(hGammaDelay.lenKernel)
+            hGammaDelay.gammaKernel = kernel / np.sum(kernel)
+
+        responses, iterationCounts = [], []
+        for frame in self.frames:
+            modelOpt, _ = objModel.process(frame)
+            responses.append(modelOpt['response'])
+            iterationCounts.append(objModel.iterationCount)
+        return np.stack(responses), np.array(iterationCounts), objModel
+
+    def test_loop_covers_the_frame(self):
+        objModel = instancing_model('FSTMD')
+        objModel.init_config()
+        objListIpt = objModel.hLamina.hGammaBandPassFilter.objListIpt
+        iterationCounts = []
+        for idx, frame in enumerate(self.frames):
+            objModel.process(frame)
+            iterationCounts.append(objModel.iterationCount)
+            # one lamina input per frame, whatever the number of iterations
+            self.assertEqual(objListIpt.pointer, idx % objListIpt.initLen)
+        self.assertGreater(max(iterationCounts), 1)
+
+    def test_options_match_plain_iteration(self):
+        refResponse, refCounts, _ = self.run_model()
+        scale = np.max(refResponse)
+        self.assertGreater(scale, 0)
+        self.assertGreater(np.max(refCounts), 2)
+
+        for options in [{'isWarmStart': True}, {'accelerationMethod': 'aitken'}, {'accelerationMethod': 'anderson'},
+                        {'tileSize': 16}, {'isWarmStart': True, 'accelerationMethod': 'aitken', 'tileSize': 16}]:
+            response, iterationCounts, _ = self.run_model(**options)
+            self.assertLess(np.max(np.abs(response - refResponse)) / scale, 1e-4, options)
+            self.assertLessEqual(np.sum(iterationCounts), np.sum(refCounts), options)
+
+        _, aitkenCounts, _ = self.run_model(accelerationMethod='aitken')
+        self.assertLess(np.sum(aitkenCounts), np.sum(refCounts) * 2 / 3)
+
+    def test_profiler_counts_iterations(self):
+        objModel = instancing_model('FSTMD')
+        objModel.init_config()
+        hProfiler = objModel.enable_profiler()
+        iterationCounts = []
+        for frame in self.frames:
+            objModel.process(frame)
+            iterationCounts.append(objModel.iterationCount)
+        objModel.disable_profiler()
+
+        self.assertEqual(hProfiler.counters['iterationCount'], iterationCounts)
+        stat = hProfiler.counter_summary()['iterationCount']
+        self.assertEqual(stat['count'], len(self.frames))
+        self.assertEqual(stat['max'], max(iterationCounts))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,33 @@
+import os
+import sys
+import subprocess
+import unittest
+
+filePath = os.path.realpath(__file__)
+pyPackagePath = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(filePath))))
+
+# runs every NumPy model on a few frames, in a fresh interpreter
+SCRIPT = '''
+import sys
+import numpy as np
+from smalltargetmotiondetectors.api import instancing_model
+from smalltargetmotiondetectors.model import __all__ as modelNames
+
+for modelName in modelNames:
+    objModel = instancing_model(modelName)
+    objModel.init_config()
+    for _ in range(3):
+        objModel.process(np.random.rand(40, 50))
+print(sorted(name for name in ('torch', 'matplotlib', 'tkinter') if name in sys.modules))
+'''
+
+
+class TestHeadlessImport(unittest.TestCase):
+    def test_numpy_models_do_not_import_torch(self):
+        output = subprocess.run([sys.executable, '-c', SCRIPT], capture_output=True, text=True, check=True,
+                                env=dict(os.environ, PYTHONPATH=pyPackagePath))
+        self.assertEqual(output.stdout.strip().splitlines()[-1], '[]')
+
+
+if __name__ == '__main__':
+    unittest.main()
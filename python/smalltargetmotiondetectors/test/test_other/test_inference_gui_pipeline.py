@@ -0,0 +1,132 @@
+import os
+import sys
+import time
+import tempfile
+import unittest
+import multiprocessing
+
+import cv2
+import numpy as np
+
+filePath = os.path.realpath(__file__)
+pyPackagePath = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(filePath))))
+sys.path.append(pyPackagePath)
+
+from smalltargetmotiondetectors.demo.inference_gui import StmdGui, PipelineTelemetry
+from smalltargetmotiondetectors.api import instancing_model
+from smalltargetmotiondetectors.util.iostream import ImgstreamReader
+
+
+NUM_FILES = 24
+MODEL_NAME = 'DSTMD'
+
+
+def run_pipeline(gui, startImgName, endImgName, consumerDelay=0.):
+    '''
+    Runs the reader and inference processes of StmdGui, the calling process
+    takes the place of the visualizer: as the visualizer, it holds the slot of
+    the last frame until the next one arrives.
+    '''
+    iptQueue, resQueue = gui._create_queues()
+    framePool = gui._create_frame_pool(startImgName, endImgName)
+    telemetry = PipelineTelemetry()
+    exitEvent = multiprocessing.Event()
+    processes = [
+        multiprocessing.Process(target=gui._read_frames,
+                                args=(iptQueue, framePool, startImgName, endImgName, exitEvent, telemetry)),
+        multiprocessing.Process(target=gui._run_inference,
+                                args=(iptQueue, resQueue, framePool, MODEL_NAME, exitEvent, telemetry)),
+    ]
+    for hProcess in processes:
+        hProcess.start()
+    outputs = []
+    shownSlot = None
+    try:
+        while (data := gui._safe_get(resQueue, exitEvent, timeout=30)) is not None:
+            slot, captureTime, result, sharedKeys, runTime = data
+            telemetry.record(captureTime)
+            views = framePool.get_slot(slot)
+            result.update({key: views[key].copy() for key in sharedKeys})
+            outputs.append((captureTime, views['gray'].copy(), result))
+            if shownSlot is not None:
+                framePool.release(shownSlot)
+            shownSlot = slot
+            time.sleep(consumerDelay)
+        for hProcess in processes:
+            hProcess.join(timeout=10)
+    finally:
+        exitEvent.set()
+        for hProcess in processes:
+            if hProcess.is_alive():
+                hProcess.terminate()
+        gui._cleanup_queues(iptQueue, resQueue, framePool.freeSlots)
+        framePool.close()
+    return outputs, telemetry.summary(), [hProcess.exitcode for hProcess in processes]
+
+
+class TestInferenceGuiPipeline(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmpDir = tempfile.TemporaryDirectory()
+        rng = np.random.default_rng(0)
+        for idx in range(1, NUM_FILES + 1):
+            img = rng.integers(0, 256, (48, 64, 3), dtype=np.uint8)
+            cv2.imwrite(os.path.join(cls.tmpDir.name, f'Frame{idx:04d}.png'), img)
+        cls.startImgName = os.path.join(cls.tmpDir.name, 'Frame0001.png')
+        cls.endImgName = os.path.join(cls.tmpDir.name, f'Frame{NUM_FILES:04d}.png')
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmpDir.cleanup()
+
+    def test_throughput_mode(self):
+        outputs, summary, exitCodes = run_pipeline(StmdGui(num_slots=3), self.startImgName, self.endImgName)
+        self.assertEqual(exitCodes, [0, 0])
+
+        # every frame, with the outputs of the model run in this process
+        objModel = instancing_model(MODEL_NAME)
+        objModel.init_config()
+        objIptStream = ImgstreamReader(startImgName=self.startImgName, endImgName=self.endImgName)
+        numFrames = 0
+        while objIptStream.hasFrame:
+            grayImg, _ = objIptStream.get_next_frame()
+            modelOpt, _ = objModel.process(grayImg)
+            _, _, result = outputs[numFrames]
+            np.testing.assert_array_equal(result['response'], modelOpt['response'])
+            np.testing.assert_array_equal(result['direction'], modelOpt['direction'])
+            numFrames += 1
+        self.assertEqual(len(outputs), numFrames)
+        self.assertEqual(summary['numResults'], numFrames)
+        self.assertEqual(summary['droppedFrames'] + summary['droppedResults'], 0)
+        self.assertGreaterEqual(summary['p99'], summary['p50'])
+
+    def test_num_slots(self):
+        # the slot on screen and the one of the next frame
+        with self.assertRaises(ValueError):
+            StmdGui(num_slots=1)
+        outputs, _, exitCodes = run_pipeline(StmdGui(num_slots=2), self.startImgName, self.endImgName)
+        self.assertEqual(exitCodes, [0, 0])
+        objIptStream = ImgstreamReader(startImgName=self.startImgName, endImgName=self.endImgName)
+        self.assertEqual(len(outputs), len(objIptStream.fileList))
+
+    def test_latency_mode(self):
+        # a slow consumer: stale frames are dropped instead of waiting
+        gui = StmdGui(num_slots=3, latency_mode=True)
+        outputs, summary, exitCodes = run_pipeline(gui, self.startImgName, self.endImgName, consumerDelay=0.05)
+        self.assertEqual(exitCodes, [0, 0])
+
+        objIptStream = ImgstreamReader(startImgName=self.startImgName, endImgName=self.endImgName)
+        numFrames = 0
+        while objIptStream.hasFrame:
+            objIptStream.get_next_frame()
+            numFrames += 1
+        self.assertEqual(summary['numResults'], len(outputs))
+        self.assertGreater(summary['droppedFrames'] + summary['droppedResults'], 0)
+        self.assertEqual(summary['numResults'] + summary['droppedFrames'] + summary['droppedResults'], numFrames)
+        # the frames that got through keep their order
+        captureTimes = [captureTime for captureTime, _, _ in outputs]
+        self.assertEqual(captureTimes, sorted(captureTimes))
+
+
+if __name__ == '__main__':
+    unittest.main()
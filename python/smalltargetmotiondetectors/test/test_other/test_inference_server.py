@@ -0,0 +1,75 @@
+import os
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+filePath = os.path.realpath(__file__)
+pyPackagePath = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(filePath))))
+sys.path.append(pyPackagePath)
+
+from smalltargetmotiondetectors.api import instancing_model
+from smalltargetmotiondetectors.api.evaluate import postprocess_output
+from smalltargetmotiondetectors.api.inference_client import InferenceClient, start_server_process
+from smalltargetmotiondetectors.util.matrixnms import MatrixNMS
+from smalltargetmotiondetectors.util.stimulus import read_synthetic_frames
+
+
+def read_frames(seed, numFrames):
+    return read_synthetic_frames({'shape': (64, 96), 'fps': 250, 'numTargets': 1, 'seed': seed}, numFrames,
+                                 dtype=np.uint8)
+
+
+class TestInferenceServer(unittest.TestCase):
+    def test_loopback(self):
+        streams = {'cam0': ('DSTMD', read_frames(0, 20)), 'cam1': ('ESTMDBackbone', read_frames(1, 20))}
+        with tempfile.TemporaryDirectory() as tmpDir:
+            socketPath = os.path.join(tmpDir, 'stmd.sock')
+            process = start_server_process(socketPath, numThreads=2)
+            try:
+                with InferenceClient(socketPath, timeout=60) as client:
+                    for streamId, (modelName, frames) in streams.items():
+                        client.open_stream(streamId, modelName, frames[0].shape, numSlots=3)
+                    with self.assertRaises(RuntimeError):
+                        client.open_stream('cam2', 'NoSuchModel', (64, 96))
+
+                    # the frames of both streams are in flight together
+                    requestIds = {streamId: [] for streamId in streams}
+                    for idx in range(20):
+                        for streamId, (_, frames) in streams.items():
+                            requestIds[streamId].append(client.submit(streamId, frames[idx]))
+                    records = {streamId: [client.get_record(requestId) for requestId in ids]
+                               for streamId, ids in requestIds.items()}
+
+                    health = client.get_health()
+                    self.assertEqual(health['status'], 'running')
+                    self.assertEqual(health['numStreams'], 2)
+                    stats = client.get_stats()
+                    self.assertEqual(stats['numFrames'], 40)
+                    self.assertEqual(stats['streams']['cam0']['numFrames'], 20)
+                    self.assertGreater(stats['streams']['cam1']['framesPerSecond'], 0)
+
+                    client.close_stream('cam0')
+                    # closing again is a no-op
+                    self.assertTrue(client.request({'op': 'close', 'stream': 'cam0'})['ok'])
+                    self.assertEqual(client.get_health()['numStreams'], 1)
+                    client.shutdown_server()
+                self.assertEqual(process.wait(timeout=30), 0)
+            finally:
+                if process.poll() is None:
+                    process.kill()
+
+        for streamId, (modelName, frames) in streams.items():
+            objModel = instancing_model(modelName)
+            objModel.init_config()
+            objNMS = MatrixNMS(15)
+            self.assertEqual([record.frameIdx for record in records[streamId]], list(range(20)))
+            for frame, record in zip(frames, records[streamId]):
+                responseListType, directionListType = postprocess_output(objModel.process(frame)[0], objNMS)
+                self.assertEqual(record.response_list(), responseListType)
+                np.testing.assert_array_equal(record.direction_list(), directionListType)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import os
+import sys
+import tempfile
+import unittest
+
+import cv2
+import numpy as np
+
+filePath = os.path.realpath(__file__)
+pyPackagePath = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(filePath))))
+sys.path.append(pyPackagePath)
+
+from smalltargetmotiondetectors.api import inference_task, instancing_model
+from smalltargetmotiondetectors.api.evaluate import get_checkpoint_log_name
+from smalltargetmotiondetectors.util.datarecord import load_state_record
+from smalltargetmotiondetectors.util.detection_log import DetectionLog
+
+
+class TestModelState(unittest.TestCase):
+    def setUp(self):
+        # a small dark target moving over a textured background
+        self.tmpDir = tempfile.TemporaryDirectory()
+        rng = np.random.default_rng(0)
+        background = cv2.GaussianBlur(rng.integers(80, 200, (64, 96), dtype=np.uint8), (5, 5), 0)
+        self.frames = []
+        for idx in range(1, 121):
+            img = background.copy()
+            x = 10 + idx // 2
+            img[30:33, x:x+3] = 0
+            cv2.imwrite(os.path.join(self.tmpDir.name, f'Frame{idx:04d}.png'), img)
+            self.frames.append(img.astype(np.float64) / 255)
+        self.imgsteamFormat = os.path.join(self.tmpDir.name, 'Frame*.png')
+        self.stateName = os.path.join(self.tmpDir.name, 'state.npz')
+
+    def tearDown(self):
+        self.tmpDir.cleanup()
+
+    def test_save_and_load_state(self):
+        for modelName in ['ESTMD', 'FracSTMD', 'FSTMD', 'ApgSTMD', 'HaarSTMD']:
+            objModel = instancing_model(modelName)
+            objModel.init_config()
+            for frame in self.frames[:40]:
+                objModel.process(frame)
+            objModel.save_state(self.stateName, frameIdx=40)
+            responses = [np.copy(objModel.process(frame)[0]['response']) for frame in self.frames[40:50]]
+
+            objRestored = instancing_model(modelName)
+            objRestored.init_config()
+            header = objRestored.load_state(self.stateName)
+            self.assertEqual(header['frameIdx'], 40)
+            for frame, response in zip(self.frames[40:50], responses):
+                np.testing.assert_array_equal(objRestored.process(frame)[0]['response'], response)
+
+    def test_para_hash(self):
+        objModel = instancing_model('ESTMD')
+        objModel.init_config()
+        objModel.save_state(self.stateName)
+
+        objOther = instancing_model('ESTMD')
+        objOther.set_para(tau3=10)
+        objOther.init_config()
+        self.assertNotEqual(objOther.get_para_hash(), objModel.get_para_hash())
+        with self.assertRaises(ValueError):
+            objOther.load_state(self.stateName)
+
+        objOther = instancing_model('DSTMD')
+        objOther.init_config()
+        with self.assertRaises(ValueError):
+            objOther.load_state(self.stateName)
+
+    def test_inference_task_checkpoint(self):
+        results, directions, _ = inference_task('DSTMD', self.imgsteamFormat, 'ImgstreamReader', 1)
+
+        # a run interrupted at frame 60, resumed from its checkpoint
+        inference_task('DSTMD', self.imgsteamFormat, 'ImgstreamReader', 1, 61,
+                       checkpointName=self.stateName, checkpointInterval=25)
+        # the checkpoint holds the state, the outputs are in the log next to it
+        self.assertNotIn('results', load_state_record(self.stateName)[1])
+        self.assertEqual(len(DetectionLog(get_checkpoint_log_name(self.stateName))), 60)
+        resumedResults, resumedDirections, _ = inference_task(
+            'DSTMD', self.imgsteamFormat, 'ImgstreamReader', 1,
+            checkpointName=self.stateName, checkpointInterval=25)
+
+        self.assertEqual(len(resumedResults), len(results))
+        for result, resumedResult in zip(results, resumedResults):
+            np.testing.assert_allclose(np.array(result), np.array(resumedResult))
+        for direction, resumedDirection in zip(directions, resumedDirections):
+            np.testing.assert_allclose(np.array(direction), np.array(resumedDirection))
+
+        with self.assertRaises(ValueError):
+            inference_task('DSTMD', self.imgsteamFormat, 'ImgstreamReader', 2,
+                           checkpointName=self.stateName)
+
+
+if __name__ == '__main__':
+    unittest.main()
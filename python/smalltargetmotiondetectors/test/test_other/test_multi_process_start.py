@@ -27,14 +27,16 @@ def task1():
         opt2 = None
         isStepping = False
         
-        # create queues
+        # create queues and the shared frame slots
         ipt_queue, res_queue = obj._create_queues()
+        frame_pool = obj._create_frame_pool(opt1, opt2)
+        exit_event = Event()
         
         # start processes
         timetic = time.time()
-        exit_event, processes = obj._start_processes(ipt_queue, res_queue, 
-                                                        modelName, opt1, opt2, 
-                                                        isStepping)
+        processes = obj._start_processes(ipt_queue, res_queue, frame_pool,
+                                         modelName, opt1, opt2, 
+                                         isStepping, exit_event)
         
         # wait for processes to finish
         while not exit_event.is_set():
@@ -59,7 +61,8 @@ def task1():
                 p.terminate()
                 
         # clear queues
-        obj._cleanup_queues(ipt_queue, res_queue)
+        obj._cleanup_queues(ipt_queue, res_queue, frame_pool.freeSlots)
+        frame_pool.close()
     
 
 
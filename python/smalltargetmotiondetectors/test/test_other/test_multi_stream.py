@@ -0,0 +1,109 @@
+import asyncio
+import os
+import sys
+import time
+import unittest
+
+import numpy as np
+
+filePath = os.path.realpath(__file__)
+pyPackagePath = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(filePath))))
+sys.path.append(pyPackagePath)
+
+from smalltargetmotiondetectors.api import instancing_model
+from smalltargetmotiondetectors.api.multi_stream import MultiStreamRunner
+from smalltargetmotiondetectors.util.stimulus import read_synthetic_frames
+
+
+def read_frames(seed, numFrames):
+    return read_synthetic_frames({'shape': (64, 96), 'fps': 250, 'numTargets': 1, 'seed': seed}, numFrames)
+
+
+class TestMultiStream(unittest.TestCase):
+    def test_streams_match_serial(self):
+        streams = {'cam0': ('DSTMD', read_frames(0, 15)),
+                   'cam1': ('DSTMD', read_frames(1, 15)),
+                   'cam2': ('ESTMDBackbone', read_frames(2, 15))}
+        runner = MultiStreamRunner(numThreads=3, maxPending=2)
+        for streamId, (modelName, _) in streams.items():
+            runner.add_stream(streamId, modelName)
+
+        async def feed(streamId, frames):
+            # submit the frames without waiting, the buffer of the stream holds them back
+            tasks = [asyncio.create_task(runner.submit(streamId, frame)) for frame in frames]
+            pending = []
+            for task in tasks:
+                pending.append(runner.get_stream_stats()[streamId]['pending'])
+                await asyncio.sleep(0)
+            return [modelOpt for modelOpt, _ in await asyncio.gather(*tasks)], max(pending)
+
+        async def main():
+            async with runner:
+                return await asyncio.gather(*(feed(streamId, frames) for streamId, (_, frames) in streams.items()))
+
+        outputs = asyncio.run(main())
+        for (streamId, (modelName, frames)), (modelOpts, maxPending) in zip(streams.items(), outputs):
+            self.assertLessEqual(maxPending, 2)
+            objModel = instancing_model(modelName)
+            objModel.init_config()
+            for frame, modelOpt in zip(frames, modelOpts):
+                refOpt, _ = objModel.process(frame)
+                np.testing.assert_array_equal(modelOpt['response'], refOpt['response'], streamId)
+
+        stats = runner.get_stream_stats()
+        self.assertEqual([stat['numFrames'] for stat in stats.values()], [15, 15, 15])
+        # the second DSTMD stream uses the kernels of the first one
+        self.assertEqual(stats['cam0']['sharedBytes'], 0)
+        self.assertGreater(stats['cam1']['sharedBytes'], 0)
+        self.assertEqual(stats['cam2']['sharedBytes'], 0)
+        self.assertIs(runner.streams['cam1'].objModel.hRetina.hGaussianBlur.gaussKernel,
+                      runner.streams['cam0'].objModel.hRetina.hGaussianBlur.gaussKernel)
+
+    def test_fair_scheduling(self):
+        runner = MultiStreamRunner(numThreads=1, maxPending=20)
+        runner.add_stream('busy', 'ESTMDBackbone')
+        runner.add_stream('quiet', 'ESTMDBackbone')
+        frames = read_frames(0, 12)
+        doneOrder = []
+
+        async def submit(streamId, frame):
+            await runner.submit(streamId, frame)
+            doneOrder.append(streamId)
+
+        async def main():
+            async with runner:
+                busyTasks = [asyncio.create_task(submit('busy', frame)) for frame in frames]
+                await asyncio.sleep(0)
+                quietTasks = [asyncio.create_task(submit('quiet', frame)) for frame in frames[:3]]
+                await asyncio.gather(*busyTasks, *quietTasks)
+
+        asyncio.run(main())
+        # the quiet stream does not wait for the backlog of the busy one
+        self.assertLess(max(idx for idx, streamId in enumerate(doneOrder) if streamId == 'quiet'), 8)
+
+    def test_remove_stream_waits_for_running_frame(self):
+        runner = MultiStreamRunner(numThreads=1)
+        finished = []
+
+        def slow_postprocess(modelOpt):
+            time.sleep(0.2)
+            finished.append(True)
+            return modelOpt
+
+        runner.add_stream('cam0', 'ESTMDBackbone', postprocess=slow_postprocess)
+        frame = read_frames(0, 1)[0]
+
+        async def main():
+            async with runner:
+                task = asyncio.create_task(runner.submit('cam0', frame))
+                await asyncio.sleep(0.05)
+                await runner.remove_stream('cam0')
+                # the model is no longer in use once the stream is removed
+                self.assertEqual(finished, [True])
+                self.assertTrue(task.cancelled())
+
+        asyncio.run(main())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import os
+import sys
+import unittest
+
+import numpy as np
+
+filePath = os.path.realpath(__file__)
+pyPackagePath = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(filePath))))
+sys.path.append(pyPackagePath)
+
+from smalltargetmotiondetectors.api import instancing_model
+from smalltargetmotiondetectors.api.pipelined_inference import PipelinedModel
+from smalltargetmotiondetectors.util.stimulus import read_synthetic_frames
+
+
+class TestPipelinedInference(unittest.TestCase):
+    @staticmethod
+    def read_frames(numFrames):
+        return read_synthetic_frames({'shape': (96, 128), 'fps': 250, 'numTargets': 1, 'seed': 0}, numFrames)
+
+    @staticmethod
+    def create_model(modelName):
+        objModel = instancing_model(modelName)
+        objModel.init_config()
+        return objModel
+
+    def test_pipelined_matches_serial(self):
+        frames = self.read_frames(25)
+        for modelName, depth in [('ESTMDBackbone', None), ('DSTMD', 2), ('FeedbackSTMD', 3), ('HaarSTMD', None)]:
+            objModel = self.create_model(modelName)
+            refOpts = []
+            for frame in frames:
+                modelOpt, _ = objModel.process(frame)
+                refOpts.append(dict(modelOpt))
+
+            with PipelinedModel(self.create_model(modelName), depth=depth) as objPipeline:
+                pipeOpts = []
+                for idx, frame in enumerate(frames):
+                    modelOpt, _ = objPipeline.process(frame)
+                    # the first outputs are still in the pipeline
+                    self.assertEqual(modelOpt is None, idx < objPipeline.latency)
+                    if modelOpt is not None:
+                        pipeOpts.append(modelOpt)
+                pipeOpts += objPipeline.flush()
+            self.assertEqual(objPipeline.latency, (depth or 4) - 1)
+
+            self.assertEqual(len(pipeOpts), len(refOpts))
+            for pipeOpt, refOpt in zip(pipeOpts, refOpts):
+                np.testing.assert_array_equal(pipeOpt['response'], refOpt['response'], modelName)
+                if modelName == 'DSTMD':
+                    np.testing.assert_array_equal(pipeOpt['direction'], refOpt['direction'])
+            self.assertEqual(objPipeline.get_pipeline_stats()['numFrames'], len(frames))
+
+    def test_unsupported_models(self):
+        # the lobula of FSTMD feeds back to the lamina
+        with self.assertRaises(ValueError):
+            PipelinedModel(self.create_model('FSTMD'))
+        with self.assertRaises(ValueError):
+            PipelinedModel(self.create_model('ESTMDBackbone'), depth=5)
+
+    def test_stage_error(self):
+        objPipeline = PipelinedModel(self.create_model('ESTMDBackbone'), depth=2)
+        frame = self.read_frames(1)[0]
+        objPipeline.process(frame)
+        objPipeline.process(frame[:10])
+        # the frame of another shape fails in the lamina, with the frame before it in its history
+        with self.assertRaises(ValueError):
+            objPipeline.flush()
+        objPipeline.close()
+        self.assertEqual(objPipeline.workers, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
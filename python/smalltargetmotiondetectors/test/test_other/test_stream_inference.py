@@ -0,0 +1,100 @@
+import os
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+filePath = os.path.realpath(__file__)
+pyPackagePath = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(filePath))))
+sys.path.append(pyPackagePath)
+
+from smalltargetmotiondetectors.api import inference_task, stream_inference
+from smalltargetmotiondetectors.api.stream_inference import (DetectionRecord, OnlineEvaluator, RecordFileWriter,
+                                                             read_record_file)
+from smalltargetmotiondetectors.util.evaluate_module import evaluation_model_by_video
+from smalltargetmotiondetectors.util.stimulus import SyntheticFrameReader
+
+
+STIMULUS = {'shape': (96, 128), 'fps': 250, 'numTargets': 2, 'seed': 0}
+
+
+class TestStreamInference(unittest.TestCase):
+    def test_matches_inference_task(self):
+        results, directions, _ = inference_task('DSTMD', STIMULUS, inputType='SyntheticFrameReader',
+                                                startFrame=5, endFrame=40)
+        records = list(stream_inference('DSTMD', STIMULUS, inputType='SyntheticFrameReader',
+                                        startFrame=5, endFrame=40))
+        self.assertEqual([record.frameIdx for record in records], list(range(5, 40)))
+        self.assertEqual([record.response_list() for record in records], results)
+        for record, directionListType in zip(records, directions):
+            # NaN for the unknown directions
+            np.testing.assert_array_equal(record.direction_list(), directionListType)
+        self.assertGreater(sum(len(record) for record in records), 0)
+        # DSTMD has directions, also on the frames without detections
+        self.assertTrue(any(len(record) == 0 for record in records))
+        for record in records:
+            self.assertIsNotNone(record.directions)
+            self.assertIsNotNone(DetectionRecord.from_dict(record.to_dict()).directions)
+
+    def test_sinks(self):
+        objIptStream = SyntheticFrameReader(STIMULUS, 0, 60)
+        groundTruth = objIptStream.get_ground_truth()
+        evaluator = OnlineEvaluator(groundTruth, thresholds=[0.2, 0.8])
+        with tempfile.TemporaryDirectory() as tmpDir:
+            fileName = os.path.join(tmpDir, 'records.jsonl')
+            writer = RecordFileWriter(fileName)
+            records = list(stream_inference('ESTMDBackbone', objIptStream, sinks=[writer, evaluator]))
+            # the sinks are closed at the end of the input
+            self.assertTrue(writer.hFile.closed)
+            readRecords = list(read_record_file(fileName))
+
+        self.assertEqual(len(readRecords), len(records))
+        for readRecord, record in zip(readRecords, records):
+            self.assertEqual(readRecord.frameIdx, record.frameIdx)
+            np.testing.assert_array_equal(readRecord.positions, record.positions)
+            np.testing.assert_array_equal(readRecord.confidences, record.confidences)
+            self.assertIsNone(readRecord.directions)
+
+        metrics = evaluator.get_metrics()
+        self.assertEqual(metrics['numFrames'], len(records))
+        np.testing.assert_array_equal(metrics['threshold'], [0.8, 0.2])
+        for idx, thresholdValue in enumerate(metrics['threshold']):
+            threInput = [[data for data in record.response_list() if data[-1] > thresholdValue]
+                         for record in records]
+            listTP, listFN, listFP = evaluation_model_by_video(threInput, groundTruth,
+                                                               confidenceThreshold=thresholdValue)
+            self.assertAlmostEqual(metrics['recall'][idx], sum(listTP) / (sum(listTP) + sum(listFN)))
+            self.assertAlmostEqual(metrics['FPPI'][idx], sum(listFP) / len(records))
+
+    def test_closing_sinks(self):
+        class Sink:
+            def __init__(self, error=None):
+                self.error = error
+                self.isClosed = False
+
+            def write(self, record, colorImg=None):
+                pass
+
+            def close(self):
+                self.isClosed = True
+                if self.error is not None:
+                    raise self.error
+
+        # a stream closed before its first record
+        sinks = [Sink(), Sink()]
+        records = stream_inference('ESTMDBackbone', SyntheticFrameReader(STIMULUS, 0, 10), sinks=sinks)
+        records.close()
+        self.assertEqual([sink.isClosed for sink in sinks], [True, True])
+        self.assertEqual(list(records), [])
+
+        # a sink failing to close does not keep the next ones open
+        sinks = [Sink(), Sink(OSError('disk full')), Sink()]
+        with self.assertRaises(OSError):
+            with stream_inference('ESTMDBackbone', SyntheticFrameReader(STIMULUS, 0, 10), sinks=sinks) as records:
+                next(records)
+        self.assertEqual([sink.isClosed for sink in sinks], [True, True, True])
+
+
+if __name__ == '__main__':
+    unittest.main()
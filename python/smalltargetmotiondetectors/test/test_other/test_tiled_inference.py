@@ -0,0 +1,116 @@
+import os
+import sys
+import unittest
+
+import numpy as np
+
+filePath = os.path.realpath(__file__)
+pyPackagePath = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(filePath))))
+sys.path.append(pyPackagePath)
+
+from smalltargetmotiondetectors.api import instancing_model
+from smalltargetmotiondetectors.api.tiled_inference import TiledModel, split_frame
+from smalltargetmotiondetectors.util.stimulus import read_synthetic_frames
+
+
+class TestTiledInference(unittest.TestCase):
+    @staticmethod
+    def read_frames(numFrames):
+        # a still cluttered background crossed by small targets
+        return read_synthetic_frames({'shape': (96, 128), 'fps': 250, 'numTargets': 1, 'seed': 0}, numFrames)
+
+    @staticmethod
+    def create_model(modelName):
+        objModel = instancing_model(modelName)
+        objModel.init_config()
+        return objModel
+
+    def test_spatial_radius(self):
+        # retina blur (3 x 3) then lobula surround inhibition (15 x 15)
+        self.assertEqual(self.create_model('ESTMDBackbone').get_spatial_radius(), 1 + 7)
+        # the medulla of HaarSTMD is normalized over the frame, the feedback loop of
+        # FSTMD runs until the whole frame has converged
+        for modelName in ['HaarSTMD', 'FSTMD']:
+            objModel = self.create_model(modelName)
+            self.assertIsNone(objModel.get_spatial_radius(), modelName)
+            with self.assertRaises(ValueError):
+                TiledModel(objModel)
+
+    def test_split_frame(self):
+        tiles, gridShape = split_frame((50, 70), 32, 4)
+        self.assertEqual(gridShape, (2, 3))
+        coverage = np.zeros((50, 70), dtype=int)
+        for tileSlice, cropSlice, innerSlice in tiles:
+            coverage[tileSlice] += 1
+            crop = np.arange(50 * 70).reshape(50, 70)[cropSlice]
+            np.testing.assert_array_equal(crop[innerSlice], np.arange(50 * 70).reshape(50, 70)[tileSlice])
+        np.testing.assert_array_equal(coverage, 1)
+
+    def test_tiled_matches_untiled(self):
+        frames = self.read_frames(30)
+        for modelName in ['ESTMDBackbone', 'DSTMD']:
+            objModel = self.create_model(modelName)
+            objTiledModel = TiledModel(self.create_model(modelName), tileSize=40)
+            maxError, scale = 0, 0
+            for frame in frames:
+                refOpt, _ = objModel.process(frame)
+                tiledOpt, _ = objTiledModel.process(frame)
+                maxError = max(maxError, np.max(np.abs(tiledOpt['response'] - refOpt['response'])))
+                scale = max(scale, np.max(refOpt['response']))
+            self.assertGreater(scale, 0)
+            self.assertLess(maxError, 1e-9 * scale, modelName)
+            if modelName == 'DSTMD':
+                np.testing.assert_allclose(tiledOpt['direction'], refOpt['direction'], atol=1e-9)
+            self.assertEqual(objTiledModel.get_tile_stats()['meanActiveRatio'], 1)
+
+    def test_threads_match_serial(self):
+        frames = self.read_frames(20)
+        for gateThreshold in [None, 0]:
+            objSerial = TiledModel(self.create_model('DSTMD'), tileSize=32, gateThreshold=gateThreshold, restFrames=5)
+            with TiledModel(self.create_model('DSTMD'), tileSize=32, gateThreshold=gateThreshold, restFrames=5,
+                            numThreads=4) as objThreaded:
+                for frame in frames:
+                    serialOpt, _ = objSerial.process(frame)
+                    threadedOpt, _ = objThreaded.process(frame)
+                    np.testing.assert_array_equal(threadedOpt['response'], serialOpt['response'])
+                    np.testing.assert_array_equal(threadedOpt['direction'], serialOpt['direction'])
+                self.assertEqual(objThreaded.get_tile_stats()['activeRatio'], objSerial.get_tile_stats()['activeRatio'])
+            self.assertIsNone(objThreaded.executor)
+
+    def test_motion_gating(self):
+        frames = self.read_frames(120)
+        objModel = self.create_model('ESTMDBackbone')
+        objTiledModel = TiledModel(self.create_model('ESTMDBackbone'), tileSize=32, gateThreshold=0)
+        maxError, scale = 0, 0
+        for frame in frames:
+            refOpt, _ = objModel.process(frame)
+            tiledOpt, _ = objTiledModel.process(frame)
+            maxError = max(maxError, np.max(np.abs(tiledOpt['response'] - refOpt['response'])))
+            scale = max(scale, np.max(refOpt['response']))
+        # the background is still, the held tiles are at rest
+        self.assertLess(maxError, 1e-9 * scale)
+
+        stat = objTiledModel.get_tile_stats()
+        self.assertEqual(stat['numFrames'], len(frames))
+        self.assertEqual(stat['restFrames'], objModel.get_temporal_receptive_field()['warmUp'] + 1)
+        # all tiles run until they have been still for restFrames frames
+        self.assertTrue(all(ratio == 1 for ratio in stat['activeRatio'][:stat['restFrames']]))
+        self.assertLess(max(stat['activeRatio'][-10:]), 1)
+        self.assertTrue(np.all(stat['tileActivity'] > 0) and np.any(stat['tileActivity'] < 1))
+        self.assertEqual(stat['errorBound'], {'input': 0, 'state': 0.})
+
+    def test_gating_needs_state_bound(self):
+        # the feedback of FeedbackSTMD has no known decay
+        objModel = self.create_model('FeedbackSTMD')
+        self.assertIsNone(objModel.get_temporal_receptive_field()['errorBound'])
+        with self.assertRaises(ValueError):
+            TiledModel(objModel, gateThreshold=0)
+        TiledModel(objModel)
+
+        # a rest period shorter than the receptive field gives no state bound
+        objTiledModel = TiledModel(self.create_model('ESTMDBackbone'), tileSize=32, gateThreshold=0, restFrames=5)
+        self.assertIsNone(objTiledModel.get_tile_stats()['errorBound']['state'])
+
+
+if __name__ == '__main__':
+    unittest.main()
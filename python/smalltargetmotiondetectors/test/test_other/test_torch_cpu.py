@@ -0,0 +1,116 @@
+import os
+import sys
+import unittest
+import warnings
+
+import numpy as np
+
+filePath = os.path.realpath(__file__)
+pyPackagePath = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(filePath))))
+sys.path.append(pyPackagePath)
+
+from smalltargetmotiondetectors.api import instancing_model
+from smalltargetmotiondetectors.core.base_core import parse_device
+from smalltargetmotiondetectors.core.math_operator import GammaDelay
+from smalltargetmotiondetectors.util.compute_module import (slice_matrix_holding_size, sum_shifted_tensors,
+                                                            correlate_shifted_tensors)
+from smalltargetmotiondetectors.util.stimulus import read_synthetic_frames
+
+try:
+    import torch
+except ImportError:
+    torch = None
+
+
+class TestParseDevice(unittest.TestCase):
+    def test_parse_device(self):
+        self.assertEqual(parse_device('cpu'), ('numpy', 'cpu'))
+        self.assertEqual(parse_device('torch-cpu'), ('torch', 'cpu'))
+        self.assertEqual(parse_device('cuda:1'), ('torch', 'cuda:1'))
+        with self.assertRaises(ValueError):
+            parse_device('gpu')
+
+    def test_gamma_delay_device(self):
+        hGammaDelay = GammaDelay(3, 15, device='torch-cpu')
+        self.assertEqual((hGammaDelay.backend, hGammaDelay.device), ('torch', 'cpu'))
+        self.assertEqual(GammaDelay(3, 15).backend, 'numpy')
+
+
+@unittest.skipIf(torch is None, 'torch is not installed')
+class TestTorchCpu(unittest.TestCase):
+    def setUp(self):
+        # small targets, so that the directional models respond
+        self.frames = self.read_frames(seed=0)
+
+    @staticmethod
+    def read_frames(seed):
+        return read_synthetic_frames({'shape': (90, 120), 'fps': 250, 'numTargets': 2, 'seed': seed}, 36)
+
+    def run_pair(self, modelName):
+        objRef = instancing_model(modelName)
+        objTest = instancing_model(modelName, device='torch-cpu')
+        objRef.init_config()
+        objTest.init_config()
+        for frame in self.frames:
+            refOpt, _ = objRef.process(frame)
+            if objTest.backend == 'torch':
+                frame = torch.from_numpy(frame).float().unsqueeze(0).unsqueeze(0)
+            testOpt, _ = objTest.process(frame)
+        testResponse = testOpt['response']
+        if objTest.backend == 'torch':
+            testResponse = testResponse.squeeze(0).squeeze(0).numpy()
+        return refOpt['response'], testResponse, objTest
+
+    def test_torch_cpu_matches_numpy(self):
+        for modelName in ['ESTMD', 'DSTMD', 'FeedbackSTMD', 'HaarSTMD', 'STMDPlus', 'ApgSTMD', 'STFeedbackSTMD']:
+            refResponse, testResponse, objTest = self.run_pair(modelName)
+            self.assertEqual((objTest.backend, objTest.device), ('torch', 'cpu'), modelName)
+            scale = np.max(np.abs(refResponse))
+            self.assertGreater(scale, 0, modelName)
+            self.assertLess(np.max(np.abs(refResponse - testResponse)) / scale, 1e-4, modelName)
+
+    def test_batch_matches_single(self):
+        objBatch = instancing_model('HaarSTMD', device='torch-cpu')
+        objSingles = [instancing_model('HaarSTMD', device='torch-cpu') for _ in range(2)]
+        for objModel in [objBatch] + objSingles:
+            objModel.init_config()
+        for frame, otherFrame in zip(self.frames, self.read_frames(seed=1)):
+            batch = torch.from_numpy(np.stack([frame, otherFrame])).float().unsqueeze(1)
+            batchOpt, _ = objBatch.process(batch)
+            singleOpts = [objModel.process(batch[i:i+1])[0] for i, objModel in enumerate(objSingles)]
+        for i, singleOpt in enumerate(singleOpts):
+            torch.testing.assert_close(batchOpt['response'][i:i+1], singleOpt['response'])
+
+    def test_tracking_needs_single_batch(self):
+        # the tracks of the mushroom body belong to one stream
+        batch = torch.from_numpy(np.stack(self.frames[:2])).float().unsqueeze(1)
+        for modelName in ['STMDPlus', 'ApgSTMD']:
+            objModel = instancing_model(modelName, device='torch-cpu')
+            objModel.init_config()
+            with self.assertRaises(ValueError, msg=modelName):
+                objModel.process(batch)
+
+    def test_shifted_tensors(self):
+        rng = np.random.default_rng(0)
+        ipt, ref = rng.random((7, 9)), rng.random((7, 9))
+        # zero and out of range shifts give zero copies
+        shiftX, shiftY = [3, -2, 0, 5, -8, 9, 1], [2, -3, 4, 0, 6, -6, -7]
+        weights = rng.random(len(shiftX))
+        iptTensor, refTensor = torch.from_numpy(ipt)[None, None], torch.from_numpy(ref)[None, None]
+        shifted = [slice_matrix_holding_size(ipt, x, y) for x, y in zip(shiftX, shiftY)]
+        np.testing.assert_allclose(sum_shifted_tensors(iptTensor, shiftX, shiftY, weights)[0, 0].numpy(),
+                                   sum(weight * item for weight, item in zip(weights, shifted)))
+        np.testing.assert_allclose(correlate_shifted_tensors(refTensor, iptTensor, shiftX, shiftY)[0, 0].numpy(),
+                                   [np.sum(ref * item) for item in shifted])
+
+    def test_numpy_only_model_falls_back(self):
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            refResponse, testResponse, objTest = self.run_pair('FSTMD')
+        self.assertTrue(any(issubclass(w.category, UserWarning) for w in caught))
+        self.assertEqual(objTest.backend, 'numpy')
+        np.testing.assert_array_equal(refResponse, testResponse)
+
+
+if __name__ == '__main__':
+    unittest.main()
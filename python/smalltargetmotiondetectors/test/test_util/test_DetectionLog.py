@@ -0,0 +1,127 @@
+import os
+import sys
+import json
+import tempfile
+import unittest
+
+import numpy as np
+
+filePath = os.path.realpath(__file__)
+pyPackagePath = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(filePath))))
+sys.path.append(pyPackagePath)
+
+from smalltargetmotiondetectors.api import inference_task, stream_inference
+from smalltargetmotiondetectors.util import evaluate_module
+from smalltargetmotiondetectors.util.detection_log import (DetectionLog, DetectionLogWriter,
+                                                           convert_json_to_detection_log,
+                                                           DETECTIONS_FILE, DETECTION_DTYPE)
+
+
+STIMULUS = {'shape': (96, 128), 'fps': 250, 'numTargets': 3, 'seed': 1}
+NUM_FRAMES = 80
+
+
+class TestDetectionLog(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.results, cls.directions, _ = inference_task('DSTMD', STIMULUS, inputType='SyntheticFrameReader',
+                                                        endFrame=NUM_FRAMES)
+        # ground truth near some detections, so that every case of the matching occurs: TP, FP, FN,
+        # frames without ground truth, and predictions matching two ground truth items
+        rng = np.random.default_rng(0)
+        cls.groundTruth = []
+        for idx, responseListType in enumerate(cls.results):
+            gT = [[x + 1, y] for x, y, _ in responseListType[:2]] + [[x, y + 1] for x, y, _ in responseListType[:1]]
+            gT.append([int(rng.integers(0, 128)), int(rng.integers(0, 96))])
+            cls.groundTruth.append([] if idx % 7 == 0 else gT)
+        cls.groundTruthBox = [[[x - 2, y - 1, 3, 2] for x, y in gT] for gT in cls.groundTruth]
+
+    def setUp(self):
+        self.tmpDir = tempfile.TemporaryDirectory()
+        self.logName = os.path.join(self.tmpDir.name, 'detections.stmdlog')
+
+    def tearDown(self):
+        self.tmpDir.cleanup()
+
+    def write_log(self, frames, mode='w', chunkSize=7):
+        with DetectionLogWriter(self.logName, mode=mode, chunkSize=chunkSize, modelName='DSTMD') as writer:
+            for idx in frames:
+                writer.append(idx, self.results[idx], self.directions[idx])
+
+    def check_lists(self, detectionLog, numFrames):
+        self.assertEqual(len(detectionLog), numFrames)
+        results, directions = detectionLog.to_lists()
+        self.assertEqual(results, self.results[:numFrames])
+        for directionListType, refDirectionListType in zip(directions, self.directions):
+            np.testing.assert_array_equal(directionListType, refDirectionListType)
+
+    def test_round_trip_and_append(self):
+        self.write_log(range(50))
+        self.write_log(range(50, NUM_FRAMES), mode='a')
+        detectionLog = DetectionLog(self.logName)
+        self.check_lists(detectionLog, NUM_FRAMES)
+        np.testing.assert_array_equal(detectionLog.frameIdx, np.arange(NUM_FRAMES))
+        self.assertTrue(detectionLog.hasDirection)
+        self.assertEqual(detectionLog.metadata, {'modelName': 'DSTMD'})
+        self.assertIsInstance(detectionLog.detections, np.memmap)
+        self.assertEqual(detectionLog[3], self.results[3])
+
+    def test_torn_tail(self):
+        self.write_log(range(NUM_FRAMES))
+        numDetections = sum(len(item) for item in self.results[:40])
+        # a crash in the middle of the detections of the 41st frame
+        with open(os.path.join(self.logName, DETECTIONS_FILE), 'r+b') as f:
+            f.truncate(numDetections * DETECTION_DTYPE.itemsize + 5)
+        self.check_lists(DetectionLog(self.logName), 40)
+
+        # appending drops the torn frames first
+        self.write_log(range(40, NUM_FRAMES), mode='a')
+        self.check_lists(DetectionLog(self.logName), NUM_FRAMES)
+
+    def test_evaluation(self):
+        self.write_log(range(NUM_FRAMES))
+        detectionLog = DetectionLog(self.logName)
+        for groundTruth in [self.groundTruth, self.groundTruthBox]:
+            for startFrame, endFrame in [(0, None), (10, 60)]:
+                with self.subTest(gTSize=len(groundTruth[1][0]), startFrame=startFrame):
+                    for evaluate in [evaluate_module.get_ROC_curve_data, evaluate_module.get_P_R_curve_data,
+                                     evaluate_module.get_thres_recall_data]:
+                        self.assertEqual(evaluate(detectionLog, groundTruth, startFrame=startFrame, endFrame=endFrame),
+                                         evaluate(self.results, groundTruth, startFrame=startFrame, endFrame=endFrame))
+            for endFrame in [60, None]:
+                self.assertEqual(evaluate_module.get_RFI_by_fixFPPI(detectionLog, groundTruth, endFrame=endFrame),
+                                 evaluate_module.get_RFI_by_fixFPPI(self.results, groundTruth, endFrame=endFrame))
+        # not a degenerate curve
+        self.assertGreater(max(evaluate_module.get_P_R_curve_data(detectionLog, self.groundTruth)[0]), 0.3)
+
+    def test_evaluation_with_missing_frames(self):
+        # frames dropped from the log, the first one included, keep their ground truth
+        frames = [idx for idx in range(NUM_FRAMES) if idx % 5 != 0]
+        with DetectionLogWriter(self.logName, chunkSize=7, startFrame=0) as writer:
+            for idx in frames:
+                writer.append(idx, self.results[idx], self.directions[idx])
+        detectionLog = DetectionLog(self.logName)
+        results = [self.results[idx] for idx in frames]
+        for groundTruth in [self.groundTruth, self.groundTruthBox]:
+            keptGroundTruth = [groundTruth[idx] for idx in frames]
+            for evaluate in [evaluate_module.get_ROC_curve_data, evaluate_module.get_P_R_curve_data,
+                             evaluate_module.get_RFI_by_fixFPPI]:
+                self.assertEqual(evaluate(detectionLog, groundTruth), evaluate(results, keptGroundTruth))
+
+    def test_stream_inference_sink(self):
+        writer = DetectionLogWriter(self.logName, chunkSize=16)
+        list(stream_inference('DSTMD', STIMULUS, inputType='SyntheticFrameReader', endFrame=NUM_FRAMES,
+                              sinks=[writer]))
+        self.check_lists(DetectionLog(self.logName), NUM_FRAMES)
+
+    def test_convert_json(self):
+        jsonName = os.path.join(self.tmpDir.name, 'output.json')
+        with open(jsonName, 'w') as f:
+            json.dump({'data_1': self.results, 'data_2': self.directions}, f, indent=4)
+        detectionLog = convert_json_to_detection_log(jsonName, self.logName, startFrame=5)
+        self.check_lists(detectionLog, NUM_FRAMES)
+        np.testing.assert_array_equal(detectionLog.frameIdx, np.arange(5, NUM_FRAMES + 5))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+import os
+import sys
+import unittest
+
+import numpy as np
+
+filePath = os.path.realpath(__file__)
+pyPackagePath = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(filePath))))
+sys.path.append(pyPackagePath)
+
+from smalltargetmotiondetectors.util.fixed_point import FixedPointAccelerator
+
+
+class TestFixedPointAccelerator(unittest.TestCase):
+    @staticmethod
+    def solve(method, threshold=1e-10, maxIterationNum=200):
+        # x = cos(x), one independent fixed point per element
+        hAccelerator = FixedPointAccelerator(method)
+        ipt = np.linspace(-1, 2, 16)
+        for iterationCount in range(1, maxIterationNum + 1):
+            opt = np.cos(ipt)
+            if np.max(np.abs(opt - ipt)) <= threshold:
+                break
+            ipt = hAccelerator.update(ipt, opt)
+        return opt, iterationCount
+
+    def test_acceleration(self):
+        plainOpt, plainCount = self.solve(None)
+        for method in ['aitken', 'anderson']:
+            opt, iterationCount = self.solve(method)
+            np.testing.assert_allclose(opt, plainOpt, atol=1e-9)
+            self.assertLess(iterationCount, plainCount / 3, method)
+
+    def test_invalid_method(self):
+        with self.assertRaises(ValueError):
+            FixedPointAccelerator('newton')
+        with self.assertRaises(ValueError):
+            FixedPointAccelerator('anderson', depth=0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import os
+import sys
+import tempfile
+import unittest
+
+import cv2
+import numpy as np
+
+filePath = os.path.realpath(__file__)
+pyPackagePath = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(filePath))))
+sys.path.append(pyPackagePath)
+
+from smalltargetmotiondetectors.util.iostream import ImgstreamReader, VidstreamReader
+from smalltargetmotiondetectors.util.frame_cache import (build_frame_cache, find_frame_cache,
+                                                         CachedFrameReader)
+
+
+class TestFrameCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpDir = tempfile.TemporaryDirectory()
+        rng = np.random.default_rng(0)
+        self.imgs = [rng.integers(0, 256, (24, 32, 3), dtype=np.uint8) for _ in range(20)]
+        for idx, img in enumerate(self.imgs, start=1):
+            cv2.imwrite(os.path.join(self.tmpDir.name, f'Frame{idx:04d}.png'), img)
+        self.imgsteamFormat = os.path.join(self.tmpDir.name, 'Frame*.png')
+
+        self.vidName = os.path.join(self.tmpDir.name, 'video.avi')
+        hWriter = cv2.VideoWriter(self.vidName, cv2.VideoWriter_fourcc(*'MJPG'), 25, (32, 24))
+        for img in self.imgs:
+            hWriter.write(img)
+        hWriter.release()
+
+    def tearDown(self):
+        self.tmpDir.cleanup()
+
+    def assert_same_stream(self, objRef, objCache):
+        numFrames = 0
+        while objRef.hasFrame:
+            self.assertTrue(objCache.hasFrame)
+            grayRef, _ = objRef.get_next_frame()
+            grayCache, _ = objCache.get_next_frame()
+            np.testing.assert_array_equal(grayRef, grayCache)
+            numFrames += 1
+        self.assertFalse(objCache.hasFrame)
+        self.assertGreater(numFrames, 0)
+
+    def test_imgstream_cache(self):
+        cacheName = build_frame_cache(self.imgsteamFormat)
+        self.assertEqual(find_frame_cache(self.imgsteamFormat), cacheName)
+        self.assert_same_stream(ImgstreamReader(self.imgsteamFormat, 3, 15),
+                                CachedFrameReader(cacheName, 3, 15))
+
+    def test_video_cache(self):
+        cacheName = build_frame_cache(self.vidName)
+        objCache = CachedFrameReader(cacheName, 5, None, dtype=np.uint8)
+        self.assertEqual(objCache.fps, 25)
+        self.assert_same_stream(VidstreamReader(self.vidName, 5, None, dtype=np.uint8), objCache)
+
+    def test_zero_copy_views(self):
+        objCache = CachedFrameReader(build_frame_cache(self.imgsteamFormat), dtype=np.uint8)
+        grayImg, colorImg = objCache.get_next_frame()
+        self.assertTrue(np.shares_memory(grayImg, objCache.frames))
+        self.assertTrue(np.shares_memory(colorImg, objCache.frames))
+
+    def test_stale_cache_is_ignored(self):
+        build_frame_cache(self.imgsteamFormat)
+        cv2.imwrite(os.path.join(self.tmpDir.name, 'Frame0021.png'), self.imgs[0])
+        self.assertIsNone(find_frame_cache(self.imgsteamFormat))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import os
+import sys
+import tempfile
+import unittest
+
+import cv2
+import numpy as np
+
+filePath = os.path.realpath(__file__)
+pyPackagePath = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(filePath))))
+sys.path.append(pyPackagePath)
+
+from smalltargetmotiondetectors.util.iostream import VidstreamReader
+from smalltargetmotiondetectors.util.frame_cache import (KeyframeIndex, load_keyframe_index,
+                                                         get_frame_cache_path, KEYFRAME_INDEX_SUFFIX)
+
+
+class TestKeyframeIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmpDir = tempfile.TemporaryDirectory()
+        self.vidName = os.path.join(self.tmpDir.name, 'video.mp4')
+        hWriter = cv2.VideoWriter(self.vidName, cv2.VideoWriter_fourcc(*'mp4v'), 30, (64, 48))
+        rng = np.random.default_rng(0)
+        for idx in range(60):
+            img = np.full((48, 64, 3), 40, dtype=np.uint8)
+            img[10:20, idx:idx + 5] = rng.integers(150, 256)
+            hWriter.write(img)
+        hWriter.release()
+
+        objReader = VidstreamReader(self.vidName, 0, None, dtype=np.uint8, useKeyframeIndex=False)
+        self.frames = []
+        while objReader.hasFrame:
+            self.frames.append(objReader.get_next_frame()[0])
+
+    def tearDown(self):
+        self.tmpDir.cleanup()
+
+    def read_frames(self, startFrame, numFrames):
+        objReader = VidstreamReader(self.vidName, startFrame, startFrame + numFrames, dtype=np.uint8)
+        frames = []
+        while objReader.hasFrame:
+            frames.append(objReader.get_next_frame()[0])
+        return objReader, frames
+
+    def test_index_is_persisted(self):
+        keyframeIndex = load_keyframe_index(self.vidName)
+        self.assertEqual(keyframeIndex.numFrames, len(self.frames))
+        self.assertEqual(keyframeIndex.keyFrames[0], 0)
+        fileName = get_frame_cache_path(self.vidName, suffix=KEYFRAME_INDEX_SUFFIX) + '.json'
+        self.assertTrue(os.path.isfile(fileName))
+        self.assertEqual(KeyframeIndex.load(fileName).keyFrames, keyframeIndex.keyFrames)
+        self.assertEqual(keyframeIndex.get_preceding_keyframe(len(self.frames) - 1),
+                         keyframeIndex.keyFrames[-1])
+        # a decoded timestamp the backend could not give is no proof of the seek
+        self.assertTrue(keyframeIndex.check_pts(3, keyframeIndex.pts[3]))
+        self.assertFalse(keyframeIndex.check_pts(3, -1.))
+        self.assertFalse(keyframeIndex.check_pts(3, keyframeIndex.pts[4]))
+
+    def test_exact_start_frame(self):
+        for startFrame in [1, 13, 31, 57]:
+            objReader, frames = self.read_frames(startFrame, 3)
+            self.assertIsNotNone(objReader.keyframeIndex)
+            for frame, refFrame in zip(frames, self.frames[startFrame:]):
+                np.testing.assert_array_equal(frame, refFrame)
+
+    def test_inaccurate_seek_falls_back(self):
+        # an index whose timestamps never match forces the decode from the first frame
+        keyframeIndex = load_keyframe_index(self.vidName)
+        keyframeIndex.pts = [-2.] * keyframeIndex.numFrames
+        keyframeIndex.save(get_frame_cache_path(self.vidName, suffix=KEYFRAME_INDEX_SUFFIX) + '.json')
+        with self.assertLogs(level='WARNING'):
+            _, frames = self.read_frames(40, 2)
+        np.testing.assert_array_equal(frames[0], self.frames[40])
+        np.testing.assert_array_equal(frames[1], self.frames[41])
+
+
+if __name__ == '__main__':
+    unittest.main()
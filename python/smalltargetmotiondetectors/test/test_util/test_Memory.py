@@ -0,0 +1,81 @@
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+filePath = os.path.realpath(__file__)
+pyPackagePath = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(filePath))))
+sys.path.append(pyPackagePath)
+
+from smalltargetmotiondetectors.api import instancing_model
+from smalltargetmotiondetectors.util.memory import MemoryTracker, run_memory_probe, share_kernels
+
+
+class TestMemory(unittest.TestCase):
+    def test_memory_report(self):
+        objModel = instancing_model('ESTMD')
+        objModel.init_config()
+        for frame in np.random.default_rng(0).random((5, 32, 48)):
+            objModel.process(frame)
+
+        report = objModel.get_memory_report()
+        buffer = report['layers']['hMedulla.hTm1.hGammaDelay']['buffers']['listInput']
+        self.assertEqual(buffer['filled'], 5)
+        self.assertEqual(buffer['bytes'], 5 * 32 * 48 * 8)
+        self.assertEqual(report['total'], sum(layer['total'] for layer in report['layers'].values()))
+
+    def test_plan_memory(self):
+        for modelName in ['DSTMD', 'FracSTMD']:
+            objModel = instancing_model(modelName)
+            objModel.init_config()
+            plan = objModel.plan_memory((90, 120), numStreams=2)
+            self.assertEqual(plan['total'], 2 * plan['peak'])
+
+            report, _ = run_memory_probe(objModel, (90, 120), 150)
+            self.assertAlmostEqual(plan['held'] / report['total'], 1, delta=0.01)
+
+    def test_memory_tracker(self):
+        objModel = instancing_model('HaarSTMD')
+        objModel.init_config()
+        with MemoryTracker(objModel) as hTracker:
+            for frame in np.random.default_rng(0).random((3, 48, 64)):
+                objModel.process(frame)
+        self.assertNotIn('process', vars(objModel))
+
+        summary = hTracker.summary()
+        self.assertEqual(summary['numFrames'], 3)
+        self.assertGreater(summary['held'], 0)
+        self.assertGreaterEqual(summary['peak'], summary['current'])
+
+        with tempfile.TemporaryDirectory() as tmpDir:
+            jsonName = os.path.join(tmpDir, 'memory.json')
+            hTracker.to_json(jsonName)
+            with open(jsonName) as hFile:
+                self.assertEqual(len(json.load(hFile)['frames']), 3)
+
+    def test_share_kernels(self):
+        objModel, objReference = instancing_model('DSTMD'), instancing_model('DSTMD')
+        objModel.init_config()
+        objReference.init_config()
+        self.assertGreater(share_kernels(objModel, objReference), 0)
+        kernel = objModel.hRetina.hGaussianBlur.gaussKernel
+        self.assertIs(kernel, objReference.hRetina.hGaussianBlur.gaussKernel)
+        self.assertFalse(kernel.flags.writeable)
+
+        # tensors cannot be made read-only, the models keep their own
+        objModel, objReference = instancing_model('DSTMD', 'torch-cpu'), instancing_model('DSTMD', 'torch-cpu')
+        objModel.init_config()
+        objReference.init_config()
+        share_kernels(objModel, objReference)
+        refCores = dict(objReference.named_cores())
+        for name, core in objModel.named_cores():
+            for attrName, value in vars(core).items():
+                if type(value).__module__ == 'torch':
+                    self.assertIsNot(value, vars(refCores[name])[attrName])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import os
+import sys
+import tempfile
+import unittest
+
+import cv2
+import numpy as np
+
+filePath = os.path.realpath(__file__)
+pyPackagePath = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(filePath))))
+sys.path.append(pyPackagePath)
+
+from smalltargetmotiondetectors.util.iostream import ImgstreamReader, ParallelImgstreamReader
+
+
+class TestParallelImgstreamReader(unittest.TestCase):
+    def setUp(self):
+        self.tmpDir = tempfile.TemporaryDirectory()
+        rng = np.random.default_rng(0)
+        for idx in range(1, 31):
+            img = rng.integers(0, 256, (24, 32, 3), dtype=np.uint8)
+            cv2.imwrite(os.path.join(self.tmpDir.name, f'Frame{idx:04d}.png'), img)
+        self.imgsteamFormat = os.path.join(self.tmpDir.name, 'Frame*.png')
+
+    def tearDown(self):
+        self.tmpDir.cleanup()
+
+    def test_same_frames_in_same_order(self):
+        objRef = ImgstreamReader(self.imgsteamFormat, 1, 30)
+        objPar = ParallelImgstreamReader(self.imgsteamFormat, 1, 30, numWorkers=3, maxInFlight=4)
+        numFrame = 0
+        while objRef.hasFrame:
+            self.assertTrue(objPar.hasFrame)
+            grayRef, colorRef = objRef.get_next_frame()
+            grayPar, colorPar = objPar.get_next_frame()
+            self.assertEqual(objRef.frameIdx, objPar.frameIdx)
+            self.assertTrue(np.array_equal(grayRef, grayPar))
+            self.assertTrue(np.array_equal(colorRef, colorPar))
+            numFrame += 1
+        self.assertFalse(objPar.hasFrame)
+        self.assertGreater(numFrame, 0)
+
+    def test_window_is_bounded(self):
+        objPar = ParallelImgstreamReader(self.imgsteamFormat, 1, 30, numWorkers=2, maxInFlight=3)
+        while objPar.hasFrame:
+            self.assertLessEqual(len(objPar.pendingFrames), 3)
+            objPar.get_next_frame()
+        self.assertEqual(len(objPar.pendingFrames), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
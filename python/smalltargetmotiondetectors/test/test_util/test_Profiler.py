@@ -0,0 +1,91 @@
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+filePath = os.path.realpath(__file__)
+pyPackagePath = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(filePath))))
+sys.path.append(pyPackagePath)
+
+from smalltargetmotiondetectors.api import instancing_model
+from smalltargetmotiondetectors.util.memory import MemoryTracker
+from smalltargetmotiondetectors.util.profiler import LayerProfiler
+
+
+class TestLayerProfiler(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.frames = [rng.random((48, 64)) for _ in range(5)]
+        self.tmpDir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpDir.cleanup()
+
+    def test_layer_timing(self):
+        objModel = instancing_model('ESTMD')
+        objModel.init_config()
+        hProfiler = objModel.enable_profiler()
+        for frame in self.frames:
+            objModel.process(frame)
+        self.assertIs(objModel.disable_profiler(), hProfiler)
+
+        summary = hProfiler.summary()
+        self.assertEqual(hProfiler.frameIdx, len(self.frames))
+        self.assertEqual(summary['model']['count'], len(self.frames))
+        for name in ['hRetina', 'hLamina', 'hMedulla', 'hLobula',
+                     'hMedulla.hTm1.hGammaDelay', 'hMedulla.hTm2.hSubInhi']:
+            self.assertIn(name, summary)
+        # a layer includes its sub-cores, the self time excludes them
+        self.assertLessEqual(summary['hLamina.hGammaBandPassFilter']['total'], summary['hLamina']['total'])
+        self.assertLessEqual(summary['hLamina']['self'], summary['hLamina']['total'])
+        self.assertEqual(sum(summary['hRetina']['histogram']['counts']), len(self.frames))
+
+        jsonName = os.path.join(self.tmpDir.name, 'profile.json')
+        hProfiler.to_json(jsonName)
+        with open(jsonName) as hFile:
+            self.assertEqual(json.load(hFile)['numFrames'], len(self.frames))
+
+        traceName = os.path.join(self.tmpDir.name, 'trace.json')
+        hProfiler.to_chrome_trace(traceName)
+        with open(traceName) as hFile:
+            events = json.load(hFile)['traceEvents']
+        self.assertEqual(sum(event['name'] == 'model' for event in events), len(self.frames))
+        self.assertTrue(all(event['ph'] == 'X' for event in events))
+
+    def test_detach(self):
+        objModel = instancing_model('FracSTMD')
+        objModel.init_config()
+        with LayerProfiler(objModel, subOperators=False) as hProfiler:
+            objModel.process(self.frames[0])
+        summary = hProfiler.summary()
+        self.assertIn('hRetina.hGaussianBlur', summary)
+        self.assertNotIn('hMedulla.hTm1.hGammaDelay', summary)
+        self.assertNotIn('hLobula.hSubInhi', summary)
+
+        # nothing is wrapped anymore
+        for _, core in objModel.named_cores():
+            self.assertNotIn('process', vars(core))
+        self.assertNotIn('process', vars(objModel))
+        objModel.process(self.frames[1])
+        self.assertEqual(hProfiler.frameIdx, 1)
+
+    def test_no_stacking_with_memory_tracker(self):
+        # both wrap the process method of the model, in either order
+        objModel = instancing_model('ESTMD')
+        objModel.init_config()
+        with MemoryTracker(objModel, withReport=False):
+            with self.assertRaises(ValueError):
+                objModel.enable_profiler()
+            self.assertIsNone(objModel.profiler)
+        objModel.enable_profiler()
+        with self.assertRaises(ValueError):
+            MemoryTracker(objModel)
+        objModel.disable_profiler()
+        self.assertNotIn('process', vars(objModel))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import os
+import sys
+import unittest
+import multiprocessing
+
+import numpy as np
+
+filePath = os.path.realpath(__file__)
+pyPackagePath = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(filePath))))
+sys.path.append(pyPackagePath)
+
+from smalltargetmotiondetectors.util.shared_frames import FrameRing, SharedFramePool
+
+
+SHAPE = (24, 32)
+NUM_FRAMES = 12
+
+
+def make_frame(idx):
+    return (np.arange(np.prod(SHAPE)).reshape(SHAPE) + idx) % 256
+
+
+def produce(framePool, slotQueue):
+    # more frames than slots, the producer waits for the slots released by the consumer
+    for idx in range(NUM_FRAMES):
+        slot = framePool.acquire(timeout=10)
+        views = framePool.get_slot(slot)
+        views['gray'][...] = make_frame(idx)
+        views['response'][...] = idx / 10
+        slotQueue.put((idx, slot))
+    slotQueue.put(None)
+    framePool.close()
+
+
+class TestFrameRing(unittest.TestCase):
+    def test_attach_by_name(self):
+        ring = FrameRing(SHAPE, np.uint8, numSlots=2)
+        try:
+            info = ring.describe()
+            attached = FrameRing(info['shape'], info['dtype'], info['numSlots'], name=info['shm'])
+            ring.frames[1] = make_frame(1)
+            np.testing.assert_array_equal(attached.frames[1], make_frame(1))
+            attached.close()
+            # only the creator removes the ring
+            np.testing.assert_array_equal(ring.frames[1], make_frame(1))
+            with self.assertRaises(ValueError):
+                FrameRing(SHAPE, np.float64, numSlots=2, name=info['shm'])
+        finally:
+            ring.close()
+        with self.assertRaises(FileNotFoundError):
+            FrameRing(SHAPE, np.uint8, numSlots=2, name=info['shm'])
+
+
+class TestSharedFramePool(unittest.TestCase):
+    def test_slots_shared_with_a_process(self):
+        # spawn pickles the pool into the process, fork hands it over as is
+        for startMethod in ['spawn', 'fork']:
+            with self.subTest(startMethod=startMethod):
+                self.check_slots_shared_with_a_process(multiprocessing.get_context(startMethod))
+
+    def check_slots_shared_with_a_process(self, context):
+        framePool = SharedFramePool({'gray': (SHAPE, np.uint8), 'response': (SHAPE, np.float64)},
+                                    numSlots=3, context=context)
+        slotQueue = context.Queue()
+        hProcess = context.Process(target=produce, args=(framePool, slotQueue))
+        hProcess.start()
+        try:
+            received = []
+            while (item := slotQueue.get(timeout=30)) is not None:
+                idx, slot = item
+                views = framePool.get_slot(slot)
+                np.testing.assert_array_equal(views['gray'], make_frame(idx))
+                np.testing.assert_array_equal(views['response'], np.full(SHAPE, idx / 10))
+                received.append(idx)
+                framePool.release(slot)
+            hProcess.join(timeout=10)
+        finally:
+            if hProcess.is_alive():
+                hProcess.terminate()
+            framePool.close()
+        self.assertEqual(hProcess.exitcode, 0)
+        self.assertEqual(received, list(range(NUM_FRAMES)))
+
+    def test_fields(self):
+        framePool = SharedFramePool({'gray': (SHAPE, np.uint8), 'color': (SHAPE + (3,), np.uint8)}, numSlots=2)
+        try:
+            self.assertEqual(framePool.fields, {'gray': (SHAPE, np.dtype(np.uint8)),
+                                                'color': (SHAPE + (3,), np.dtype(np.uint8))})
+            slots = {framePool.acquire(timeout=1), framePool.acquire(timeout=1)}
+            self.assertEqual(slots, {0, 1})
+            self.assertEqual(framePool.get_slot(1)['color'].shape, SHAPE + (3,))
+        finally:
+            framePool.close()
+        with self.assertRaises(ValueError):
+            SharedFramePool({'gray': (SHAPE, np.uint8)}, numSlots=0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import os
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+filePath = os.path.realpath(__file__)
+pyPackagePath = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(filePath))))
+sys.path.append(pyPackagePath)
+
+from smalltargetmotiondetectors.util.stimulus import SyntheticFrameReader, read_synthetic_frames
+from smalltargetmotiondetectors.api import inference_task, evaluate_task
+
+
+class TestSyntheticFrameReader(unittest.TestCase):
+    def test_targets(self):
+        stimulus = {'shape': (60, 80), 'fps': 100, 'background': 'uniform',
+                    'targets': [{'position': (30, 10), 'velocity': (0, 100), 'size': (3, 3)}]}
+        objIptStream = SyntheticFrameReader(stimulus, 5, 8, dtype=np.uint8)
+        groundTruth = objIptStream.get_ground_truth()
+        self.assertEqual(groundTruth, [[[15, 30]], [[16, 30]], [[17, 30]]])
+        self.assertEqual(objIptStream.get_ground_truth(withBox=True)[0], [[14, 29, 3, 3]])
+
+        frames = []
+        while objIptStream.hasFrame:
+            grayImg, colorImg = objIptStream.get_next_frame()
+            frames.append(grayImg)
+        self.assertEqual(len(frames), 3)
+        self.assertEqual(colorImg.shape, (60, 80, 3))
+        # a black 3x3 target on a gray background
+        self.assertEqual(np.count_nonzero(frames[0] == 0), 9)
+        self.assertTrue(np.all(frames[0][29:32, 14:17] == 0))
+
+    def test_deterministic(self):
+        stimulus = {'shape': (48, 64), 'numTargets': 4, 'backgroundVelocity': (50, -100), 'seed': 3}
+        frames1 = SyntheticFrameReader(stimulus).render_frames(np.arange(0, 20))
+        objIptStream = SyntheticFrameReader(stimulus, 10, 20, dtype=np.uint8, blockSize=3)
+        frames2 = [objIptStream.get_next_frame()[0] for _ in range(10)]
+        np.testing.assert_array_equal(frames1[10:], frames2)
+        self.assertFalse(objIptStream.hasFrame)
+        self.assertFalse(np.array_equal(frames1[0], frames1[10]))
+        self.assertRaises(ValueError, SyntheticFrameReader, {'numTarget': 2})
+
+        frames3 = read_synthetic_frames(stimulus, 10, dtype=np.uint8, startFrame=10)
+        np.testing.assert_array_equal(frames3, frames2)
+
+    def test_evaluate(self):
+        stimulus = {'shape': (60, 80), 'numFrames': 150, 'background': 'uniform',
+                    'targets': [{'position': (30, 10), 'velocity': (0, 250)}]}
+        results, _, _ = inference_task('ESTMD', stimulus, 'SyntheticFrameReader')
+        groundTruth = SyntheticFrameReader(stimulus).get_ground_truth()
+        self.assertEqual(len(results), len(groundTruth))
+        # the response lags behind the target by a few pixels
+        _, AR, _ = evaluate_task(results[50:], groundTruth[50:], gTError=8, plotFigures=False)
+        self.assertGreater(AR, 0.9)
+
+        with tempfile.TemporaryDirectory() as tmpDir:
+            fileName = os.path.join(tmpDir, 'stimulus.json')
+            with open(fileName, 'w') as hFile:
+                hFile.write('{"shape": [60, 80], "numFrames": 5}')
+            objIptStream = SyntheticFrameReader(fileName)
+            self.assertEqual(objIptStream.endFrame, 5)
+            self.assertEqual(objIptStream.get_next_frame()[0].shape, (60, 80))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,5 @@
 import numpy as np
-from scipy.special import gamma
+from math import gamma
 
 
 def create_gaussian_kernel(size, sigma):
@@ -1,6 +1,10 @@
+import json
+import os
 from dataclasses import dataclass
 from typing import Any, List
 
+import numpy as np
+
 
 @dataclass
 class CircularList(list):
@@ -70,6 +74,127 @@ class ModelNameMapping:
         self.classNameHandle = classNameHandle
 
 
+STATE_RECORD_VERSION = 1
+
+
+def encode_state(key, value, arrays, meta):
+    """
+    Flattens a state value into arrays and a JSON-compatible description.
+
+    Arrays are stored under `key` (or `key/idx` for the items of a container),
+    the description of every key goes to `meta`. Supported values are None,
+    scalars, strings, NumPy arrays (also of dtype object), torch tensors,
+    CircularLists, lists, tuples and dicts with string keys.
+    """
+    if value is None:
+        meta[key] = {'type': 'none'}
+    elif isinstance(value, CircularList):
+        meta[key] = {'type': 'circularlist', 'initLen': value.initLen,
+                     'pointer': value.pointer, 'len': len(value)}
+        for idx, item in enumerate(value):
+            encode_state(f'{key}/{idx}', item, arrays, meta)
+    elif isinstance(value, (list, tuple)):
+        meta[key] = {'type': type(value).__name__, 'len': len(value)}
+        for idx, item in enumerate(value):
+            encode_state(f'{key}/{idx}', item, arrays, meta)
+    elif isinstance(value, dict):
+        meta[key] = {'type': 'dict', 'keys': [str(name) for name in value]}
+        for name, item in value.items():
+            encode_state(f'{key}/{name}', item, arrays, meta)
+    elif isinstance(value, np.ndarray) and value.dtype == object:
+        meta[key] = {'type': 'objectarray', 'shape': list(value.shape)}
+        for idx, item in enumerate(value.flat):
+            encode_state(f'{key}/{idx}', item, arrays, meta)
+    elif isinstance(value, np.ndarray):
+        meta[key] = {'type': 'ndarray'}
+        arrays[key] = value
+    elif type(value).__module__ == 'torch':
+        meta[key] = {'type': 'tensor', 'device': str(value.device)}
+        arrays[key] = value.detach().cpu().numpy()
+    elif isinstance(value, (bool, int, float, str, np.generic)):
+        meta[key] = {'type': 'scalar',
+                     'value': value.item() if isinstance(value, np.generic) else value}
+    else:
+        raise TypeError(f'Cannot record a state of type {type(value).__name__} ({key}).')
+
+
+def decode_state(key, arrays, meta):
+    """ Rebuilds a state value flattened by encode_state. """
+    info = meta[key]
+    if info['type'] == 'none':
+        return None
+    elif info['type'] == 'circularlist':
+        value = CircularList()
+        value.extend(decode_state(f'{key}/{idx}', arrays, meta) for idx in range(info['len']))
+        value.initLen = info['initLen']
+        value.pointer = info['pointer']
+        return value
+    elif info['type'] in ('list', 'tuple'):
+        value = [decode_state(f'{key}/{idx}', arrays, meta) for idx in range(info['len'])]
+        return value if info['type'] == 'list' else tuple(value)
+    elif info['type'] == 'dict':
+        return {name: decode_state(f'{key}/{name}', arrays, meta) for name in info['keys']}
+    elif info['type'] == 'objectarray':
+        value = np.empty(info['shape'], dtype=object)
+        for idx in range(value.size):
+            value.flat[idx] = decode_state(f'{key}/{idx}', arrays, meta)
+        return value
+    elif info['type'] == 'ndarray':
+        return arrays[key]
+    elif info['type'] == 'tensor':
+        import torch
+        return torch.from_numpy(arrays[key]).to(info['device'])
+    else:
+        return info['value']
+
+
+def save_state_record(fileName, state, header=None):
+    """
+    Saves a state dict to an uncompressed .npz file.
+
+    Every array of the state is stored as its own entry, the structure of the
+    state and the header go to a JSON entry, so the file loads without pickle.
+    The file is written to a temporary name first, an interrupted save never
+    leaves a truncated record behind.
+
+    Parameters:
+    - fileName: Path of the record.
+    - state: dict of state values, see encode_state.
+    - header: JSON-compatible dict stored along with the state.
+    """
+    arrays = {}
+    meta = {}
+    for key, value in state.items():
+        encode_state(key, value, arrays, meta)
+    record = {'version': STATE_RECORD_VERSION, 'keys': list(state), 'meta': meta,
+              'header': header or {}}
+
+    entries = {f'arr_{idx}': array for idx, array in enumerate(arrays.values())}
+    record['arrays'] = dict(zip(arrays, entries))
+    tmpName = f'{fileName}.tmp'
+    with open(tmpName, 'wb') as hFile:
+        np.savez(hFile, __record__=np.array(json.dumps(record)), **entries)
+    os.replace(tmpName, fileName)
+
+
+def load_state_record(fileName):
+    """
+    Loads a state dict saved by save_state_record.
+
+    Returns:
+    - state: dict of state values.
+    - header: dict stored along with the state.
+    """
+    with np.load(fileName, allow_pickle=False) as hFile:
+        record = json.loads(str(hFile['__record__']))
+        if record['version'] != STATE_RECORD_VERSION:
+            raise ValueError(f'Unsupported state record version: {record["version"]}.')
+        arrays = {key: hFile[entry] for key, entry in record['arrays'].items()}
+
+    state = {key: decode_state(key, arrays, record['meta']) for key in record['keys']}
+    return state, record['header']
+
+
 if __name__ == "__main__":
     A = CircularList(3)
     B = CircularList(9)
@@ -0,0 +1,304 @@
+import os
+import json
+
+import numpy as np
+
+
+# A detection log is a folder holding the header, the detections of all the
+# frames one after the other, and the index of the frames
+DETECTION_LOG_VERSION = 1
+HEADER_FILE = 'header.json'
+DETECTIONS_FILE = 'detections.bin'
+FRAMES_FILE = 'frames.bin'
+
+# Direction is NaN when unknown or when the model has none
+DETECTION_DTYPE = np.dtype([('frame', '<i8'),
+                            ('x', '<i4'),
+                            ('y', '<i4'),
+                            ('confidence', '<f8'),
+                            ('direction', '<f8')])
+# Index of the frames: the detections of the i-th frame of the log are the rows
+# end[i-1] (0 for the first frame) to end[i] of the detections
+FRAME_DTYPE = np.dtype([('frame', '<i8'),
+                        ('end', '<i8')])
+
+
+class DetectionLogWriter:
+    '''
+    DetectionLogWriter - Appends the detections of the frames to a detection log.
+      The frames are buffered and written in chunks of chunkSize frames, the
+      detections first, then their entries of the frame index: a frame is only
+      in the log once its index entry is written, so a log cut short by a crash
+      reads as the frames before the last complete chunk. Records of
+      stream_inference can be written directly, the writer is a sink (see
+      stream_inference).
+
+    Example:
+        with DetectionLogWriter('detections.stmdlog') as writer:
+            for record in stream_inference('DSTMD', vidName, inputType='VidstreamReader',
+                                           sinks=[writer]):
+                ...
+        detectionLog = DetectionLog('detections.stmdlog')
+    '''
+
+    def __init__(self, logName, mode='w', chunkSize=256, **metadata):
+        '''
+          Parameters:
+              - logName: Folder of the log.
+              - mode: 'w' starts a new log, 'a' appends to an existing one (or
+                  starts it).
+              - chunkSize: Number of frames written at once.
+              - **metadata: JSON serializable items stored in the header (e.g.
+                  modelName, inputpath), see DetectionLog.metadata.
+        '''
+        if mode not in ('w', 'a'):
+            raise ValueError(f"mode must be 'w' or 'a', not {mode!r}.")
+        self.logName = logName
+        self.chunkSize = chunkSize
+        self.pendingDetections = []
+        self.pendingFrames = []
+        os.makedirs(logName, exist_ok=True)
+
+        self.numFrames = 0
+        self.numDetections = 0
+        self.hasDirection = False
+        self.metadata = {}
+        if mode == 'a' and os.path.exists(os.path.join(logName, HEADER_FILE)):
+            header = read_header(logName)
+            self.hasDirection = header['hasDirection']
+            self.metadata = header['metadata']
+            self.numFrames, self.numDetections = repair_log(logName)
+        else:
+            for fileName in (DETECTIONS_FILE, FRAMES_FILE):
+                open(os.path.join(logName, fileName), 'wb').close()
+        self.metadata.update(metadata)
+        self.hDetections = open(os.path.join(logName, DETECTIONS_FILE), 'ab')
+        self.hFrames = open(os.path.join(logName, FRAMES_FILE), 'ab')
+        self.write_header()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def append(self, frameIdx, responseListType, directionListType=()):
+        '''
+        append - Adds the detections of a frame.
+
+          Parameters:
+              - frameIdx: Index of the frame in the input.
+              - responseListType: [x, y, confidence] detections of the frame, as
+                  returned by postprocess_output.
+              - directionListType: [x, y, direction] of the same detections, or
+                  an empty list for a model without direction.
+        '''
+        detections = np.zeros(len(responseListType), dtype=DETECTION_DTYPE)
+        if len(responseListType):
+            responseArray = np.asarray(responseListType, dtype=np.float64)
+            if responseArray.ndim != 2 or responseArray.shape[1] != 3:
+                raise ValueError('The detections of a detection log are [x, y, confidence] lists.')
+            detections['frame'] = frameIdx
+            detections['x'] = responseArray[:, 0]
+            detections['y'] = responseArray[:, 1]
+            detections['confidence'] = responseArray[:, 2]
+            if len(directionListType):
+                detections['direction'] = [item[-1] for item in directionListType]
+                self.hasDirection = True
+            else:
+                detections['direction'] = np.nan
+        self.pendingDetections.append(detections)
+        self.numDetections += len(detections)
+        self.pendingFrames.append((frameIdx, self.numDetections))
+        self.numFrames += 1
+        if len(self.pendingFrames) >= self.chunkSize:
+            self.flush()
+
+    def write(self, record, colorImg=None):
+        ''' Adds a DetectionRecord, as a sink of stream_inference. '''
+        self.append(record.frameIdx, record.response_list(), record.direction_list())
+        # also when the frames written so far have no detections
+        self.hasDirection |= record.directions is not None
+
+    def flush(self):
+        ''' Writes the buffered frames. '''
+        if not self.pendingFrames:
+            return
+        np.concatenate(self.pendingDetections).tofile(self.hDetections)
+        self.hDetections.flush()
+        # the index entries last, they make the frames part of the log
+        np.array(self.pendingFrames, dtype=FRAME_DTYPE).tofile(self.hFrames)
+        self.hFrames.flush()
+        self.pendingDetections = []
+        self.pendingFrames = []
+        self.write_header()
+
+    def write_header(self):
+        fileName = os.path.join(self.logName, HEADER_FILE)
+        with open(fileName + '.tmp', 'w') as f:
+            json.dump({'version': DETECTION_LOG_VERSION,
+                       'detectionDtype': DETECTION_DTYPE.descr,
+                       'frameDtype': FRAME_DTYPE.descr,
+                       'hasDirection': self.hasDirection,
+                       'metadata': self.metadata}, f)
+        os.replace(fileName + '.tmp', fileName)
+
+    def close(self):
+        if self.hFrames.closed:
+            return
+        self.flush()
+        self.hDetections.close()
+        self.hFrames.close()
+
+
+def read_header(logName):
+    with open(os.path.join(logName, HEADER_FILE), 'r') as f:
+        header = json.load(f)
+    if header.get('version') != DETECTION_LOG_VERSION:
+        raise ValueError(f'Unsupported detection log version in {logName}.')
+    return header
+
+
+def repair_log(logName, maxFrames=None):
+    '''
+    repair_log - Drops what was written after the last complete chunk of a log.
+
+      Parameters:
+          - logName: Folder of the log.
+          - maxFrames: Also drops the frames after the first maxFrames ones,
+              e.g. to go back to a checkpoint.
+
+      Returns:
+          - numFrames: Number of frames of the log.
+          - numDetections: Number of detections of the log.
+    '''
+    frames = load_array(os.path.join(logName, FRAMES_FILE), FRAME_DTYPE)
+    numDetections = os.path.getsize(os.path.join(logName, DETECTIONS_FILE)) // DETECTION_DTYPE.itemsize
+    numFrames = int(np.searchsorted(frames['end'], numDetections, side='right'))
+    if maxFrames is not None:
+        numFrames = min(numFrames, maxFrames)
+    numDetections = int(frames['end'][numFrames - 1]) if numFrames else 0
+    del frames
+    for fileName, size in ((FRAMES_FILE, numFrames * FRAME_DTYPE.itemsize),
+                           (DETECTIONS_FILE, numDetections * DETECTION_DTYPE.itemsize)):
+        with open(os.path.join(logName, fileName), 'r+b') as f:
+            f.truncate(size)
+    return numFrames, numDetections
+
+
+def load_array(fileName, dtype):
+    ''' Memory-maps the complete records of a file, read only. '''
+    numRecords = os.path.getsize(fileName) // dtype.itemsize
+    if numRecords == 0:
+        # an empty file cannot be mapped
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(fileName, dtype=dtype, mode='r', shape=(numRecords,))
+
+
+class DetectionLog:
+    '''
+    DetectionLog - Memory-mapped reader of a detection log.
+      The detections stay in the file, as a structured array of (frame, x, y,
+      confidence, direction), and are only read when used. The evaluation
+      functions (evaluate_task, get_ROC_curve_data, ...) take a DetectionLog in
+      place of the response lists and work on its arrays. Indexing a log gives
+      the [x, y, confidence] list of a frame, as in the output of
+      inference_task.
+
+    Properties:
+        detections - Structured array (DETECTION_DTYPE) of all the detections.
+        frames - Structured array (FRAME_DTYPE) of the frame index.
+        hasDirection - Whether the model of the log outputs directions.
+        metadata - Metadata of the writer.
+    '''
+
+    def __init__(self, logName):
+        self.logName = logName
+        header = read_header(logName)
+        if np.dtype([tuple(item) for item in header['detectionDtype']]) != DETECTION_DTYPE:
+            raise ValueError(f'Unexpected detection layout in {logName}.')
+        self.hasDirection = header['hasDirection']
+        self.metadata = header['metadata']
+
+        frames = load_array(os.path.join(logName, FRAMES_FILE), FRAME_DTYPE)
+        detections = load_array(os.path.join(logName, DETECTIONS_FILE), DETECTION_DTYPE)
+        # frames whose detections are not all written yet are left out
+        numFrames = int(np.searchsorted(frames['end'], len(detections), side='right'))
+        self.frames = frames[:numFrames]
+        self.detections = detections[:int(frames['end'][numFrames - 1]) if numFrames else 0]
+        self.ends = np.asarray(self.frames['end'])
+        self.starts = np.concatenate([[0], self.ends[:-1]]).astype(np.int64)
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __getitem__(self, idx):
+        return self.response_list(idx)
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self.response_list(idx)
+
+    @property
+    def frameIdx(self):
+        ''' Index in the input of every frame of the log. '''
+        return np.asarray(self.frames['frame'])
+
+    def get_frame(self, idx):
+        ''' Structured array of the detections of the idx-th frame of the log. '''
+        return self.detections[self.starts[idx]:self.ends[idx]]
+
+    def response_list(self, idx):
+        ''' [x, y, confidence] list of the idx-th frame of the log. '''
+        detections = self.get_frame(idx)
+        return [[x, y, confidence] for x, y, confidence in
+                zip(detections['x'].tolist(), detections['y'].tolist(), detections['confidence'].tolist())]
+
+    def direction_list(self, idx):
+        ''' [x, y, direction] list of the idx-th frame of the log, empty without directions. '''
+        if not self.hasDirection:
+            return []
+        detections = self.get_frame(idx)
+        return [[x, y, direction] for x, y, direction in
+                zip(detections['x'].tolist(), detections['y'].tolist(), detections['direction'].tolist())]
+
+    def to_lists(self):
+        '''
+        to_lists - Returns the response and direction lists of all the frames.
+
+          Returns:
+              - results, directions: As returned by inference_task.
+        '''
+        return [self.response_list(idx) for idx in range(len(self))], \
+            [self.direction_list(idx) for idx in range(len(self))]
+
+
+def convert_json_to_detection_log(jsonName, logName, startFrame=0, chunkSize=4096):
+    '''
+    convert_json_to_detection_log - Converts a JSON file of detections to a detection log.
+
+      Parameters:
+          - jsonName: JSON file written by save_as_json(fileName, results,
+              directions) (demo/evaluate_model.py), i.e. {'data_1': results,
+              'data_2': directions}, or holding the results list alone.
+          - logName: Folder of the new log.
+          - startFrame: Index of the first frame in the input.
+          - chunkSize: See DetectionLogWriter.
+
+      Returns:
+          - detectionLog: DetectionLog of the converted file.
+    '''
+    with open(jsonName, 'r') as f:
+        data = json.load(f)
+    if isinstance(data, dict):
+        results = data['data_1']
+        directions = data.get('data_2', [])
+    else:
+        results, directions = data, []
+
+    with DetectionLogWriter(logName, chunkSize=chunkSize, source=os.path.abspath(jsonName),
+                            startFrame=startFrame) as writer:
+        for idx, responseListType in enumerate(results):
+            directionListType = directions[idx] if idx < len(directions) else []
+            writer.append(startFrame + idx, responseListType, directionListType)
+    return DetectionLog(logName)
@@ -1,3 +1,4 @@
+import numpy as np
 
 
 def evaluation_model_by_video(modelOpt: list, 
@@ -257,6 +258,153 @@ def compute_ROI(rect1, rect2):
     return ROI
 
 
+def get_frame_range(modelOpt, groundTruth, startFrame=0, endFrame=None):
+    """
+    Returns the range of the evaluated frames, the frames startFrame to endFrame of those with both outputs and ground truth.
+
+    For a DetectionLog, returns the ground truth indices of its evaluated frames (see get_log_frame_pairs).
+    """
+    if hasattr(modelOpt, 'detections'):
+        return get_log_frame_pairs(modelOpt, groundTruth, startFrame, endFrame)[1]
+    return range(min(len(modelOpt), len(groundTruth)))[startFrame:None if endFrame is None else endFrame + 1]
+
+
+def get_log_frame_pairs(detectionLog, groundTruth, startFrame=0, endFrame=None):
+    """
+    Pairs the frames of a DetectionLog with the ground truth by their frame index.
+
+    The ground truth starts at the start frame of the log, the startFrame of its
+    metadata or else its first frame. Frames missing from the log, e.g. dropped
+    by a latency sink, are left out of the evaluation, as are the ground truth
+    items past the end of the log.
+
+    Returns:
+    - logIdxs: Positions in the log of the evaluated frames.
+    - gTIdxs: Indices in the ground truth of the same frames, startFrame to endFrame.
+    """
+    frameIdx = detectionLog.frameIdx
+    if not len(frameIdx):
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    gTIdxs = frameIdx - detectionLog.metadata.get('startFrame', frameIdx[0])
+    isEvaluated = (gTIdxs >= startFrame) & (gTIdxs < len(groundTruth))
+    if endFrame is not None:
+        isEvaluated &= gTIdxs <= endFrame
+    logIdxs = np.flatnonzero(isEvaluated)
+    return logIdxs, gTIdxs[logIdxs]
+
+
+def get_metric_counter(modelOpt, 
+                       groundTruth: list, 
+                       gTError: int = 1, 
+                       ROIThreshold: float = 0.5, 
+                       startFrame: int = 0, 
+                       endFrame: int = None):
+    """
+    Returns a function counting the TP, FN and FP of the frames startFrame to endFrame at a confidence threshold.
+
+    The counts are the sums of those of evaluation_model_by_video over the
+    predictions above the threshold. For a DetectionLog, the predictions are
+    matched with the ground truth once, and each threshold then costs a few
+    binary searches (see get_detection_log_counter).
+
+    Parameters:
+    - modelOpt: Model output data, lists as evaluation_model_by_video or a DetectionLog.
+    - groundTruth: Ground truth data.
+    - gTError: Distance error scope for ground truth.
+    - ROIThreshold: ROI threshold.
+    - startFrame: Starting frame of the dataset.
+    - endFrame: Ending frame of the dataset (optional).
+
+    Returns:
+    - count_metrics: Function of (thresholdValue, inclusive=False) returning
+      totalTP, totalFN, totalFP, the predictions with a confidence above
+      (inclusive: at or above) thresholdValue being kept.
+    """
+    if hasattr(modelOpt, 'detections'):
+        return get_detection_log_counter(modelOpt, groundTruth, gTError, startFrame, endFrame)
+    frameRange = get_frame_range(modelOpt, groundTruth, startFrame, endFrame)
+
+    def count_metrics(thresholdValue, inclusive=False):
+        # Filter data based on the threshold value
+        if inclusive:
+            threInput = [[data for data in frame if data[-1] >= thresholdValue] for frame in modelOpt]
+        else:
+            threInput = [[data for data in frame if data[-1] > thresholdValue] for frame in modelOpt]
+
+        # Evaluate the model by video
+        listTP, listFN, listFP = evaluation_model_by_video(threInput, 
+                                                           groundTruth, 
+                                                           confidenceThreshold=thresholdValue, 
+                                                           gTError=gTError,
+                                                           ROIThreshold=ROIThreshold)
+        return sum(listTP[frameRange.start:frameRange.stop]), \
+            sum(listFN[frameRange.start:frameRange.stop]), \
+            sum(listFP[frameRange.start:frameRange.stop])
+
+    return count_metrics
+
+
+def get_detection_log_counter(detectionLog, groundTruth, gTError=1, startFrame=0, endFrame=None):
+    """
+    get_metric_counter for a DetectionLog, whose predictions are dots.
+
+    As in compute_metrics_by_frame, a prediction is a TP when it matches a
+    ground truth item, the first one it matches is then found; a ground truth
+    item is a FN when no prediction found it. A frame without ground truth
+    counts as one TP. The confidences of the TP, of the FP and, for every ground
+    truth item, the highest confidence of the predictions finding it are sorted
+    once, a threshold keeps the upper part of each. The frames are paired with
+    the ground truth by their frame index (see get_log_frame_pairs).
+    """
+    tpConfidences = []
+    fpConfidences = []
+    foundConfidences = []
+    numEmptyFrames = 0
+    for logIdx, gTIdx in zip(*get_log_frame_pairs(detectionLog, groundTruth, startFrame, endFrame)):
+        if not len(groundTruth[gTIdx]):
+            numEmptyFrames += 1
+            continue
+        gTArray = np.asarray(groundTruth[gTIdx], dtype=np.float64)
+        detections = detectionLog.get_frame(logIdx)
+        if not len(detections):
+            foundConfidences.append(np.full(len(gTArray), -np.inf))
+            continue
+
+        # (number of predictions, number of ground truth items) matches
+        x = detections['x'][:, None].astype(np.float64)
+        y = detections['y'][:, None].astype(np.float64)
+        if gTArray.shape[1] == 2:
+            # match_two_dots
+            isMatched = (np.abs(x - gTArray[:, 0]) <= gTError) & (np.abs(y - gTArray[:, 1]) <= gTError)
+        elif gTArray.shape[1] == 4:
+            # match_dot_in_bbox
+            isMatched = (x >= gTArray[:, 0] - gTError) & (x <= gTArray[:, 0] + gTArray[:, 2] + gTError) \
+                & (y >= gTArray[:, 1] - gTError) & (y <= gTArray[:, 1] + gTArray[:, 3] + gTError)
+        else:
+            raise ValueError('The ground truth items must be [x, y] dots or [x, y, w, h] boxes.')
+
+        confidence = np.asarray(detections['confidence'])
+        isTP = isMatched.any(axis=1)
+        tpConfidences.append(confidence[isTP])
+        fpConfidences.append(confidence[~isTP])
+        found = np.full(len(gTArray), -np.inf)
+        np.maximum.at(found, isMatched[isTP].argmax(axis=1), confidence[isTP])
+        foundConfidences.append(found)
+
+    tpConfidences, fpConfidences, foundConfidences = \
+        [np.sort(np.concatenate(item)) if item else np.zeros(0)
+         for item in (tpConfidences, fpConfidences, foundConfidences)]
+
+    def count_metrics(thresholdValue, inclusive=False):
+        side = 'left' if inclusive else 'right'
+        numTP = len(tpConfidences) - np.searchsorted(tpConfidences, thresholdValue, side=side)
+        numFP = len(fpConfidences) - np.searchsorted(fpConfidences, thresholdValue, side=side)
+        numFound = len(foundConfidences) - np.searchsorted(foundConfidences, thresholdValue, side=side)
+        return int(numEmptyFrames + numTP), int(len(foundConfidences) - numFound), int(numFP)
+
+    return count_metrics
+
+
 def get_RFI_by_fixFPPI(modelOpt: list, 
                        groundTruth: list,
                        aimFPPI: float = 1,  
@@ -290,24 +438,18 @@ def get_RFI_by_fixFPPI(modelOpt: list,
     thresholdValue = 0.5
     preThresholdValue = 0.0
 
-    while True:
-        # Filter data based on the current threshold
-        threInput = [[data for data in frame if data[-1] >= thresholdValue] 
-                     for frame in modelOpt]
+    count_metrics = get_metric_counter(modelOpt, groundTruth, gTError, ROIThreshold, startFrame, endFrame)
+    numFrames = len(get_frame_range(modelOpt, groundTruth, startFrame, endFrame))
 
-        # Compute metrics
-        listTP, listFN, listFP = evaluation_model_by_video(threInput, 
-                                                            groundTruth, 
-                                                            confidenceThreshold=thresholdValue, 
-                                                            gTError=gTError,
-                                                            ROIThreshold=ROIThreshold)
+    while True:
+        # Compute metrics of the data at or above the current threshold
+        totalTP, totalFN, totalFP = count_metrics(thresholdValue, inclusive=True)
 
         # Calculate RFI and FPPI
-        numberAT = sum(listFN[startFrame:endFrame+1]) + sum(listTP[startFrame:endFrame+1])
+        numberAT = totalFN + totalTP
         # Calculate Recall Per Image (RFI) and False Positive Per Image (FPPI)
-        RFI = sum(listTP[startFrame:endFrame+1]) / numberAT if numberAT > 0 else 0
-        FPPI = sum(listFP[startFrame:endFrame + 1]) / (endFrame - startFrame + 1) \
-            if len(listFP[startFrame:endFrame+1]) > 0 else 0
+        RFI = totalTP / numberAT if numberAT > 0 else 0
+        FPPI = totalFP / numFrames if numFrames > 0 else 0
 
         # Check for convergence
         if abs(FPPI - aimFPPI) < 0.01 or abs(thresholdValue - preThresholdValue) < 1e-5:
@@ -349,9 +491,6 @@ def get_ROC_curve_data(modelOpt: list,
     - thresholdList: List of thresholds.
     """
 
-    if endFrame is None:
-        endFrame = len(modelOpt) - 1
-
     lowerFPPI, upperFPPI = rangeOfFPPI
     intervalFPPI = (upperFPPI - lowerFPPI) / 20
     errorFPPI = (upperFPPI - lowerFPPI) / 100
@@ -362,29 +501,20 @@ def get_ROC_curve_data(modelOpt: list,
     listMark = [True] * len(thresholdList)
     shouldFoundLower = shouldFoundUpper = True
 
+    count_metrics = get_metric_counter(modelOpt, groundTruth, gTError, ROIThreshold, startFrame, endFrame)
+    numFrames = len(get_frame_range(modelOpt, groundTruth, startFrame, endFrame))
+
     while any(listMark):
         idx = next((i for i, marked in enumerate(listMark) if marked), None)
 
         thresholdValue = thresholdList[idx]
 
-        # Filter data based on the threshold value
-        threInput = [[data for data in frame if data[-1] > thresholdValue] for frame in modelOpt]
-
-        # Evaluate the model by video
-        listTP, listFN, listFP = evaluation_model_by_video(threInput, 
-                                                           groundTruth, 
-                                                           confidenceThreshold=thresholdValue, 
-                                                           gTError=gTError,
-                                                           ROIThreshold=ROIThreshold)
-
-        # total TP, FN and FP
-        totalTP = sum(listTP[startFrame:endFrame + 1])
-        totalFN = sum(listFN[startFrame:endFrame + 1])
-        totalFP = sum(listFP[startFrame:endFrame + 1])
+        # total TP, FN and FP of the data above the threshold value
+        totalTP, totalFN, totalFP = count_metrics(thresholdValue)
 
         # Calculate Recall Per Image (RFI) and False Positive Per Image (FPPI)
         RFI = totalTP / (totalTP + totalFN) if (totalTP + totalFN) > 0 else 0
-        FPPI = totalFP / (endFrame - startFrame + 1) if (endFrame - startFrame + 1) > 0 else 0
+        FPPI = totalFP / numFrames if numFrames > 0 else 0
 
         RPIList[idx] = RFI
         FPPIList[idx] = FPPI
@@ -475,33 +605,20 @@ def get_P_R_curve_data(modelOpt: list,
     - thresholdList: List of thresholds.
     """
 
-    if endFrame is None:
-        endFrame = len(modelOpt) - 1
-
     thresholdList = [1, 0.5, 0]
     rList = [None] * len(thresholdList)
     pList = [None] * len(thresholdList)
     listMark = [True] * len(thresholdList)
 
+    count_metrics = get_metric_counter(modelOpt, groundTruth, gTError, ROIThreshold, startFrame, endFrame)
+
     while any(listMark):
         idx = next((i for i, marked in enumerate(listMark) if marked), None)
 
         thresholdValue = thresholdList[idx]
 
-        # Filter data based on the threshold value
-        threInput = [[data for data in frame if data[-1] > thresholdValue] for frame in modelOpt]
-
-        # Evaluate the model by video
-        listTP, listFN, listFP = evaluation_model_by_video(threInput, 
-                                                           groundTruth, 
-                                                           confidenceThreshold=thresholdValue, 
-                                                           gTError=gTError,
-                                                           ROIThreshold=ROIThreshold)
-
-        # total TP, FN and FP
-        totalTP = sum(listTP[startFrame:endFrame + 1])
-        totalFN = sum(listFN[startFrame:endFrame + 1])
-        totalFP = sum(listFP[startFrame:endFrame + 1])
+        # total TP, FN and FP of the data above the threshold value
+        totalTP, totalFN, totalFP = count_metrics(thresholdValue)
 
         # Calculate Recall Per Image (RFI) and False Positive Per Image (FPPI)
         recall = totalTP / (totalTP + totalFN) if (totalTP + totalFN) > 0 else 0
@@ -556,31 +673,22 @@ def get_thres_recall_data(modelOpt: list,
     - thresholdList: List of thresholds.
     """
 
-    if endFrame is None:
-        endFrame = len(modelOpt) - 1
-    
     lowerBound, upperBound = rangeOfThreshold
     totalLen = int((upperBound - lowerBound) / thresholdInteval)
 
     thresholdList = [lowerBound + i * thresholdInteval for i in range(totalLen)] + [upperBound]
     RPIList = [None for _ in range(totalLen + 1)]
     
-    for idx, thresholdValue in enumerate(thresholdList):
-        # Filter data based on the threshold value
-        threInput = [[data for data in frame if data[-1] >= thresholdValue] 
-                     for frame in modelOpt]
+    count_metrics = get_metric_counter(modelOpt, groundTruth, gTError, ROIThreshold, startFrame, endFrame)
 
-        # Evaluate the model by video
-        listTP, listFN, listFP = evaluation_model_by_video(threInput, 
-                                                           groundTruth, 
-                                                           confidenceThreshold=thresholdValue, 
-                                                           gTError=gTError,
-                                                           ROIThreshold=ROIThreshold)
+    for idx, thresholdValue in enumerate(thresholdList):
+        # Evaluate the data at or above the threshold value
+        totalTP, totalFN, _ = count_metrics(thresholdValue, inclusive=True)
 
         # Calculate RFI and FPPI
-        numberAT = sum(listFN[startFrame:endFrame+1]) + sum(listTP[startFrame:endFrame+1])
+        numberAT = totalFN + totalTP
         # Calculate Recall Per Image (RFI) and False Positive Per Image (FPPI)
-        RFI = sum(listTP[startFrame:endFrame+1]) / numberAT if numberAT > 0 else 0
+        RFI = totalTP / numberAT if numberAT > 0 else 0
 
         RPIList[idx] = RFI
 
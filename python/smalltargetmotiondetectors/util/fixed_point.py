@@ -0,0 +1,98 @@
+import numpy as np
+
+
+class FixedPointAccelerator:
+    """
+    Accelerates the fixed-point iteration x = G(x) of a feedback loop.
+
+    Properties:
+        - method: None (plain iteration, the next input is G(x)), 'aitken'
+          (element-wise Aitken delta-squared extrapolation, every other
+          iteration) or 'anderson' (Anderson mixing of the past iterations).
+        - depth: Number of past iterations mixed by the Anderson method.
+
+    Methods:
+        - reset: Forgets the past iterations, before a new fixed point.
+        - update: Returns the next input from the last input and its image.
+    """
+
+    def __init__(self, method=None, depth=3):
+        """
+        Constructor method
+        """
+        if method not in [None, 'aitken', 'anderson']:
+            raise ValueError("method must be None, 'aitken' or 'anderson'.")
+        if not isinstance(depth, int) or depth <= 0:
+            raise ValueError("depth must be a positive integer.")
+        self.method = method
+        self.depth = depth
+        self.reset()
+
+    def reset(self):
+        """
+        Forgets the past iterations.
+        """
+        self.lastIpt = None         # input of the last plain iteration (aitken)
+        self.lastOpt = None         # image of the last input (anderson)
+        self.lastResidual = None
+        self.diffOpts = []          # differences of the last images (anderson)
+        self.diffResiduals = []     # differences of the last residuals (anderson)
+
+    def update(self, ipt, opt):
+        """
+        Returns the input of the next iteration.
+
+        Parameters:
+            - ipt: Input x of the last iteration.
+            - opt: Its image G(x).
+
+        Returns:
+            - nextIpt: Input of the next iteration.
+        """
+        if self.method == 'aitken':
+            return self.update_aitken(ipt, opt)
+        elif self.method == 'anderson':
+            return self.update_anderson(ipt, opt)
+        return opt
+
+    def update_aitken(self, ipt, opt):
+        """
+        Extrapolates x0, x1 = G(x0), x2 = G(x1) to x2 - (x2 - x1)^2 / (x2 - 2 x1 + x0).
+
+        Only the elements whose steps shrink (|x2 - x1| < |x1 - x0|) are
+        extrapolated, the others keep x2.
+        """
+        if self.lastIpt is None:
+            self.lastIpt = ipt
+            return opt
+
+        delta1 = ipt - self.lastIpt
+        delta2 = opt - ipt
+        step = np.zeros_like(opt)
+        np.divide(delta2 ** 2, delta2 - delta1, out=step, where=np.abs(delta2) < np.abs(delta1))
+        # the next input is not the image of this one, the next iteration is a plain one
+        self.lastIpt = None
+        return opt - step
+
+    def update_anderson(self, ipt, opt):
+        """
+        Mixes the last images with the weights that minimize the mixed residual G(x) - x.
+        """
+        residual = opt - ipt
+        if self.lastResidual is not None:
+            self.diffResiduals = (self.diffResiduals + [residual - self.lastResidual])[-self.depth:]
+            self.diffOpts = (self.diffOpts + [opt - self.lastOpt])[-self.depth:]
+        self.lastResidual = residual
+        self.lastOpt = opt
+        if not self.diffResiduals:
+            return opt
+
+        # normal equations of min |residual - sum(gamma[i] * diffResiduals[i])|
+        gram = np.array([[np.vdot(diffI, diffJ) for diffJ in self.diffResiduals] for diffI in self.diffResiduals])
+        projection = np.array([np.vdot(diffI, residual) for diffI in self.diffResiduals])
+        gamma = np.linalg.lstsq(gram, projection, rcond=None)[0]
+
+        nextIpt = opt.copy()
+        for weight, diffOpt in zip(gamma, self.diffOpts):
+            nextIpt -= weight * diffOpt
+        return nextIpt
@@ -0,0 +1,437 @@
+import os
+import glob
+import json
+import hashlib
+import logging
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from .iostream import convert_gray
+
+
+logger = logging.getLogger(__name__)
+
+# Cache files are '<cacheName>.npy' (frames) and '<cacheName>.json' (header)
+FRAME_CACHE_SUFFIX = '.framecache'
+# Keyframe indexes of videos are '<cacheName>.json' (see KeyframeIndex)
+KEYFRAME_INDEX_SUFFIX = '.keyframes'
+FRAME_CACHE_VERSION = 1
+# Directory used for the caches when the folder of the input is not writable
+FRAME_CACHE_DIR_ENV = 'STMD_FRAME_CACHE_DIR'
+
+VIDEO_SOURCE = 'VidstreamReader'
+IMGSTREAM_SOURCE = 'ImgstreamReader'
+
+
+def get_frame_cache_path(inputpath, cacheDir=None, suffix=FRAME_CACHE_SUFFIX):
+    '''
+    get_frame_cache_path - Returns the cache name (without extension) of an input.
+      By default the cache is stored next to the input. With cacheDir (or the
+      STMD_FRAME_CACHE_DIR environment variable) all caches share one folder,
+      a hash of the absolute input path then keeps the names apart.
+
+      Parameters:
+          - inputpath: Video file or image stream format (e.g. 'folder/Frame*.jpg').
+          - cacheDir: Folder of the cache (optional).
+          - suffix: Suffix of the cache name (optional, KEYFRAME_INDEX_SUFFIX for keyframe indexes).
+
+      Returns:
+          - cacheName: Path of the cache without the '.npy'/'.json' extension.
+    '''
+    inputpath = os.path.abspath(inputpath)
+    folder, baseName = os.path.split(inputpath)
+    baseName = baseName.replace('*', '#').replace('?', '#')
+    if cacheDir is None:
+        cacheDir = os.environ.get(FRAME_CACHE_DIR_ENV)
+    if cacheDir is None:
+        return os.path.join(folder, baseName + suffix)
+    pathHash = hashlib.sha1(inputpath.encode()).hexdigest()[:8]
+    return os.path.join(cacheDir, f'{baseName}_{pathHash}{suffix}')
+
+
+def build_frame_cache(inputpath, inputType=None, cacheDir=None, overwrite=False, numWorkers=None):
+    '''
+    build_frame_cache - Decodes an input once into a memory-mapped uint8 grayscale stack.
+      The frames are converted exactly as the readers do (BGR to gray), so a
+      CachedFrameReader yields the same frames as VidstreamReader/ImgstreamReader.
+
+      Parameters:
+          - inputpath: Video file or image stream format.
+          - inputType: 'VidstreamReader' or 'ImgstreamReader' (optional, guessed from inputpath).
+          - cacheDir: Folder of the cache (optional, see get_frame_cache_path).
+          - overwrite: Whether to rebuild an existing valid cache.
+          - numWorkers: Number of decoding threads for image streams (optional).
+
+      Returns:
+          - cacheName: Path of the cache without extension.
+    '''
+    sourceType = get_source_type(inputpath, inputType)
+    cacheName = get_frame_cache_path(inputpath, cacheDir)
+    if not overwrite and find_frame_cache(inputpath, cacheDir) is not None:
+        return cacheName
+    os.makedirs(os.path.dirname(cacheName), exist_ok=True)
+
+    header = {
+        'version': FRAME_CACHE_VERSION,
+        'source': os.path.abspath(inputpath),
+        'sourceType': sourceType,
+        'signature': get_source_signature(inputpath, sourceType),
+        'fps': None,
+        'frameIds': None,
+    }
+
+    # the header is written last, an interrupted build leaves no valid cache
+    tmpName = cacheName + '.tmp.npy'
+    if sourceType == VIDEO_SOURCE:
+        numFrames, header['fps'] = decode_video(inputpath, tmpName)
+    else:
+        numFrames, header['frameIds'] = decode_imgstream(inputpath, tmpName, numWorkers)
+    os.replace(tmpName, cacheName + '.npy')
+
+    frames = np.load(cacheName + '.npy', mmap_mode='r')
+    header['shape'] = list(frames.shape)
+    header['dtype'] = str(frames.dtype)
+    del frames
+    with open(cacheName + '.json.tmp', 'w') as f:
+        json.dump(header, f, indent=4)
+    os.replace(cacheName + '.json.tmp', cacheName + '.json')
+
+    logger.info(f'Frame cache of {numFrames} frames written to {cacheName}.npy')
+    return cacheName
+
+
+def decode_video(vidName, npyName):
+    hVid = cv2.VideoCapture(vidName)
+    if not hVid.isOpened():
+        raise Exception(f'Could not open the video {vidName}.')
+    numFrames = int(hVid.get(cv2.CAP_PROP_FRAME_COUNT))
+    height = int(hVid.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    width = int(hVid.get(cv2.CAP_PROP_FRAME_WIDTH))
+    fps = hVid.get(cv2.CAP_PROP_FPS)
+
+    frames = np.lib.format.open_memmap(npyName, mode='w+', dtype=np.uint8,
+                                       shape=(numFrames, height, width))
+    # VidstreamReader never reads beyond CAP_PROP_FRAME_COUNT, neither does the cache
+    idx = 0
+    while idx < numFrames:
+        ret, colorImg = hVid.read()
+        if not ret:
+            break
+        frames[idx] = cv2.cvtColor(colorImg, cv2.COLOR_BGR2GRAY)
+        idx += 1
+    hVid.release()
+    frames.flush()
+
+    if idx < numFrames:
+        # the container over-reported its frame count, keep the decoded part only
+        decoded = np.array(frames[:idx])
+        del frames
+        np.save(npyName, decoded)
+        numFrames = idx
+    return numFrames, fps
+
+
+def decode_imgstream(imgsteamFormat, npyName, numWorkers=None):
+    fileList = sorted(glob.glob(imgsteamFormat))
+    if not fileList:
+        raise Exception('No files matching the format could be found.')
+    frameIds = get_frame_ids(imgsteamFormat, fileList)
+
+    def read_gray(fileName):
+        colorImg = cv2.imread(fileName)
+        if colorImg is None:
+            raise Exception(f'Could not read the image {fileName}!')
+        return cv2.cvtColor(colorImg, cv2.COLOR_BGR2GRAY)
+
+    firstImg = read_gray(fileList[0])
+    frames = np.lib.format.open_memmap(npyName, mode='w+', dtype=np.uint8,
+                                       shape=(len(fileList),) + firstImg.shape)
+    with ThreadPoolExecutor(max_workers=numWorkers) as executor:
+        for idx, grayImg in enumerate(executor.map(read_gray, fileList)):
+            if grayImg.shape != firstImg.shape:
+                raise Exception(f'Image {fileList[idx]} has a different size from the first one.')
+            frames[idx] = grayImg
+    frames.flush()
+    return len(fileList), frameIds
+
+
+def get_frame_ids(imgsteamFormat, fileList):
+    '''
+    Frame numbers of the image files, as ImgstreamReader names them
+    ('Frame0007.jpg' is frame 7 for the format 'Frame*.jpg').
+    None when a file name has no number.
+    '''
+    basename = os.path.splitext(os.path.basename(imgsteamFormat))[0]
+    basename = basename[:-1] if basename.endswith('*') else ''
+    frameIds = []
+    for fileName in fileList:
+        name = os.path.splitext(os.path.basename(fileName))[0]
+        try:
+            frameIds.append(int(name[len(basename):] if name.startswith(basename) else name))
+        except ValueError:
+            return None
+    return frameIds
+
+
+def get_source_type(inputpath, inputType=None):
+    if inputType is None:
+        return VIDEO_SOURCE if os.path.isfile(inputpath) else IMGSTREAM_SOURCE
+    if inputType == VIDEO_SOURCE:
+        return VIDEO_SOURCE
+    if inputType.endswith(IMGSTREAM_SOURCE):  # ImgstreamReader and ParallelImgstreamReader
+        return IMGSTREAM_SOURCE
+    raise ValueError(f'Frame caches do not support the inputType {inputType}.')
+
+
+def get_source_signature(inputpath, sourceType):
+    '''Size and modification time of the input, a changed input invalidates its cache.'''
+    fileList = [inputpath] if sourceType == VIDEO_SOURCE else glob.glob(inputpath)
+    stats = [os.stat(fileName) for fileName in fileList]
+    return {
+        'numFiles': len(stats),
+        'size': sum(item.st_size for item in stats),
+        'mtime': max((item.st_mtime for item in stats), default=0.),
+    }
+
+
+def find_frame_cache(inputpath, cacheDir=None, inputType=None):
+    '''
+    find_frame_cache - Looks for an up-to-date frame cache of an input.
+
+      Returns:
+          - cacheName: Path of the cache without extension, or None when there is
+              no cache or the input changed after the cache was built.
+    '''
+    cacheName = get_frame_cache_path(inputpath, cacheDir)
+    try:
+        with open(cacheName + '.json', 'r') as f:
+            header = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if header.get('version') != FRAME_CACHE_VERSION or not os.path.isfile(cacheName + '.npy'):
+        return None
+    try:
+        sourceType = get_source_type(inputpath, inputType)
+        if sourceType != header['sourceType'] \
+                or get_source_signature(inputpath, sourceType) != header['signature']:
+            return None
+    except (OSError, ValueError):
+        return None
+    return cacheName
+
+
+class KeyframeIndex:
+    '''
+    KeyframeIndex - Frame numbers and keyframe positions of a video.
+      The index is built once from the packets of the video (no decoding) and
+      persisted next to the video, or in STMD_FRAME_CACHE_DIR. VidstreamReader
+      uses it to seek to the keyframe preceding a frame and decode forward to
+      that frame, instead of relying on the frame accuracy of the codec seek.
+
+    Properties:
+        numFrames - Number of frames of the video.
+        fps - Frame rate of the video.
+        keyFrames - Sorted frame numbers (display order) of the keyframes.
+        pts - Presentation timestamp of each frame, used to check a seek.
+    '''
+
+    def __init__(self, numFrames, fps, keyFrames, pts=None, signature=None):
+        self.numFrames = numFrames
+        self.fps = fps
+        self.keyFrames = sorted(set(keyFrames) | {0})  # decoding can always start at the first frame
+        self.pts = pts
+        self.signature = signature
+
+    @classmethod
+    def build(cls, vidName):
+        '''
+        build - Scans the packets of a video for keyframes.
+          The packets come in decoding order, their frame numbers are the ranks
+          of their timestamps.
+        '''
+        hVid = cv2.VideoCapture(vidName, cv2.CAP_FFMPEG)
+        if not hVid.isOpened():
+            raise Exception(f'Could not open the video {vidName}.')
+        fps = hVid.get(cv2.CAP_PROP_FPS)
+        if not hVid.set(cv2.CAP_PROP_FORMAT, -1):
+            hVid.release()
+            raise Exception('The video backend cannot read raw packets.')
+        packetPts = []
+        isKeyPacket = []
+        while hVid.grab():
+            packetPts.append(hVid.get(cv2.CAP_PROP_PTS))
+            isKeyPacket.append(bool(hVid.get(cv2.CAP_PROP_LRF_HAS_KEY_FRAME)))
+        hVid.release()
+
+        pts = sorted(packetPts)
+        if len(set(pts)) == len(pts) and all(item >= 0 for item in pts):
+            frameOfPts = {item: frame for frame, item in enumerate(pts)}
+            keyFrames = [frameOfPts[item] for item, isKey in zip(packetPts, isKeyPacket) if isKey]
+        else:
+            # no usable timestamps, only the first frame is a safe starting point
+            pts = None
+            keyFrames = [0]
+        return cls(len(packetPts), fps, keyFrames, pts,
+                   get_source_signature(vidName, VIDEO_SOURCE))
+
+    def get_preceding_keyframe(self, frame):
+        '''Nearest keyframe at or before a frame.'''
+        return self.keyFrames[bisect_right(self.keyFrames, frame) - 1]
+
+    def check_pts(self, frame, pts):
+        '''
+        check_pts - Whether a decoded timestamp is the one of the frame.
+          True when the index has no timestamp for the frame. The timestamps of
+          an index are never negative, a negative one (unknown or invalid) fails.
+        '''
+        if self.pts is None or frame >= len(self.pts):
+            return True
+        return pts >= 0 and self.pts[frame] == pts
+
+    def save(self, fileName):
+        with open(fileName + '.tmp', 'w') as f:
+            json.dump({'version': FRAME_CACHE_VERSION,
+                       'numFrames': self.numFrames,
+                       'fps': self.fps,
+                       'keyFrames': self.keyFrames,
+                       'pts': self.pts,
+                       'signature': self.signature}, f)
+        os.replace(fileName + '.tmp', fileName)
+
+    @classmethod
+    def load(cls, fileName):
+        with open(fileName, 'r') as f:
+            data = json.load(f)
+        if data.get('version') != FRAME_CACHE_VERSION:
+            raise ValueError(f'Unsupported keyframe index version in {fileName}.')
+        return cls(data['numFrames'], data['fps'], data['keyFrames'], data['pts'], data['signature'])
+
+
+def load_keyframe_index(vidName, cacheDir=None, build=True):
+    '''
+    load_keyframe_index - Loads the keyframe index of a video, building it when needed.
+
+      Parameters:
+          - vidName: Path of the video.
+          - cacheDir: Folder of the index (optional, see get_frame_cache_path).
+          - build: Whether to build (and persist) a missing or outdated index.
+
+      Returns:
+          - keyframeIndex: KeyframeIndex, or None when there is none and it
+              could not be built.
+    '''
+    fileName = get_frame_cache_path(vidName, cacheDir, KEYFRAME_INDEX_SUFFIX) + '.json'
+    try:
+        keyframeIndex = KeyframeIndex.load(fileName)
+        if keyframeIndex.signature == get_source_signature(vidName, VIDEO_SOURCE):
+            return keyframeIndex
+    except (OSError, ValueError, KeyError):
+        pass
+    if not build:
+        return None
+
+    try:
+        keyframeIndex = KeyframeIndex.build(vidName)
+    except Exception as error:
+        logger.warning(f'No keyframe index for {vidName}: {error}')
+        return None
+    try:
+        os.makedirs(os.path.dirname(fileName), exist_ok=True)
+        keyframeIndex.save(fileName)
+    except OSError as error:
+        # a read-only folder only costs a rebuild next time
+        logger.warning(f'Could not save the keyframe index {fileName}: {error}')
+    return keyframeIndex
+
+
+class CachedFrameReader:
+    '''
+    CachedFrameReader - Reads frames from a frame cache (see build_frame_cache).
+      The cache is memory-mapped read-only, so worker processes reading the same
+      cache share the page cache and nothing is decoded. startFrame and endFrame
+      are interpreted as by the reader the cache was built from (frame positions
+      for videos, file numbers for image streams).
+
+      With dtype=np.uint8 the grayscale frames are zero-copy views of the cache.
+      There is no color in the cache, the second output is a read-only
+      (H, W, 3) view of the grayscale frame.
+
+    Example:
+        objIptStream = CachedFrameReader(find_frame_cache('video.mp4'), 0, 100)
+        while objIptStream.hasFrame:
+            grayImg, colorImg = objIptStream.get_next_frame()
+    '''
+
+    def __init__(self, cacheName, startFrame=None, endFrame=None, dtype=None):
+        '''
+          Parameters:
+              - cacheName: Path of the cache, with or without extension.
+              - startFrame: Starting frame (optional, defaults to the first frame).
+              - endFrame: Ending frame, excluded (optional, defaults to the last frame).
+              - dtype: dtype of the grayscale output (optional, see convert_gray).
+        '''
+        cacheName = os.path.splitext(cacheName)[0] if cacheName.endswith(('.npy', '.json')) else cacheName
+        with open(cacheName + '.json', 'r') as f:
+            self.header = json.load(f)
+        self.frames = np.load(cacheName + '.npy', mmap_mode='r')
+        self.fps = self.header['fps']
+        self.dtype = dtype
+
+        numFrames = len(self.frames)
+        if self.header['sourceType'] == VIDEO_SOURCE:
+            self.startIdx = 0 if startFrame is None else startFrame
+            self.endIdx = numFrames if endFrame is None else min(endFrame, numFrames)
+        else:
+            # same frame selection as ImgstreamReader
+            frameIds = self.header['frameIds'] or list(range(1, numFrames + 1))
+            startFrame = frameIds[0] if startFrame is None else startFrame
+            endFrame = numFrames if not endFrame else min(endFrame, numFrames)
+            if startFrame not in frameIds:
+                raise Exception('Cannot find the start frame.')
+            if endFrame not in frameIds:
+                raise Exception('Cannot find the end frame.')
+            self.startIdx = frameIds.index(startFrame)
+            self.endIdx = frameIds.index(endFrame)
+
+        self.currIdx = 0
+        self.frameIdx = self.startIdx
+        self.endFrame = self.endIdx
+        self.hasFrame = self.startIdx < self.endIdx
+
+    def get_next_frame(self):
+        '''
+        get_next_frame - Retrieves the next frame from the cache.
+
+          Returns:
+              - grayImg: Grayscale frame.
+              - colorImg: Read-only three channel view of the grayscale frame.
+        '''
+        if not self.hasFrame:
+            raise Exception('Having reached the last frame.')
+
+        rawImg = self.frames[self.frameIdx]
+        grayImg = convert_gray(rawImg, self.dtype)
+
+        self.currIdx += 1
+        self.frameIdx += 1
+        self.hasFrame = self.frameIdx < self.endIdx
+
+        return grayImg, np.broadcast_to(rawImg[..., None], rawImg.shape + (3,))
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Decode inputs once into memory-mapped frame caches.')
+    parser.add_argument('inputs', nargs='+', help='video files or image stream formats (quoted)')
+    parser.add_argument('--cache-dir', default=None, help='folder of the caches')
+    parser.add_argument('--overwrite', action='store_true', help='rebuild existing caches')
+    args = parser.parse_args()
+
+    for inputpath in args.inputs:
+        print(build_frame_cache(inputpath, cacheDir=args.cache_dir, overwrite=args.overwrite))
+        if get_source_type(inputpath) == VIDEO_SOURCE:
+            load_keyframe_index(inputpath, cacheDir=args.cache_dir)
@@ -4,18 +4,50 @@ import time
 
 import cv2
 import glob
+import importlib
 import logging
-import matplotlib
-matplotlib.use('TkAgg')
-import matplotlib.pyplot as plt
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
-import tkinter as tk
-from tkinter import ttk, filedialog, messagebox
 
 from .matrixnms import MatrixNMS
 from .. import model
 
 
+class LazyModule:
+    '''
+    LazyModule - Module imported on first attribute access.
+      The GUI and plotting modules are only needed for visualization, deferring
+      them keeps the readers importable, and fast to import, on headless hosts.
+    '''
+
+    def __init__(self, moduleName, setup=None):
+        self._moduleName = moduleName
+        self._setup = setup
+        self._module = None
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        if self._module is None:
+            if self._setup is not None:
+                self._setup()
+            self._module = importlib.import_module(self._moduleName)
+        return getattr(self._module, name)
+
+
+def use_tk_backend():
+    import matplotlib
+    matplotlib.use('TkAgg')
+
+
+plt = LazyModule('matplotlib.pyplot', setup=use_tk_backend)
+tk = LazyModule('tkinter')
+ttk = LazyModule('tkinter.ttk')
+filedialog = LazyModule('tkinter.filedialog')
+messagebox = LazyModule('tkinter.messagebox')
+
+
 # Get the full path of this file
 filePath = os.path.realpath(__file__)
 gitCodePath = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(filePath))))
@@ -38,7 +70,8 @@ class ImgstreamReader:
                  startFrame=1, 
                  endFrame=None, 
                  startImgName = None, 
-                 endImgName = None):
+                 endImgName = None,
+                 dtype = None):
         '''
         ImgstreamReader Constructor - Initializes the ImgstreamReader object.
           This constructor initializes the ImgstreamReader object. It takes optional
@@ -49,6 +82,7 @@ class ImgstreamReader:
               - imgsteamFormat: Format of the image stream (optional).
               - startFrame: Starting frame index (optional).
               - endFrame: Ending frame index (optional).
+              - dtype: dtype of the grayscale output (optional, see convert_gray).
         '''
 
         self.hasFrame = False    # Flag indicating if there are frames available
@@ -61,6 +95,7 @@ class ImgstreamReader:
         self.imgsteamFormat = imgsteamFormat
         self.startFrame = startFrame
         self.endFrame = endFrame       # Index of the last frame
+        self.dtype = dtype             # dtype of the grayscale output
 
         # Initialize file list based on input arguments
         if startImgName and endImgName is not None:
@@ -128,7 +163,7 @@ class ImgstreamReader:
             raise Exception('The image stream must be in the same folder!')
         
         # Update fileList property with files matching the selected extension
-        self.fileList = glob.glob(os.path.join(startFolder, '*' + extNameSta))
+        self.fileList = sorted(glob.glob(os.path.join(startFolder, '*' + extNameSta)))
 
     def get_filelist_from_imgsteamformat(self):
         '''
@@ -147,7 +182,7 @@ class ImgstreamReader:
         '''
 
         # Retrieve the list of files matching the image stream format
-        self.fileList = glob.glob(self.imgsteamFormat)
+        self.fileList = sorted(glob.glob(self.imgsteamFormat))
         
         # Extract the basename and extension from the specified format
         _dirName, _baseName = os.path.split(self.imgsteamFormat)
@@ -207,10 +242,30 @@ class ImgstreamReader:
         # Get information about the current frame
         fileInfo = self.fileList[self.currIdx]
 
+        # Read and convert the image file
+        grayImg, colorImg = self.read_frame(fileInfo)
+
+        # Update internal state to point to the next frame
+        self.move_to_next_frame()
+
+        return grayImg, colorImg
+
+    def read_frame(self, fileInfo):
+        '''
+        read_frame - Decodes one image file of the stream.
+          This method does not touch the reading state, so it can be called from
+          decoding threads (see ParallelImgstreamReader).
+
+          Parameters:
+              - fileInfo: Path of the image file.
+
+          Returns:
+              - garyImg: Grayscale version of the image.
+              - colorImg: Color version (RGB) of the image.
+        '''
         # Try to read the image file
         try:
             colorImg = cv2.imread(fileInfo)
-            self.hasFrame = True
         except:
             # If an error occurs while reading the image, set hasFrame to false
             self.hasFrame = False
@@ -222,9 +277,14 @@ class ImgstreamReader:
             raise Exception('Image is none!')
 
         # Convert the color image to grayscale
-        grayImg = cv2.cvtColor(colorImg, cv2.COLOR_BGR2GRAY).astype(float) / 255
+        grayImg = convert_gray(cv2.cvtColor(colorImg, cv2.COLOR_BGR2GRAY), self.dtype)
 
-        # Update internal state to point to the next frame
+        return grayImg, cv2.cvtColor(colorImg, cv2.COLOR_BGR2RGB)
+
+    def move_to_next_frame(self):
+        '''
+        move_to_next_frame - Advances the reading state by one frame.
+        '''
         if self.currIdx < len(self.fileList)-1:
             self.hasFrame = True
             self.currIdx = self.currIdx + 1
@@ -233,8 +293,167 @@ class ImgstreamReader:
             # If the end of the image stream is reached, set hasFrame to false
             self.hasFrame = False
 
-        return np.double(grayImg), cv2.cvtColor(colorImg, cv2.COLOR_BGR2RGB)
-    
+
+class ParallelImgstreamReader(ImgstreamReader):
+    '''
+    ParallelImgstreamReader - ImgstreamReader that decodes frames on a thread pool.
+      cv2.imread releases the GIL, so several image files can be decoded at the
+      same time. Frames are submitted to the pool in file order and handed out in
+      the same order, so the reader is a drop-in replacement for ImgstreamReader.
+      At most `maxInFlight` frames are being decoded or waiting to be consumed,
+      which bounds the memory held by the reader. Files that are about to enter
+      the window are announced to the OS with posix_fadvise(WILLNEED) where it is
+      available, so their pages are fetched while the current ones are decoded.
+
+    Example:
+        objIptStream = ParallelImgstreamReader(startImgName=startImgName,
+                                               endImgName=endImgName,
+                                               numWorkers=4)
+        while objIptStream.hasFrame:
+            grayImg, colorImg = objIptStream.get_next_frame()
+    '''
+    def __init__(self,
+                 imgsteamFormat=None,
+                 startFrame=1,
+                 endFrame=None,
+                 startImgName = None,
+                 endImgName = None,
+                 numWorkers = None,
+                 maxInFlight = None,
+                 readaheadLen = None,
+                 dtype = None):
+        '''
+          Parameters:
+              - imgsteamFormat, startFrame, endFrame, startImgName, endImgName, dtype:
+                  Same as ImgstreamReader.
+              - numWorkers: Number of decoding threads (default: min(8, cpu count)).
+              - maxInFlight: Maximum number of frames decoded ahead of the consumer
+                  (default: 2 * numWorkers).
+              - readaheadLen: Number of files beyond the window that receive a
+                  readahead hint (default: maxInFlight, 0 disables the hints).
+        '''
+        super().__init__(imgsteamFormat, startFrame, endFrame, startImgName, endImgName, dtype)
+
+        if numWorkers is None:
+            numWorkers = min(8, os.cpu_count() or 1)
+        if maxInFlight is None:
+            maxInFlight = 2 * numWorkers
+        if readaheadLen is None:
+            readaheadLen = maxInFlight
+        if numWorkers < 1 or maxInFlight < 1:
+            raise ValueError('numWorkers and maxInFlight must be positive.')
+
+        self.numWorkers = numWorkers
+        self.maxInFlight = maxInFlight
+        self.readaheadLen = readaheadLen if hasattr(os, 'posix_fadvise') else 0
+
+        self.hExecutor = ThreadPoolExecutor(max_workers=numWorkers,
+                                            thread_name_prefix='ImgstreamDecoder')
+        self.pendingFrames = deque()    # Futures of the decoded frames, in file order
+        self.submitIdx = self.currIdx   # Index of the next file to submit
+        self.hintIdx = self.currIdx     # Index of the next file to hint
+
+        if self.hasFrame:
+            self.fill_window()
+
+    def fill_window(self):
+        '''
+        fill_window - Submits files until the in-flight window is full.
+        '''
+        while len(self.pendingFrames) < self.maxInFlight \
+            and self.submitIdx < len(self.fileList):
+            self.pendingFrames.append(
+                self.hExecutor.submit(self.read_frame, self.fileList[self.submitIdx])
+                )
+            self.submitIdx += 1
+
+        hintEnd = min(self.submitIdx + self.readaheadLen, len(self.fileList))
+        self.hintIdx = max(self.hintIdx, self.submitIdx)
+        while self.hintIdx < hintEnd:
+            readahead_file(self.fileList[self.hintIdx])
+            self.hintIdx += 1
+
+    def get_next_frame(self):
+        '''
+        get_next_frame - Retrieves the next decoded frame, in file order.
+
+          Returns:
+              - garyImg: Grayscale version of the retrieved frame.
+              - colorImg: Color version (RGB) of the retrieved frame.
+        '''
+        if not self.pendingFrames:
+            raise Exception('Having reached the last frame.')
+
+        # Wait for the oldest frame in the window
+        hFuture = self.pendingFrames.popleft()
+        try:
+            grayImg, colorImg = hFuture.result()
+        except:
+            self.hasFrame = False
+            self.close()
+            raise
+
+        # Update internal state and keep the window full
+        self.move_to_next_frame()
+        if self.hasFrame:
+            self.fill_window()
+        else:
+            self.close()
+
+        return grayImg, colorImg
+
+    def close(self):
+        '''
+        close - Stops the decoding threads and drops the frames still in flight.
+        '''
+        for hFuture in self.pendingFrames:
+            hFuture.cancel()
+        self.pendingFrames.clear()
+        self.hExecutor.shutdown(wait=False, cancel_futures=True)
+
+    def __del__(self):
+        if hasattr(self, 'hExecutor'):
+            self.close()
+
+
+def convert_gray(grayImg, dtype=None):
+    '''
+    convert_gray - Converts a uint8 grayscale image to the dtype requested from a reader.
+
+      Parameters:
+          - grayImg: uint8 grayscale image.
+          - dtype: None or a floating dtype gives gray levels in [0, 1] (None means
+              float64). np.uint8 keeps the raw image, the model retina then folds
+              the 1/255 normalization into its blur (see BaseModel.set_dtype).
+
+      Returns:
+          - grayImg: Converted grayscale image.
+    '''
+    dtype = np.dtype(np.float64 if dtype is None else dtype)
+    if dtype == np.uint8:
+        return grayImg
+    return grayImg.astype(dtype) / dtype.type(255)
+
+
+def readahead_file(fileName):
+    '''
+    readahead_file - Hints the OS that a file will be read soon.
+      This is a best-effort hint: platforms without posix_fadvise and files
+      that cannot be opened are silently skipped.
+    '''
+    if not hasattr(os, 'posix_fadvise'):
+        return
+    try:
+        fd = os.open(fileName, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
 
 class VidstreamReader:
     """
@@ -252,6 +471,7 @@ class VidstreamReader:
         frameIdx - Index of the current frame in the video.
         hWaitbar - Handle to the waitbar.
         endFrame - Ending frame number.
+        keyframeIndex - KeyframeIndex of the video used to seek to startFrame (None without).
 
 
     Methods:
@@ -269,7 +489,7 @@ class VidstreamReader:
         del vidReader
     """
 
-    def __init__(self, vidName=None, startFrame=0, endFrame=None):
+    def __init__(self, vidName=None, startFrame=0, endFrame=None, dtype=None, useKeyframeIndex=True):
         """
         Constructor method for VidstreamReader class.
         
@@ -277,6 +497,10 @@ class VidstreamReader:
             vidName (str): Name of the video file.
             startFrame (int, optional): Starting frame number. Defaults to 1.
             endFrame (int, optional): Ending frame number. Defaults to None, which indicates the last frame of the video.
+            dtype (optional): dtype of the grayscale output. Defaults to None (float64), see convert_gray.
+            useKeyframeIndex (bool, optional): Whether to start at startFrame through the keyframe
+                index of the video (built and persisted on first use, see util/frame_cache.py).
+                Defaults to True.
             
         Returns:
             VidstreamReader: Instance of the VidstreamReader class.
@@ -296,19 +520,29 @@ class VidstreamReader:
                 title='Selecting a input video'
                 )
 
+        self.vidName = vidName
         self.hVid = cv2.VideoCapture(vidName)
 
         self.currIdx = 0
         self.hasFrame = self.hVid.isOpened()
         self.startFrame = startFrame
+        self.dtype = dtype
+
+        # seeking is only needed past the first frame
+        self.keyframeIndex = None
+        if useKeyframeIndex and startFrame > 0 and self.hasFrame:
+            # imported here, frame_cache imports this module
+            from .frame_cache import load_keyframe_index
+            self.keyframeIndex = load_keyframe_index(vidName)
 
-        if endFrame is None:
-            self.endFrame = int(self.hVid.get(cv2.CAP_PROP_FRAME_COUNT))
+        if self.keyframeIndex is not None:
+            numFrames = self.keyframeIndex.numFrames
         else:
-            if endFrame > self.hVid.get(cv2.CAP_PROP_FRAME_COUNT):
-                self.endFrame = int(self.hVid.get(cv2.CAP_PROP_FRAME_COUNT))
-            else:
-                self.endFrame = endFrame
+            numFrames = int(self.hVid.get(cv2.CAP_PROP_FRAME_COUNT))
+        if endFrame is None or endFrame > numFrames:
+            self.endFrame = numFrames
+        else:
+            self.endFrame = endFrame
 
     def get_next_frame(self):
         """
@@ -322,13 +556,14 @@ class VidstreamReader:
 
         if self.hasFrame:
             if self.currIdx == 0:
-                self.hVid.set(cv2.CAP_PROP_POS_FRAMES, self.startFrame)
+                ret, colorImg = self.read_start_frame()
                 self.frameIdx = self.startFrame
-            ret, colorImg = self.hVid.read()
+            else:
+                ret, colorImg = self.hVid.read()
             if not ret:
                 raise Exception('Could not get the frame.')
                     
-            grayImg = cv2.cvtColor(colorImg, cv2.COLOR_BGR2GRAY).astype(float) / 255
+            grayImg = convert_gray(cv2.cvtColor(colorImg, cv2.COLOR_BGR2GRAY), self.dtype)
         else:
             raise Exception('Having reached the last frame.')
 
@@ -341,6 +576,44 @@ class VidstreamReader:
 
         return grayImg, cv2.cvtColor(colorImg, cv2.COLOR_BGR2RGB)
 
+    def read_start_frame(self):
+        """
+        Reads the frame startFrame.
+        Without a keyframe index this is a codec seek (CAP_PROP_POS_FRAMES), which is not
+        frame-accurate for every codec. With the index, the timestamp of the decoded frame
+        is checked against the index. A wrong codec seek is retried from the preceding
+        keyframe, decoding forward to startFrame, and as a last resort from the first frame.
+
+        Returns:
+            tuple: (ret, colorImg) as cv2.VideoCapture.read.
+        """
+        if self.keyframeIndex is None:
+            if self.startFrame > 0:
+                self.hVid.set(cv2.CAP_PROP_POS_FRAMES, self.startFrame)
+            return self.hVid.read()
+
+        keyFrame = self.keyframeIndex.get_preceding_keyframe(self.startFrame)
+        # a codec seek decodes forward from a keyframe itself, it is kept when it checks out
+        for seekFrame in sorted({self.startFrame, keyFrame}, reverse=True):
+            self.hVid.set(cv2.CAP_PROP_POS_FRAMES, seekFrame)
+            ret, colorImg = self.decode_forward(self.startFrame - seekFrame)
+            if ret and self.keyframeIndex.check_pts(self.startFrame, self.hVid.get(cv2.CAP_PROP_PTS)):
+                return ret, colorImg
+
+        logger.warning(f'Inaccurate seek to frame {self.startFrame}, decoding {self.vidName} from the start.')
+        self.hVid.release()
+        self.hVid = cv2.VideoCapture(self.vidName)
+        return self.decode_forward(self.startFrame)
+
+    def decode_forward(self, numSkipped):
+        """
+        Skips numSkipped frames (decoded but not converted) and reads the next one.
+        """
+        for _ in range(numSkipped):
+            if not self.hVid.grab():
+                return False, None
+        return self.hVid.read()
+
     def __del__(self):
         """
         Destructor method.
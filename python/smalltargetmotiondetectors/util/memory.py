@@ -0,0 +1,332 @@
+import copy
+import json
+import logging
+import tracemalloc
+from functools import wraps
+
+import numpy as np
+
+from .datarecord import CircularList
+
+
+def get_nbytes(value, memo=None):
+    """
+    Returns the number of bytes of the arrays held by a value.
+
+    NumPy arrays and torch tensors are counted, containers (CircularList,
+    list, tuple, dict, object arrays) are walked. An array met twice (same
+    object in memo) is only counted once.
+    """
+    if memo is None:
+        memo = set()
+    if value is None or id(value) in memo:
+        return 0
+    if isinstance(value, np.ndarray):
+        memo.add(id(value))
+        if value.dtype != object:
+            return value.nbytes
+        return sum(get_nbytes(item, memo) for item in value.flat)
+    if isinstance(value, (list, tuple)):
+        memo.add(id(value))
+        return sum(get_nbytes(item, memo) for item in value)
+    if isinstance(value, dict):
+        memo.add(id(value))
+        return sum(get_nbytes(item, memo) for item in value.values())
+    if type(value).__module__ == 'torch':
+        memo.add(id(value))
+        return value.element_size() * value.nelement()
+    return 0
+
+
+def get_memory_report(objModel):
+    """
+    Returns the bytes held by every layer of a model.
+
+    The memory of a core is split into
+        - buffers: the history buffers (CircularList attributes), with their
+          length and number of filled slots,
+        - state: the attributes listed in `stateAttrs` (see BaseCore.get_state),
+        - other: the remaining arrays, i.e. kernels and the last output.
+    Sub-cores are reported on their own. The arrays held by the model itself
+    (layer outputs, `stateAttrs`) are reported under 'self'. An array shared by
+    several attributes is counted once, at its first occurrence.
+
+    Returns:
+        - dict {'total': bytes, 'layers': {coreName: {'total', 'buffers', 'state', 'other'}}},
+          buffers is {attrName: {'bytes', 'length', 'filled'}}, state and other
+          are {attrName: bytes}.
+    """
+    memo = set()
+    layers = {}
+    for name, core in objModel.named_cores():
+        layer = {'total': 0, 'buffers': {}, 'state': {}, 'other': {}}
+        for attrName, value in vars(core).items():
+            if isinstance(value, CircularList):
+                nbytes = get_nbytes(value, memo)
+                layer['buffers'][attrName] = {'bytes': nbytes,
+                                              'length': len(value),
+                                              'filled': sum(item is not None for item in value)}
+            else:
+                nbytes = get_nbytes(value, memo)
+                if attrName in core.stateAttrs:
+                    layer['state'][attrName] = nbytes
+                elif nbytes:
+                    layer['other'][attrName] = nbytes
+            layer['total'] += nbytes
+        layers[name] = layer
+
+    layer = {'total': 0, 'buffers': {}, 'state': {}, 'other': {}}
+    for attrName, value in vars(objModel).items():
+        nbytes = get_nbytes(value, memo)
+        if attrName in objModel.stateAttrs:
+            layer['state'][attrName] = nbytes
+        elif nbytes:
+            layer['other'][attrName] = nbytes
+        layer['total'] += nbytes
+    layers['self'] = layer
+
+    return {'total': sum(layer['total'] for layer in layers.values()), 'layers': layers}
+
+
+def is_equal_kernel(value, refValue):
+    """
+    Whether value and refValue are equal NumPy arrays, or lists or tuples of equal arrays.
+
+    Torch tensors are never equal kernels: a tensor cannot be made read-only,
+    an in-place update of a shared tensor would change the other model.
+    """
+    if isinstance(value, np.ndarray):
+        return isinstance(refValue, np.ndarray) and value.dtype == refValue.dtype and value.dtype != object \
+            and np.array_equal(value, refValue)
+    if type(value) in (list, tuple):
+        return type(refValue) is type(value) and len(value) == len(refValue) and len(value) > 0 \
+            and all(is_equal_kernel(item, refItem) for item, refItem in zip(value, refValue))
+    return False
+
+
+def share_kernels(objModel, objReference):
+    """
+    Makes a model use the kernel arrays of another model of the same class where they are equal.
+
+    Call it after `init_config` of both models, before they process any frame:
+    the arrays held by the cores at that point are their kernels (the history
+    buffers are empty and the outputs are None). Every array of objModel equal
+    to the array of the same attribute of objReference is replaced by it, so
+    models with the same parameters keep a single copy of their kernels. The
+    shared arrays are made read-only, a core writing into a shared kernel fails
+    instead of changing the other model. Only NumPy arrays are shared: the
+    `stateAttrs`, the history buffers and the torch tensors (see
+    is_equal_kernel) never are, a model on the torch backend keeps its own
+    kernels.
+
+    Returns:
+        - nbytes: Number of bytes objModel no longer holds.
+    """
+    if type(objModel) is not type(objReference):
+        return 0
+    refCores = dict(objReference.named_cores())
+    nbytes = 0
+    for name, core in objModel.named_cores():
+        refCore = refCores.get(name)
+        if type(refCore) is not type(core):
+            continue
+        for attrName, value in vars(core).items():
+            refValue = vars(refCore).get(attrName)
+            if attrName in core.stateAttrs or value is refValue or isinstance(value, CircularList) \
+                    or not is_equal_kernel(value, refValue):
+                continue
+            for item in (refValue if type(refValue) in (list, tuple) else (refValue,)):
+                if isinstance(item, np.ndarray):
+                    item.flags.writeable = False
+            nbytes += get_nbytes(value)
+            setattr(core, attrName, refValue)
+    return nbytes
+
+
+def run_memory_probe(objModel, shape, numFrames, seed=0):
+    """
+    Runs a copy of a model on random frames and measures its memory.
+
+    Returns:
+        - report: get_memory_report of the copy after the last frame.
+        - transient: Largest host allocation within a frame on top of the memory
+          held before it (tracemalloc), in bytes.
+    """
+    objProbe = copy.deepcopy(objModel)
+    rng = np.random.default_rng(seed)
+    transient = 0
+    wasTracing = tracemalloc.is_tracing()
+    if not wasTracing:
+        tracemalloc.start()
+    try:
+        for _ in range(numFrames):
+            frame = rng.random(shape)
+            if objProbe.backend == 'torch':
+                import torch
+                frame = torch.from_numpy(frame).to(device=objProbe.device).float().unsqueeze(0).unsqueeze(0)
+            tracemalloc.reset_peak()
+            current, _ = tracemalloc.get_traced_memory()
+            objProbe.process(frame)
+            _, peak = tracemalloc.get_traced_memory()
+            transient = max(transient, peak - current)
+    finally:
+        if not wasTracing:
+            tracemalloc.stop()
+    return get_memory_report(objProbe), transient
+
+
+def plan_memory(objModel, shape, numStreams=1, probeShapes=((48, 64), (64, 96)), numFrames=None):
+    """
+    Predicts the memory of a model for an input resolution, before running it.
+
+    The configured model (after `init_config`) is copied and run on random
+    frames at two small probe resolutions, until its history buffers are full.
+    The bytes of every buffer, state and other attribute, and the transient
+    allocations within a frame, are fitted as `fixed + perPixel * H * W`, and
+    extrapolated to `shape`. History buffers grow linearly with the frame size,
+    kernels do not, so the fit is exact for both. The transient part only covers
+    host memory traced by tracemalloc (NumPy, OpenCV outputs), not GPU memory.
+
+    Parameters:
+        - objModel: Configured model.
+        - shape: (height, width) of the input.
+        - numStreams: Number of streams processed at once (one model each).
+        - probeShapes: Two small (height, width) to probe.
+        - numFrames: Number of probe frames, defaults to fill every buffer.
+
+    Returns:
+        - dict with the predicted bytes 'held' (buffers, states, kernels, outputs
+          of one model), 'transient', 'peak' (held + transient) and 'total'
+          (numStreams * peak), and 'layers' {coreName: predicted held bytes}.
+    """
+    if numFrames is None:
+        numFrames = max([len(value) for _, core in objModel.named_cores()
+                         for value in vars(core).values() if isinstance(value, CircularList)]
+                        + [objModel.get_temporal_memory()]) + 2
+
+    probes = [run_memory_probe(objModel, probeShape, numFrames) for probeShape in probeShapes]
+    pixels = [probeShape[0] * probeShape[1] for probeShape in probeShapes]
+    numPixels = shape[0] * shape[1]
+
+    def extrapolate(nbytes):
+        perPixel = (nbytes[1] - nbytes[0]) / (pixels[1] - pixels[0])
+        return max(int(round(nbytes[0] + perPixel * (numPixels - pixels[0]))), 0)
+
+    layers = {name: extrapolate([report['layers'][name]['total'] for report, _ in probes])
+              for name in probes[0][0]['layers']}
+    held = sum(layers.values())
+    transient = extrapolate([transient for _, transient in probes])
+    return {'shape': tuple(shape),
+            'held': held,
+            'transient': transient,
+            'peak': held + transient,
+            'total': numStreams * (held + transient),
+            'layers': dict(sorted(layers.items(), key=lambda item: -item[1]))}
+
+
+class MemoryTracker:
+    """
+    MemoryTracker - Diagnostics mode tracking the memory of a model per frame.
+
+    While attached, every call of the model `process` is traced with
+    tracemalloc; for each frame, the memory held by the model after the frame
+    (get_memory_report) and the traced host allocations (current and peak
+    within the frame) are recorded. Tracing slows the model down noticeably,
+    use it for diagnostics only.
+
+    Example:
+        with MemoryTracker(objModel) as hTracker:
+            for frame in frames:
+                objModel.process(frame)
+        hTracker.print_summary()
+    """
+
+    def __init__(self, objModel=None, withReport=True):
+        """
+        Constructor.
+
+        Parameters:
+            - objModel: Model to track, attached at once when given (optional).
+            - withReport: Whether to walk the model after every frame for the held bytes.
+        """
+        self.withReport = withReport
+        self.objModel = None
+        self.records = []   # per frame: {'frame', 'held', 'current', 'peak'}
+        self._startedTracing = False
+
+        if objModel is not None:
+            self.attach(objModel)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.detach()
+
+    def attach(self, objModel):
+        """
+        Wraps the process method of the model and starts tracemalloc.
+
+        A model whose `process` is already wrapped, e.g. by a LayerProfiler, is
+        refused, as in LayerProfiler.attach.
+        """
+        if self.objModel is not None:
+            self.detach()
+        if 'process' in vars(objModel):
+            raise ValueError('The process method of the model is already wrapped, detach the other wrapper first.')
+        self.objModel = objModel
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._startedTracing = True
+
+        process = objModel.process
+
+        @wraps(process)
+        def tracked(*args, **kwargs):
+            tracemalloc.reset_peak()
+            try:
+                return process(*args, **kwargs)
+            finally:
+                current, peak = tracemalloc.get_traced_memory()
+                held = get_memory_report(objModel)['total'] if self.withReport else None
+                self.records.append({'frame': len(self.records), 'held': held,
+                                     'current': current, 'peak': peak})
+
+        objModel.process = tracked
+
+    def detach(self):
+        """
+        Restores the process method and stops tracemalloc if it was started here.
+        """
+        if self.objModel is not None and 'process' in vars(self.objModel):
+            del self.objModel.process
+        self.objModel = None
+        if self._startedTracing:
+            tracemalloc.stop()
+            self._startedTracing = False
+
+    def summary(self):
+        """
+        Returns the number of frames and the maximum held, current and peak bytes.
+        """
+        summary = {'numFrames': len(self.records)}
+        for key in ('held', 'current', 'peak'):
+            values = [record[key] for record in self.records if record[key] is not None]
+            summary[key] = max(values) if values else None
+        return summary
+
+    def print_summary(self):
+        logger = logging.getLogger(__name__)
+        summary = self.summary()
+        msg = f'Memory over {summary["numFrames"]} frames (MB):'
+        for key in ('held', 'current', 'peak'):
+            if summary[key] is not None:
+                msg += f' {key} {summary[key] / 2**20:.1f}'
+        logger.info(msg)
+
+    def to_json(self, fileName):
+        """
+        Saves the summary and the per-frame records to a JSON file.
+        """
+        with open(fileName, 'w') as hFile:
+            json.dump({'unit': 'bytes', 'summary': self.summary(), 'frames': self.records}, hFile, indent=2)
@@ -0,0 +1,280 @@
+import json
+import logging
+import os
+import threading
+import time
+from functools import wraps
+
+import numpy as np
+
+from ..core.math_operator import GammaDelay, SurroundInhibition
+
+
+# Methods timed on top of `process`, GammaDelay is mostly called through them
+SUB_OPERATOR_METHODS = {
+    GammaDelay: ('process_matrix', 'process_tensor', 'process_list', 'process_circularlist'),
+    SurroundInhibition: (),
+}
+FRAME_EVENT_NAME = 'model'
+
+
+class LayerProfiler:
+    """
+    LayerProfiler - Opt-in per-layer timing of a model.
+
+    The profiler wraps the `process` method of the model and of every core
+    (including the GammaDelay and SurroundInhibition sub-operators) on the
+    instances, with monotonic timers. Nothing is wrapped until `attach`, and
+    `detach` restores the original methods, so a model that is not profiled
+    runs without any overhead.
+
+    Each call is recorded with its inclusive duration; the time spent in the
+    sub-cores it calls is subtracted for the self duration. Calls of the same
+    core are aggregated into statistics and histograms (`summary`), and the
+    calls of the first frames can be exported as a Chrome trace timeline
+    (chrome://tracing or https://ui.perfetto.dev). The model attributes listed
+    in its `profilerCounters`, such as the iterations of a feedback loop, are
+    recorded after each frame (`counter_summary`).
+
+    Example:
+        objModel.init_config()
+        with LayerProfiler(objModel) as hProfiler:
+            for frame in frames:
+                objModel.process(frame)
+        hProfiler.print_summary()
+        hProfiler.to_chrome_trace('trace.json')
+    """
+
+    def __init__(self, objModel=None, subOperators=True, maxTraceEvents=1000000, synchronize=None):
+        """
+        Constructor.
+
+        Parameters:
+            - objModel: Model to profile, attached at once when given (optional).
+            - subOperators: Whether to time the GammaDelay and SurroundInhibition
+              sub-operators, or only the cores of the model.
+            - maxTraceEvents: Maximum number of calls kept for the timeline, the
+              statistics cover all calls.
+            - synchronize: Whether to wait for CUDA kernels before reading the
+              timers. Defaults to True on a CUDA model.
+        """
+        self.subOperators = subOperators
+        self.maxTraceEvents = maxTraceEvents
+        self.synchronize = synchronize
+
+        self.objModel = None
+        self.durations = {}     # name -> list of inclusive durations (ns)
+        self.selfDurations = {} # name -> list of self durations (ns)
+        self.traceEvents = []   # (name, start, duration, frameIdx) in ns
+        self.counters = {}      # name -> list of per-frame values of the model counters
+        self.frameIdx = 0
+        self.startTime = None
+
+        self._wrapped = []      # (object, attribute name)
+        self._local = threading.local()
+
+        if objModel is not None:
+            self.attach(objModel)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.detach()
+
+    def attach(self, objModel):
+        """
+        Wraps the process methods of the model and of its cores.
+
+        Must be called after `init_config`, which creates some of the cores.
+        A model whose `process` is already wrapped, e.g. by a MemoryTracker, is
+        refused: detaching them in the wrong order would leave a stale wrapper.
+        """
+        if self.objModel is not None:
+            self.detach()
+        if 'process' in vars(objModel):
+            raise ValueError('The process method of the model is already wrapped, detach the other wrapper first.')
+        self.objModel = objModel
+        if self.synchronize is None:
+            self.synchronize = str(objModel.device).startswith('cuda')
+        if self.startTime is None:
+            self.startTime = time.perf_counter_ns()
+
+        self.wrap(objModel, 'process', FRAME_EVENT_NAME, isFrame=True)
+        for name, core in objModel.named_cores():
+            if not self.subOperators and isinstance(core, tuple(SUB_OPERATOR_METHODS)):
+                continue
+            subMethods = [method for coreClass, methods in SUB_OPERATOR_METHODS.items()
+                          if isinstance(core, coreClass) for method in methods]
+            self.wrap(core, 'process', name)
+            for method in subMethods:
+                self.wrap(core, method, f'{name}.{method}')
+
+    def detach(self):
+        """
+        Restores the original methods.
+        """
+        for obj, method in self._wrapped:
+            if method in vars(obj):
+                delattr(obj, method)
+        self._wrapped = []
+        self.objModel = None
+
+    def wrap(self, obj, method, name, isFrame=False):
+        # the bound method of the class, the wrapper shadows it on the instance
+        func = getattr(obj, method)
+        if not callable(func) or method in vars(obj):
+            return
+
+        @wraps(func)
+        def timed(*args, **kwargs):
+            stack = getattr(self._local, 'stack', None)
+            if stack is None:
+                stack = self._local.stack = []
+            stack.append(0)
+            start = time.perf_counter_ns()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                if self.synchronize:
+                    import torch
+                    torch.cuda.synchronize()
+                duration = time.perf_counter_ns() - start
+                childDuration = stack.pop()
+                if stack:
+                    stack[-1] += duration
+                self.record(name, start, duration, duration - childDuration)
+                if isFrame:
+                    self.record_counters()
+                    self.frameIdx += 1
+
+        setattr(obj, method, timed)
+        self._wrapped.append((obj, method))
+
+    def record(self, name, start, duration, selfDuration):
+        self.durations.setdefault(name, []).append(duration)
+        self.selfDurations.setdefault(name, []).append(selfDuration)
+        if len(self.traceEvents) < self.maxTraceEvents:
+            self.traceEvents.append((name, start, duration, self.frameIdx))
+
+    def record_counters(self):
+        if self.objModel is None:
+            return
+        for name in getattr(self.objModel, 'profilerCounters', ()):
+            self.counters.setdefault(name, []).append(getattr(self.objModel, name))
+
+    def reset(self):
+        """
+        Clears the recorded calls.
+        """
+        self.durations = {}
+        self.selfDurations = {}
+        self.traceEvents = []
+        self.counters = {}
+        self.frameIdx = 0
+        self.startTime = time.perf_counter_ns()
+
+    def summary(self, numBins=20):
+        """
+        Returns the statistics of every timed layer, in ms.
+
+        Parameters:
+            - numBins: Number of log-spaced bins of the duration histograms.
+
+        Returns:
+            - dict {name: {count, total, mean, self, min, p50, p90, p99, max,
+              histogram: {edges, counts}}}, `self` is the total self time. Layers
+              are sorted by decreasing total time.
+        """
+        summary = {}
+        for name, durations in self.durations.items():
+            durations = np.array(durations) / 1e6
+            selfDurations = np.array(self.selfDurations[name]) / 1e6
+            low = max(durations.min(), 1e-6)
+            high = max(durations.max(), low * 1.01)
+            counts, edges = np.histogram(durations, bins=np.geomspace(low, high, numBins + 1))
+            p50, p90, p99 = np.percentile(durations, [50, 90, 99])
+            summary[name] = {
+                'count': int(durations.size),
+                'total': float(durations.sum()),
+                'mean': float(durations.mean()),
+                'self': float(selfDurations.sum()),
+                'min': float(durations.min()),
+                'p50': float(p50),
+                'p90': float(p90),
+                'p99': float(p99),
+                'max': float(durations.max()),
+                'histogram': {'edges': edges.tolist(), 'counts': counts.tolist()},
+            }
+        return dict(sorted(summary.items(), key=lambda item: -item[1]['total']))
+
+    def counter_summary(self):
+        """
+        Returns the statistics of the model counters over the frames.
+
+        Returns:
+            - dict {name: {count, total, mean, min, max, histogram: {values, counts}}}.
+        """
+        summary = {}
+        for name, values in self.counters.items():
+            values = np.array(values)
+            uniqueValues, counts = np.unique(values, return_counts=True)
+            summary[name] = {
+                'count': int(values.size),
+                'total': float(values.sum()),
+                'mean': float(values.mean()),
+                'min': float(values.min()),
+                'max': float(values.max()),
+                'histogram': {'values': uniqueValues.tolist(), 'counts': counts.tolist()},
+            }
+        return summary
+
+    def print_summary(self, topK=None):
+        """
+        Logs a table of the layers by decreasing total time.
+        """
+        logger = logging.getLogger(__name__)
+        summary = self.summary()
+        names = list(summary)[:topK]
+        width = max([len(name) for name in names] + [5])
+        msg = f'Per-layer timing over {self.frameIdx} frames (ms):\n'
+        msg += f'  {"layer":{width}} {"count":>7} {"total":>10} {"self":>10} {"mean":>8} {"p90":>8} {"p99":>8}\n'
+        for name in names:
+            stat = summary[name]
+            msg += (f'  {name:{width}} {stat["count"]:7d} {stat["total"]:10.1f} {stat["self"]:10.1f} '
+                    f'{stat["mean"]:8.3f} {stat["p90"]:8.3f} {stat["p99"]:8.3f}\n')
+        for name, stat in self.counter_summary().items():
+            msg += f'  {name}: mean {stat["mean"]:.2f}, min {stat["min"]:g}, max {stat["max"]:g}\n'
+        logger.info(msg)
+
+    def to_json(self, fileName, numBins=20):
+        """
+        Saves the model name, the number of frames and the summary to a JSON file.
+        """
+        report = {
+            'model': None if self.objModel is None else self.objModel.__class__.__name__,
+            'numFrames': self.frameIdx,
+            'unit': 'ms',
+            'layers': self.summary(numBins),
+            'counters': self.counter_summary(),
+        }
+        with open(fileName, 'w') as hFile:
+            json.dump(report, hFile, indent=2)
+
+    def to_chrome_trace(self, fileName):
+        """
+        Saves the recorded calls as a Chrome trace (Trace Event Format).
+        """
+        pid = os.getpid()
+        startTime = self.startTime or 0
+        events = [{'name': name,
+                   'cat': 'frame' if name == FRAME_EVENT_NAME else 'layer',
+                   'ph': 'X',
+                   'ts': (start - startTime) / 1e3,
+                   'dur': duration / 1e3,
+                   'pid': pid,
+                   'tid': 0,
+                   'args': {'frame': frameIdx}}
+                  for name, start, duration, frameIdx in self.traceEvents]
+        with open(fileName, 'w') as hFile:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, hFile)
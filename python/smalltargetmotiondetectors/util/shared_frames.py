@@ -0,0 +1,175 @@
+import os
+import multiprocessing
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+
+class FrameRing:
+    '''
+    Ring of frame slots in shared memory.
+
+    One process creates the ring and writes each frame into a slot (or decodes
+    it there directly, see `frames`), another process attaches to it by name,
+    from `describe`, and reads the slot in place, so the frames cross the
+    process boundary without being pickled or copied. Which slots are free is
+    up to the users of the ring: the inference client frees a slot once the
+    server has answered for its frame, SharedFramePool keeps a queue of the
+    free slots.
+    '''
+
+    def __init__(self, shape, dtype=np.uint8, numSlots=4, name=None, keepTracked=False):
+        '''
+        Parameters:
+            - shape: Shape of a frame, e.g. (height, width).
+            - dtype: dtype of the frames.
+            - numSlots: Number of slots, i.e. frames in flight.
+            - name: Name of an existing ring to attach to, None creates a new one.
+            - keepTracked: Whether an attached ring stays registered with the
+              resource tracker of this process. Processes started by
+              multiprocessing share the tracker of their parent, which already
+              tracks the ring; any other process unregisters it, otherwise its
+              tracker would remove the ring of the owner at exit.
+        '''
+        self.shape = tuple(int(size) for size in shape)
+        self.dtype = np.dtype(dtype)
+        self.numSlots = int(numSlots)
+        nbytes = self.numSlots * int(np.prod(self.shape)) * self.dtype.itemsize
+
+        # a forked child inherits the ring without owning it
+        self.ownerPid = os.getpid() if name is None else None
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=nbytes)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            if not keepTracked:
+                # the owner unlinks the ring, not the resource tracker of this process
+                resource_tracker.unregister(self.shm._name, 'shared_memory')
+            if self.shm.size < nbytes:
+                self.shm.close()
+                raise ValueError(f'The shared memory {name} is smaller than {self.numSlots} frames of '
+                                 f'{self.shape} {self.dtype}.')
+        self.name = self.shm.name
+        # (numSlots, *shape) view of the shared memory
+        self.frames = np.ndarray((self.numSlots,) + self.shape, dtype=self.dtype, buffer=self.shm.buf)
+
+    def describe(self):
+        ''' Returns what the other process needs to attach to the ring. '''
+        return {'shm': self.name, 'shape': list(self.shape), 'dtype': self.dtype.str, 'numSlots': self.numSlots}
+
+    def close(self):
+        ''' Detaches from the ring, the owner also removes it. '''
+        if self.frames is None:
+            return
+        self.frames = None
+        try:
+            self.shm.close()
+        except BufferError:
+            # a frame of the ring is still referenced, the mapping goes with it
+            pass
+        if self.ownerPid == os.getpid():
+            self.shm.unlink()
+
+
+class SharedFramePool:
+    '''
+    Pool of slots in shared memory for a pipeline of processes.
+
+    A slot holds one array per field (e.g. the gray and color frames and the
+    model outputs of a frame), each field is a FrameRing. A stage takes a free
+    slot with `acquire`, fills it in place and sends only the slot number to
+    the next stage, the last stage hands the slot back with `release`. The
+    frames are then written once into shared memory instead of being pickled
+    and copied at every hop, and the number of slots bounds the frames in
+    flight.
+
+    The pool is created by the parent process and passed to the processes of
+    the pipeline in the arguments of multiprocessing.Process, they attach to
+    the same slots. The parent closes the pool when the pipeline has stopped.
+
+    Example:
+        pool = SharedFramePool({'gray': ((480, 640), np.uint8),
+                                'color': ((480, 640, 3), np.uint8)}, numSlots=8)
+        # producer process
+        slot = pool.acquire()
+        pool.get_slot(slot)['gray'][:] = grayImg
+        queue.put(slot)
+        # consumer process
+        slot = queue.get()
+        grayImg = pool.get_slot(slot)['gray']
+        ...
+        pool.release(slot)
+    '''
+
+    def __init__(self, fields, numSlots=8, context=None):
+        '''
+        Parameters:
+            - fields: dict {fieldName: (shape, dtype)} of the arrays of a slot.
+            - numSlots: Number of slots.
+            - context: multiprocessing context of the processes of the pipeline,
+              defaults to the current start method.
+        '''
+        if numSlots < 1:
+            raise ValueError('numSlots must be a positive integer.')
+        self.numSlots = int(numSlots)
+        self.rings = {}
+        try:
+            for fieldName, (shape, dtype) in fields.items():
+                self.rings[fieldName] = FrameRing(shape, dtype, self.numSlots)
+        except Exception:
+            self.close()
+            raise
+        self.freeSlots = (multiprocessing if context is None else context).Queue()
+        for slot in range(self.numSlots):
+            self.freeSlots.put(slot)
+
+    def __getstate__(self):
+        # sent to a child process, which attaches to the rings of the parent
+        return {'numSlots': self.numSlots,
+                'rings': {fieldName: ring.describe() for fieldName, ring in self.rings.items()},
+                'freeSlots': self.freeSlots}
+
+    def __setstate__(self, state):
+        self.numSlots = state['numSlots']
+        self.freeSlots = state['freeSlots']
+        self.rings = {fieldName: FrameRing(info['shape'], info['dtype'], info['numSlots'], name=info['shm'],
+                                           keepTracked=True)
+                      for fieldName, info in state['rings'].items()}
+
+    @property
+    def fields(self):
+        ''' dict {fieldName: (shape, dtype)} of the arrays of a slot. '''
+        return {fieldName: (ring.shape, ring.dtype) for fieldName, ring in self.rings.items()}
+
+    def acquire(self, timeout=None):
+        '''
+        Takes a free slot, waits for one when all the slots are in flight.
+
+        Raises:
+            - queue.Empty: No slot was freed within timeout (s).
+        '''
+        return self.freeSlots.get(timeout=timeout)
+
+    def release(self, slot):
+        ''' Hands a slot back to the pool. '''
+        self.freeSlots.put(slot)
+
+    def get_slot(self, slot):
+        ''' Returns the arrays of a slot, {fieldName: view of the shared memory}. '''
+        return {fieldName: ring.frames[slot] for fieldName, ring in self.rings.items()}
+
+    def close(self):
+        ''' Detaches from the slots, the process that created the pool also removes them. '''
+        for ring in self.rings.values():
+            ring.close()
+
+
+def convert_frame(frame, objModel):
+    ''' Returns the input of a model for a frame of a shared slot, a view of the slot for the NumPy backend. '''
+    if objModel.backend == 'torch':
+        import torch
+        tensor = torch.from_numpy(frame).to(device=objModel.device).float()
+        if frame.dtype == np.uint8:
+            tensor = tensor / 255
+        return tensor.unsqueeze(0).unsqueeze(0)
+    return frame
@@ -0,0 +1,258 @@
+import json
+
+import numpy as np
+
+from .iostream import convert_gray
+
+
+# Default stimulus, see SyntheticFrameReader
+DEFAULT_STIMULUS = {
+    'shape': (240, 320),            # (height, width) in pixels
+    'fps': 1000,                    # sampling frequency, velocities are in pixels/s
+    'numFrames': 1000,
+    'seed': 0,
+    'background': 'clutter',        # 'clutter' or 'uniform'
+    'backgroundLuminance': 0.5,     # mean gray level in [0, 1]
+    'clutterContrast': 0.4,         # gray level range of the clutter around its mean
+    'clutterScale': 8,              # spatial scale of the clutter in pixels
+    'backgroundVelocity': (0, 0),   # (row, col) in pixels/s, the background wraps around
+    'targets': None,                # list of {'position', 'velocity', 'size', 'contrast'}
+    'numTargets': 1,                # number of random targets when targets is None
+    'targetSize': (5, 5),           # (height, width) in pixels
+    'targetSpeed': 250,             # pixels/s, random direction
+    'targetContrast': 1.0,          # 1 - target / background luminance, 1 is a black target
+    'wrap': True,                   # targets leaving the frame re-enter on the other side
+}
+
+
+class SyntheticFrameReader:
+    '''
+    SyntheticFrameReader - Renders a deterministic small target stimulus.
+      Small targets of given size, velocity and contrast move over a uniform or
+      cluttered background, which can move as well. Frames are rendered in
+      vectorized blocks as uint8 gray images, so the reader is much faster than
+      the models and adds no I/O noise to a benchmark. The exact target
+      positions are known, see get_ground_truth.
+
+      The reader has the interface of VidstreamReader, startFrame and endFrame
+      are frame numbers, endFrame is excluded. The stimulus is a dict or a JSON
+      file of the keys of DEFAULT_STIMULUS, missing keys take their default.
+      Each target is a dict with
+          - position: (row, col) of its center in the first frame,
+          - velocity: (row, col) in pixels/s,
+          - size: (height, width), defaults to targetSize,
+          - contrast: defaults to targetContrast.
+
+    Example:
+        objIptStream = SyntheticFrameReader({'shape': (250, 500), 'numTargets': 3}, 0, 500)
+        groundTruth = objIptStream.get_ground_truth()
+        while objIptStream.hasFrame:
+            grayImg, colorImg = objIptStream.get_next_frame()
+    '''
+
+    def __init__(self, stimulus=None, startFrame=0, endFrame=None, dtype=None, blockSize=64):
+        '''
+          Parameters:
+              - stimulus: dict or JSON file of the stimulus (optional, see DEFAULT_STIMULUS).
+              - startFrame: Starting frame.
+              - endFrame: Ending frame, excluded (optional, defaults to numFrames).
+              - dtype: dtype of the grayscale output (optional, see convert_gray).
+              - blockSize: Number of frames rendered at once.
+        '''
+        if isinstance(stimulus, str):
+            with open(stimulus, 'r') as f:
+                stimulus = json.load(f)
+        unknownKeys = set(stimulus or {}) - set(DEFAULT_STIMULUS)
+        if unknownKeys:
+            raise ValueError(f'Unknown stimulus keys: {sorted(unknownKeys)}')
+        self.stimulus = {**DEFAULT_STIMULUS, **(stimulus or {})}
+        self.dtype = dtype
+        self.blockSize = blockSize
+
+        self.shape = tuple(int(size) for size in self.stimulus['shape'])
+        self.fps = self.stimulus['fps']
+        self.startFrame = startFrame
+        self.endFrame = self.stimulus['numFrames'] if endFrame is None else endFrame
+
+        rng = np.random.default_rng(self.stimulus['seed'])
+        self.background = self.create_background(rng)
+        self.init_targets(rng)
+
+        self.block = None
+        self.blockStart = None
+        self.currIdx = 0
+        self.frameIdx = self.startFrame
+        self.hasFrame = self.frameIdx < self.endFrame
+
+    def create_background(self, rng):
+        ''' Returns the uint8 background, the clutter is periodic to wrap around seamlessly. '''
+        luminance = self.stimulus['backgroundLuminance']
+        if self.stimulus['background'] == 'uniform':
+            return np.full(self.shape, round(255 * luminance), dtype=np.uint8)
+        elif self.stimulus['background'] != 'clutter':
+            raise ValueError(f"Unknown background: {self.stimulus['background']}")
+
+        # low-pass filtered white noise, filtered in the Fourier domain
+        freqRow = np.fft.fftfreq(self.shape[0])[:, None]
+        freqCol = np.fft.fftfreq(self.shape[1])[None, :]
+        sigma = self.stimulus['clutterScale']
+        lowPass = np.exp(-2 * (np.pi * sigma) ** 2 * (freqRow ** 2 + freqCol ** 2))
+        clutter = np.fft.ifft2(np.fft.fft2(rng.standard_normal(self.shape)) * lowPass).real
+        clutter = (clutter - clutter.min()) / max(np.ptp(clutter), 1e-12) - 0.5
+        background = luminance + self.stimulus['clutterContrast'] * clutter
+        return np.round(255 * np.clip(background, 0, 1)).astype(np.uint8)
+
+    def init_targets(self, rng):
+        ''' Converts the targets to arrays, random targets are drawn when none is given. '''
+        targets = self.stimulus['targets']
+        if targets is None:
+            numTargets = self.stimulus['numTargets']
+            positions = rng.random((numTargets, 2)) * self.shape
+            angles = rng.random(numTargets) * 2 * np.pi
+            velocities = self.stimulus['targetSpeed'] * np.stack([np.sin(angles), np.cos(angles)], axis=1)
+            targets = [{'position': position, 'velocity': velocity}
+                       for position, velocity in zip(positions, velocities)]
+
+        numTargets = len(targets)
+        self.targetPosition = np.array([target['position'] for target in targets], dtype=float).reshape(numTargets, 2)
+        self.targetVelocity = np.array([target['velocity'] for target in targets], dtype=float).reshape(numTargets, 2)
+        self.targetSize = np.array([target.get('size', self.stimulus['targetSize']) for target in targets],
+                                   dtype=int).reshape(numTargets, 2)
+        contrast = np.array([target.get('contrast', self.stimulus['targetContrast']) for target in targets],
+                            dtype=float)
+        targetLuminance = self.stimulus['backgroundLuminance'] * (1 - contrast)
+        self.targetValue = np.round(255 * np.clip(targetLuminance, 0, 1)).astype(np.uint8)
+
+    def get_target_boxes(self, frameIdxs):
+        '''
+        Returns the centers and the top left corners of the targets.
+
+          Returns:
+              - centers: (numFrames, numTargets, 2) int (row, col) of the centers.
+              - tops: (numFrames, numTargets, 2) int (row, col) of the top left corners.
+              - isVisible: (numFrames, numTargets) whether the center is in the frame.
+        '''
+        times = np.asarray(frameIdxs, dtype=float)[:, None, None] / self.fps
+        centers = np.round(self.targetPosition + times * self.targetVelocity).astype(int)
+        if self.stimulus['wrap']:
+            centers %= self.shape
+        isVisible = np.all((centers >= 0) & (centers < self.shape), axis=-1)
+        return centers, centers - self.targetSize // 2, isVisible
+
+    def render_frames(self, frameIdxs):
+        '''
+        Renders frames.
+
+          Parameters:
+              - frameIdxs: Frame numbers.
+
+          Returns:
+              - frames: (len(frameIdxs), height, width) uint8 gray frames.
+        '''
+        frameIdxs = np.asarray(frameIdxs)
+        height, width = self.shape
+
+        # background, shifted by whole pixels
+        shifts = np.round(frameIdxs[:, None] / self.fps * np.asarray(self.stimulus['backgroundVelocity'])).astype(int)
+        if np.any(shifts):
+            rowIdxs = (np.arange(height)[None, :] - shifts[:, :1]) % height
+            colIdxs = (np.arange(width)[None, :] - shifts[:, 1:]) % width
+            frames = self.background[rowIdxs[:, :, None], colIdxs[:, None, :]]
+        else:
+            frames = np.repeat(self.background[None], len(frameIdxs), axis=0)
+
+        # targets, as (frame, target, pixel) index arrays over the largest target
+        if len(self.targetValue):
+            _, tops, _ = self.get_target_boxes(frameIdxs)
+            maxHeight, maxWidth = self.targetSize.max(axis=0)
+            offsetRow = np.arange(maxHeight)[None, None, :, None]
+            offsetCol = np.arange(maxWidth)[None, None, None, :]
+            rows = tops[..., 0, None, None] + offsetRow
+            cols = tops[..., 1, None, None] + offsetCol
+            mask = (offsetRow < self.targetSize[None, :, 0, None, None]) \
+                & (offsetCol < self.targetSize[None, :, 1, None, None])
+            if self.stimulus['wrap']:
+                rows %= height
+                cols %= width
+            else:
+                mask = mask & (rows >= 0) & (rows < height) & (cols >= 0) & (cols < width)
+            rows, cols, mask = np.broadcast_arrays(rows, cols, mask)
+            frameNums = np.broadcast_to(np.arange(len(frameIdxs))[:, None, None, None], mask.shape)
+            values = np.broadcast_to(self.targetValue[None, :, None, None], mask.shape)
+            frames[frameNums[mask], rows[mask], cols[mask]] = values[mask]
+        return frames
+
+    def get_ground_truth(self, startFrame=None, endFrame=None, withBox=False):
+        '''
+        Returns the ground truth in the format of evaluate_task.
+
+          Parameters:
+              - startFrame: Starting frame (optional, defaults to the one of the reader).
+              - endFrame: Ending frame, excluded (optional, defaults to the one of the reader).
+              - withBox: Whether to return bounding boxes instead of centers.
+
+          Returns:
+              - groundTruth: For every frame, the [x, y] (column, row) centers of
+                  the visible targets, as the model outputs, or their [x, y, width,
+                  height] boxes from the top left corner.
+        '''
+        startFrame = self.startFrame if startFrame is None else startFrame
+        endFrame = self.endFrame if endFrame is None else endFrame
+        centers, tops, isVisible = self.get_target_boxes(np.arange(startFrame, endFrame))
+        if withBox:
+            sizes = np.broadcast_to(self.targetSize, tops.shape)
+            items = np.concatenate([tops[..., ::-1], sizes[..., ::-1]], axis=-1)
+        else:
+            items = centers[..., ::-1]
+        return [frameItems[frameIsVisible].tolist() for frameItems, frameIsVisible in zip(items, isVisible)]
+
+    def save_ground_truth(self, fileName, withBox=False):
+        ''' Saves the ground truth of the reader frames to a JSON file {'groundTruth': ...}. '''
+        with open(fileName, 'w') as f:
+            json.dump({'groundTruth': self.get_ground_truth(withBox=withBox)}, f)
+
+    def get_next_frame(self):
+        '''
+        get_next_frame - Renders the next frame.
+
+          Returns:
+              - grayImg: Grayscale frame.
+              - colorImg: Read-only three channel view of the grayscale frame.
+        '''
+        if not self.hasFrame:
+            raise Exception('Having reached the last frame.')
+
+        if self.block is None or not self.blockStart <= self.frameIdx < self.blockStart + len(self.block):
+            self.blockStart = self.frameIdx
+            self.block = self.render_frames(np.arange(self.frameIdx, min(self.frameIdx + self.blockSize,
+                                                                          self.endFrame)))
+        rawImg = self.block[self.frameIdx - self.blockStart]
+        grayImg = convert_gray(rawImg, self.dtype)
+
+        self.currIdx += 1
+        self.frameIdx += 1
+        self.hasFrame = self.frameIdx < self.endFrame
+
+        return grayImg, np.broadcast_to(rawImg[..., None], rawImg.shape + (3,))
+
+
+
+def read_synthetic_frames(stimulus=None, numFrames=None, dtype=None, startFrame=0):
+    '''
+    read_synthetic_frames - Renders the gray frames of a stimulus at once.
+
+      Parameters:
+          - stimulus: dict or JSON file of the stimulus (optional, see DEFAULT_STIMULUS).
+          - numFrames: Number of frames (optional, defaults to the numFrames of the stimulus).
+          - dtype: dtype of the frames (optional, see convert_gray).
+          - startFrame: First frame.
+
+      Returns:
+          - frames: List of the grayscale frames, as returned by get_next_frame.
+    '''
+    objIptStream = SyntheticFrameReader(stimulus, startFrame,
+                                        None if numFrames is None else startFrame + numFrames, dtype=dtype)
+    frames = []
+    while objIptStream.hasFrame:
+        frames.append(objIptStream.get_next_frame()[0])
+    return frames